@@ -50,8 +50,11 @@ except ImportError as e:
 
 from .ncbi_taxonomy import *
 from .coretype.tree import *
+from .coretype.frozentree import *
+from .coretype.bipartitions import *
 from .coretype.seqgroup import *
 from .phylo.phylotree import *
+from .phylo.orthology import *
 from .evol.evoltree import *
 from .webplugin.webapp import *
 from .phyloxml import Phyloxml, PhyloxmlTree
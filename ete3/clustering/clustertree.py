@@ -170,15 +170,11 @@ class ClusterNode(TreeNode):
             array = ArrayTable(arraytbl)
 
         missing_leaves = []
-        matrix_values = [i for r in range(len(array.matrix))\
-                           for i in array.matrix[r] if numpy.isfinite(i)]
-
-        array._matrix_min = min(matrix_values)
-        array._matrix_max = max(matrix_values)
+        array._matrix_min, array._matrix_max = _get_finite_range(array.matrix)
 
         for n in self.traverse():
             n.arraytable = array
-            if n.is_leaf() and n.name in array.rowNames:
+            if n.is_leaf() and n.name in array.rowValues:
                 n._profile = array.get_row_vector(n.name)
             elif n.is_leaf():
                 n._profile = [numpy.nan]*len(array.colNames)
@@ -242,13 +238,45 @@ class ClusterNode(TreeNode):
         nodes = _translate_nodes(self, *clusters)
         return clustvalidation.get_dunn_index(fdist, *nodes)
 
+    def update_validation(self, fdist=None):
+        """
+        .. versionadded: 3.1
+
+        Calculates the mean and deviation profiles, silhouette values
+        and inter/intra-cluster distances of all nodes under this one
+        in a single batch, which is much faster than querying them
+        node by node in large trees.
+
+        Returns a dictionary with the Dunn index of every internal
+        node, using its children as clusters.
+        """
+        if fdist is None:
+            fdist = self._fdist
+        return clustvalidation.update_validation(self, fdist)
+
     def _calculate_avg_profile(self):
         """ This internal function updates the mean profile
         associated to an internal node. """
 
-        # Updates internal values
-        self._profile, self._std_profile = clustvalidation.get_avg_profile(self)
-
+        # Updates internal values of the whole subtree, so descendant
+        # profiles are already cached when requested
+        clustvalidation.update_profiles(self)
+
+
+def _get_finite_range(matrix, chunk_size=4096):
+    """ Returns min and max finite values in matrix, reading it by
+    chunks of rows (so memory mapped matrices are not fully loaded)"""
+    vmin, vmax = None, None
+    for start in range(0, len(matrix), chunk_size):
+        values = numpy.asarray(matrix[start:start+chunk_size])
+        values = values[numpy.isfinite(values)]
+        if len(values):
+            cmin, cmax = values.min(), values.max()
+            vmin = cmin if vmin is None else min(vmin, cmin)
+            vmax = cmax if vmax is None else max(vmax, cmax)
+    if vmin is None:
+        raise ValueError("No finite values found in matrix")
+    return vmin, vmax
 
 # cosmetic alias
 #: .. currentmodule:: ete3
@@ -44,10 +44,8 @@ from six.moves import range
 
 def safe_mean(values):
     """ Returns mean value discarding non finite values """
-    valid_values = []
-    for v in values:
-        if numpy.isfinite(v):
-            valid_values.append(v)
+    values = numpy.asarray(values, dtype=float)
+    valid_values = values[numpy.isfinite(values)]
     return numpy.mean(valid_values), numpy.std(valid_values)
 
 def safe_mean_vector(vectors):
@@ -56,52 +54,64 @@ def safe_mean_vector(vectors):
     # if only one vector, avg = itself
     if len(vectors)==1:
         return vectors[0], numpy.zeros(len(vectors[0]))
-    # Takes the vector length form the first item
-    length = len(vectors[0])
 
-    safe_mean = []
-    safe_std  = []
-
-    for pos in range(length):
-        pos_mean = []
-        for v in vectors:
-            if numpy.isfinite(v[pos]):
-                pos_mean.append(v[pos])
-        safe_mean.append(numpy.mean(pos_mean))
-        safe_std.append(numpy.std(pos_mean))
-    return numpy.array(safe_mean), numpy.array(safe_std)
+    matrix = numpy.asarray(vectors, dtype=float)
+    valid = numpy.isfinite(matrix)
+    counts = valid.sum(axis=0)
+    values = numpy.where(valid, matrix, 0.0)
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        safe_mean = values.sum(axis=0) / counts
+        dev = numpy.where(valid, matrix - safe_mean, 0.0)
+        safe_std = numpy.sqrt((dev * dev).sum(axis=0) / counts)
+    return safe_mean, safe_std
 
 def get_silhouette_width(fdist, cluster):
     sisters = cluster.get_sisters()
+    vdist = get_vectorized_dist(fdist)
+
+    # Skip nodes without profile
+    leaf_vectors = [i._profile for i in cluster.iter_leaves()
+                    if i._profile is not None]
+    if leaf_vectors:
+        leaf_matrix = numpy.asarray(leaf_vectors, dtype=float)
+        cluster_profile = cluster.profile
 
     # Calculates silhouette
     silhouette = []
     intra_dist = []
     inter_dist = []
     for st in sisters:
-        if st.profile is None:
+        if st.profile is None or not leaf_vectors:
             continue
-        for i in cluster.iter_leaves():
-            # Skip nodes without profile
-            if i._profile is not None:
-                # item intraclsuterdist -> Centroid Diameter
-                a = fdist(i.profile, cluster.profile)*2
-                # intracluster dist -> Centroid Linkage
-                b = fdist(i.profile, st.profile)
+        # item intraclsuterdist -> Centroid Diameter
+        a = vdist(leaf_matrix, cluster_profile) * 2
+        # intracluster dist -> Centroid Linkage
+        b = vdist(leaf_matrix, st.profile)
+        intra_dist.append(a)
+        inter_dist.append(b)
+        silhouette.append(_get_silhouette_values(a, b))
 
-                if (b-a) == 0.0:
-                    s = 0.0
-                else:
-                    s =  (b-a) / max(a,b)
+    silhouette, std = safe_mean(_concat(silhouette))
+    intracluster_dist, std = safe_mean(_concat(intra_dist))
+    intercluster_dist, std = safe_mean(_concat(inter_dist))
+    return silhouette, intracluster_dist, intercluster_dist
 
-                intra_dist.append(a)
-                inter_dist.append(b)
-                silhouette.append(s)
+def _get_silhouette_values(a, b):
+    diff = b - a
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        return numpy.where(diff == 0.0, 0.0, diff / numpy.maximum(a, b))
 
-    silhouette, std = safe_mean(silhouette)
-    intracluster_dist, std = safe_mean(intra_dist)
-    intercluster_dist, std = safe_mean(inter_dist)
-    return silhouette, intracluster_dist, intercluster_dist
+def _concat(arrays):
+    if arrays:
+        return numpy.concatenate(arrays)
+    return numpy.zeros(0)
+
+def _get_finite_mean(arrays):
+    values = _concat(arrays)
+    values = values[numpy.isfinite(values)]
+    if not len(values):
+        return numpy.nan
+    return values.mean()
 
 def get_avg_profile(node):
     """ This internal function updates the mean profile
@@ -156,6 +166,148 @@ def get_dunn_index(fdist, *clusters):
 
 
 
+# ####################
+# batch validation
+# ####################
+
+def _get_leaf_data(root):
+    """ Returns the list of leaves under root (in preorder), a
+    dictionary with the range of leaf positions covered by every node,
+    and the matrix of leaf profiles (rows of leaves with no profile are
+    filled with NaN values). """
+    leaves, node2range = root.get_leaf_ranges()
+
+    has_profile = numpy.array([n._profile is not None for n in leaves], dtype=bool)
+    length = max([len(n._profile) for n in leaves if n._profile is not None] or [0])
+    matrix = numpy.empty((len(leaves), length))
+    matrix.fill(numpy.nan)
+    for i, n in enumerate(leaves):
+        if n._profile is not None:
+            matrix[i] = n._profile
+    return leaves, node2range, matrix, has_profile
+
+def update_profiles(root):
+    """ Updates the mean and deviation profiles of all nodes under
+    root (included) in a single post-order pass. Non finite values are
+    discarded, as in :func:`get_avg_profile`.
+
+    Partial means and variances are merged from children to parents,
+    so leaf profiles are visited only once.
+    """
+    leaves, node2range, matrix, has_profile = _get_leaf_data(root)
+    _update_profiles(root, leaves, node2range, matrix, has_profile)
+
+def _update_profiles(root, leaves, node2range, matrix, has_profile):
+    valid = numpy.isfinite(matrix)
+    node2stats = {}
+    for node in root.traverse("postorder"):
+        if node.is_leaf():
+            i = node2range[node][0]
+            if has_profile[i]:
+                node._std_profile = [0.0] * len(node._profile)
+                node2stats[node] = (valid[i].astype(float),
+                                    numpy.where(valid[i], matrix[i], 0.0),
+                                    numpy.zeros(matrix.shape[1]))
+            continue
+
+        # Merges (count, mean, M2) values of children at every position
+        count, mean, m2 = None, None, None
+        for ch in node.children:
+            if ch not in node2stats:
+                continue
+            ch_count, ch_mean, ch_m2 = node2stats.pop(ch)
+            if count is None:
+                count, mean, m2 = ch_count, ch_mean, ch_m2
+                continue
+            total = count + ch_count
+            with numpy.errstate(invalid="ignore", divide="ignore"):
+                ratio = numpy.where(total > 0, ch_count / total, 0.0)
+            delta = ch_mean - mean
+            mean = mean + delta * ratio
+            m2 = m2 + ch_m2 + delta * delta * count * ratio
+            count = total
+
+        if count is None:
+            node._profile, node._std_profile = None, None
+        else:
+            node2stats[node] = (count, mean, m2)
+            with numpy.errstate(invalid="ignore", divide="ignore"):
+                node._profile = numpy.where(count > 0, mean, numpy.nan)
+                node._std_profile = numpy.sqrt(m2 / count)
+
+def update_validation(root, fdist):
+    """ Calculates mean and deviation profiles, silhouette values and
+    inter/intra-cluster distances for all nodes under root (included),
+    as :func:`get_avg_profile` and :func:`get_silhouette_width` would
+    do node by node.
+
+    Distances are computed in batch (one call per node and sister) for
+    the built-in euclidean, pearson and spearman distances.
+
+    Returns a dictionary with the Dunn index of every internal node,
+    using its children as clusters.
+    """
+    leaves, node2range, matrix, has_profile = _get_leaf_data(root)
+    _update_profiles(root, leaves, node2range, matrix, has_profile)
+    vdist = get_vectorized_dist(fdist)
+
+    # Leaves with no profile are skipped, so the profiles under every
+    # node are a contiguous block of rows in the matrix of valid ones
+    matrix = matrix[has_profile]
+    positions = numpy.concatenate([[0], numpy.cumsum(has_profile)])
+    block_dist = _get_block_dist(fdist, matrix)
+
+    # item intraclsuterdist -> Centroid Diameter, for all leaves under
+    # every node
+    node2block = {}
+    node2intra = {}
+    for node in root.traverse():
+        start, end = node2range[node]
+        node2block[node] = (positions[start], positions[end])
+        if node._profile is None:
+            node2intra[node] = numpy.zeros(0)
+        else:
+            node2intra[node] = block_dist(positions[start], positions[end],
+                                          node._profile) * 2
+
+    node2dunn = {}
+    for node in root.traverse():
+        start, end = node2block[node]
+        silhouette = []
+        intra_dist = []
+        inter_dist = []
+        if node.up is not None and end > start:
+            a = node2intra[node]
+            for st in node.up.children:
+                if st is node or st._profile is None:
+                    continue
+                # intracluster dist -> Centroid Linkage
+                b = block_dist(start, end, st._profile)
+                intra_dist.append(a)
+                inter_dist.append(b)
+                silhouette.append(_get_silhouette_values(a, b))
+
+        node._silhouette = _get_finite_mean(silhouette)
+        node._intracluster_dist = _get_finite_mean(intra_dist)
+        node._intercluster_dist = _get_finite_mean(inter_dist)
+
+        if len(node.children) > 1:
+            node2dunn[node] = _get_dunn_index(vdist, node.children, node2intra)
+    return node2dunn
+
+def _get_dunn_index(vdist, clusters, node2intra):
+    intra_dist = _concat([node2intra[c] for c in clusters])
+    if not len(intra_dist) or any(c._profile is None for c in clusters):
+        return numpy.nan
+    max_a = numpy.max(intra_dist)
+    profiles = numpy.asarray([c._profile for c in clusters], dtype=float)
+    min_b = min([numpy.min(vdist(profiles[i+1:], profiles[i]))
+                 for i in range(len(clusters) - 1)])
+    if max_a == 0.0:
+        return 0.0
+    return min_b / max_a
+
+
 # ####################
 # distance functions
 # ####################
@@ -204,4 +356,123 @@ def square_euclidean_dist(v1,v2):
         raise ValueError("Cannot calculate values")
     return  distance/valids
 
+
+# ####################
+# vectorized distance functions
+# ####################
+
+def get_vectorized_dist(fdist):
+    """ Returns a function computing the distance between every row of
+    a matrix and a given vector. Built-in distances are computed with
+    NumPy operations, while any other function is called row by row.
+
+    Unlike their pairwise counterparts, vectorized distances return NaN
+    instead of raising an error when no valid positions are found.
+    """
+    if fdist in _VECTORIZED_DISTS:
+        return _VECTORIZED_DISTS[fdist]
+    def vdist(matrix, vector):
+        return numpy.array([fdist(row, vector) for row in matrix], dtype=float)
+    return vdist
+
+def _get_block_dist(fdist, matrix):
+    """ Returns a function computing the distance between a block of
+    consecutive rows of matrix and a given vector. Row data needed by
+    correlation distances (i.e. ranks) is calculated only once. """
+    if fdist is pearson_dist or fdist is spearman_dist:
+        rank = fdist is spearman_dist
+        values = _rank_rows(matrix) if rank else matrix
+        dev, norms, constant = _get_row_deviations(values)
+        def block_dist(start, end, vector):
+            vector = numpy.asarray(vector, dtype=float)
+            vvalues = _rank_rows(vector[None, :])[0] if rank else vector
+            dist = _correlation_dist(dev[start:end], norms[start:end],
+                                     constant[start:end], vvalues)
+            dist[_equal_rows(matrix[start:end], vector)] = 0.0
+            return dist
+    else:
+        vdist = get_vectorized_dist(fdist)
+        def block_dist(start, end, vector):
+            return vdist(matrix[start:end], vector)
+    return block_dist
+
+def _equal_rows(matrix, vector):
+    return (matrix == vector).all(axis=1)
+
+def _rank_rows(matrix):
+    """ Ranks the values of every row (1-based, ties get the average
+    rank, as in scipy.stats.rankdata). Rows containing non finite values
+    get NaN ranks. """
+    nrows, ncols = matrix.shape
+    order = numpy.argsort(matrix, axis=1, kind="mergesort")
+    values = numpy.take_along_axis(matrix, order, axis=1)
+    index = numpy.arange(ncols)
+    changes = values[:, 1:] != values[:, :-1]
+    true_col = numpy.ones((nrows, 1), dtype=bool)
+    # first and last sorted position of the group of ties of every value
+    starts = numpy.where(numpy.hstack([true_col, changes]), index, 0)
+    starts = numpy.maximum.accumulate(starts, axis=1)
+    ends = numpy.where(numpy.hstack([changes, true_col]), index, ncols)
+    ends = numpy.minimum.accumulate(ends[:, ::-1], axis=1)[:, ::-1]
+    ranks = numpy.empty(matrix.shape)
+    numpy.put_along_axis(ranks, order, (starts + ends) / 2.0 + 1, axis=1)
+    ranks[~numpy.isfinite(matrix).all(axis=1)] = numpy.nan
+    return ranks
+
+def _get_row_deviations(matrix):
+    dev = matrix - matrix.mean(axis=1)[:, None]
+    norms = numpy.sqrt((dev * dev).sum(axis=1))
+    # correlation is not defined for constant profiles
+    constant = _equal_rows(matrix, matrix[:, :1])
+    return dev, norms, constant
+
+def _correlation_dist(dev, norms, constant, vector):
+    vdev, vnorm, vconstant = _get_row_deviations(vector[None, :])
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        r = numpy.dot(dev, vdev[0]) / (norms * vnorm[0])
+    dist = 1.0 - numpy.clip(r, -1.0, 1.0)
+    # perfectly correlated vectors get a distance of exactly 0, as with
+    # scipy, despite rounding errors
+    dist[numpy.abs(dist) < 1e-12] = 0.0
+    dist[constant] = numpy.nan
+    if vconstant[0]:
+        dist.fill(numpy.nan)
+    return dist
+
+def square_euclidean_dist_matrix(matrix, vector):
+    matrix = numpy.asarray(matrix, dtype=float)
+    vector = numpy.asarray(vector, dtype=float)
+    valid = numpy.isfinite(matrix) & numpy.isfinite(vector)
+    diff = numpy.where(valid, matrix - vector, 0.0)
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        dist = (diff * diff).sum(axis=1) / valid.sum(axis=1)
+    dist[_equal_rows(matrix, vector)] = 0.0
+    return dist
+
+def euclidean_dist_matrix(matrix, vector):
+    return numpy.sqrt(square_euclidean_dist_matrix(matrix, vector))
+
+def pearson_dist_matrix(matrix, vector):
+    matrix = numpy.asarray(matrix, dtype=float)
+    vector = numpy.asarray(vector, dtype=float)
+    dev, norms, constant = _get_row_deviations(matrix)
+    dist = _correlation_dist(dev, norms, constant, vector)
+    dist[_equal_rows(matrix, vector)] = 0.0
+    return dist
+
+def spearman_dist_matrix(matrix, vector):
+    matrix = numpy.asarray(matrix, dtype=float)
+    vector = numpy.asarray(vector, dtype=float)
+    dev, norms, constant = _get_row_deviations(_rank_rows(matrix))
+    dist = _correlation_dist(dev, norms, constant, _rank_rows(vector[None, :])[0])
+    dist[_equal_rows(matrix, vector)] = 0.0
+    return dist
+
+_VECTORIZED_DISTS = {
+    euclidean_dist: euclidean_dist_matrix,
+    square_euclidean_dist: square_euclidean_dist_matrix,
+    pearson_dist: pearson_dist_matrix,
+    spearman_dist: spearman_dist_matrix,
+}
+
 default_dist = spearman_dist
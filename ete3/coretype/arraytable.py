@@ -45,7 +45,8 @@ import math
 from os import path
 
 from .. import numpy
-from ..parser.text_arraytable import write_arraytable, read_arraytable
+from ..parser.text_arraytable import (write_arraytable, read_arraytable,
+                                      write_npy_arraytable, read_npy_arraytable)
 import six
 from six.moves import range
 
@@ -62,7 +63,7 @@ class ArrayTable(object):
     def __str__(self):
         return str(self.matrix)
 
-    def __init__(self, matrix_file=None, mtype="float"):
+    def __init__(self, matrix_file=None, mtype="float", mmap_mode="r"):
         self.colNames  = []
         self.rowNames  = []
         self.colValues = {}
@@ -70,8 +71,13 @@ class ArrayTable(object):
         self.matrix   = None
         self.mtype = None
 
-        # If matrix file is supplied
-        if matrix_file is not None:
+        # If matrix file is supplied. Binary (.npy) matrices saved with
+        # write_npy() are memory mapped using mmap_mode
+        if matrix_file is not None and matrix_file.endswith(".npy"):
+            read_npy_arraytable(matrix_file, \
+                                mmap_mode=mmap_mode, \
+                                arraytable_object = self)
+        elif matrix_file is not None:
             read_arraytable(matrix_file, \
                             mtype=mtype, \
                             arraytable_object = self)
@@ -191,20 +197,29 @@ class ArrayTable(object):
         self.matrix = m
         self.colValues.clear()
         self.rowValues.clear()
-        # link columns names to vectors
-        i = 0
-        for colname in self.colNames:
-            self.colValues[colname] = self.matrix[:,i]
-            i+=1
-        # link row names to vectors
-        i = 0
-        for rowname in self.rowNames:
-            self.rowValues[rowname] = self.matrix[i,:]
-            i+=1
+        # link columns and row names to vectors
+        self.colValues.update(zip(self.colNames, self.matrix.T))
+        self.rowValues.update(zip(self.rowNames, self.matrix))
 
     def write(self, fname, colnames=None):
         write_arraytable(self, fname, colnames=colnames)
 
+    def write_npy(self, fname):
+        """
+        .. versionadded: 3.1
+
+        Saves the matrix as a binary NumPy file (.npy), plus a sidecar
+        file (.npy.names) with row and column names. Saved tables are
+        memory mapped when loaded again by ArrayTable or ClusterTree:
+
+        ::
+
+          A = ArrayTable("expression.txt", mtype="float32")
+          A.write_npy("expression.npy")
+          t = ClusterTree("tree.nw", text_array="expression.npy")
+        """
+        write_npy_arraytable(self, fname)
+
 
 
 def get_centroid_dist(vcenter,vlist,fdist):
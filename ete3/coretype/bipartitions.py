@@ -0,0 +1,271 @@
+# #START_LICENSE###########################################################
+#
+#
+# This file is part of the Environment for Tree Exploration program
+# (ETE).  http://etetoolkit.org
+#
+# ETE is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ETE is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public
+# License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ETE.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#                     ABOUT THE ETE PACKAGE
+#                     =====================
+#
+# ETE is distributed under the GPL copyleft license (2008-2015).
+#
+# If you make use of ETE in published work, please cite:
+#
+# Jaime Huerta-Cepas, Joaquin Dopazo and Toni Gabaldon.
+# ETE: a python Environment for Tree Exploration. Jaime BMC
+# Bioinformatics 2010,:24doi:10.1186/1471-2105-11-24
+#
+# Note that extra references to the specific methods implemented in
+# the toolkit may be available in the documentation.
+#
+# More info at http://etetoolkit.org. Contact: huerta@embl.de
+#
+#
+# #END_LICENSE#############################################################
+from __future__ import absolute_import
+from __future__ import print_function
+
+from six.moves import range
+
+from .. import numpy
+from .tree import TreeError
+
+__all__ = ["robinson_foulds_matrix"]
+
+# Support value assumed for unrooted partitions not matching any node
+_NO_SUPPORT = 999999999
+
+def _count_bits(value):
+    return bin(value).count("1")
+
+class _TreeBipartitions(object):
+    """
+    Integer bitset encoding of all the nodes of a tree. Each leaf is
+    mapped to a bit of a leaf index shared by all compared trees, and
+    every node is represented by the bitset of its descendant leaves.
+    """
+    __slots__ = ["nodes", "leafmask", "dupmask", "_edges"]
+
+    def __init__(self, tree, attr, leaf_index):
+        self.nodes = []  # (bitset, support) in postorder
+        self.leafmask = 0
+        self.dupmask = 0
+        self._edges = None
+
+        node2bits = {}
+        for node in tree.traverse("postorder"):
+            if node.is_leaf():
+                bits = 0
+                if hasattr(node, attr):
+                    bits = leaf_index[getattr(node, attr)]
+                    if self.leafmask & bits:
+                        self.dupmask |= bits
+                    self.leafmask |= bits
+            else:
+                bits = 0
+                for ch in node.children:
+                    bits |= node2bits.pop(ch)
+            node2bits[node] = bits
+            self.nodes.append((bits, node.support))
+
+    def get_edges(self, common, unrooted, min_support):
+        """
+        Returns the set of edges (restricted to the leaves in common),
+        the subset of edges discarded by min_support, and the number of
+        valid edges counted for the maximum RF distance.
+        """
+        if common == self.leafmask and self._edges is not None:
+            return self._edges
+
+        # support values of the (last visited) node with each content
+        support = {}
+        for bits, node_support in self.nodes:
+            support[bits & common] = node_support
+
+        if unrooted:
+            lowbit = common & -common
+            edges = set()
+            for side1 in support:
+                side2 = common ^ side1
+                # Partitions are identified by their first side, which is
+                # empty for the root partition, or the side containing the
+                # lowest leaf otherwise
+                if not side1 or not side2:
+                    edges.add(0)
+                elif side1 & lowbit:
+                    edges.add(side1)
+                else:
+                    edges.add(side2)
+            if not common:
+                edges.discard(0)
+
+            discard = set()
+            if min_support:
+                for key in edges:
+                    node_support = support.get(key, support.get(common ^ key, _NO_SUPPORT))
+                    if node_support < min_support:
+                        discard.add(key)
+
+            nparts = 0
+            ncommon = _count_bits(common)
+            for key in edges - discard:
+                size = _count_bits(key)
+                if size > 1 and ncommon - size > 1:
+                    nparts += 1
+        else:
+            edges = set(support)
+            edges.discard(0)
+
+            discard = set()
+            if min_support:
+                discard = set([key for key in edges if support[key] < min_support])
+
+            nparts = len([True for key in edges - discard if key & (key - 1)])
+
+        result = (edges, discard, nparts)
+        if common == self.leafmask:
+            self._edges = result
+        return result
+
+def _compare(bip1, bip2, unrooted, min_support_t1, min_support_t2):
+    common = bip1.leafmask & bip2.leafmask
+    if bip1.dupmask & common:
+        raise TreeError('Duplicated items found in source tree')
+    if bip2.dupmask & common:
+        raise TreeError('Duplicated items found in reference tree')
+
+    edges1, discard1, nparts1 = bip1.get_edges(common, unrooted, min_support_t1)
+    edges2, discard2, nparts2 = bip2.get_edges(common, unrooted, min_support_t2)
+
+    rf = len(((edges1 ^ edges2) - discard2) - discard1)
+    if unrooted:
+        max_rf = nparts1 + nparts2
+    else:
+        # root partitions are not counted
+        max_rf = nparts1 + nparts2 - 2
+    return rf, max_rf
+
+# Data shared with worker processes
+_WORKER_DATA = None
+
+def _init_worker(*args):
+    global _WORKER_DATA
+    _WORKER_DATA = args
+
+def _compare_row(i, data=None):
+    if data is None:
+        data = _WORKER_DATA
+    bips1, bips2, symmetric, unrooted, min_support_t1, min_support_t2 = data
+    start = i + 1 if symmetric else 0
+    return [_compare(bips1[i], bips2[j], unrooted, min_support_t1, min_support_t2)
+            for j in range(start, len(bips2))]
+
+def robinson_foulds_matrix(trees1, trees2=None, attr_t1="name", attr_t2="name",
+                           unrooted_trees=False, min_support_t1=0.0,
+                           min_support_t2=0.0, normalized=False, cpus=1):
+    """
+    .. versionadded: 3.1
+
+    Computes the Robinson-Foulds distance between every pair of trees
+    in two collections, returning the same values as
+    :func:`TreeNode.robinson_foulds`. The bipartitions of each tree are
+    encoded only once as integer bitsets over a leaf index shared by all
+    trees, so that every comparison is reduced to a few set operations.
+
+    :argument trees1: list of tree instances.
+
+    :argument None trees2: list of reference tree instances. If not
+      provided, all trees in ``trees1`` are compared against each other.
+
+    :argument name attr_t1: Compare trees using a custom node attribute
+      as a node name in trees1.
+
+    :argument name attr_t2: Compare trees using a custom node attribute
+      as a node name in trees2.
+
+    :argument False unrooted_trees: If True, consider trees as unrooted.
+
+    :argument 0.0 min_support_t1: discard branches in trees1 with support
+      values lower than this threshold.
+
+    :argument 0.0 min_support_t2: discard branches in trees2 with support
+      values lower than this threshold.
+
+    :argument False normalized: If True, each RF distance is divided by
+      the maximum RF distance of the corresponding pair of trees (NaN
+      if the maximum is zero but the trees differ).
+
+    :argument 1 cpus: number of processes used to compare trees.
+
+    :returns: a NumPy matrix with one row per tree in ``trees1`` and one
+      column per tree in ``trees2``.
+    """
+    if numpy is None:
+        raise TreeError("NumPy is required to compute RF distance matrices")
+
+    symmetric = trees2 is None
+    if symmetric:
+        trees2, attr_t2, min_support_t2 = trees1, attr_t1, min_support_t1
+
+    if not unrooted_trees:
+        for t in (trees1 if symmetric else list(trees1) + list(trees2)):
+            if len(t.children) > 2:
+                raise TreeError("Unrooted tree found! You may want to activate the unrooted_trees flag.")
+
+    # Shared leaf index, in sorted order of leaf names
+    names = set()
+    for trees, attr in [(trees1, attr_t1), (trees2, attr_t2)]:
+        for t in trees:
+            names.update([getattr(n, attr) for n in t.iter_leaves() if hasattr(n, attr)])
+    leaf_index = dict([(name, 1 << i) for i, name in enumerate(sorted(names))])
+
+    bips1 = [_TreeBipartitions(t, attr_t1, leaf_index) for t in trees1]
+    if symmetric:
+        bips2 = bips1
+    else:
+        bips2 = [_TreeBipartitions(t, attr_t2, leaf_index) for t in trees2]
+
+    data = (bips1, bips2, symmetric, unrooted_trees, min_support_t1, min_support_t2)
+    if cpus > 1 and len(bips1) > 1:
+        from multiprocessing import Pool
+        pool = Pool(cpus, _init_worker, data)
+        try:
+            rows = pool.map(_compare_row, range(len(bips1)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        rows = [_compare_row(i, data) for i in range(len(bips1))]
+
+    dtype = "float64" if normalized else "int64"
+    matrix = numpy.zeros((len(bips1), len(bips2)), dtype=dtype)
+    for i, row in enumerate(rows):
+        start = i + 1 if symmetric else 0
+        for j, (rf, max_rf) in enumerate(row, start):
+            if normalized:
+                if not rf:
+                    value = 0.0
+                elif max_rf > 0:
+                    value = rf / float(max_rf)
+                else:
+                    value = numpy.nan
+            else:
+                value = rf
+            matrix[i, j] = value
+            if symmetric:
+                matrix[j, i] = value
+    return matrix
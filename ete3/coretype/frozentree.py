@@ -0,0 +1,672 @@
+# #START_LICENSE###########################################################
+#
+#
+# This file is part of the Environment for Tree Exploration program
+# (ETE).  http://etetoolkit.org
+#
+# ETE is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ETE is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public
+# License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ETE.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#                     ABOUT THE ETE PACKAGE
+#                     =====================
+#
+# ETE is distributed under the GPL copyleft license (2008-2015).
+#
+# If you make use of ETE in published work, please cite:
+#
+# Jaime Huerta-Cepas, Joaquin Dopazo and Toni Gabaldon.
+# ETE: a python Environment for Tree Exploration. Jaime BMC
+# Bioinformatics 2010,:24doi:10.1186/1471-2105-11-24
+#
+# Note that extra references to the specific methods implemented in
+# the toolkit may be available in the documentation.
+#
+# More info at http://etetoolkit.org. Contact: huerta@embl.de
+#
+#
+# #END_LICENSE#############################################################
+from __future__ import absolute_import
+from __future__ import print_function
+
+from array import array
+from collections import deque
+
+import six
+
+from ..parser.newick import (_get_newick_string, _scan_newick, _parse_label,
+                             _parse_nhx, write_newick, NewickError)
+from .tree import (TreeNode, TreeError, DEFAULT_DIST, DEFAULT_SUPPORT,
+                   DEFAULT_NAME, _translate_nodes)
+
+__all__ = ["FrozenTree", "FrozenTreeNode"]
+
+BASIC_FEATURES = frozenset(["dist", "support", "name"])
+
+class _FrozenTreeData(object):
+    """
+    Array based storage of a complete tree structure. Nodes are identified
+    by their position in preorder, so that all descendants of node ``i`` are
+    found between positions ``i+1`` and ``end[i]``. Node names are stored in
+    a single string table, and NHX features in a sparse dictionary.
+    """
+    __slots__ = ["parent", "first_child", "next_sibling", "end", "dist",
+                 "support", "names", "name_offsets", "renamed",
+                 "extra_features", "_last_child", "_name_list"]
+
+    def __init__(self, root_dist=DEFAULT_DIST):
+        self.parent = array("i", [-1])
+        self.first_child = array("i", [-1])
+        self.next_sibling = array("i", [-1])
+        self.end = None
+        self.dist = array("d", [root_dist])
+        self.support = array("d", [DEFAULT_SUPPORT])
+        self.names = None
+        self.name_offsets = None
+        self.renamed = {}
+        self.extra_features = {}
+        # Only used while building the tree
+        self._last_child = array("i", [-1])
+        self._name_list = [DEFAULT_NAME]
+
+    def add_child(self, parent):
+        idx = len(self.parent)
+        self.parent.append(parent)
+        self.first_child.append(-1)
+        self.next_sibling.append(-1)
+        self.dist.append(DEFAULT_DIST)
+        self.support.append(DEFAULT_SUPPORT)
+        self._name_list.append(DEFAULT_NAME)
+        self._last_child.append(-1)
+        if self.first_child[parent] == -1:
+            self.first_child[parent] = idx
+        else:
+            self.next_sibling[self._last_child[parent]] = idx
+        self._last_child[parent] = idx
+        return idx
+
+    def set_data(self, idx, label, spec, quoted_names, remove_blanks=True):
+        container1, container2 = spec[0], spec[3]
+        value1, value2, nhx = _parse_label(label, spec, quoted_names, remove_blanks)
+        if value1 is not None:
+            self.set_value(idx, container1, value1)
+        if value2 is not None:
+            self.set_value(idx, container2, value2)
+        if nhx is not None:
+            for pname, pvalue in _parse_nhx(nhx):
+                self.set_value(idx, pname, pvalue)
+
+    def set_value(self, idx, attr, value):
+        if attr == "name":
+            if self._name_list is not None:
+                self._name_list[idx] = value
+            else:
+                self.renamed[idx] = value
+        elif attr in ("dist", "support"):
+            # NHX values are not converted by the parser
+            try:
+                value = float(value)
+            except ValueError:
+                raise NewickError("node %s must be a float number [%s]" %(attr, value))
+            getattr(self, attr)[idx] = value
+        else:
+            self.extra_features.setdefault(idx, {})[attr] = value
+
+    def get_name(self, idx):
+        if self.renamed and idx in self.renamed:
+            return self.renamed[idx]
+        return self.names[self.name_offsets[idx]:self.name_offsets[idx+1]]
+
+    def finish(self):
+        """ Builds the string table and preorder ranges once all nodes have
+        been loaded. """
+        offsets = array("l", [0])
+        total = 0
+        for name in self._name_list:
+            total += len(name)
+            offsets.append(total)
+        self.names = ''.join(self._name_list)
+        self.name_offsets = offsets
+
+        end = array("i", range(len(self.parent)))
+        parent = self.parent
+        for i in range(len(parent)-1, 0, -1):
+            p = parent[i]
+            if end[i] > end[p]:
+                end[p] = end[i]
+        self.end = end
+
+        self._name_list = None
+        self._last_child = None
+
+class FrozenTreeNode(object):
+    """
+    FrozenTreeNode (FrozenTree) is a read-mostly and memory efficient
+    version of :class:`TreeNode`. Topology is stored as arrays of integers
+    (parent, first child and next sibling of every node), branch lengths
+    and supports as arrays of floats, and node names within a single string
+    table. Node instances are lightweight views over such arrays, which are
+    created on demand and can be discarded at any time.
+
+    Topology cannot be modified, but node distances, supports, names and
+    extra features can be updated.
+
+    :argument newick: Path to the file containing the tree or, alternatively,
+       the text string containing the same information.
+
+    :argument 0 format: subnewick format (see :class:`TreeNode`).
+
+    :argument False quoted_node_names: Set to True if node names are quoted.
+
+    **Examples:**
+
+    ::
+
+        t = FrozenTree('/home/user/huge_tree.nw')
+        t = FrozenTree.from_tree(Tree('(A:1,(B:1,(C:1,D:1):0.5):0.5);'))
+        print(t.get_common_ancestor("C", "D").get_leaf_names())
+    """
+    __slots__ = ["_data", "_idx"]
+
+    def __init__(self, newick=None, format=0, quoted_node_names=False):
+        if newick is not None:
+            if not isinstance(newick, six.string_types):
+                raise NewickError("'newick' argument must be either a filename or a newick string.")
+            data = _FrozenTreeData(root_dist=0.0)
+            _scan_newick(_get_newick_string(newick), 0, format,
+                         quoted_node_names, data.add_child, data.set_data)
+        else:
+            data = _FrozenTreeData()
+        data.finish()
+        self._data = data
+        self._idx = 0
+
+    @staticmethod
+    def from_tree(tree):
+        """
+        Returns a frozen copy of a :class:`TreeNode` instance and all its
+        descendants.
+        """
+        data = _FrozenTreeData()
+        # Nodes are indexed as they are visited, so indexes follow preorder
+        to_visit = [(tree, -1)]
+        while to_visit:
+            node, parent = to_visit.pop()
+            idx = data.add_child(parent) if parent != -1 else 0
+            data._name_list[idx] = node.name
+            data.dist[idx] = node.dist
+            data.support[idx] = node.support
+            for fname in node.features:
+                if fname not in BASIC_FEATURES and hasattr(node, fname):
+                    data.set_value(idx, fname, getattr(node, fname))
+            to_visit.extend([(ch, idx) for ch in reversed(node.children)])
+        data.finish()
+
+        root = FrozenTreeNode.__new__(FrozenTreeNode)
+        root._data = data
+        root._idx = 0
+        return root
+
+    def to_tree(self, tree_class=TreeNode):
+        """
+        Returns a regular (mutable) tree containing the current node and all
+        its descendants.
+        """
+        data = self._data
+        idx2node = {}
+        for i in range(self._idx, data.end[self._idx]+1):
+            node = tree_class()
+            node.name = data.get_name(i)
+            node.dist = data.dist[i]
+            node.support = data.support[i]
+            if i in data.extra_features:
+                node.add_features(**data.extra_features[i])
+            if i != self._idx:
+                idx2node[data.parent[i]].add_child(node)
+            idx2node[i] = node
+        return idx2node[self._idx]
+
+    def _view(self, idx):
+        node = FrozenTreeNode.__new__(FrozenTreeNode)
+        node._data = self._data
+        node._idx = idx
+        return node
+
+    def _get_name(self):
+        return self._data.get_name(self._idx)
+    def _set_name(self, value):
+        self._data.renamed[self._idx] = value
+
+    def _get_dist(self):
+        return self._data.dist[self._idx]
+    def _set_dist(self, value):
+        try:
+            self._data.dist[self._idx] = float(value)
+        except ValueError:
+            raise TreeError('node dist must be a float number')
+
+    def _get_support(self):
+        return self._data.support[self._idx]
+    def _set_support(self, value):
+        try:
+            self._data.support[self._idx] = float(value)
+        except ValueError:
+            raise TreeError('node support must be a float number')
+
+    def _get_up(self):
+        parent = self._data.parent[self._idx]
+        return self._view(parent) if parent != -1 else None
+
+    def _get_children(self):
+        return [self._view(i) for i in self._iter_children_idx(self._idx)]
+
+    def _get_features(self):
+        return BASIC_FEATURES.union(self._data.extra_features.get(self._idx, ()))
+
+    #: Node name
+    name = property(fget=_get_name, fset=_set_name)
+    #: Branch length distance to parent node. Default = 0.0
+    dist = property(fget=_get_dist, fset=_set_dist)
+    #: Branch support for current node
+    support = property(fget=_get_support, fset=_set_support)
+    #: Pointer to parent node
+    up = property(fget=_get_up)
+    #: A list of children nodes
+    children = property(fget=_get_children)
+    #: Names of the features available in this node
+    features = property(fget=_get_features)
+
+    def __getattr__(self, attr):
+        # Only called for attributes not found in the node view, which are
+        # looked up within the extra features of the node
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        try:
+            return self._data.extra_features[self._idx][attr]
+        except KeyError:
+            raise AttributeError(attr)
+
+    def __eq__(self, other):
+        return isinstance(other, FrozenTreeNode) and \
+            self._data is other._data and self._idx == other._idx
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((id(self._data), self._idx))
+
+    def __nonzero__(self):
+        return True
+
+    def __bool__(self):
+        return True
+
+    def __repr__(self):
+        return "FrozenTree node '%s' (%s)" %(self.name, hex(self.__hash__()))
+
+    def __and__(self, value):
+        """ This allows to execute tree&'A' to obtain the descendant node
+        whose name is A"""
+        value = str(value)
+        for i in self._iter_levelorder_idx(self._idx):
+            if self._data.get_name(i) == value:
+                return self._view(i)
+        raise TreeError("Node not found")
+
+    def __str__(self):
+        return self.get_ascii(show_internal=False)
+
+    def __contains__(self, item):
+        """ Check if item belongs to this node. The 'item' argument must
+        be a node instance or its associated name."""
+        if isinstance(item, FrozenTreeNode):
+            return item._data is self._data and \
+                self._idx < item._idx <= self._data.end[self._idx]
+        elif type(item) == str:
+            return any(self._data.get_name(i) == item for i in self._iter_preorder_idx(self._idx))
+
+    def __len__(self):
+        """Node len returns number of leaves."""
+        first_child = self._data.first_child
+        return sum(1 for i in self._iter_preorder_idx(self._idx) if first_child[i] == -1)
+
+    def __iter__(self):
+        """ Iterator over leaf nodes"""
+        return self.iter_leaves()
+
+    def add_feature(self, pr_name, pr_value):
+        """
+        Add or update a node's feature.
+        """
+        if pr_name == "dist":
+            self.dist = pr_value
+        elif pr_name == "support":
+            self.support = pr_value
+        else:
+            self._data.set_value(self._idx, pr_name, pr_value)
+
+    def add_features(self, **features):
+        """
+        Add or update several features. """
+        for fname, fvalue in six.iteritems(features):
+            self.add_feature(fname, fvalue)
+
+    def del_feature(self, pr_name):
+        """
+        Permanently deletes a node's feature.
+        """
+        extra = self._data.extra_features.get(self._idx, {})
+        if pr_name in extra:
+            del extra[pr_name]
+
+    # Index based iterators
+    def _iter_children_idx(self, idx):
+        data = self._data
+        child = data.first_child[idx]
+        while child != -1:
+            yield child
+            child = data.next_sibling[child]
+
+    def _iter_preorder_idx(self, idx, is_leaf_fn=None):
+        if is_leaf_fn is None:
+            for i in range(idx, self._data.end[idx]+1):
+                yield i
+        else:
+            end = self._data.end
+            i = idx
+            last = end[idx]
+            while i <= last:
+                yield i
+                i = end[i] + 1 if is_leaf_fn(self._view(i)) else i + 1
+
+    def _iter_levelorder_idx(self, idx, is_leaf_fn=None):
+        data = self._data
+        tovisit = deque([idx])
+        while tovisit:
+            i = tovisit.popleft()
+            yield i
+            if not is_leaf_fn or not is_leaf_fn(self._view(i)):
+                child = data.first_child[i]
+                while child != -1:
+                    tovisit.append(child)
+                    child = data.next_sibling[child]
+
+    def _iter_prepostorder_idx(self, idx, is_leaf_fn=None, postorder_only=False):
+        data = self._data
+        to_visit = [idx]
+        while to_visit:
+            i = to_visit.pop(-1)
+            if i < 0:
+                # POSTORDER ACTIONS
+                yield (True, -i - 1)
+                continue
+
+            # PREORDER ACTIONS
+            if is_leaf_fn is None:
+                is_leaf = data.first_child[i] == -1
+            else:
+                is_leaf = is_leaf_fn(self._view(i))
+            if not is_leaf:
+                to_visit.append(-i - 1)
+                to_visit.extend(reversed(list(self._iter_children_idx(i))))
+            if not postorder_only or is_leaf:
+                yield (False, i)
+
+    # Topology
+    def get_children(self):
+        """
+        Returns an independent list of node's children.
+        """
+        return self.children
+
+    def get_sisters(self):
+        """
+        Returns an independent list of sister nodes.
+        """
+        parent = self._data.parent[self._idx]
+        if parent == -1:
+            return []
+        return [self._view(i) for i in self._iter_children_idx(parent) if i != self._idx]
+
+    def is_leaf(self):
+        """
+        Return True if current node is a leaf.
+        """
+        return self._data.first_child[self._idx] == -1
+
+    def is_root(self):
+        """
+        Returns True if current node has no parent
+        """
+        return self._data.parent[self._idx] == -1
+
+    def get_tree_root(self):
+        """
+        Returns the absolute root node of current tree structure.
+        """
+        return self._view(0)
+
+    def iter_ancestors(self):
+        """
+        Iterates over the list of all ancestor nodes from current node
+        to the current tree root.
+        """
+        parent = self._data.parent
+        i = parent[self._idx]
+        while i != -1:
+            yield self._view(i)
+            i = parent[i]
+
+    def get_ancestors(self):
+        """
+        Returns the list of all ancestor nodes from current node to
+        the current tree root.
+        """
+        return [n for n in self.iter_ancestors()]
+
+    # Traversing
+    def traverse(self, strategy="levelorder", is_leaf_fn=None):
+        """
+        Returns an iterator to traverse the tree structure under this
+        node. See :func:`TreeNode.traverse` for documentation.
+        """
+        if strategy == "preorder":
+            indexes = self._iter_preorder_idx(self._idx, is_leaf_fn)
+        elif strategy == "levelorder":
+            indexes = self._iter_levelorder_idx(self._idx, is_leaf_fn)
+        elif strategy == "postorder":
+            indexes = (i for post, i in self._iter_prepostorder_idx(
+                self._idx, is_leaf_fn, postorder_only=True))
+        else:
+            raise ValueError("Unknown traversing strategy: %s" %strategy)
+        return (self._view(i) for i in indexes)
+
+    def iter_prepostorder(self, is_leaf_fn=None):
+        """
+        Iterate over all nodes in a tree yielding every node in both
+        pre and post order. Each iteration returns a postorder flag
+        (True if node is being visited in postorder) and a node
+        instance.
+        """
+        for post, i in self._iter_prepostorder_idx(self._idx, is_leaf_fn):
+            yield (post, self._view(i))
+
+    def iter_descendants(self, strategy="levelorder", is_leaf_fn=None):
+        """
+        Returns an iterator over all descendant nodes.
+        """
+        for n in self.traverse(strategy=strategy, is_leaf_fn=is_leaf_fn):
+            if n._idx != self._idx:
+                yield n
+
+    def get_descendants(self, strategy="levelorder", is_leaf_fn=None):
+        """
+        Returns a list of all (leaves and internal) descendant nodes.
+        """
+        return [n for n in self.iter_descendants(strategy=strategy,
+                                                 is_leaf_fn=is_leaf_fn)]
+
+    def _iter_leaves_idx(self, is_leaf_fn=None):
+        if is_leaf_fn is None:
+            first_child = self._data.first_child
+            for i in self._iter_preorder_idx(self._idx):
+                if first_child[i] == -1:
+                    yield i
+        else:
+            for i in self._iter_preorder_idx(self._idx, is_leaf_fn):
+                if is_leaf_fn(self._view(i)):
+                    yield i
+
+    def iter_leaves(self, is_leaf_fn=None):
+        """
+        Returns an iterator over the leaves under this node.
+        """
+        for i in self._iter_leaves_idx(is_leaf_fn):
+            yield self._view(i)
+
+    def get_leaves(self, is_leaf_fn=None):
+        """
+        Returns the list of terminal nodes (leaves) under this node.
+        """
+        return [n for n in self.iter_leaves(is_leaf_fn=is_leaf_fn)]
+
+    def iter_leaf_names(self, is_leaf_fn=None):
+        """
+        Returns an iterator over the leaf names under this node.
+        """
+        get_name = self._data.get_name
+        for i in self._iter_leaves_idx(is_leaf_fn):
+            yield get_name(i)
+
+    def get_leaf_names(self, is_leaf_fn=None):
+        """
+        Returns the list of terminal node names under the current
+        node.
+        """
+        return [name for name in self.iter_leaf_names(is_leaf_fn=is_leaf_fn)]
+
+    def iter_search_nodes(self, **conditions):
+        """
+        Search nodes in an iterative way. Matches are yielded as they
+        are being found.
+        """
+        for n in self.traverse():
+            conditions_passed = 0
+            for key, value in six.iteritems(conditions):
+                if hasattr(n, key) and getattr(n, key) == value:
+                    conditions_passed +=1
+            if conditions_passed == len(conditions):
+                yield n
+
+    def search_nodes(self, **conditions):
+        """
+        Returns the list of nodes matching a given set of conditions.
+        """
+        return [n for n in self.iter_search_nodes(**conditions)]
+
+    def get_leaves_by_name(self, name):
+        """
+        Returns a list of leaf nodes matching a given name.
+        """
+        get_name = self._data.get_name
+        return [self._view(i) for i in self._iter_leaves_idx() if get_name(i) == name]
+
+    def get_common_ancestor(self, *target_nodes):
+        """
+        Returns the first common ancestor between this node and a given
+        list of 'target_nodes'. Nodes can be given as node instances or
+        node names.
+        """
+        if len(target_nodes) == 1 and type(target_nodes[0]) \
+                in set([set, tuple, list, frozenset]):
+            target_nodes = target_nodes[0]
+
+        target_nodes = _translate_nodes(self, *target_nodes)
+        if type(target_nodes) != list:
+            if target_nodes == self:
+                return self
+            target_nodes = [target_nodes, self]
+
+        for n in target_nodes:
+            if n._data is not self._data:
+                raise TreeError("Nodes are not connected!")
+
+        indexes = [n._idx for n in target_nodes]
+        lowest, highest = min(indexes), max(indexes)
+        # In preorder, the common ancestor is the first ancestor of the
+        # lowest index whose range of descendants includes the highest one
+        data = self._data
+        common = lowest
+        while data.end[common] < highest:
+            common = data.parent[common]
+        return self._view(common)
+
+    def get_distance(self, target, target2=None, topology_only=False):
+        """
+        Returns the distance between two nodes. If only one target is
+        specified, it returns the distance between the target and the
+        current node. See :func:`TreeNode.get_distance`.
+        """
+        if target2 is None:
+            target2 = self
+            root = self.get_tree_root()
+        else:
+            root = self
+
+        target, target2 = _translate_nodes(root, target, target2)
+        ancestor = root.get_common_ancestor(target, target2)._idx
+
+        data = self._data
+        dist = 0.0
+        for i in [target2._idx, target._idx]:
+            while i != ancestor:
+                if topology_only:
+                    if i != target._idx:
+                        dist += 1
+                else:
+                    dist += data.dist[i]
+                i = data.parent[i]
+        return dist
+
+    def write(self, features=None, outfile=None, format=0, is_leaf_fn=None,
+              format_root_node=False, dist_formatter=None, support_formatter=None,
+              name_formatter=None, quoted_node_names=False):
+        """
+        Returns the newick representation of current node. See
+        :func:`TreeNode.write` for documentation.
+        """
+        nw = write_newick(self, features=features, format=format,
+                          is_leaf_fn=is_leaf_fn,
+                          format_root_node=format_root_node,
+                          dist_formatter=dist_formatter,
+                          support_formatter=support_formatter,
+                          name_formatter=name_formatter,
+                          quoted_names=quoted_node_names)
+
+        if outfile is not None:
+            with open(outfile, "w") as OUT:
+                OUT.write(nw)
+        else:
+            return nw
+
+    def get_ascii(self, show_internal=True, compact=False, attributes=None):
+        """
+        Returns a string containing an ascii drawing of the tree.
+        """
+        return self.to_tree().get_ascii(show_internal=show_internal,
+                                        compact=compact, attributes=attributes)
+
+# Alias
+#: .. currentmodule:: ete3
+FrozenTree = FrozenTreeNode
@@ -45,15 +45,192 @@ Currently, Fasta, Phylip sequencial and Phylip interleaved formats are
 supported.
 """
 from __future__ import absolute_import
+from __future__ import print_function
 
-from ..parser.fasta import read_fasta, write_fasta
+import os
+import mmap
+from sys import stderr as STDERR
+
+from .. import numpy
+from ..parser.fasta import read_fasta, write_fasta, IndexedFasta
 from ..parser.paml import read_paml, write_paml
 from ..parser.phylip import read_phylip, write_phylip
 import six
-from six.moves import zip
+from six.moves import zip, collections_abc
 
 __all__ = ["SeqGroup"]
 
+class SeqBuffer(collections_abc.MutableMapping):
+    """
+    .. versionadded: 3.1
+
+    Dictionary-like container of sequences, in which all sequences are
+    stored as bytes in a single contiguous buffer, plus a table with
+    the start and end offsets of each entry. It is used by
+    :class:`SeqGroup` as the ``id2seq`` dictionary when sequences are
+    loaded with ``storage="buffer"``.
+
+    :argument None filename: If provided, the buffer is written into
+      this file and memory-mapped when read, so sequences are not kept
+      in memory. Otherwise, a bytearray is used.
+      The file is closed by :func:`close`, when the buffer is used as
+      a context manager, or when the buffer is garbage collected.
+
+    Sequences are expected to contain only single byte (latin-1)
+    characters.
+    """
+    def __init__(self, filename=None):
+        self.filename = filename
+        self._offsets = {}
+        self._size = 0
+        self._mmap = None
+        if filename is None:
+            self._data = bytearray()
+            self._handle = None
+        else:
+            self._data = None
+            self._handle = open(filename, "w+b")
+
+    def __getitem__(self, seqid):
+        start, end = self._offsets[seqid]
+        return self._get_data()[start:end].decode("latin-1")
+
+    def __setitem__(self, seqid, seq):
+        # Sequences are always appended, so replaced sequences leave
+        # unused bytes in the buffer
+        seq = seq.encode("latin-1")
+        start = self._size
+        if self.filename is not None:
+            self._close_mmap()
+            if self._handle is None:
+                self._handle = open(self.filename, "r+b")
+            self._handle.seek(start)
+            self._handle.write(seq)
+        else:
+            self._data.extend(seq)
+        self._size += len(seq)
+        self._offsets[seqid] = (start, self._size)
+
+    def __delitem__(self, seqid):
+        del self._offsets[seqid]
+
+    def __iter__(self):
+        return iter(self._offsets)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __contains__(self, seqid):
+        return seqid in self._offsets
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        # __init__ may have failed before the handle was set
+        if getattr(self, "_handle", None) is not None:
+            self.close()
+
+    def __getstate__(self):
+        # file-backed buffers are pickled as regular bytes buffers
+        state = self.__dict__.copy()
+        state["_data"] = bytes(self._get_data()[:self._size])
+        state["_handle"] = state["_mmap"] = state["filename"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._data = bytearray(self._data)
+
+    def get_buffer(self):
+        """ Returns the underlying buffer (a bytearray or a read-only
+        memory map). """
+        return self._get_data()
+
+    def get_offsets(self, seqid):
+        """ Returns the (start, end) positions of a sequence within the
+        buffer. """
+        return self._offsets[seqid]
+
+    def close(self):
+        """ Closes the file used by memory-mapped buffers. """
+        if self._handle is not None:
+            self._close_mmap()
+            self._handle.close()
+            self._handle = None
+            # reopens the buffer in read only mode on next access
+            self._data = None
+
+    def _close_mmap(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _get_data(self):
+        if self._data is not None:
+            return self._data
+        if self._mmap is None:
+            if self._handle is not None:
+                self._handle.flush()
+                fileno = self._handle.fileno()
+            else:
+                self._handle = open(self.filename, "r+b")
+                fileno = self._handle.fileno()
+            if self._size == 0:
+                return b""
+            self._mmap = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+class IndexedSeqs(collections_abc.MutableMapping):
+    """
+    .. versionadded: 3.1
+
+    Dictionary-like container of the sequences in an indexed FASTA file
+    (see :class:`ete3.parser.fasta.IndexedFasta`). Sequences are read
+    from disk every time they are accessed, unless they have been
+    replaced.
+
+    :argument index: IndexedFasta instance.
+    """
+    def __init__(self, index):
+        self.index = index
+        # sequence ids point to index entries, or to sequences if replaced
+        self._items = dict([(i, i) for i in range(len(index.entries))])
+
+    def __getitem__(self, seqid):
+        value = self._items[seqid]
+        if isinstance(value, six.string_types):
+            return value
+        return self.index.get_seq(value)
+
+    def __setitem__(self, seqid, seq):
+        self._items[seqid] = seq
+
+    def __delitem__(self, seqid):
+        del self._items[seqid]
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, seqid):
+        return seqid in self._items
+
+    def close(self):
+        """ Closes the FASTA file. """
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
 class SeqGroup(object):
     """
     SeqGroup class can be used to store a set of sequences (aligned
@@ -71,6 +248,22 @@ class SeqGroup(object):
         of 10 chars. To avoid this effect, you can use the relaxed
         phylip format: ``phylip_relaxed`` and ``iphylip_relaxed``.
 
+    :argument dict storage: ``dict`` stores every sequence as a separate
+        string. ``buffer`` stores all sequences in a single contiguous
+        bytes buffer (see :class:`SeqBuffer`), which greatly reduces
+        memory usage for large alignments.
+
+    :argument None buffer_file: when storage is ``buffer``, sequences are
+        written into this file and memory-mapped, instead of being kept
+        in memory.
+
+    If storage is ``index``, sequences must be a FASTA file (plain or
+    compressed with bgzip). A samtools compatible index (.fai) is built
+    next to it, or reused if present, and sequences are only read from
+    disk when requested. Header comments are not loaded in this mode.
+    The file is kept open until :func:`close` is called, or the
+    SeqGroup is used as a context manager.
+
     ::
 
      msf = ">seq1\\nAAAAAAAAAAA\\n>seq2\\nTTTTTTTTTTTTT\\n"
@@ -90,7 +283,8 @@ class SeqGroup(object):
     def __iter__(self):
         return self.iter_entries()
 
-    def __init__(self, sequences=None , format="fasta", fix_duplicates=True, **kwargs):
+    def __init__(self, sequences=None , format="fasta", fix_duplicates=True,
+                 storage="dict", buffer_file=None, **kwargs):
         self.parsers = {
             "fasta": [read_fasta, write_fasta, {}],
             "phylip": [read_phylip, write_phylip, {"interleaved":False, "relaxed":False}],
@@ -103,20 +297,73 @@ class SeqGroup(object):
         self.id2name = {}
         self.name2id = {}
         self.id2comment= {}
-        self.id2seq = {}
+
+        if storage == "buffer":
+            self.id2seq = SeqBuffer(buffer_file)
+        elif storage == "dict":
+            self.id2seq = {}
+        elif storage == "index":
+            self._load_index(sequences, format, fix_duplicates)
+            return
+        else:
+            raise ValueError("Unsupported storage: [%s]" %storage)
 
         if sequences is not None:
             format = format.lower()
             if format in self.parsers:
                 read = self.parsers[format][0]
                 args = self.parsers[format][2]
-                read(sequences, obj=self, fix_duplicates=fix_duplicates, **args)
+                if storage == "buffer" and read is not read_fasta:
+                    # Other parsers grow sequences in place, so they are
+                    # moved into the buffer once loaded
+                    id2seq, self.id2seq = self.id2seq, {}
+                    read(sequences, obj=self, fix_duplicates=fix_duplicates, **args)
+                    id2seq.update(self.id2seq)
+                    self.id2seq = id2seq
+                else:
+                    read(sequences, obj=self, fix_duplicates=fix_duplicates, **args)
             else:
                 raise ValueError("Unsupported format: [%s]" %format)
 
     def __repr__(self):
         return "SeqGroup (%s)" %hex(self.__hash__())
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        .. versionadded: 3.1
+
+        Closes the files used by ``buffer`` (file backed) and ``index``
+        storages. Other storages are not affected.
+        """
+        if hasattr(self.id2seq, "close"):
+            self.id2seq.close()
+
+    def _load_index(self, fname, format, fix_duplicates):
+        if format.lower() != "fasta" or fname is None or not os.path.isfile(fname):
+            raise ValueError("Indexed storage requires a FASTA file")
+
+        index = IndexedFasta(fname)
+        self.id2seq = IndexedSeqs(index)
+        # duplicated names are fixed as in read_fasta
+        names = {}
+        for seqid, entry in enumerate(index.entries):
+            seq_name = entry.name
+            if fix_duplicates and seq_name in names:
+                tag = str(names[seq_name])
+                names[seq_name] += 1
+                old_name = seq_name
+                seq_name = tag+"_"+seq_name
+                print("Duplicated entry [%s] was renamed to [%s]" %(old_name, seq_name), file=STDERR)
+            self.id2name[seqid] = seq_name
+            self.name2id[seq_name] = seqid
+            names[seq_name] = names.get(seq_name, 0) + 1
+
     def write(self, format="fasta", outfile=None):
         """ Returns the text representation of the sequences in the
         supplied given format (default=FASTA). If "oufile" argument is
@@ -164,3 +411,141 @@ class SeqGroup(object):
         self.id2comment[seqid] = comments
         self.id2seq[seqid] = seq
 
+    def to_array(self, names=None):
+        """
+        .. versionadded: 3.1
+
+        Returns the alignment as a NumPy matrix of uint8 character codes,
+        with one row per sequence and one column per alignment position.
+        Sequences are copied at once into the matrix, with no per
+        character operations.
+
+        :argument None names: list of entry names to include, in the
+          given order. By default, all entries are used, in the same
+          order as :func:`iter_entries`.
+        """
+        if numpy is None:
+            raise ImportError("NumPy is required to build alignment matrices")
+        if names is None:
+            seqs = list(self.id2seq.values())
+        else:
+            seqs = [self.get_seq(name) for name in names]
+        if not seqs:
+            return numpy.zeros((0, 0), dtype=numpy.uint8)
+        ncols = len(seqs[0])
+        for seq in seqs:
+            if len(seq) != ncols:
+                raise ValueError("Sequences are not aligned: unequal lengths found")
+        data = "".join(seqs).encode("latin-1")
+        return numpy.frombuffer(data, dtype=numpy.uint8).reshape(len(seqs), ncols).copy()
+
+    @classmethod
+    def from_array(cls, matrix, names, comments=None, **kwargs):
+        """
+        .. versionadded: 3.1
+
+        Creates a new SeqGroup from a matrix of character codes, as
+        returned by :func:`to_array`.
+
+        :argument matrix: 2D NumPy array of uint8 values (or any other
+          array that can be converted to it).
+
+        :argument names: list of entry names, one per row.
+
+        :argument None comments: list of comments (lists of strings),
+          one per row.
+
+        Any other argument (i.e. storage) is passed to the SeqGroup
+        constructor.
+        """
+        if numpy is None:
+            raise ImportError("NumPy is required to read alignment matrices")
+        matrix = numpy.ascontiguousarray(matrix, dtype=numpy.uint8)
+        if matrix.ndim != 2:
+            raise ValueError("A 2D matrix is expected")
+        if len(names) != matrix.shape[0]:
+            raise ValueError("Number of names and matrix rows differ")
+
+        seqgroup = cls(**kwargs)
+        data = matrix.tobytes().decode("latin-1")
+        ncols = matrix.shape[1]
+        for seqid, name in enumerate(names):
+            seqgroup.id2name[seqid] = name
+            seqgroup.name2id[name] = seqid
+            seqgroup.id2comment[seqid] = list(comments[seqid]) if comments else []
+            seqgroup.id2seq[seqid] = data[seqid * ncols:(seqid + 1) * ncols]
+        return seqgroup
+
+    def get_gap_profile(self, gap_chars="-"):
+        """
+        .. versionadded: 3.1
+
+        Returns a NumPy array with the fraction of gaps in every column
+        of the alignment.
+
+        :argument - gap_chars: characters considered as gaps.
+        """
+        matrix = self.to_array()
+        return _get_gap_mask(matrix, gap_chars).mean(axis=0)
+
+    def get_identity_profile(self, gap_chars="-"):
+        """
+        .. versionadded: 3.1
+
+        Returns a NumPy array with the fraction of sequences sharing the
+        most frequent (non gap) character of every column of the
+        alignment. Comparisons are case sensitive.
+
+        :argument - gap_chars: characters considered as gaps.
+        """
+        matrix = self.to_array()
+        if not matrix.size:
+            return numpy.zeros(matrix.shape[1])
+        gaps = set(bytearray(gap_chars.encode("latin-1")))
+        best = numpy.zeros(matrix.shape[1], dtype=numpy.int64)
+        for code in numpy.unique(matrix):
+            if code not in gaps:
+                numpy.maximum(best, (matrix == code).sum(axis=0), out=best)
+        return best / float(matrix.shape[0])
+
+    def select_columns(self, columns, **kwargs):
+        """
+        .. versionadded: 3.1
+
+        Returns a new SeqGroup containing only the selected columns of
+        the alignment.
+
+        :argument columns: boolean mask with one value per column, or
+          list of column indexes.
+
+        ::
+
+          # removes columns with more than 50% of gaps
+          trimmed = alg.select_columns(alg.get_gap_profile() <= 0.5)
+        """
+        names = [name for name, seq, comments in self.iter_entries()]
+        comments = [comments for name, seq, comments in self.iter_entries()]
+        columns = numpy.asarray(columns)
+        if not columns.size:
+            # empty lists are converted into float arrays
+            columns = columns.astype(int)
+        matrix = self.to_array()[:, columns]
+        return self.__class__.from_array(matrix, names, comments, **kwargs)
+
+    def select_rows(self, names, **kwargs):
+        """
+        .. versionadded: 3.1
+
+        Returns a new SeqGroup containing only the entries with the
+        given names, in the given order.
+
+        :argument names: list of entry names.
+        """
+        comments = [self.id2comment.get(self.name2id[name], []) for name in names]
+        return self.__class__.from_array(self.to_array(names), names, comments, **kwargs)
+
+def _get_gap_mask(matrix, gap_chars):
+    mask = numpy.zeros(matrix.shape, dtype=bool)
+    for code in bytearray(gap_chars.encode("latin-1")):
+        mask |= (matrix == code)
+    return mask
@@ -51,6 +51,7 @@ from six.moves import (cPickle, map, range, zip)
 
 from ..parser.newick import read_newick, write_newick
 from .. import utils
+from .. import numpy
 
 # the following imports are necessary to set fixed styles and faces
 try:
@@ -108,6 +109,12 @@ class TreeNode(object):
           100      topology only
           ======  ==============================================
 
+    :argument False quoted_node_names: Set to True if node names are
+       quoted (i.e. they may contain newick reserved characters).
+
+    :argument regex newick_engine: newick parser implementation. Use "fast"
+       to read very large trees with the single-pass tokenizing parser.
+
     :returns: a tree node object which represents the base of the tree.
 
     **Examples:**
@@ -126,6 +133,9 @@ class TreeNode(object):
             self._dist = float(value)
         except ValueError:
             raise TreeError('node dist must be a float number')
+        # The LCA index also stores distances to the root
+        if self._lca_index is not None:
+            self._lca_index.drop()
 
     def _get_support(self):
         return self._support
@@ -139,6 +149,11 @@ class TreeNode(object):
         return self._up
     def _set_up(self, value):
         if type(value) == type(self) or value is None:
+            # Any topology change invalidates the LCA index
+            if self._lca_index is not None:
+                self._lca_index.drop()
+            if value is not None and value._lca_index is not None:
+                value._lca_index.drop()
             self._up = value
         else:
             raise TreeError("bad node_up type")
@@ -150,6 +165,8 @@ class TreeNode(object):
             for n in value:
                 if type(n) != type(self):
                     raise TreeError("Incorrect child node type")
+            if self._lca_index is not None:
+                self._lca_index.drop()
             self._children = value
         else:
             raise TreeError("Incorrect children type")
@@ -189,8 +206,11 @@ class TreeNode(object):
     faces = property(fget=_get_face_areas, \
                          fset=_set_face_areas)
 
+    # LCA index shared by all nodes in the tree (see build_lca_index)
+    _lca_index = None
+
     def __init__(self, newick=None, format=0, dist=None, support=None,
-                 name=None, quoted_node_names=False):
+                 name=None, quoted_node_names=False, newick_engine="regex"):
         self._children = []
         self._up = None
         self._dist = DEFAULT_DIST
@@ -210,9 +230,17 @@ class TreeNode(object):
         if newick is not None:
             self._dist = 0.0
             read_newick(newick, root_node = self, format=format,
-                        quoted_names=quoted_node_names)
+                        quoted_names=quoted_node_names, engine=newick_engine)
 
 
+    def __getstate__(self):
+        # LCA indexes refer to the whole tree, so they are never copied
+        if "_lca_index" in self.__dict__:
+            state = self.__dict__.copy()
+            del state["_lca_index"]
+            return state
+        return self.__dict__
+
     def __nonzero__(self):
         return True
 
@@ -715,6 +743,27 @@ class TreeNode(object):
                 #POSTORDER ACTIONS
                 yield (True, node)
 
+    def get_leaf_ranges(self):
+        """
+        .. versionadded: 3.1
+
+        Returns the list of leaves under this node, in preorder, and a
+        dictionary with the (start, end) range of positions in that
+        list covered by the leaves of every node, so the leaves of any
+        clade can be accessed as a slice.
+        """
+        leaves = []
+        node2range = {}
+        for postorder, node in self.iter_prepostorder():
+            if postorder:
+                node2range[node] = (node2range[node], len(leaves))
+            elif node.children:
+                node2range[node] = len(leaves)
+            else:
+                node2range[node] = (len(leaves), len(leaves) + 1)
+                leaves.append(node)
+        return leaves, node2range
+
     def _iter_descendants_postorder(self, is_leaf_fn=None):
         to_visit = [self]
         if is_leaf_fn is not None:
@@ -900,6 +949,12 @@ class TreeNode(object):
                 #the target_node provided
                 target_nodes = [target_nodes, self]
 
+        lca_index = self._get_lca_index()
+        if lca_index is not None and not get_path:
+            common = lca_index.get_common_ancestor(target_nodes)
+            if common is not None:
+                return common
+
         n2path = {}
         reference = []
         ref_node = None
@@ -932,6 +987,35 @@ class TreeNode(object):
         else:
             return common
 
+    def build_lca_index(self):
+        """
+        .. versionadded: 3.1
+
+        Builds an index of the whole tree structure (Euler tour plus
+        sparse table) that allows to find the common ancestor of any pair
+        of nodes in constant time. Once built, it is used automatically
+        by :func:`get_common_ancestor`, :func:`get_distance` and
+        :func:`check_monophyly` from any node of the tree.
+
+        The index is dropped as soon as the tree topology is modified, and
+        needs to be rebuilt to be used again.
+
+        Note that, when the index is available, branch length distances
+        are computed from cumulative root-to-node distances, so the last
+        decimal digits may differ from those obtained by summing branches.
+        """
+        root = self.get_tree_root()
+        index = _LCAIndex(root)
+        for node in index.nodes:
+            node._lca_index = index
+        return index
+
+    def _get_lca_index(self):
+        index = self._lca_index
+        if index is not None and index.nodes is not None:
+            return index
+        return None
+
     def iter_search_nodes(self, **conditions):
         """
         Search nodes in an iterative way. Matches are yielded as they
@@ -1016,6 +1100,13 @@ class TreeNode(object):
             root = self
 
         target, target2 = _translate_nodes(root, target, target2)
+
+        lca_index = self._get_lca_index()
+        if lca_index is not None:
+            dist = lca_index.get_distance(target, target2, topology_only)
+            if dist is not None:
+                return dist
+
         ancestor = root.get_common_ancestor(target, target2)
 
         dist = 0.0
@@ -1364,7 +1455,7 @@ class TreeNode(object):
                          tree_style=tree_style, win_name=name)
 
     def render(self, file_name, layout=None, w=None, h=None, \
-                       tree_style=None, units="px", dpi=90):
+                       tree_style=None, units="px", dpi=90, backend=None):
         """
         Renders the node structure as an image.
 
@@ -1381,9 +1472,19 @@ class TreeNode(object):
         :var None w: width of the image in :attr:`units`
         :var 90 dpi: dots per inches.
 
+        :var None backend: "qt" renders the image with Qt. "svg" uses
+          a Qt free renderer that writes SVG images directly (PDF and PNG
+          images require cairosvg) and supports TextFace, AttrFace,
+          RectFace and CircleFace. If None, Qt is used when available.
+
         """
 
-        from ..treeview import drawer
+        from ..treeview.svg_render import get_render_backend
+        if get_render_backend(backend) == "qt":
+            from ..treeview import drawer
+        else:
+            from ..treeview import svg_render as drawer
+
         if file_name.startswith('%%return'):
             return drawer.get_img(self, w=w, h=h,
                                   layout=layout, tree_style=tree_style,
@@ -1430,15 +1531,17 @@ class TreeNode(object):
             self.write(features=[], format_root_node=True)
             new_node = self.__class__(self.write(features=[]))
         elif method == "deepcopy":
-            parent = self.up
-            self.up = None
+            # Detaching the node temporarily does not modify topology, so
+            # the up setter (which drops the LCA index) is bypassed
+            parent = self._up
+            self._up = None
             new_node = copy.deepcopy(self)
-            self.up = parent
+            self._up = parent
         elif method == "cpickle":
-            parent = self.up
-            self.up = None
+            parent = self._up
+            self._up = None
             new_node = six.moves.cPickle.loads(six.moves.cPickle.dumps(self, 2))
-            self.up = parent
+            self._up = parent
         else:
             raise TreeError("Invalid copy method")
 
@@ -2168,18 +2271,26 @@ class TreeNode(object):
         if type(values) != set:
             values = set(values)
 
-        # This is the only time I traverse the tree, then I use cached
-        # leaf content
-        n2leaves = self.get_cached_content()
+        lca_index = self._get_lca_index()
+        if lca_index is None or unrooted:
+            # This is the only time I traverse the tree, then I use cached
+            # leaf content
+            n2leaves = self.get_cached_content()
+            all_leaves = n2leaves[self]
+        else:
+            # Common ancestors and leaf counts are available from the LCA
+            # index, so there is no need to cache the content of every node
+            n2leaves = None
+            all_leaves = self.get_leaves()
 
         # Raise an error if requested attribute values are not even present
         if ignore_missing:
-            found_values = set([getattr(n, target_attr) for n in n2leaves[self]])
+            found_values = set([getattr(n, target_attr) for n in all_leaves])
             missing_values = values - found_values
             values = values & found_values
 
         # Locate leaves matching requested attribute values
-        targets = set([leaf for leaf in n2leaves[self]
+        targets = set([leaf for leaf in all_leaves
                    if getattr(leaf, target_attr) in values])
         if not ignore_missing:
             if values - set([getattr(leaf, target_attr) for leaf in targets]):
@@ -2203,7 +2314,12 @@ class TreeNode(object):
             # get_common_ancestor function is smart enough to detect it
             # and avoid unnecessary traversing.
             common = self.get_common_ancestor(targets)
-            observed = n2leaves[common]
+            if n2leaves is not None:
+                observed = n2leaves[common]
+            elif lca_index.count_leaves(common) == len(targets):
+                observed = targets
+            else:
+                observed = common.get_leaves()
             foreign_leaves = set([leaf for leaf in observed
                               if getattr(leaf, target_attr) not in values])
 
@@ -2357,7 +2473,7 @@ class TreeNode(object):
         for n in target:
             _resolve(n)
 
-    def cophenetic_matrix(self):
+    def cophenetic_matrix(self, as_array=False, dtype="float64", memmap=None):
         """
         .. versionadded: 3.1.1
 
@@ -2418,9 +2534,32 @@ class TreeNode(object):
         We will also return the one dimensional array with the leaves in the order in which they appear in the matrix
         (i.e. the column and/or row headers).
 
-        :param filename: the optional file to write to. If not provided, output will be to standard output
+        When as_array is True, distances are computed with NumPy array
+        operations instead, which is much faster for large trees: the
+        patristic distance between two leaves is d(root, A) + d(root, B) -
+        2 * d(root, LCA(A, B)), and the root distance of every LCA is
+        written as a block of the matrix for each internal node, so each
+        cell is filled only once.
+
+        :argument False as_array: if True, a NumPy array is returned instead
+          of nested lists. Rows and columns follow the order of the tree
+          leaves (see :func:`get_leaves`) rather than sorted leaf names,
+          and duplicated leaf names are kept as separate rows.
+
+        :argument float64 dtype: NumPy data type of the returned array
+          (i.e. "float32" halves the memory used by large matrices). Only
+          used when as_array is True or memmap is provided.
+
+        :argument None memmap: if a file name is provided, the matrix is
+          written directly into a :class:`numpy.memmap` stored in that
+          file, which is returned. Implies as_array=True.
+
         :return: two-dimensional array and a one dimensional array
         """
+        if as_array or memmap is not None:
+            if numpy is None:
+                raise TreeError("NumPy is required to compute cophenetic arrays")
+            return self._cophenetic_array(dtype, memmap)
 
         leaves = self.get_leaves()
         paths = {x: set() for x in leaves}
@@ -2459,6 +2598,41 @@ class TreeNode(object):
                     output[i].append(leaf_distances[n][m])
         return output, allleaves
 
+    def _cophenetic_array(self, dtype, memmap):
+        # Leaves of every clade occupy a contiguous range of positions
+        # when visited in preorder
+        leaves, node2range = self.get_leaf_ranges()
+        root_dist = {self: 0.0}
+        for node in self.iter_descendants("preorder"):
+            root_dist[node] = root_dist[node.up] + node.dist
+
+        nleaves = len(leaves)
+        if memmap is not None:
+            matrix = numpy.memmap(memmap, dtype=dtype, mode="w+",
+                                  shape=(nleaves, nleaves))
+        else:
+            matrix = numpy.empty((nleaves, nleaves), dtype=dtype)
+        # the diagonal is not covered below; avoid arithmetic on garbage
+        numpy.fill_diagonal(matrix, 0)
+
+        # Fill every cell with the root distance of the LCA of the
+        # corresponding pair of leaves. Cells (i, j) with i under a child
+        # of node and j under any of its siblings have node as LCA.
+        for node, (start, end) in six.iteritems(node2range):
+            for ch in node.children:
+                ch_start, ch_end = node2range[ch]
+                matrix[ch_start:ch_end, start:ch_start] = root_dist[node]
+                matrix[ch_start:ch_end, ch_end:end] = root_dist[node]
+
+        leaf_dists = numpy.array([root_dist[n] for n in leaves], dtype=dtype)
+        matrix *= -2
+        matrix += leaf_dists[:, None]
+        matrix += leaf_dists[None, :]
+        numpy.fill_diagonal(matrix, 0)
+        if memmap is not None:
+            matrix.flush()
+        return matrix, [n.name for n in leaves]
+
     def add_face(self, face, column, position="branch-right"):
         """
         .. versionadded: 2.1
@@ -2586,6 +2760,127 @@ class TreeNode(object):
         from .. import _ph
         _ph.call()
 
+class _LCAIndex(object):
+    """
+    Lowest common ancestor index. The Euler tour of the tree is stored
+    together with a sparse table of range minimum queries, in which each
+    entry encodes the depth and preorder id of a node as a single integer
+    (depth * number_of_nodes + id).
+    """
+    def __init__(self, root):
+        from array import array
+
+        self.nodes = []   # nodes in preorder
+        self.node2id = {}
+        depth = array("l")
+        root_dist = array("d")
+        first = array("l")
+        euler = []
+
+        # Euler tour: every node is visited before its children, and again
+        # after visiting each of them
+        to_visit = [(root, iter(root.children))]
+        self._register(root, None, depth, root_dist, first, euler)
+        while to_visit:
+            node, children = to_visit[-1]
+            child = next(children, None)
+            if child is None:
+                to_visit.pop()
+                if to_visit:
+                    euler.append(self.node2id[to_visit[-1][0]])
+            else:
+                self._register(child, node, depth, root_dist, first, euler)
+                to_visit.append((child, iter(child.children)))
+
+        # leaf counts, accumulated in reverse preorder
+        nnodes = len(self.nodes)
+        leaf_count = array("l", [0]) * nnodes
+        for i in range(nnodes - 1, -1, -1):
+            node = self.nodes[i]
+            if not node.children:
+                leaf_count[i] += 1
+            if i:
+                leaf_count[self.node2id[node.up]] += leaf_count[i]
+
+        # sparse table
+        level = array("q", [depth[i] * nnodes + i for i in euler])
+        table = [level]
+        span = 1
+        while span * 2 <= len(level):
+            prev = table[-1]
+            table.append(array("q", map(min, prev[:len(prev)-span], prev[span:])))
+            span *= 2
+
+        self.nnodes = nnodes
+        self.depth = depth
+        self.root_dist = root_dist
+        self.leaf_count = leaf_count
+        self.first = first
+        self.table = table
+
+    def _register(self, node, parent, depth, root_dist, first, euler):
+        i = len(self.nodes)
+        self.nodes.append(node)
+        self.node2id[node] = i
+        if parent is None:
+            depth.append(0)
+            root_dist.append(0.0)
+        else:
+            parent_id = self.node2id[parent]
+            depth.append(depth[parent_id] + 1)
+            root_dist.append(root_dist[parent_id] + node.dist)
+        first.append(len(euler))
+        euler.append(i)
+
+    def drop(self):
+        """ Releases all index data. """
+        self.nodes = None
+        self.node2id = None
+        self.depth = self.root_dist = self.leaf_count = None
+        self.first = self.table = None
+
+    def _lca_id(self, id1, id2):
+        left, right = self.first[id1], self.first[id2]
+        if left > right:
+            left, right = right, left
+        k = (right - left + 1).bit_length() - 1
+        level = self.table[k]
+        return min(level[left], level[right - (1 << k) + 1]) % self.nnodes
+
+    def get_common_ancestor(self, nodes):
+        """ Returns the common ancestor of nodes, or None if any of them
+        is not indexed. """
+        try:
+            ids = [self.node2id[n] for n in nodes]
+        except KeyError:
+            return None
+        if not ids:
+            return None
+        common = ids[0]
+        for i in ids[1:]:
+            common = self._lca_id(common, i)
+        return self.nodes[common]
+
+    def get_distance(self, target, target2, topology_only=False):
+        """ Returns the distance between two nodes, or None if any of them
+        is not indexed. """
+        try:
+            id1, id2 = self.node2id[target], self.node2id[target2]
+        except KeyError:
+            return None
+        common = self._lca_id(id1, id2)
+        if topology_only:
+            # Same convention as TreeNode.get_distance: target itself is
+            # not counted
+            return float((self.depth[id2] - self.depth[common]) +
+                         max(self.depth[id1] - self.depth[common] - 1, 0))
+        else:
+            return self.root_dist[id1] + self.root_dist[id2] - 2 * self.root_dist[common]
+
+    def count_leaves(self, node):
+        """ Returns the number of leaves under node. """
+        return self.leaf_count[self.node2id[node]]
+
 def _translate_nodes(root, *nodes):
     name2node = dict([ [n, None] for n in nodes if type(n) is str])
     if name2node:
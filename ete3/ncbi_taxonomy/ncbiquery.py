@@ -51,6 +51,7 @@ except ImportError:
     # python 3 support
     import pickle
 
+from array import array
 from collections import defaultdict, Counter
 
 from hashlib import md5
@@ -62,12 +63,22 @@ import six
 from six.moves import map
 import warnings
 
+from ..utils import LRUCache
+
 
 __all__ = ["NCBITaxa", "is_taxadb_up_to_date"]
 
 DB_VERSION = 2
 DEFAULT_TAXADB = os.path.join(os.environ.get('HOME', '/'), '.etetoolkit', 'taxa.sqlite')
 
+# Suffix of the binary taxonomy index stored next to the database file
+TRAVERSE_INDEX_SUFFIX = ".traverse.idx"
+
+# Max number of taxid records kept in memory by each NCBITaxa instance
+DEFAULT_CACHE_SIZE = 500000
+# Max number of taxids included in a single SQL query
+QUERY_CHUNK_SIZE = 5000
+
 
 def is_taxadb_up_to_date(dbfile=DEFAULT_TAXADB):
     """Check if a valid and up-to-date taxa.sqlite database exists
@@ -90,14 +101,44 @@ def is_taxadb_up_to_date(dbfile=DEFAULT_TAXADB):
     return True
 
 
+def _iter_chunks(values, size=None):
+    values = list(values)
+    size = size or QUERY_CHUNK_SIZE
+    for i in range(0, len(values), size):
+        yield values[i:i+size]
+
+def _as_taxids(values):
+    taxids = set()
+    for v in values:
+        try:
+            taxids.add(int(v))
+        except (ValueError, TypeError):
+            pass
+    return taxids
+
 class NCBITaxa(object):
     """
     versionadded: 2.3
 
     Provides a local transparent connector to the NCBI taxonomy database.
+
+    Names, ranks and lineages of the queried taxids are kept in a
+    memory cache, so that repeated queries do not hit the database
+    again. See :func:`prefetch` and :func:`cache_info`.
+
+    :param None dbfile: path to the taxa.sqlite database file.
+
+    :param None taxdump_file: an alternative location of the
+        taxdump.tar.gz file used to (re)build the database.
+
+    :param 500000 cache_size: max number of taxids kept in the memory
+        cache (least recently used ones are discarded first). Use None
+        for an unbounded cache, or 0 to disable it.
     """
 
-    def __init__(self, dbfile=None, taxdump_file=None):
+    def __init__(self, dbfile=None, taxdump_file=None, cache_size=DEFAULT_CACHE_SIZE):
+        self._cache = LRUCache(cache_size)
+        self._traverse_index = None
 
         if not dbfile:
             self.dbfile = DEFAULT_TAXADB
@@ -131,10 +172,107 @@ class NCBITaxa(object):
             update_db(self.dbfile)
         else:
             update_db(self.dbfile, taxdump_file)
+        if getattr(self, "db", None) is not None:
+            # the database file has been replaced by a new one
+            self.db.close()
+            self._connect()
+        self._cache.clear()
+        if self._traverse_index is not None:
+            self._traverse_index.close()
+            self._traverse_index = None
 
     def _connect(self):
         self.db = sqlite3.connect(self.dbfile)
 
+    def _get_traverse_index(self):
+        """
+        Returns the memory mapped taxonomy index, which is created from
+        legacy traverse.pkl files if necessary.
+        """
+        if self._traverse_index is None:
+            fname = self.dbfile + TRAVERSE_INDEX_SUFFIX
+            if not os.path.exists(fname):
+                with open(self.dbfile + ".traverse.pkl", "rb") as CACHED_TRAVERSE:
+                    prepostorder = pickle.load(CACHED_TRAVERSE)
+                order, end = prepostorder_to_index(prepostorder)
+                try:
+                    write_traverse_index(order, end, fname)
+                except (IOError, OSError):
+                    # read only installations: the index is kept in memory
+                    data = get_traverse_index_data(order, end)
+                    self._traverse_index = TraverseIndex(data=data)
+            if self._traverse_index is None:
+                self._traverse_index = TraverseIndex(fname)
+        return self._traverse_index
+
+    def prefetch(self, taxids, lineages=False):
+        """
+        .. versionadded: 3.1
+
+        Loads the name, common name, rank and lineage of many taxids into
+        the memory cache using a few chunked queries.
+
+        :param taxids: a list of taxid numbers.
+
+        :param False lineages: if True, all taxids in the lineage of the
+            requested taxids are also loaded.
+        """
+        records = self._get_records(taxids)
+        if lineages:
+            all_taxids = set()
+            for record in six.itervalues(records):
+                all_taxids.update(record[3])
+            self._get_records(all_taxids)
+
+    def cache_info(self):
+        """
+        .. versionadded: 3.1
+
+        Returns a dictionary with the number of cache hits and misses
+        (counted per taxid), as well as the current and max size of the
+        cache.
+        """
+        return {"hits": self._cache.hits,
+                "misses": self._cache.misses,
+                "size": len(self._cache),
+                "maxsize": self._cache.maxsize}
+
+    def clear_cache(self):
+        """
+        .. versionadded: 3.1
+
+        Discards all cached taxid records and resets cache statistics.
+        """
+        self._cache.clear()
+
+    def _get_records(self, taxids):
+        """
+        Returns a dictionary with the (spname, common, rank, lineage) record
+        of every taxid found in the species table. Records not found in
+        the cache are loaded from the database.
+        """
+        records = {}
+        missing = []
+        cache = self._cache
+        for taxid in _as_taxids(taxids):
+            record = cache.get(taxid, False)
+            if record is False:
+                missing.append(taxid)
+            elif record is not None:
+                records[taxid] = record
+
+        for chunk in _iter_chunks(missing):
+            cmd = 'SELECT taxid, spname, common, rank, track FROM species WHERE taxid IN (%s);' %','.join(map(str, chunk))
+            for tax, spname, common, rank, track in self.db.execute(cmd).fetchall():
+                lineage = tuple(map(int, reversed(track.split(","))))
+                records[tax] = record = (spname, common, rank, lineage)
+                cache.set(tax, record)
+            # taxids not found are also cached, so they are not queried again
+            for taxid in chunk:
+                if taxid not in records:
+                    cache.set(taxid, None)
+        return records
+
     def _translate_merged(self, all_taxids):
         conv_all_taxids = set((list(map(int, all_taxids))))
         cmd = 'select taxid_old, taxid_new FROM merged WHERE taxid_old IN (%s)' %','.join(map(str, all_taxids))
@@ -193,29 +331,18 @@ class NCBITaxa(object):
     def get_rank(self, taxids):
         'return a dictionary converting a list of taxids into their corresponding NCBI taxonomy rank'
 
-        all_ids = set(taxids)
-        all_ids.discard(None)
-        all_ids.discard("")
-        query = ','.join(['"%s"' %v for v in all_ids])
-        cmd = "select taxid, rank FROM species WHERE taxid IN (%s);" %query
-        result = self.db.execute(cmd)
         id2rank = {}
-        for tax, spname in result.fetchall():
-            id2rank[tax] = spname
+        for tax, record in six.iteritems(self._get_records(taxids)):
+            id2rank[tax] = record[2]
         return id2rank
 
     def get_lineage_translator(self, taxids):
         """Given a valid taxid number, return its corresponding lineage track as a
         hierarchically sorted list of parent taxids.
         """
-        all_ids = set(taxids)
-        all_ids.discard(None)
-        all_ids.discard("")
-        query = ','.join(['"%s"' %v for v in all_ids])
-        result = self.db.execute('SELECT taxid, track FROM species WHERE taxid IN (%s);' %query)
         id2lineages = {}
-        for tax, track in result.fetchall():
-            id2lineages[tax] = list(map(int, reversed(track.split(","))))
+        for tax, record in six.iteritems(self._get_records(taxids)):
+            id2lineages[tax] = list(record[3])
 
         return id2lineages
 
@@ -227,32 +354,25 @@ class NCBITaxa(object):
         if not taxid:
             return None
         taxid = int(taxid)
-        result = self.db.execute('SELECT track FROM species WHERE taxid=%s' %taxid)
-        raw_track = result.fetchone()
-        if not raw_track:
+        record = self._get_records([taxid]).get(taxid)
+        if not record:
             #perhaps is an obsolete taxid
             _, merged_conversion = self._translate_merged([taxid])
             if taxid in merged_conversion:
-                result = self.db.execute('SELECT track FROM species WHERE taxid=%s' %merged_conversion[taxid])
-                raw_track = result.fetchone()
+                record = self._get_records([merged_conversion[taxid]]).get(merged_conversion[taxid])
             # if not raise error
-            if not raw_track:
-                #raw_track = ["1"]
+            if not record:
                 raise ValueError("%s taxid not found" %taxid)
             else:
                 warnings.warn("taxid %s was translated into %s" %(taxid, merged_conversion[taxid]))
 
-        track = list(map(int, raw_track[0].split(",")))
-        return list(reversed(track))
+        return list(record[3])
 
     def get_common_names(self, taxids):
-        query = ','.join(['"%s"' %v for v in taxids])
-        cmd = "select taxid, common FROM species WHERE taxid IN (%s);" %query
-        result = self.db.execute(cmd)
         id2name = {}
-        for tax, common_name in result.fetchall():
-            if common_name:
-                id2name[tax] = common_name
+        for tax, record in six.iteritems(self._get_records(taxids)):
+            if record[1]:
+                id2name[tax] = record[1]
         return id2name
 
     def get_taxid_translator(self, taxids, try_synonyms=True):
@@ -261,14 +381,9 @@ class NCBITaxa(object):
         """
 
         all_ids = set(map(int, taxids))
-        all_ids.discard(None)
-        all_ids.discard("")
-        query = ','.join(['"%s"' %v for v in all_ids])
-        cmd = "select taxid, spname FROM species WHERE taxid IN (%s);" %query
-        result = self.db.execute(cmd)
         id2name = {}
-        for tax, spname in result.fetchall():
-            id2name[tax] = spname
+        for tax, record in six.iteritems(self._get_records(all_ids)):
+            id2name[tax] = record[0]
 
         # any taxid without translation? lets tray in the merged table
         if len(all_ids) != len(id2name) and try_synonyms:
@@ -277,11 +392,8 @@ class NCBITaxa(object):
             new2old = {v: k for k,v in six.iteritems(old2new)}
 
             if old2new:
-                query = ','.join(['"%s"' %v for v in new2old])
-                cmd = "select taxid, spname FROM species WHERE taxid IN (%s);" %query
-                result = self.db.execute(cmd)
-                for tax, spname in result.fetchall():
-                    id2name[new2old[tax]] = spname
+                for tax, record in six.iteritems(self._get_records(new2old)):
+                    id2name[new2old[tax]] = record[0]
 
         return id2name
 
@@ -347,25 +459,14 @@ class NCBITaxa(object):
         if conversion:
             taxid = conversion[taxid]
 
-        with open(self.dbfile+".traverse.pkl", "rb") as CACHED_TRAVERSE:
-            prepostorder = pickle.load(CACHED_TRAVERSE)
-        descendants = {}
-        found = 0
-        for tid in prepostorder:
-            if tid == taxid:
-                found += 1
-            elif found == 1:
-                descendants[tid] = descendants.get(tid, 0) + 1
-            elif found == 2:
-                break
-
-        if not found:
+        descendants = self._get_traverse_index().get_descendants(taxid, intermediate_nodes=True)
+        if descendants is None:
             raise ValueError("taxid not found:%s" %taxid)
-        elif found == 1:
+        elif not descendants:
             return [taxid]
 
         if rank_limit or collapse_subspecies or return_tree:
-            tree = self.get_topology(list(descendants.keys()), intermediate_nodes=intermediate_nodes, collapse_subspecies=collapse_subspecies, rank_limit=rank_limit)
+            tree = self.get_topology(descendants, intermediate_nodes=intermediate_nodes, collapse_subspecies=collapse_subspecies, rank_limit=rank_limit)
             if return_tree:
                 return tree
             elif intermediate_nodes:
@@ -374,9 +475,9 @@ class NCBITaxa(object):
                 return map(int, [n.name for n in tree])
 
         elif intermediate_nodes:
-            return [tid for tid, count in six.iteritems(descendants)]
+            return descendants
         else:
-            return [tid for tid, count in six.iteritems(descendants) if count == 1]
+            return self._get_traverse_index().get_descendants(taxid)
 
     def get_topology(self, taxids, intermediate_nodes=False, rank_limit=None, collapse_subspecies=False, annotate=True):
         """Given a list of taxid numbers, return the minimal pruned NCBI taxonomy tree
@@ -399,87 +500,96 @@ class NCBITaxa(object):
         """
         from .. import PhyloTree
         taxids, merged_conversion = self._translate_merged(taxids)
-        if len(taxids) == 1:
-            root_taxid = int(list(taxids)[0])
-            with open(self.dbfile+".traverse.pkl", "rb") as CACHED_TRAVERSE:
-                prepostorder = pickle.load(CACHED_TRAVERSE)
-            descendants = {}
-            found = 0
-            nodes = {}
-            hit = 0
-            visited = set()
-            start = prepostorder.index(root_taxid)
-            try:
-            	end = prepostorder.index(root_taxid, start+1)
-            	subtree = prepostorder[start:end+1]
-            except ValueError:
-                # If root taxid is not found in postorder, must be a tip node
-            	subtree = [root_taxid]
-            leaves = set([v for v, count in Counter(subtree).items() if count == 1])
-            nodes[root_taxid] = PhyloTree(name=str(root_taxid))
-            current_parent = nodes[root_taxid]
-            for tid in subtree:
-                if tid in visited:
-                    current_parent = nodes[tid].up
-                else:
-                    visited.add(tid)
-                    nodes[tid] = PhyloTree(name=str(tid))
-                    current_parent.add_child(nodes[tid])
-                    if tid not in leaves:
-                        current_parent = nodes[tid]
-            root = nodes[root_taxid]
+
+        # The topology is first assembled as lists of children taxids, and
+        # tree nodes are only created for the final pruned tree
+        children = defaultdict(list)
+        single_taxid = len(taxids) == 1
+        if single_taxid:
+            root = int(list(taxids)[0])
+            index = self._get_traverse_index()
+            taxid_range = index.get_range(root)
+            if taxid_range is None:
+                raise ValueError("taxid not found:%s" %root)
+            start, stop = taxid_range
+            parents = [(root, stop)]
+            for pos, tid in enumerate(index.order[start+1:stop].tolist(), start+1):
+                while parents[-1][1] <= pos:
+                    parents.pop()
+                children[parents[-1][0]].append(tid)
+                parents.append((tid, index.end[pos]))
+            id2rank = None
         else:
             taxids = set(map(int, taxids))
-            sp2track = {}
-            elem2node = {}
-            id2lineage = self.get_lineage_translator(taxids)
+            records = self._get_records(taxids)
+            lineages = [records[sp][3] for sp in taxids]
             all_taxids = set()
-            for lineage in id2lineage.values():
+            for lineage in lineages:
                 all_taxids.update(lineage)
             id2rank = self.get_rank(all_taxids)
-            for sp in taxids:
-                track = []
-                lineage = id2lineage[sp]
 
-                for elem in lineage:
-                    if elem not in elem2node:
-                        node = elem2node.setdefault(elem, PhyloTree())
-                        node.name = str(elem)
-                        node.taxid = elem
-                        node.add_feature("rank", str(id2rank.get(int(elem), "no rank")))
-                    else:
-                        node = elem2node[elem]
-                    track.append(node)
-                sp2track[sp] = track
             # generate parent child relationships
-            for sp, track in six.iteritems(sp2track):
+            linked = set()
+            for lineage in lineages:
                 parent = None
-                for elem in track:
-                    if parent and elem not in parent.children:
-                        parent.add_child(elem)
-                    if rank_limit and elem.rank == rank_limit:
+                for elem in lineage:
+                    if parent is not None and elem not in linked:
+                        linked.add(elem)
+                        children[parent].append(elem)
+                    if rank_limit and id2rank.get(elem, "no rank") == rank_limit:
                         break
                     parent = elem
-            root = elem2node[1]
+            root = 1
 
-        #remove onechild-nodes
+        #remove onechild-nodes in levelorder, moving their child to the
+        #end of the children of their parent (deleted positions are set
+        #to None)
         if not intermediate_nodes:
-            for n in root.get_descendants():
-                if len(n.children) == 1 and int(n.name) not in taxids:
-                    n.delete(prevent_nondicotomic=False)
-
-        if len(root.children) == 1:
-            tree = root.children[0].detach()
-        else:
-            tree = root
+            parent_of = {}
+            position = {}
+            for parent, taxid_children in six.iteritems(children):
+                for i, tid in enumerate(taxid_children):
+                    parent_of[tid] = parent
+                    position[tid] = i
+            levelorder = [root]
+            for tid in levelorder:
+                levelorder.extend(children.get(tid, []))
+            for tid in levelorder:
+                taxid_children = children.get(tid)
+                if tid != root and taxid_children and len(taxid_children) == 1 and tid not in taxids:
+                    parent, child = parent_of[tid], taxid_children[0]
+                    children[parent][position[tid]] = None
+                    position[child] = len(children[parent])
+                    parent_of[child] = parent
+                    children[parent].append(child)
+                    del children[tid]
+            for tid in list(children):
+                children[tid] = [ch for ch in children[tid] if ch is not None]
+
+        if len(children.get(root, [])) == 1:
+            root = children[root][0]
 
         if collapse_subspecies:
-            to_detach = []
-            for node in tree.traverse():
-                if node.rank == "species":
-                    to_detach.extend(node.children)
-            for n in to_detach:
-                n.detach()
+            if id2rank is None:
+                id2rank = self.get_rank(_iter_taxid_preorder(root, children))
+            for tid in list(_iter_taxid_preorder(root, children)):
+                if id2rank.get(tid) == "species":
+                    children.pop(tid, None)
+
+        # create tree nodes
+        to_visit = [(root, None)]
+        while to_visit:
+            tid, parent = to_visit.pop()
+            node = PhyloTree()
+            node.name = str(tid)
+            if not single_taxid:
+                node.taxid = tid
+                node.add_feature("rank", str(id2rank.get(tid, "no rank")))
+            if parent is None:
+                tree = node
+            else:
+                parent.add_child(node)
+            to_visit.extend([(ch, node) for ch in reversed(children.get(tid, []))])
 
         if annotate:
             self.annotate_tree(tree)
@@ -664,85 +774,12 @@ class NCBITaxa(object):
     #     return self.annotate_tree(t, tax2name, tax2track, attr_name="taxid")
 
 
-def load_ncbi_tree_from_dump(tar):
-    from .. import Tree
-    # Download: http://ftp.ncbi.nih.gov/pub/taxonomy/taxdump.tar.gz
-    parent2child = {}
-    name2node = {}
-    node2taxname = {}
-    synonyms = set()
-    name2rank = {}
-    node2common = {}
-    print("Loading node names...")
-    unique_nocase_synonyms = set()
-    for line in tar.extractfile("names.dmp"):
-        line = str(line.decode())
-        fields =  [_f.strip() for _f in line.split("|")]
-        nodename = fields[0]
-        name_type = fields[3].lower()
-        taxname = fields[1]
-
-        # Clean up tax names so we make sure the don't include quotes. See https://github.com/etetoolkit/ete/issues/469
-        taxname = taxname.rstrip('"').lstrip('"')
-
-        if name_type == "scientific name":
-            node2taxname[nodename] = taxname
-        if name_type == "genbank common name":
-            node2common[nodename] = taxname
-        elif name_type in set(["synonym", "equivalent name", "genbank equivalent name",
-                               "anamorph", "genbank synonym", "genbank anamorph", "teleomorph"]):
-
-            # Keep track synonyms, but ignore duplicate case-insensitive names. See https://github.com/etetoolkit/ete/issues/469
-            synonym_key = (nodename, taxname.lower())
-            if synonym_key not in unique_nocase_synonyms:
-                unique_nocase_synonyms.add(synonym_key)
-                synonyms.add((nodename, taxname))
-
-    print(len(node2taxname), "names loaded.")
-    print(len(synonyms), "synonyms loaded.")
-
-    print("Loading nodes...")
-    for line in tar.extractfile("nodes.dmp"):
-        line = str(line.decode())
-        fields =  line.split("|")
-        nodename = fields[0].strip()
-        parentname = fields[1].strip()
-        n = Tree()
-        n.name = nodename
-        n.taxname = node2taxname[nodename]
-        if nodename in node2common:
-            n.common_name = node2common[nodename]
-        n.rank = fields[2].strip()
-        parent2child[nodename] = parentname
-        name2node[nodename] = n
-    print(len(name2node), "nodes loaded.")
-
-    print("Linking nodes...")
-    for node in name2node:
-       if node == "1":
-           t = name2node[node]
-       else:
-           parent = parent2child[node]
-           parent_node = name2node[parent]
-           parent_node.add_child(name2node[node])
-    print("Tree is loaded.")
-    return t, synonyms
-
-def generate_table(t):
-    OUT = open("taxa.tab", "w")
-    for j, n in enumerate(t.traverse()):
-        if j%1000 == 0:
-            print("\r",j,"generating entries...", end=' ')
-        temp_node = n
-        track = []
-        while temp_node:
-            track.append(temp_node.name)
-            temp_node = temp_node.up
-        if n.up:
-            print('\t'.join([n.name, n.up.name, n.taxname, getattr(n, "common_name", ""), n.rank, ','.join(track)]), file=OUT)
-        else:
-            print('\t'.join([n.name, "", n.taxname, getattr(n, "common_name", ""), n.rank, ','.join(track)]), file=OUT)
-    OUT.close()
+def _iter_taxid_preorder(root, children):
+    to_visit = [root]
+    while to_visit:
+        tid = to_visit.pop()
+        yield tid
+        to_visit.extend(reversed(children.get(tid, [])))
 
 def update_db(dbfile, targz_file=None):
     basepath = os.path.split(dbfile)[0]
@@ -776,84 +813,339 @@ def update_db(dbfile, targz_file=None):
             urlretrieve("http://ftp.ncbi.nih.gov/pub/taxonomy/taxdump.tar.gz", targz_file)
             print('Done. Parsing...', file=sys.stderr)
 
-    tar = tarfile.open(targz_file, 'r')
-    t, synonyms = load_ncbi_tree_from_dump(tar)
-    prepostorder = [int(node.name) for post, node in t.iter_prepostorder()]
-    pickle.dump(prepostorder, open(dbfile+'.traverse.pkl', "wb"), 2)
-
     print("Updating database: %s ..." %dbfile)
-    generate_table(t)
+    with tarfile.open(targz_file, 'r') as tar:
+        order, end = upload_taxdump(tar, dbfile)
+    write_traverse_index(order, end, dbfile+TRAVERSE_INDEX_SUFFIX)
 
-    with open("syn.tab", "w") as SYN:
-        SYN.write('\n'.join(["%s\t%s" %(v[0],v[1]) for v in synonyms]))
+# Size of the batches of rows sent to executemany()
+INSERT_BATCH_SIZE = 50000
 
-    with open("merged.tab", "w") as merged:
-        for line in tar.extractfile("merged.dmp"):
-            line = str(line.decode())
-            out_line = '\t'.join([_f.strip() for _f in line.split('|')[:2]])
-            merged.write(out_line+'\n')
-    try:
-        upload_data(dbfile)
-    except:
-        raise
-    else:
-        os.system("rm syn.tab merged.tab taxa.tab")
-        # remove only downloaded taxdump file
-        if not targz_file:
-            os.system("rm taxdump.tar.gz")
-
-def upload_data(dbfile):
-    print()
-    print('Uploading to', dbfile)
+SYNONYM_NAME_TYPES = set(["synonym", "equivalent name", "genbank equivalent name",
+                          "anamorph", "genbank synonym", "genbank anamorph", "teleomorph"])
+
+def _iter_dmp_fields(tar, fname):
+    for line in tar.extractfile(fname):
+        line = str(line.decode())
+        yield [_f.strip() for _f in line.split("|")]
+
+def _iter_batches(rows, size=INSERT_BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def upload_taxdump(tar, dbfile):
+    """
+    Creates the taxonomy database by streaming the content of an open
+    taxdump tar file into sqlite. Rows are inserted in batches within a
+    single transaction and indexes are created once all data is loaded.
+    Taxonomy lineages are computed from parent ids, without building
+    tree objects.
+
+    The database is built into a new file, which replaces dbfile only
+    once complete, so a failed update leaves the previous database
+    untouched.
+
+    Returns the preorder list of taxids and the preorder position
+    following the last descendant of each taxid (see
+    :func:`write_traverse_index`).
+    """
     basepath = os.path.split(dbfile)[0]
     if basepath and not os.path.exists(basepath):
         os.mkdir(basepath)
 
-    db = sqlite3.connect(dbfile)
+    tmp_dbfile = dbfile + ".tmp"
+    if os.path.exists(tmp_dbfile):
+        os.remove(tmp_dbfile)
+    db = sqlite3.connect(tmp_dbfile)
+    try:
+        order, end = _fill_taxdump_db(tar, db)
+    except:
+        db.close()
+        os.remove(tmp_dbfile)
+        raise
+    db.close()
 
-    create_cmd = """
-    DROP TABLE IF EXISTS stats;
-    DROP TABLE IF EXISTS species;
-    DROP TABLE IF EXISTS synonym;
-    DROP TABLE IF EXISTS merged;
-    CREATE TABLE stats (version INT PRIMARY KEY);
-    CREATE TABLE species (taxid INT PRIMARY KEY, parent INT, spname VARCHAR(50) COLLATE NOCASE, common VARCHAR(50) COLLATE NOCASE, rank VARCHAR(50), track TEXT);
-    CREATE TABLE synonym (taxid INT,spname VARCHAR(50) COLLATE NOCASE, PRIMARY KEY (spname, taxid));
-    CREATE TABLE merged (taxid_old INT, taxid_new INT);
-    CREATE INDEX spname1 ON species (spname COLLATE NOCASE);
-    CREATE INDEX spname2 ON synonym (spname COLLATE NOCASE);
-    """
-    for cmd in create_cmd.split(';'):
+    _replace_file(tmp_dbfile, dbfile)
+    return order, end
+
+def _replace_file(src, dst):
+    if hasattr(os, "replace"):
+        os.replace(src, dst)
+    else:
+        # python 2 cannot overwrite files when renaming on windows
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+def _fill_taxdump_db(tar, db):
+    # transactions are explicitly handled. The database file is new and
+    # only used once complete, so no journal is needed.
+    db.isolation_level = None
+    for cmd in ["PRAGMA journal_mode = OFF",
+                "PRAGMA synchronous = OFF",
+                "PRAGMA temp_store = MEMORY",
+                "PRAGMA cache_size = -200000"]:
         db.execute(cmd)
-    print()
 
+    db.execute("BEGIN")
+    for cmd in ["CREATE TABLE stats (version INT PRIMARY KEY)",
+                "CREATE TABLE species (taxid INT PRIMARY KEY, parent INT, spname VARCHAR(50) COLLATE NOCASE, common VARCHAR(50) COLLATE NOCASE, rank VARCHAR(50), track TEXT)",
+                "CREATE TABLE synonym (taxid INT,spname VARCHAR(50) COLLATE NOCASE, PRIMARY KEY (spname, taxid))",
+                "CREATE TABLE merged (taxid_old INT, taxid_new INT)"]:
+        db.execute(cmd)
     db.execute("INSERT INTO stats (version) VALUES (%d);" %DB_VERSION)
-    db.commit()
-
-    for i, line in enumerate(open("syn.tab")):
-        if i%5000 == 0 :
-            print('\rInserting synonyms:     % 6d' %i, end=' ', file=sys.stderr)
-            sys.stderr.flush()
-        taxid, spname = line.strip('\n').split('\t')
-        db.execute("INSERT INTO synonym (taxid, spname) VALUES (?, ?);", (taxid, spname))
-    print()
-    db.commit()
-    for i, line in enumerate(open("merged.tab")):
-        if i%5000 == 0 :
-            print('\rInserting taxid merges: % 6d' %i, end=' ', file=sys.stderr)
-            sys.stderr.flush()
-        taxid_old, taxid_new = line.strip('\n').split('\t')
-        db.execute("INSERT INTO merged (taxid_old, taxid_new) VALUES (?, ?);", (taxid_old, taxid_new))
-    print()
-    db.commit()
-    for i, line in enumerate(open("taxa.tab")):
-        if i%5000 == 0 :
-            print('\rInserting taxids:      % 6d' %i, end=' ', file=sys.stderr)
-            sys.stderr.flush()
-        taxid, parentid, spname, common, rank, lineage = line.strip('\n').split('\t')
-        db.execute("INSERT INTO species (taxid, parent, spname, common, rank, track) VALUES (?, ?, ?, ?, ?, ?);", (taxid, parentid, spname, common, rank, lineage))
-    print()
-    db.commit()
+
+    # Names: synonyms are inserted as they are found, scientific and
+    # common names are kept until nodes are loaded
+    print("Loading node names...", file=sys.stderr)
+    taxid2name = {}
+    taxid2common = {}
+    def iter_synonyms():
+        unique_nocase_synonyms = set()
+        for fields in _iter_dmp_fields(tar, "names.dmp"):
+            taxid = int(fields[0])
+            name_type = fields[3].lower()
+            # Clean up tax names so we make sure the don't include quotes. See https://github.com/etetoolkit/ete/issues/469
+            taxname = fields[1].rstrip('"').lstrip('"')
+
+            if name_type == "scientific name":
+                taxid2name[taxid] = taxname
+            elif name_type == "genbank common name":
+                taxid2common[taxid] = taxname
+            elif name_type in SYNONYM_NAME_TYPES:
+                # Ignore duplicate case-insensitive names. See https://github.com/etetoolkit/ete/issues/469
+                synonym_key = (taxid, taxname.lower())
+                if synonym_key not in unique_nocase_synonyms:
+                    unique_nocase_synonyms.add(synonym_key)
+                    yield (taxid, taxname)
+
+    nsynonyms = 0
+    for batch in _iter_batches(iter_synonyms()):
+        db.executemany("INSERT INTO synonym (taxid, spname) VALUES (?, ?);", batch)
+        nsynonyms += len(batch)
+    print(len(taxid2name), "names loaded.", file=sys.stderr)
+    print(nsynonyms, "synonyms loaded.", file=sys.stderr)
+
+    # Nodes: the children of each taxid are kept in file order as linked
+    # lists stored in arrays indexed by taxid (0 is used as null value)
+    print("Loading nodes...", file=sys.stderr)
+    rank_names = []
+    rank2code = {}
+    taxid2rank = array("H")
+    first_child = array("l")
+    next_sibling = array("l")
+    last_child = array("l")
+    nnodes = 0
+    for fields in _iter_dmp_fields(tar, "nodes.dmp"):
+        taxid, parent = int(fields[0]), int(fields[1])
+        size = max(taxid, parent) + 1
+        if size > len(first_child):
+            size = max(size, len(first_child) * 2) - len(first_child)
+            for arr in (taxid2rank, first_child, next_sibling, last_child):
+                arr.extend(array(arr.typecode, [0]) * size)
+
+        if fields[2] not in rank2code:
+            rank2code[fields[2]] = len(rank_names)
+            rank_names.append(fields[2])
+        taxid2rank[taxid] = rank2code[fields[2]]
+        nnodes += 1
+        if taxid == 1:
+            continue
+        if last_child[parent]:
+            next_sibling[last_child[parent]] = taxid
+        else:
+            first_child[parent] = taxid
+        last_child[parent] = taxid
+    last_child = None
+    print(nnodes, "nodes loaded.", file=sys.stderr)
+
+    # Species table and preorder traversal from the root, in which
+    # lineage tracks are built from the parent track
+    order = array("i")
+    end = array("i")
+    def iter_species():
+        tracks = []
+        to_visit = [1]
+        parents = [""]
+        positions = []
+        while to_visit:
+            taxid = to_visit.pop()
+            if taxid < 0:
+                # postorder
+                end[positions.pop()] = len(order)
+                tracks.pop()
+                parents.pop()
+                continue
+
+            order.append(taxid)
+            end.append(len(order))
+            parent = parents[-1]
+            track = "%s,%s" %(taxid, tracks[-1]) if tracks else str(taxid)
+            yield (taxid, parent, taxid2name[taxid], taxid2common.get(taxid, ""),
+                   rank_names[taxid2rank[taxid]], track)
+
+            child = first_child[taxid]
+            if child:
+                tracks.append(track)
+                parents.append(taxid)
+                positions.append(len(order) - 1)
+                to_visit.append(-taxid)
+                children = []
+                while child:
+                    children.append(child)
+                    child = next_sibling[child]
+                to_visit.extend(reversed(children))
+
+    ntaxa = 0
+    for batch in _iter_batches(iter_species()):
+        db.executemany("INSERT INTO species (taxid, parent, spname, common, rank, track) VALUES (?, ?, ?, ?, ?, ?);", batch)
+        ntaxa += len(batch)
+        print('\rInserting taxids:      % 6d' %ntaxa, end=' ', file=sys.stderr)
+    print(file=sys.stderr)
+
+    merged = ((int(fields[0]), int(fields[1])) for fields in _iter_dmp_fields(tar, "merged.dmp"))
+    for batch in _iter_batches(merged):
+        db.executemany("INSERT INTO merged (taxid_old, taxid_new) VALUES (?, ?);", batch)
+
+    print("Creating indexes...", file=sys.stderr)
+    db.execute("CREATE INDEX spname1 ON species (spname COLLATE NOCASE);")
+    db.execute("CREATE INDEX spname2 ON synonym (spname COLLATE NOCASE);")
+    db.execute("COMMIT")
+    return order, end
+
+# Version of the binary traverse index file format
+TRAVERSE_INDEX_VERSION = 1
+
+def write_traverse_index(order, end, fname):
+    """
+    Writes a binary index of the taxonomy tree, that can be memory
+    mapped by :class:`TraverseIndex`. The file contains native 32 bit
+    integers: a header (format version, number of taxids, size of the
+    position table), the preorder list of taxids, the position after
+    the last descendant of each preorder position, and the preorder
+    position of each taxid (-1 if missing).
+
+    The index is written into a new file that replaces fname once
+    complete, as fname may be memory mapped by other processes.
+    """
+    tmp_fname = fname + ".tmp"
+    try:
+        with open(tmp_fname, "wb") as OUT:
+            OUT.write(get_traverse_index_data(order, end))
+        _replace_file(tmp_fname, fname)
+    except:
+        if os.path.exists(tmp_fname):
+            os.remove(tmp_fname)
+        raise
+
+def get_traverse_index_data(order, end):
+    """
+    Returns the content of the binary taxonomy index (see
+    :func:`write_traverse_index`) as bytes.
+    """
+    max_taxid = max(order) if order else 0
+    position = array("i", [-1]) * (max_taxid + 1)
+    for i, taxid in enumerate(order):
+        position[taxid] = i
+    header = array("i", [TRAVERSE_INDEX_VERSION, len(order), len(position)])
+    return b"".join([values.tostring() if six.PY2 else values.tobytes()
+                     for values in (header, array("i", order), array("i", end), position)])
+
+def prepostorder_to_index(prepostorder):
+    """
+    Converts a list of taxids visited in pre and post order (as stored
+    in the legacy traverse.pkl files, in which internal nodes appear
+    twice) into preorder and end position arrays.
+    """
+    leaves = set([v for v, count in six.iteritems(Counter(prepostorder)) if count == 1])
+    order = array("i")
+    end = array("i")
+    opened = []
+    for taxid in prepostorder:
+        if opened and order[opened[-1]] == taxid:
+            end[opened.pop()] = len(order)
+        else:
+            order.append(taxid)
+            end.append(len(order))
+            if taxid not in leaves:
+                opened.append(len(order) - 1)
+    return order, end
+
+class TraverseIndex(object):
+    """
+    Memory mapped access to the binary taxonomy index created by
+    :func:`write_traverse_index`. All descendants of a taxid are found
+    in a contiguous range of the preorder list of taxids.
+
+    :param fname: path to the index file.
+
+    :param None data: if provided, the index is read from these bytes
+        (see :func:`get_traverse_index_data`) instead of fname.
+    """
+    def __init__(self, fname=None, data=None):
+        if data is not None:
+            self._mmap = data
+        else:
+            import mmap
+            with open(fname, "rb") as IN:
+                self._mmap = mmap.mmap(IN.fileno(), 0, access=mmap.ACCESS_READ)
+        self._itemsize = array("i").itemsize
+        version, norder, nposition = self._int_view(0, 3)
+        if version != TRAVERSE_INDEX_VERSION:
+            raise ValueError("Unsupported taxonomy index version: %s" %version)
+        offset = self._itemsize * 3
+        self.order = self._int_view(offset, norder)
+        offset += self._itemsize * norder
+        self.end = self._int_view(offset, norder)
+        offset += self._itemsize * norder
+        self.position = self._int_view(offset, nposition)
+
+    def _int_view(self, offset, size):
+        stop = offset + self._itemsize * size
+        if six.PY2:
+            # python 2 memoryviews cannot be cast, so data is copied
+            values = array("i")
+            values.fromstring(self._mmap[offset:stop])
+            return values
+        return memoryview(self._mmap)[offset:stop].cast("i")
+
+    def close(self):
+        self.order = self.end = self.position = None
+        if hasattr(self._mmap, "close"):
+            self._mmap.close()
+
+    def get_range(self, taxid):
+        """
+        Returns the preorder position of taxid and the position
+        following its last descendant, or None if taxid is not found.
+        """
+        if 0 <= taxid < len(self.position):
+            pos = self.position[taxid]
+            if pos >= 0:
+                return pos, self.end[pos]
+        return None
+
+    def get_descendants(self, taxid, intermediate_nodes=False):
+        """
+        Returns the list of descendant taxids (in preorder), or None if
+        taxid is not found.
+        """
+        taxid_range = self.get_range(taxid)
+        if taxid_range is None:
+            return None
+        start, stop = taxid_range
+        descendants = self.order[start + 1:stop].tolist()
+        if intermediate_nodes:
+            return descendants
+        ends = self.end[start + 1:stop].tolist()
+        return [tid for pos, (tid, tid_end) in enumerate(zip(descendants, ends), start + 2)
+                if tid_end == pos]
 
 if __name__ == "__main__":
     ncbi = NCBITaxa()
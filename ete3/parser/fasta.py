@@ -54,7 +54,8 @@ def read_fasta(source, obj=None, header_delimiter="\t", fix_duplicates=True):
     else:
         SC = obj
 
-    names = set([])
+    # number of times each name has been seen
+    names = {}
     seq_id = -1
 
     # Prepares handle from which read sequences
@@ -68,6 +69,8 @@ def read_fasta(source, obj=None, header_delimiter="\t", fix_duplicates=True):
         _source = iter(source.split("\n"))
 
     seq_name = None
+    # lines of the current sequence, joined once the whole entry is read
+    seq_chunks = []
     for line in _source:
         line = line.strip()
         if line.startswith('#') or not line:
@@ -75,9 +78,12 @@ def read_fasta(source, obj=None, header_delimiter="\t", fix_duplicates=True):
         # Reads seq number
         elif line.startswith('>'):
             # Checks if previous name had seq
-            if seq_id>-1 and SC.id2seq[seq_id] == "":
-                raise Exception("No sequence found for "+seq_name)
-            
+            if seq_id>-1:
+                if not seq_chunks:
+                    raise Exception("No sequence found for "+seq_name)
+                SC.id2seq[seq_id] = "".join(seq_chunks)
+                seq_chunks = []
+
             seq_id += 1
             # Takes header info
             seq_header_fields = [_f.strip() for _f in line[1:].split(header_delimiter)]
@@ -85,17 +91,17 @@ def read_fasta(source, obj=None, header_delimiter="\t", fix_duplicates=True):
 
             # Checks for duplicated seq names
             if fix_duplicates and seq_name in names:
-                tag = str(len([k for k in list(SC.name2id.keys()) if k.endswith(seq_name)]))
+                tag = str(names[seq_name])
+                names[seq_name] += 1
                 old_name = seq_name
                 seq_name = tag+"_"+seq_name
                 print("Duplicated entry [%s] was renamed to [%s]" %(old_name, seq_name), file=STDERR)
 
             # stores seq_name
-            SC.id2seq[seq_id] = ""
             SC.id2name[seq_id] = seq_name
             SC.name2id[seq_name] = seq_id
             SC.id2comment[seq_id] = seq_header_fields[1:]
-            names.add(seq_name)
+            names[seq_name] = names.get(seq_name, 0) + 1
 
         else:
             if seq_name is None:
@@ -105,11 +111,13 @@ def read_fasta(source, obj=None, header_delimiter="\t", fix_duplicates=True):
             s = line.strip().replace(" ","")
 
             # append to seq_string
-            SC.id2seq[seq_id] += s
+            seq_chunks.append(s)
 
-    if seq_name and SC.id2seq[seq_id] == "":
-        print(seq_name,"has no sequence", file=STDERR)
-        return None
+    if seq_name:
+        SC.id2seq[seq_id] = "".join(seq_chunks)
+        if not seq_chunks:
+            print(seq_name,"has no sequence", file=STDERR)
+            return None
 
     # Everything ok
     return SC
@@ -132,3 +140,285 @@ def write_fasta(sequences, outfile = None, seqwidth = 80):
         OUT.close()
     else:
         return text
+
+# Fasta index files (samtools faidx compatible)
+FAI_SUFFIX = ".fai"
+GZI_SUFFIX = ".gzi"
+
+class FastaIndexEntry(object):
+    """ Entry of a .fai index: sequence name, length, offset of the first
+    base, and number of bases and bytes per line. """
+    __slots__ = ["name", "length", "offset", "linebases", "linewidth"]
+
+    def __init__(self, name, length, offset, linebases, linewidth):
+        self.name = name
+        self.length = length
+        self.offset = offset
+        self.linebases = linebases
+        self.linewidth = linewidth
+
+    def get_size(self):
+        """ Returns the number of bytes used by the sequence in the file. """
+        if not self.linebases:
+            return 0
+        nlines, rest = divmod(self.length, self.linebases)
+        return nlines * self.linewidth + rest
+
+def _is_bgzf(fname):
+    with open(fname, "rb") as fh:
+        header = fh.read(16)
+    # gzip magic number, FEXTRA flag and the "BC" subfield of BGZF blocks
+    return (len(header) == 16 and header[:4] == b"\x1f\x8b\x08\x04"
+            and header[12:14] == b"BC")
+
+def _iter_bgzf_blocks(fh):
+    """ Yields the compressed offset, the compressed size and the data of
+    every block in a BGZF file. """
+    import zlib
+    import struct
+    offset = 0
+    while True:
+        header = fh.read(18)
+        if not header:
+            break
+        if len(header) < 18 or header[:4] != b"\x1f\x8b\x08\x04":
+            raise ValueError("Invalid BGZF block at offset %d" %offset)
+        xlen = struct.unpack("<H", header[10:12])[0]
+        extra = header[12:] + fh.read(xlen - 6)
+        bsize = None
+        pos = 0
+        while pos < xlen:
+            slen = struct.unpack("<H", extra[pos+2:pos+4])[0]
+            if extra[pos:pos+2] == b"BC":
+                bsize = struct.unpack("<H", extra[pos+4:pos+6])[0]
+            pos += 4 + slen
+        if bsize is None:
+            raise ValueError("Invalid BGZF block at offset %d" %offset)
+        cdata = fh.read(bsize - xlen - 19)
+        fh.read(8) # crc and uncompressed size
+        yield offset, bsize + 1, zlib.decompress(cdata, -15)
+        offset += bsize + 1
+
+class _BgzfReader(object):
+    """ Random access to the uncompressed content of BGZF files, using
+    the block offsets stored in a .gzi index. """
+    def __init__(self, fname, blocks):
+        # blocks: sorted list of (compressed, uncompressed) offsets
+        self.fh = open(fname, "rb")
+        self.coffsets = [0] + [c for c, u in blocks]
+        self.uoffsets = [0] + [u for c, u in blocks]
+        self._cache = (None, b"")
+
+    def read(self, offset, size):
+        from bisect import bisect_right
+        i = bisect_right(self.uoffsets, offset) - 1
+        chunks = []
+        pos = offset - self.uoffsets[i]
+        while size > 0 and i < len(self.coffsets):
+            data = self._read_block(i)
+            chunk = data[pos:pos+size]
+            chunks.append(chunk)
+            size -= len(chunk)
+            pos = 0
+            i += 1
+        return b"".join(chunks)
+
+    def _read_block(self, i):
+        if self._cache[0] == i:
+            return self._cache[1]
+        self.fh.seek(self.coffsets[i])
+        for _, _, data in _iter_bgzf_blocks(self.fh):
+            break
+        self._cache = (i, data)
+        return data
+
+    def close(self):
+        self.fh.close()
+
+def read_gzi(fname):
+    """ Reads a .gzi index, returning the list of (compressed,
+    uncompressed) offsets of all BGZF blocks but the first one. """
+    import struct
+    with open(fname, "rb") as fh:
+        n = struct.unpack("<Q", fh.read(8))[0]
+        values = struct.unpack("<%dQ" %(n*2), fh.read(16*n))
+    return list(zip(values[0::2], values[1::2]))
+
+def write_gzi(blocks, fname):
+    import struct
+    with open(fname, "wb") as fh:
+        fh.write(struct.pack("<Q", len(blocks)))
+        for coffset, uoffset in blocks:
+            fh.write(struct.pack("<QQ", coffset, uoffset))
+
+def read_fai(fname):
+    """ Reads a .fai index, returning the list of its entries. """
+    entries = []
+    with open(fname) as fh:
+        for line in fh:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 5:
+                continue
+            entries.append(FastaIndexEntry(fields[0], *[int(v) for v in fields[1:5]]))
+    return entries
+
+def write_fai(entries, fname):
+    with open(fname, "w") as fh:
+        for e in entries:
+            fh.write("%s\t%d\t%d\t%d\t%d\n" %(e.name, e.length, e.offset, e.linebases, e.linewidth))
+
+def _iter_bgzf_lines(fh, blocks):
+    """ Yields the lines of a BGZF file, registering the offsets of
+    every block into blocks."""
+    pending = b""
+    uoffset = 0
+    for coffset, csize, data in _iter_bgzf_blocks(fh):
+        if coffset and data:
+            blocks.append((coffset, uoffset))
+        uoffset += len(data)
+        lines = (pending + data).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + b"\n"
+    if pending:
+        yield pending
+
+def index_fasta(fname, header_delimiter="\t"):
+    """
+    .. versionadded: 3.1
+
+    Builds a samtools compatible index (.fai) of a FASTA file, plain or
+    compressed with bgzip, in which case a .gzi index with the
+    offsets of compressed blocks is also written. Index files are
+    written next to the FASTA file.
+
+    Entry names are obtained from headers as in :func:`read_fasta`,
+    that is, splitting them by header_delimiter (tab by default). Note
+    that samtools uses the text before the first white space instead,
+    so names of headers containing spaces are written differently.
+    Comment lines (starting with #) are skipped as in
+    :func:`read_fasta`. Lines of each sequence must have the same
+    length, except the last one, and comment or blank lines are only
+    allowed before or after them.
+
+    :returns: the list of index entries.
+    """
+    entries = []
+    bgzf = _is_bgzf(fname)
+    blocks = []
+    fh = open(fname, "rb")
+    try:
+        if bgzf:
+            lines = _iter_bgzf_lines(fh, blocks)
+        else:
+            lines = fh
+
+        delimiter = header_delimiter.encode("latin-1")
+        offset = 0
+        entry = None
+        last_line = None # (bases, bytes) of the last line of current entry
+        for line in lines:
+            size = len(line)
+            if line.startswith(b">"):
+                name = line[1:].split(delimiter)[0].strip().decode("latin-1")
+                entry = FastaIndexEntry(name, 0, offset + size, 0, 0)
+                entries.append(entry)
+                last_line = None
+            elif entry is not None:
+                nbases = len(line.rstrip())
+                if line.startswith(b"#") or not nbases:
+                    if not entry.length:
+                        # comments and blank lines before the sequence
+                        entry.offset = offset + size
+                    else:
+                        # are only allowed at the end of an entry
+                        last_line = (0, size)
+                elif last_line is not None and (last_line[0] != entry.linebases or
+                                                last_line[1] != entry.linewidth or
+                                                nbases > entry.linebases):
+                    raise ValueError("Different line length in sequence [%s]" %entry.name)
+                else:
+                    if not entry.linebases:
+                        entry.linebases, entry.linewidth = nbases, size
+                    entry.length += nbases
+                    last_line = (nbases, size)
+            offset += size
+    finally:
+        fh.close()
+
+    write_fai(entries, fname + FAI_SUFFIX)
+    if bgzf:
+        write_gzi(blocks, fname + GZI_SUFFIX)
+    return entries
+
+class IndexedFasta(object):
+    """
+    .. versionadded: 3.1
+
+    Random access to the sequences of an indexed FASTA file (plain or
+    compressed with bgzip). Index files are built with
+    :func:`index_fasta` if missing or older than the FASTA file, and
+    reused otherwise. Names are read from existing index files as they
+    are, so indexes built by samtools use the samtools naming
+    convention (see :func:`index_fasta`).
+
+    :argument fname: path to the FASTA file.
+
+    :argument header_delimiter: used to obtain entry names from
+      headers when the index is built (tab by default).
+
+    The FASTA file is kept open until :func:`close` is called, the
+    instance is used as a context manager, or it is garbage collected.
+    """
+    def __init__(self, fname, header_delimiter="\t"):
+        self.fname = fname
+        self._fh = self._reader = None
+        fai = fname + FAI_SUFFIX
+        bgzf = _is_bgzf(fname)
+        if fname.endswith(".gz") and not bgzf:
+            raise ValueError("Compressed FASTA files can only be indexed if compressed with bgzip")
+
+        index_files = [fai, fname + GZI_SUFFIX] if bgzf else [fai]
+        mtime = os.path.getmtime(fname)
+        if all([os.path.exists(f) and os.path.getmtime(f) >= mtime for f in index_files]):
+            self.entries = read_fai(fai)
+        else:
+            self.entries = index_fasta(fname, header_delimiter)
+
+        if bgzf:
+            self._reader = _BgzfReader(fname, read_gzi(fname + GZI_SUFFIX))
+        else:
+            import mmap
+            self._fh = open(fname, "rb")
+            if os.path.getsize(fname):
+                self._reader = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._reader = b""
+
+    def get_seq(self, i):
+        """ Returns the sequence of the i-th entry of the index. """
+        e = self.entries[i]
+        if isinstance(self._reader, _BgzfReader):
+            data = self._reader.read(e.offset, e.get_size())
+        else:
+            data = self._reader[e.offset:e.offset+e.get_size()]
+        return data.decode("latin-1").replace("\n", "").replace("\r", "")
+
+    def close(self):
+        # empty files are read from an empty bytes string
+        if self._reader:
+            self._reader.close()
+        if self._fh is not None:
+            self._fh.close()
+        self._fh = self._reader = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        # __init__ may have failed before the file was opened
+        if getattr(self, "_fh", None) is not None or getattr(self, "_reader", None):
+            self.close()
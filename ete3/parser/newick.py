@@ -43,7 +43,7 @@ import os
 import six
 from six.moves import map
 
-__all__ = ["read_newick", "write_newick", "print_supported_formats"]
+__all__ = ["read_newick", "iter_newick", "write_newick", "print_supported_formats"]
 
 ITERABLE_TYPES = set([list, set, tuple, frozenset])
 
@@ -62,8 +62,26 @@ _QUOTED_TEXT_RE = r"""((?=["'])(?:"[^"\\]*(?:\\[\s\S][^"\\]*)*"|'[^'\\]*(?:\\[\s
 #_QUOTED_TEXT_RE = r"""["'](?:(?<=")[^"\\]*(?s:\\.[^"\\]*)*"|(?<=')[^'\\]*(?s:\\.[^'\\]*)*')""]"]"""
 #_QUOTED_TEXT_RE = r"""(?=["'])(?:"[^"\\]*(?:\\[\s\S][^"\\]*)*"|'[^'\\]*(?:\\[\s\S][^'\\]*)*')]"]")"]"""
 
+_QUOTED_TEXT_MATCHER = re.compile(_QUOTED_TEXT_RE)
 _QUOTED_TEXT_PREFIX='ete3_quotref_'
 
+# Tokenizers used by the single-pass parser engine. Every character of the
+# newick string is consumed either as a structural token (group 1) or as part
+# of a node label (group 2). Square brackets are kept within labels, so NHX
+# blocks may safely contain commas or parentheses.
+_NW_TOKENS_RE = re.compile(r"([(),;])|((?:[^(),;\[]+|\[[^\]]*\]|\[)+)")
+_QUOTED_NW_TOKENS_RE = re.compile(
+    r"""([(),;])|((?:"[^"\\]*(?:\\[\s\S][^"\\]*)*"|'[^'\\]*(?:\\[\s\S][^'\\]*)*'"""
+    r"""|[^(),;\['"]+|\[[^\]]*\]|[\['"])+)""")
+_NW_BLANKS = dict.fromkeys(map(ord, "\n\r\t"))
+
+NEWICK_ENGINES = ["regex", "fast"]
+
+# Characters that matter when splitting a stream into individual trees
+_TREE_END_RE = re.compile(r"[;\[\]]")
+_QUOTED_TREE_END_RE = re.compile(r"""[;\[\]'"\\]""")
+STREAM_CHUNK_SIZE = 1024 * 1024
+
 DEFAULT_DIST = 1.0
 DEFAULT_NAME = ''
 DEFAULT_SUPPORT = 1.0
@@ -213,7 +231,8 @@ class NewickError(Exception):
         value += "\nYou may want to check other newick loading flags like 'format' or 'quoted_node_names'."
         Exception.__init__(self, value)
 
-def read_newick(newick, root_node=None, format=0, quoted_names=False):
+def read_newick(newick, root_node=None, format=0, quoted_names=False,
+                engine="regex"):
     """ Reads a newick tree from either a string or a file, and returns
     an ETE tree structure.
 
@@ -224,36 +243,27 @@ def read_newick(newick, root_node=None, format=0, quoted_names=False):
 
     You can also take advantage from this behaviour to concatenate
     several tree structures.
+
+    The ``engine`` argument selects the parser implementation. "regex"
+    (default) is the reference parser, which matches every node against
+    a regular expression. "fast" tokenizes the whole string in a single
+    linear scan and is recommended for very large trees. Both engines
+    produce the same trees for every supported format.
     """
 
+    if engine not in NEWICK_ENGINES:
+        raise ValueError("Unknown newick engine '%s'. Use one of: %s"
+                         %(engine, ', '.join(NEWICK_ENGINES)))
+
     if root_node is None:
         from ..coretype.tree import TreeNode
         root_node = TreeNode()
 
     if isinstance(newick, six.string_types):
+        nw = _get_newick_string(newick)
 
-        # try to determine whether the file exists.
-        # For very large trees, if newick contains the content of the tree, rather than a file name,
-        # this may fail, at least on Windows, because the os fails to stat the file content, deeming it
-        # too long for testing with os.path.exists.  This raises a ValueError with description
-        # "stat: path too long for Windows".  This is described in issue #258
-        try:
-            file_exists = os.path.exists(newick)
-        except ValueError:      # failed to stat
-            file_exists = False
-
-        # if newick refers to a file, read it from file; otherwise, regard it as a Newick content string.
-        if file_exists:
-            if newick.endswith('.gz'):
-                import gzip
-                with gzip.open(newick) as INPUT:
-                    nw = INPUT.read()
-            else:
-                with open(newick) as INPUT:
-                    nw = INPUT.read()
-        else:
-            nw = newick
-
+        if engine == "fast":
+            return _read_newick_fast(nw, root_node, format, quoted_names)
 
         matcher = compile_matchers(formatcode=format)
         nw = nw.strip()
@@ -268,6 +278,168 @@ def read_newick(newick, root_node=None, format=0, quoted_names=False):
     else:
         raise NewickError("'newick' argument must be either a filename or a newick string.")
 
+def _get_newick_string(newick):
+    """ Returns the newick text contained in the file newick, or newick
+    itself if it does not refer to an existing file. """
+
+    # try to determine whether the file exists.
+    # For very large trees, if newick contains the content of the tree, rather than a file name,
+    # this may fail, at least on Windows, because the os fails to stat the file content, deeming it
+    # too long for testing with os.path.exists.  This raises a ValueError with description
+    # "stat: path too long for Windows".  This is described in issue #258
+    try:
+        file_exists = os.path.exists(newick)
+    except ValueError:      # failed to stat
+        file_exists = False
+
+    # if newick refers to a file, read it from file; otherwise, regard it as a Newick content string.
+    if file_exists:
+        if newick.endswith('.gz'):
+            import gzip
+            with gzip.open(newick, 'rt') as INPUT:
+                return INPUT.read()
+        else:
+            with open(newick) as INPUT:
+                return INPUT.read()
+    else:
+        return newick
+
+def iter_newick(source, format=0, quoted_names=False, engine="fast",
+                skip=0, every=1, tree_class=None):
+    """ Iterates over the trees stored in a multi-newick file (i.e. bootstrap
+    replicates or posterior samples), one ";"-terminated tree at a time.
+    Memory usage is bounded by the size of the largest tree in the file.
+
+    :argument source: path to a plain or gzipped (.gz) file, or an opened
+       file object (text or binary).
+
+    :argument 0 format: subnewick format used to read all trees.
+
+    :argument False quoted_names: Set to True if node names are quoted.
+
+    :argument fast engine: newick parser engine (see :func:`read_newick`).
+
+    :argument 0 skip: number of trees to discard at the beginning of the
+       file (i.e. burn-in).
+
+    :argument 1 every: yield only one tree out of every N trees found after
+       the skipped ones.
+
+    :argument None tree_class: class of the returned trees. TreeNode is used
+       by default. Classes whose constructor does not accept the format,
+       quoted_node_names or newick_engine arguments (i.e. ClusterTree)
+       are built with their own defaults, so only format 0 and unquoted
+       names can be read with them.
+
+    Trees that are discarded by the skip or every arguments are never parsed.
+
+    **Example:**
+
+    ::
+
+        for t in iter_newick("bootstraps.nw.gz", skip=1000, every=10):
+            print(t.get_topology_id())
+
+    """
+    if tree_class is None:
+        from ..coretype.tree import TreeNode
+        tree_class = TreeNode
+    if skip < 0 or every < 1:
+        raise ValueError("skip must be >= 0 and every must be >= 1")
+
+    if isinstance(source, six.string_types):
+        if source.endswith('.gz'):
+            import gzip
+            handler = gzip.open(source, 'rt')
+        else:
+            handler = open(source)
+        try:
+            for tree in iter_newick(handler, format=format, quoted_names=quoted_names,
+                                    engine=engine, skip=skip, every=every,
+                                    tree_class=tree_class):
+                yield tree
+        finally:
+            handler.close()
+        return
+
+    tree_args = _get_tree_args(tree_class, format, quoted_names, engine)
+    for i, nw in enumerate(_iter_newick_strings(source, quoted_names)):
+        if i < skip or (i - skip) % every:
+            continue
+        yield tree_class(newick=nw, **tree_args)
+
+def _get_tree_args(tree_class, format, quoted_names, engine):
+    """ Returns the parser options accepted by the constructor of
+    tree_class. """
+    try:
+        from inspect import getfullargspec as getargspec
+    except ImportError:
+        from inspect import getargspec
+    spec = getargspec(tree_class.__init__)
+    varkw = getattr(spec, "varkw", None) or getattr(spec, "keywords", None)
+
+    tree_args = {}
+    # the parser engine only changes parsing speed, so it is silently
+    # dropped if not supported
+    for arg, value, default in [("format", format, 0),
+                                ("quoted_node_names", quoted_names, False),
+                                ("newick_engine", engine, None)]:
+        if varkw or arg in spec.args:
+            tree_args[arg] = value
+        elif default is not None and value != default:
+            raise ValueError("%s does not support the %s argument"
+                             %(tree_class.__name__, arg))
+    return tree_args
+
+def _iter_newick_strings(handler, quoted_names):
+    """ Splits the content of an opened file into individual newick strings.
+    The input is read in chunks, and semicolons found within NHX comments or
+    quoted names are not considered as tree terminators. """
+    import codecs
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    splitter = _QUOTED_TREE_END_RE if quoted_names else _TREE_END_RE
+
+    pieces = []
+    in_brackets = False
+    quote = None
+    escaped_pos = -1
+    offset = 0
+    while True:
+        chunk = handler.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            break
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+
+        start = 0
+        for match in splitter.finditer(chunk):
+            char = match.group()
+            pos = offset + match.start()
+            if quote is not None:
+                if pos == escaped_pos:
+                    continue
+                elif char == "\\":
+                    escaped_pos = pos + 1
+                elif char == quote:
+                    quote = None
+            elif in_brackets:
+                if char == "]":
+                    in_brackets = False
+            elif char == "[":
+                in_brackets = True
+            elif char == "'" or char == '"':
+                quote = char
+            elif char == ";":
+                pieces.append(chunk[start:match.end()])
+                start = match.end()
+                yield ''.join(pieces).strip()
+                pieces = []
+        pieces.append(chunk[start:])
+        offset += len(chunk)
+
+    if ''.join(pieces).strip():
+        raise NewickError("Unexpected data at the end of the newick stream. Missing ';'?")
+
 def _read_newick_from_string(nw, root_node, matcher, formatcode, quoted_names):
     """ Reads a newick string in the New Hampshire format. """
 
@@ -349,17 +521,183 @@ def _read_newick_from_string(nw, root_node, matcher, formatcode, quoted_names):
 
     return root_node
 
+def _read_newick_fast(nw, root_node, formatcode, quoted_names):
+    """ Reads a newick string in the New Hampshire format using a single
+    linear scan. Structural tokens drive a small state machine, and node
+    labels are decoded with plain string operations instead of matching a
+    regular expression per node. """
+    return _scan_newick(nw, root_node, formatcode, quoted_names,
+                        type(root_node).add_child, _set_node_data)
+
+def _scan_newick(nw, root, formatcode, quoted_names, add_child, set_data):
+    """ Tokenizes a newick string and builds its topology through the
+    provided callbacks. ``add_child(parent)`` must create and return a new
+    child of parent, and ``set_data(node, label, spec, quoted_names,
+    remove_blanks)`` must store the data encoded in a node label. Nodes are
+    always created in preorder. """
+
+    leaf_spec = _get_label_spec(formatcode, "leaf")
+    single_spec = _get_label_spec(formatcode, "single")
+    internal_spec = _get_label_spec(formatcode, "internal")
+    tokenizer = _QUOTED_NW_TOKENS_RE if quoted_names else _NW_TOKENS_RE
+    allow_empty_leaves = (formatcode == 100)
+
+    parents = []      # stack of open internal nodes
+    closed = None     # internal node just closed, whose label may follow
+    has_item = False  # whether the current sibling slot is already filled
+    started = False
+    finished = False
+
+    for match in tokenizer.finditer(nw):
+        token, label = match.groups()
+        if token is None:
+            if not label.strip():
+                continue
+            elif finished:
+                raise NewickError("Unexpected data after the end of the tree: '%s'" %label[:50])
+            elif closed is not None:
+                set_data(closed, label, internal_spec, quoted_names, True)
+                closed = None
+            elif parents:
+                if has_item:
+                    raise NewickError("Broken newick structure at: '%s'" %label[:50])
+                set_data(add_child(parents[-1]), label, leaf_spec, quoted_names, True)
+                has_item = True
+            elif not started:
+                # Single node tree
+                set_data(root, label, single_spec, quoted_names, False)
+                started = True
+            else:
+                raise NewickError("Broken newick structure at: '%s'" %label[:50])
+
+        elif token == "(":
+            if finished or has_item or (not parents and started):
+                raise NewickError("Broken newick structure at position %d" %match.start())
+            if not parents:
+                parents.append(root)
+                started = True
+            else:
+                parents.append(add_child(parents[-1]))
+
+        elif token == ")" or token == ",":
+            if not parents:
+                raise NewickError('Parentheses do not match. Broken tree structure?')
+            if not has_item:
+                if not allow_empty_leaves:
+                    raise NewickError('Empty leaf node found')
+                add_child(parents[-1])
+            if token == ")":
+                closed = parents.pop()
+                has_item = True
+            else:
+                closed = None
+                has_item = False
+
+        else: # ";"
+            if parents:
+                raise NewickError('Parentheses do not match. Broken tree structure?')
+            closed = None
+            finished = True
+
+    if not finished:
+        raise NewickError('Unexisting tree file or Malformed newick tree structure.')
+    return root
+
+def _get_label_spec(formatcode, node_type):
+    """ Returns the containers and converters used to decode the label of a
+    given node type, as well as whether each of its fields is mandatory. """
+    if node_type == "internal":
+        (container1, converterFn1, flexible1), (container2, converterFn2, flexible2) = NW_FORMAT[formatcode][2:4]
+    else:
+        (container1, converterFn1, flexible1), (container2, converterFn2, flexible2) = NW_FORMAT[formatcode][0:2]
+
+    # Leaves always require their first field (i.e. a name)
+    required1 = converterFn1 is not None and (node_type == "leaf" or not flexible1)
+    required2 = converterFn2 is not None and not flexible2
+    return container1, converterFn1, required1, container2, converterFn2, required2
+
+def _set_node_data(node, label, spec, quoted_names, remove_blanks=True):
+    """ Stores the data encoded in a node label into node. """
+    container1, converterFn1, required1, container2, converterFn2, required2 = spec
+    value1, value2, nhx = _parse_label(label, spec, quoted_names, remove_blanks)
+    if value1 is not None:
+        setattr(node, container1, value1)
+        node.features.add(container1)
+    if value2 is not None:
+        setattr(node, container2, value2)
+        node.features.add(container2)
+    if nhx is not None:
+        _parse_extra_features(node, nhx)
+
+def _parse_label(label, spec, quoted_names, remove_blanks=True):
+    """ Decodes the label found after a leaf or a closing parenthesis
+    (i.e. "name:dist[&&NHX:...]"). Returns the values of its two fields
+    (None if missing) and its raw NHX string (if any). """
+    container1, converterFn1, required1, container2, converterFn2, required2 = spec
+
+    quoted = None
+    if quoted_names:
+        label = label.lstrip()
+        quoted_match = _QUOTED_TEXT_MATCHER.match(label)
+        if quoted_match:
+            quoted = quoted_match.group(0)[1:-1] # without the quotes
+            label = label[quoted_match.end():]
+
+    if remove_blanks and ("\n" in label or "\t" in label or "\r" in label):
+        label = label.translate(_NW_BLANKS)
+    nhx = None
+    nhx_start = label.find("[&&NHX")
+    if nhx_start > -1:
+        nhx = label[nhx_start:].rstrip()
+        label = label[:nhx_start]
+        if not nhx.startswith("[&&NHX:") or nhx.find("]") != len(nhx) - 1:
+            raise NewickError("Unexpected newick format '%s'" %nhx[:50])
+
+    value1 = value2 = None
+    first, sep, second = label.partition(":")
+    first = first.strip()
+    try:
+        if quoted is not None:
+            if first or converterFn1 is not str:
+                raise ValueError()
+            value1 = quoted
+        elif first:
+            if converterFn1 is None:
+                raise ValueError()
+            value1 = converterFn1(first)
+        elif required1:
+            raise ValueError()
+
+        if sep:
+            second = second.strip()
+            if converterFn2 is None or not second or ":" in second:
+                raise ValueError()
+            value2 = converterFn2(second)
+        elif required2:
+            raise ValueError()
+    except ValueError:
+        raise NewickError("Unexpected newick format '%s'" %label[:50])
+
+    return value1, value2, nhx
+
 def _parse_extra_features(node, NHX_string):
     """ Reads node's extra data form its NHX string. NHX uses this
     format:  [&&NHX:prop1=value1:prop2=value2] """
+    for pname, pvalue in _parse_nhx(NHX_string):
+        node.add_feature(pname, pvalue)
+
+def _parse_nhx(NHX_string):
+    """ Returns the list of (name, value) pairs encoded in a NHX string. """
     NHX_string = NHX_string.replace("[&&NHX:", "")
     NHX_string = NHX_string.replace("]", "")
+    fields = []
     for field in NHX_string.split(":"):
         try:
             pname, pvalue = field.split("=")
         except ValueError as e:
             raise NewickError('Invalid NHX format %s' %field)
-        node.add_feature(pname, pvalue)
+        fields.append((pname, pvalue))
+    return fields
 
 def compile_matchers(formatcode):
     matchers = {}
@@ -451,9 +789,13 @@ def write_newick(rootnode, features=None, format=1, format_root_node=True,
     """ Iteratively export a tree structure and returns its NHX
     representation. """
     newick = []
-    leaf = is_leaf_fn if is_leaf_fn else lambda n: not bool(n.children)
+    leaf = is_leaf_fn if is_leaf_fn else rootnode.__class__.is_leaf
+    # True for the root node and right after opening a parenthesis, so the
+    # next visited node needs no preceding comma
+    first_child = True
     for postorder, node in rootnode.iter_prepostorder(is_leaf_fn=is_leaf_fn):
         if postorder:
+            first_child = False
             newick.append(")")
             if node.up is not None or format_root_node:
                 newick.append(format_node(node, "internal", format,
@@ -463,8 +805,9 @@ def write_newick(rootnode, features=None, format=1, format_root_node=True,
                                           quoted_names=quoted_names))
                 newick.append(_get_features_string(node, features))
         else:
-            if node is not rootnode and node != node.up.children[0]:
+            if not first_child:
                 newick.append(",")
+            first_child = False
 
             if leaf(node):
                 newick.append(format_node(node, "leaf", format,
@@ -475,6 +818,7 @@ def write_newick(rootnode, features=None, format=1, format_root_node=True,
                 newick.append(_get_features_string(node, features))
             else:
                 newick.append("(")
+                first_child = True
 
     newick.append(";")
     return ''.join(newick)
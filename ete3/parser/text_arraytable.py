@@ -46,10 +46,25 @@ from .. import numpy
 
 from six.moves import map
 
-__all__ = ['read_arraytable', 'write_arraytable']
+__all__ = ['read_arraytable', 'write_arraytable', 'read_npy_arraytable',
+           'write_npy_arraytable']
+
+# Sidecar file storing row and column names of binary matrices
+NAMES_SUFFIX = ".names"
+
+# Number of matrix lines converted at once
+CHUNK_SIZE = 4096
+
+# Empty (or blank) fields are read as missing values
+EMPTY_FIELD = re.compile(r"\t[^\S\t\n]*(?=[\t\n]|$)")
 
 def read_arraytable(matrix_file, mtype="float", arraytable_object = None):
-    """ Reads a text tab-delimited matrix from file """
+    """ Reads a text tab-delimited matrix from file.
+
+    Values are converted in chunks of lines, so memory usage is not
+    much higher than the final matrix. Any NumPy type can be used as
+    mtype (i.e. float32 halves the memory used by float matrices).
+    """
 
     if arraytable_object is None:
         from ..coretype import arraytable
@@ -58,9 +73,14 @@ def read_arraytable(matrix_file, mtype="float", arraytable_object = None):
         A = arraytable_object
 
     A.mtype          = mtype
-    temp_matrix         = []
+    chunks              = []
+    chunk_values        = []
+    rownames            = []
+    colnames            = []
     rowname_counter     = {}
     colname_counter     = {}
+    seen_rownames       = set()
+    seen_colnames       = set()
     row_dup_flag = False
     col_dup_flag = False
 
@@ -74,26 +94,23 @@ def read_arraytable(matrix_file, mtype="float", arraytable_object = None):
     for line in matrix_data:
         # Clean up line
         line = line.strip("\n")
-        #line = line.replace(" ","")
         # Skip empty lines
         if not line:
             continue
-        # Get fields in line
-        fields = line.split("\t")
         # Read column names
-        if line[0]=='#' and re.match("#NAMES",fields[0],re.IGNORECASE):
-            counter = 0
+        if line[0]=='#' and re.match("#NAMES", line, re.IGNORECASE):
+            fields = line.split("\t")
             for colname in fields[1:]:
                 colname = colname.strip()
 
                 # Handle duplicated col names by adding a number
                 colname_counter[colname] = colname_counter.get(colname,0) + 1
-                if colname in A.colValues:
+                if colname in seen_colnames:
                     colname += "_%d" % colname_counter[colname]
                     col_dup_flag = True
                 # Adds colname
-                A.colValues[colname] = None
-                A.colNames.append(colname)
+                seen_colnames.add(colname)
+                colnames.append(colname)
             if col_dup_flag:
                 print("Duplicated column names were renamed.", file=stderr)
 
@@ -102,44 +119,119 @@ def read_arraytable(matrix_file, mtype="float", arraytable_object = None):
             continue
 
         # Read values (only when column names are loaded)
-        elif A.colNames:
+        elif colnames:
             # Checks shape
-            if len(fields)-1 != len(A.colNames):
-                raise ValueError("Invalid number of columns. Expecting:%d" % len(A.colNames))
+            if line.count("\t") != len(colnames):
+                raise ValueError("Invalid number of columns. Expecting:%d" % len(colnames))
 
-            # Extracts row name and remove it from fields
-            rowname  = fields.pop(0).strip()
+            # Extracts row name and keeps values as text
+            rowname, values = line.split("\t", 1)
+            rowname = rowname.strip()
 
             # Handles duplicated row names by adding a number
             rowname_counter[rowname] = rowname_counter.get(rowname,0) + 1
-            if rowname in A.rowValues:
+            if rowname in seen_rownames:
                 rowname += "_%d" % rowname_counter[rowname]
-                row_dup_names = True
+                row_dup_flag = True
 
             # Adds row name
-            A.rowValues[rowname] = None
-            A.rowNames.append(rowname)
-
-            # Reads row values
-            values = []
-            for f in fields:
-                if f.strip()=="":
-                    f = numpy.nan
-                values.append(f)
-            temp_matrix.append(values)
+            seen_rownames.add(rowname)
+            rownames.append(rowname)
+            chunk_values.append(values)
+            if len(chunk_values) == CHUNK_SIZE:
+                chunks.append(_convert_values(chunk_values, len(colnames), mtype))
+                chunk_values = []
         else:
             raise ValueError("Column names are required.")
 
     if row_dup_flag:
         print("Duplicated row names were renamed.", file=stderr)
 
-    # Convert all read lines into a numpy matrix
-    vmatrix = numpy.array(temp_matrix).astype(A.mtype)
+    if chunk_values or not chunks:
+        chunks.append(_convert_values(chunk_values, len(colnames), mtype))
+
+    # Joins all converted chunks into a single numpy matrix
+    if len(chunks) == 1:
+        vmatrix = chunks[0]
+    else:
+        vmatrix = numpy.concatenate(chunks)
+    del chunks
 
     # Updates indexes to link names and vectors in matrix
+    A.rowNames = rownames
+    A.colNames = colnames
     A._link_names2matrix(vmatrix)
     return A
 
+def _convert_values(lines, ncols, mtype):
+    """ Converts a list of lines (tab delimited values) into a matrix """
+    dtype = numpy.dtype(mtype)
+    if not lines:
+        return numpy.zeros((0, ncols), dtype=dtype)
+
+    if dtype.kind == "f":
+        # Values are parsed at once by numpy. Empty fields are made
+        # explicit, as blank separators would be otherwise skipped
+        text = EMPTY_FIELD.sub("\tnan", "\t" + "\n\t".join(lines))
+        try:
+            matrix = numpy.fromstring(text, dtype=dtype, sep="\t")
+        except ValueError:
+            matrix = None
+        if matrix is not None and matrix.size == len(lines) * ncols:
+            return matrix.reshape(len(lines), ncols)
+
+    # Any other type, or invalid values (so the original error is
+    # raised)
+    values = []
+    for line in lines:
+        values.append([numpy.nan if f.strip()=="" else f
+                       for f in line.split("\t")])
+    return numpy.array(values).astype(mtype)
+
+def write_npy_arraytable(A, fname):
+    """ Saves the matrix of an ArrayTable as a binary NumPy (.npy) file,
+    and its row and column names into the fname + ".names" file. Binary
+    matrices can be memory mapped when loaded again.
+
+    .. versionadded: 3.1
+    """
+    numpy.save(fname, A.matrix)
+    if not fname.endswith(".npy"):
+        fname += ".npy"
+    with open(fname + NAMES_SUFFIX, "w") as OUT:
+        print('\t'.join(["#NAMES"] + list(A.colNames)), file=OUT)
+        for rname in A.rowNames:
+            print(rname, file=OUT)
+
+def read_npy_arraytable(fname, mmap_mode="r", arraytable_object=None):
+    """ Reads a binary matrix saved by :func:`write_npy_arraytable`.
+
+    :argument r mmap_mode: numpy memory mapping mode. By default, the
+      matrix is mapped read-only, so opening a table is instant and
+      values are loaded from disk on demand. Use None to load the whole
+      matrix in memory.
+
+    .. versionadded: 3.1
+    """
+    if arraytable_object is None:
+        from ..coretype import arraytable
+        A = arraytable.ArrayTable()
+    else:
+        A = arraytable_object
+
+    matrix = numpy.load(fname, mmap_mode=mmap_mode)
+    rownames = []
+    with open(fname + NAMES_SUFFIX) as NAMES:
+        colnames = NAMES.readline().rstrip("\n").split("\t")[1:]
+        for line in NAMES:
+            rownames.append(line.rstrip("\n"))
+
+    A.mtype = matrix.dtype.name
+    A.rowNames = rownames
+    A.colNames = colnames
+    A._link_names2matrix(matrix)
+    return A
+
 def write_arraytable(A, fname, colnames=None):
     if colnames is None:
         colnames = []
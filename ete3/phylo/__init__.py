@@ -41,4 +41,5 @@ from __future__ import absolute_import
 
 from .phylotree import *
 from .evolevents import *
-__all__ = phylotree.__all__  + evolevents.__all__
+from .orthology import *
+__all__ = phylotree.__all__  + evolevents.__all__ + orthology.__all__
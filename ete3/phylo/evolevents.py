@@ -39,7 +39,44 @@
 
 __all__ = ["EvolEvent"]
 
-class EvolEvent:
+class LeafNameSet(object):
+    """
+    Deferred set of leaf names. Leaves are taken from one or more
+    ranges of a shared list, and can be filtered by species. The set of
+    names is only created when an event attribute using it is read.
+    """
+    __slots__ = ["leaves", "ranges", "species", "same_species"]
+
+    def __init__(self, leaves, ranges, species=None, same_species=True):
+        self.leaves = leaves
+        self.ranges = ranges
+        self.species = species
+        self.same_species = same_species
+
+    def materialize(self):
+        leaves = self.leaves
+        names = set()
+        for start, end in self.ranges:
+            if self.species is None:
+                names.update([leaves[i].name for i in range(start, end)])
+            else:
+                for i in range(start, end):
+                    if (leaves[i].species == self.species) == self.same_species:
+                        names.add(leaves[i].name)
+        return names
+
+def _deferred_attr(attr):
+    def fget(self):
+        value = self.__dict__.get(attr)
+        if isinstance(value, LeafNameSet):
+            value = value.materialize()
+            self.__dict__[attr] = value
+        return value
+    def fset(self, value):
+        self.__dict__[attr] = value
+    return property(fget=fget, fset=fset)
+
+class EvolEvent(object):
     """ Basic evolutionary event. It stores all the information about an
     event(node) ocurred in a phylogenetic tree.
 
@@ -51,8 +88,16 @@ class EvolEvent:
 
     :attr:`node` : link to the event node in the tree
 
+    Sequence attributes may be given as :class:`LeafNameSet` instances,
+    which are converted into sets of names the first time they are read.
     """
 
+    in_seqs = _deferred_attr("_in_seqs")
+    out_seqs = _deferred_attr("_out_seqs")
+    inparalogs = _deferred_attr("_inparalogs")
+    outparalogs = _deferred_attr("_outparalogs")
+    orthologs = _deferred_attr("_orthologs")
+
     def __init__(self):
         self.etype         = None   # 'S=speciation D=duplication'
         self.in_seqs       = []
@@ -71,6 +116,8 @@ class EvolEvent:
         self.seed          = None   # Seed ID used to start the phylogenetic pipeline
         self.branch_supports  = []
 
-
-
-
+    def __getstate__(self):
+        # deferred sets refer to tree nodes, so they are resolved first
+        for attr in ["in_seqs", "out_seqs", "inparalogs", "outparalogs", "orthologs"]:
+            getattr(self, attr)
+        return self.__dict__
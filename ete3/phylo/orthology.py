@@ -0,0 +1,229 @@
+# #START_LICENSE###########################################################
+#
+#
+# This file is part of the Environment for Tree Exploration program
+# (ETE).  http://etetoolkit.org
+#
+# ETE is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ETE is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public
+# License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ETE.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#                     ABOUT THE ETE PACKAGE
+#                     =====================
+#
+# ETE is distributed under the GPL copyleft license (2008-2015).
+#
+# If you make use of ETE in published work, please cite:
+#
+# Jaime Huerta-Cepas, Joaquin Dopazo and Toni Gabaldon.
+# ETE: a python Environment for Tree Exploration. Jaime BMC
+# Bioinformatics 2010,:24doi:10.1186/1471-2105-11-24
+#
+# Note that extra references to the specific methods implemented in
+# the toolkit may be available in the documentation.
+#
+# More info at http://etetoolkit.org. Contact: huerta@embl.de
+#
+#
+# #END_LICENSE#############################################################
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+from collections import deque
+from itertools import islice
+
+import six
+
+from .. import numpy
+from .phylotree import PhyloTree, _parse_species
+
+__all__ = ["iter_orthology_records", "write_orthology_records",
+           "iter_orthology_arrays"]
+
+# Columns of the records produced for every tree family
+RECORD_FIELDS = ["family", "etype", "event", "seq1", "seq2"]
+
+def _iter_families(trees):
+    """ Assigns a family name to every input tree. """
+    for i, item in enumerate(trees):
+        if isinstance(item, (tuple, list)):
+            family, newick = item
+        elif os.path.exists(item):
+            family, newick = os.path.splitext(os.path.basename(item))[0], item
+        else:
+            family, newick = str(i), item
+        yield family, newick
+
+# Options shared by all the families processed by a worker process
+_WORKER_DATA = None
+
+def _init_worker(*args):
+    global _WORKER_DATA
+    _WORKER_DATA = args
+
+def _get_family_records(family, newick, data=None):
+    if data is None:
+        data = _WORKER_DATA
+    sos_thr, sp_naming_function, format, paralogs = data
+
+    t = PhyloTree(newick, sp_naming_function=sp_naming_function, format=format)
+    name2sp = {}
+    for leaf in t.iter_leaves():
+        name2sp[leaf.name] = leaf.species
+
+    records = []
+    for i, e in enumerate(t.get_descendant_evol_events(sos_thr)):
+        if e.etype == "D" and not paralogs:
+            continue
+        side1, side2 = sorted(e.in_seqs), sorted(e.out_seqs)
+        for seq1 in side1:
+            sp1 = name2sp[seq1]
+            for seq2 in side2:
+                # only sequences from different species are orthologs
+                if e.etype == "S" and sp1 == name2sp[seq2]:
+                    continue
+                records.append((family, e.etype, i, seq1, seq2))
+    return family, records
+
+def _get_chunk_records(chunk, data=None):
+    return [_get_family_records(family, newick, data) for family, newick in chunk]
+
+def _iter_family_records(trees, sos_thr, sp_naming_function, format, paralogs,
+                         cpus, chunksize):
+    data = (sos_thr, sp_naming_function, format, paralogs)
+    families = _iter_families(trees)
+    chunks = iter(lambda: list(islice(families, chunksize)), [])
+
+    if cpus > 1:
+        from multiprocessing import Pool
+        pool = Pool(cpus, _init_worker, data)
+        try:
+            # Keeps a bounded number of chunks in flight, so memory does
+            # not depend on the number of families
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(_get_chunk_records, (chunk,)))
+                if len(pending) >= cpus * 2:
+                    for records in pending.popleft().get():
+                        yield records
+            while pending:
+                for records in pending.popleft().get():
+                    yield records
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for chunk in chunks:
+            for records in _get_chunk_records(chunk, data):
+                yield records
+
+def iter_orthology_records(trees, sos_thr=0.0, sp_naming_function=_parse_species,
+                           format=0, paralogs=True, cpus=1, chunksize=10):
+    """
+    .. versionadded: 3.1
+
+    Detects speciation and duplication events in a collection of gene
+    trees using the species overlap algorithm (see
+    :func:`PhyloNode.get_descendant_evol_events`), and yields one record
+    per pair of sequences found at both sides of each event. Trees are
+    processed in chunks and records are streamed back in input order,
+    so memory usage does not grow with the number of families.
+
+    Each record is a tuple ``(family, etype, event, seq1, seq2)``, where
+    ``etype`` is "S" for ortholog pairs and "D" for paralog pairs
+    originated by a duplication, and ``event`` is the index of the
+    event within its family.
+
+    :argument trees: iterator of newick strings, newick files or
+      ``(family, newick)`` tuples. Families are named after the file
+      name (without extension) or the position of the tree in the input.
+
+    :argument 0.0 sos_thr: species overlap score threshold used to
+      label duplications.
+
+    :argument _parse_species sp_naming_function: function used to
+      obtain species names from leaf names. It must be defined at the
+      module level when ``cpus`` > 1.
+
+    :argument 0 format: newick format of the input trees.
+
+    :argument True paralogs: If False, only ortholog pairs are reported.
+
+    :argument 1 cpus: number of processes used to analyze trees.
+
+    :argument 10 chunksize: number of trees sent at once to each process.
+    """
+    for family, records in _iter_family_records(trees, sos_thr, sp_naming_function,
+                                                format, paralogs, cpus, chunksize):
+        for r in records:
+            yield r
+
+def write_orthology_records(trees, outfile, header=True, **kargs):
+    """
+    .. versionadded: 3.1
+
+    Writes the records produced by :func:`iter_orthology_records` as a
+    tab delimited file.
+
+    :argument trees: iterator of newick strings, newick files or
+      ``(family, newick)`` tuples.
+
+    :argument outfile: path or file object where records are written.
+
+    :argument True header: If True, a first line with column names is
+      written.
+
+    Any other argument is passed to :func:`iter_orthology_records`.
+
+    :returns: the number of records written.
+    """
+    if isinstance(outfile, six.string_types):
+        OUT = open(outfile, "w")
+    else:
+        OUT = outfile
+
+    nrecords = 0
+    try:
+        if header:
+            OUT.write("#%s\n" % "\t".join(RECORD_FIELDS))
+        for family, etype, event, seq1, seq2 in iter_orthology_records(trees, **kargs):
+            OUT.write("%s\t%s\t%d\t%s\t%s\n" % (family, etype, event, seq1, seq2))
+            nrecords += 1
+    finally:
+        if OUT is not outfile:
+            OUT.close()
+    return nrecords
+
+def iter_orthology_arrays(trees, sos_thr=0.0, sp_naming_function=_parse_species,
+                          format=0, paralogs=True, cpus=1, chunksize=10):
+    """
+    .. versionadded: 3.1
+
+    Same as :func:`iter_orthology_records`, but yields a ``(family,
+    records)`` tuple per tree, where records are a NumPy record array
+    with the fields ``family``, ``etype``, ``event``, ``seq1`` and
+    ``seq2``. String columns are sized to the longest value in each
+    family.
+    """
+    if numpy is None:
+        raise ImportError("NumPy is required to build orthology record arrays")
+
+    for family, records in _iter_family_records(trees, sos_thr, sp_naming_function,
+                                                format, paralogs, cpus, chunksize):
+        seqlen = 1
+        for r in records:
+            seqlen = max(seqlen, len(r[3]), len(r[4]))
+        dtype = [("family", "U%d" % max(1, len(family))), ("etype", "U1"),
+                 ("event", "i4"), ("seq1", "U%d" % seqlen), ("seq2", "U%d" % seqlen)]
+        yield family, numpy.array(records, dtype=dtype).view(numpy.recarray)
@@ -52,7 +52,7 @@ import re
 import itertools
 from collections import defaultdict
 from .. import TreeNode, SeqGroup, NCBITaxa
-from .reconciliation import get_reconciled_tree
+from .reconciliation import get_reconciled_tree_lca
 from . import spoverlap
 
 __all__ = ["PhyloNode", "PhyloTree"]
@@ -60,10 +60,43 @@ __all__ = ["PhyloNode", "PhyloTree"]
 def _parse_species(name):
     return name[:3]
 
+def _count_bits(value):
+    return bin(value).count("1")
+
+def _iter_species_overlap_nodes(tree, target_attr="species"):
+    """ Yields the nodes whose children share any species (or any other
+    leaf attribute), which are labeled as duplications by the species
+    overlap algorithm. Species content of every node is encoded as an
+    integer bitset. """
+    if target_attr == "species":
+        species, leaf2code = tree.resolve_species()
+    else:
+        value2code = {}
+        leaf2code = {}
+        for leaf in tree.iter_leaves():
+            value = getattr(leaf, target_attr, None)
+            leaf2code[leaf] = value2code.setdefault(value, len(value2code))
+
+    node2bits = {}
+    for node in tree.traverse("postorder"):
+        if node.children:
+            bits = 0
+            sp_subtotal = 0
+            for ch in node.children:
+                bits |= node2bits[ch]
+                sp_subtotal += _count_bits(node2bits[ch])
+            node2bits[node] = bits
+            nspcs = _count_bits(bits)
+            if nspcs > 1 and nspcs != sp_subtotal:
+                yield node
+        else:
+            node2bits[node] = 1 << leaf2code[node]
+
 def is_dup(n):
     return getattr(n, "evoltype", None) == "D"
 
-def get_subtrees(tree, full_copy=False, features=None, newick_only=False):
+def get_subtrees(tree, full_copy=False, features=None, newick_only=False,
+                 output="tree", callback=None):
     """Calculate all possible species trees within a gene tree. I
     tested several recursive and iterative approaches to do it and
     this is the most efficient way I found. The method is now fast and
@@ -78,11 +111,34 @@ def get_subtrees(tree, full_copy=False, features=None, newick_only=False):
     first accessed. This allows to filter out cases producing astronomic numbers
     of sptrees.
 
+    Species trees can be yielded as PhyloTree instances ("tree"), newick
+    strings ("newick"), tuples with their leaf nodes in the original
+    tree ("leaves"), or integer bitsets in which the bit i is set if
+    the i-th leaf of the original tree is present ("bitset"). If a
+    callback function is provided, it is called with the tuple of leaf
+    nodes of every species tree, and only species trees for which it
+    returns True are yielded.
+
     """
+    if newick_only:
+        output = "newick"
     ntrees, ndups = calc_subtrees(tree)
-    return ntrees, ndups, _get_subtrees(tree, full_copy, features, newick_only)
+    return ntrees, ndups, _get_subtrees(tree, full_copy, features, output, callback)
+
+def _iter_sptree_leaves(nw):
+    """ Yields the node ids of a species tree in tuple format """
+    to_visit = [nw]
+    while to_visit:
+        item = to_visit.pop()
+        if isinstance(item, tuple):
+            to_visit.extend(reversed(item))
+        else:
+            yield item
+
+def _get_subtrees(tree, full_copy=False, features=None, output="tree", callback=None):
+    if output not in set(["tree", "newick", "leaves", "bitset"]):
+        raise ValueError("Unknown species tree output type: %s" %output)
 
-def _get_subtrees(tree, full_copy=False, features=None, newick_only=False):
     # First I need to precalculate all the species trees in tuple (newick) format
     nid = 0
     n2nid = {}
@@ -110,38 +166,66 @@ def _get_subtrees(tree, full_copy=False, features=None, newick_only=False):
 
     sp_trees = n2subtrees[n2nid[tree]]
 
-    # Second, I yield a tree per iteration in newick or ETE format
+    # Second, I yield a tree per iteration in the requested format. No
+    # text is generated or parsed in between.
     features = set(features) if features else set()
     features.update(["name"])
 
-    def _nodereplacer(match):
-        pre, b, post =  match.groups()
-        pre = '' if not pre else pre
-        post = '' if not post else post
-        node = nid2node[int(b)]
-        fstring = ""
-        if features:
-            fstring = "".join(["[&&NHX:",
-                               ':'.join(["%s=%s" %(f, getattr(node, f))
-                                         for f in features if hasattr(node, f)])
-                               , "]"])
+    if callback is not None:
+        sp_trees = (nw for nw in sp_trees if
+                    callback(tuple([nid2node[_nid] for _nid in _iter_sptree_leaves(nw)])))
 
-        return ''.join([pre, node.name, fstring, post])
+    if output == "leaves":
+        for nw in sp_trees:
+            yield tuple([nid2node[_nid] for _nid in _iter_sptree_leaves(nw)])
 
-    if newick_only:
-        id_match = re.compile("([^0-9])?(\d+)([^0-9])?")
+    elif output == "bitset":
+        nid2bit = {}
+        for i, leaf in enumerate(tree.iter_leaves()):
+            nid2bit[n2nid[leaf]] = 1 << i
         for nw in sp_trees:
-            yield re.sub(id_match, _nodereplacer, str(nw)+";")
+            bits = 0
+            for _nid in _iter_sptree_leaves(nw):
+                bits |= nid2bit[_nid]
+            yield bits
+
+    elif output == "newick":
+        # leaf labels are computed only once
+        nid2label = {}
+        def _get_label(_nid):
+            label = nid2label.get(_nid)
+            if label is None:
+                node = nid2node[_nid]
+                fstring = "".join(["[&&NHX:",
+                                   ':'.join(["%s=%s" %(f, getattr(node, f))
+                                             for f in features if hasattr(node, f)])
+                                   , "]"])
+                label = nid2label[_nid] = node.name + fstring
+            return label
+
+        def _to_newick(nw):
+            if isinstance(nw, tuple):
+                return "(%s)" %', '.join([_to_newick(item) for item in nw])
+            return _get_label(nw)
+
+        for nw in sp_trees:
+            yield _to_newick(nw)+";"
     else:
         for nw in sp_trees:
-            # I take advantage from the fact that I generated the subtrees
-            # using tuples, so str representation is actually a newick :)
-            t = PhyloTree(str(nw)+";")
-            # Map features from original tree
-            for leaf in t.iter_leaves():
-                _nid = int(leaf.name)
-                for f in features:
-                    leaf.add_feature(f, getattr(nid2node[_nid], f))
+            # Trees are built directly from the tuple structure, and
+            # features mapped from original tree
+            t = PhyloTree(dist=0.0)
+            to_visit = [(t, nw)]
+            while to_visit:
+                node, item = to_visit.pop()
+                if isinstance(item, tuple):
+                    for subitem in item:
+                        to_visit.append((node.add_child(), subitem))
+                else:
+                    source = nid2node[item]
+                    for f in features:
+                        node.add_feature(f, getattr(source, f))
+            t.set_species_naming_function(_parse_species)
             yield t
 
 def calc_subtrees(tree):
@@ -353,12 +437,25 @@ class PhyloNode(TreeNode):
     :returns: a tree node object which represents the base of the tree.
     """
 
+    # (naming function, name, species) of the last species lookup
+    _species_cache = None
+
     def _get_species(self):
-        if self._speciesFunction:
+        fn = self._speciesFunction
+        if fn:
+            # Cached values are reused only while the name and the
+            # naming function stay the same
+            cache = self._species_cache
+            if cache is not None and cache[0] is fn and cache[1] == self.name:
+                return cache[2]
             try:
-                return self._speciesFunction(self.name)
-            except:
-                return self._speciesFunction(self)
+                species = fn(self.name)
+            except Exception:
+                # naming functions receiving the node are not cached,
+                # as they may depend on other node attributes
+                return fn(self)
+            self._species_cache = (fn, self.name, species)
+            return species
         else:
             return self._species
 
@@ -450,6 +547,38 @@ class PhyloNode(TreeNode):
         #       "Warnning: [%d] internal nodes could not be found in the alignment." %\
         #       len(missing_leaves)
 
+    def resolve_species(self):
+        """
+        .. versionadded: 3.1
+
+        Resolves the species of all leaves under this node at once,
+        and encodes them as integer codes, so that species set
+        operations can be done with integers instead of names. Species
+        caches of all leaves are filled as a side effect.
+
+        :returns: a tuple ``(species, leaf2code)``, where ``species`` is
+          the list of species names indexed by their code, and
+          ``leaf2code`` a dictionary translating every leaf node into
+          its species code.
+
+        ::
+
+          species, leaf2code = tree.resolve_species()
+          sp_codes = set([leaf2code[leaf] for leaf in node])
+
+        """
+        species = []
+        sp2code = {}
+        leaf2code = {}
+        for leaf in self.iter_leaves():
+            sp = leaf.species
+            code = sp2code.get(sp)
+            if code is None:
+                code = sp2code[sp] = len(species)
+                species.append(sp)
+            leaf2code[leaf] = code
+        return species, leaf2code
+
     def get_species(self):
         """ Returns the set of species covered by its partition. """
         return set([l.species for l in self.iter_leaves()])
@@ -475,8 +604,11 @@ class PhyloNode(TreeNode):
     def reconcile(self, species_tree):
         """ Returns the reconcilied topology with the provided species
         tree, and a list of evolutionary events inferred from such
-        reconciliation. """
-        return get_reconciled_tree(self, species_tree, [])
+        reconciliation. The species tree can also be provided as a
+        :class:`SpeciesTreeIndex`, which is faster when reconciling
+        many gene trees (see :func:`get_reconciled_tree_lca`). """
+        recon_tree, events, losses = get_reconciled_tree_lca(self, species_tree)
+        return recon_tree, events
 
     def get_my_evol_events(self, sos_thr=0.0):
         """ Returns a list of duplication and speciation events in
@@ -610,7 +742,8 @@ class PhyloNode(TreeNode):
         return outgroup_node
 
     def get_speciation_trees(self, map_features=None, autodetect_duplications=True,
-                             newick_only=False, target_attr='species'):
+                             newick_only=False, target_attr='species',
+                             output="tree", callback=None):
         """
         .. versionadded: 2.2
 
@@ -630,20 +763,29 @@ class PhyloNode(TreeNode):
         mapped from the original gene family tree to each species
         tree subtree.
 
+        :argument tree output: Type of the species trees returned by
+        the iterator: "tree" (PhyloTree instances), "newick" (same as
+        newick_only=True), "leaves" (tuple with the leaf nodes of each
+        species tree in the original tree) or "bitset" (integer in
+        which bit i is set if the i-th leaf of the original tree is
+        part of the species tree). "leaves" and "bitset" modes do not
+        build any tree.
+
+        :argument None callback: A function receiving the tuple of leaf
+        nodes of each species tree. Only species trees for which it
+        returns True are yielded, so it can be used to count or filter
+        species trees before they are built.
+
         :returns: (number_of_sptrees, number_of_dups, species_tree_iterator)
 
         """
         t = self
         if autodetect_duplications:
-            #n2content, n2species = t.get_node2species()
-            n2content = t.get_cached_content()
-            n2species = t.get_cached_content(store_attr=target_attr)
-            for node in n2content:
-                sp_subtotal = sum([len(n2species[_ch]) for _ch in node.children])
-                if len(n2species[node]) > 1 and len(n2species[node]) != sp_subtotal:
-                    node.add_features(evoltype="D")
+            for node in _iter_species_overlap_nodes(t, target_attr):
+                node.add_features(evoltype="D")
 
-        sp_trees = get_subtrees(t, features=map_features, newick_only=newick_only)
+        sp_trees = get_subtrees(t, features=map_features, newick_only=newick_only,
+                                output=output, callback=callback)
 
         return sp_trees
 
@@ -692,23 +834,10 @@ class PhyloNode(TreeNode):
             t = self.copy("deepcopy")
 
         if autodetect_duplications:
-            dups = 0
-            #n2content, n2species = t.get_node2species()
-            n2content = t.get_cached_content()
-            n2species = t.get_cached_content(store_attr="species")
-
-            #print "Detecting dups"
-            for node in n2content:
-                sp_subtotal = sum([len(n2species[_ch]) for _ch in node.children])
-                if  len(n2species[node]) > 1 and len(n2species[node]) != sp_subtotal:
-                    node.add_features(evoltype="D")
-                    dups += 1
-                elif node.is_leaf():
-                    node._leaf = True
-            #print dups
-        else:
-            for node in t.iter_leaves():
-                node._leaf = True
+            for node in _iter_species_overlap_nodes(t):
+                node.add_features(evoltype="D")
+        for node in t.iter_leaves():
+            node._leaf = True
         sp_trees = get_subparts(t)
         return sp_trees
 
@@ -39,7 +39,8 @@ from __future__ import absolute_import
 # #END_LICENSE#############################################################
 
 import copy
-from .evolevents import EvolEvent
+from .evolevents import EvolEvent, LeafNameSet
+from ..coretype.tree import _LCAIndex
 
 
 def get_reconciled_tree(node, sptree, events):
@@ -211,3 +212,199 @@ def get_reconciled_tree_zmasek(gtree, sptree, inplace=False):
     cleanup(gtree)
     return gtree
 
+
+class SpeciesTreeIndex(object):
+    """
+    .. versionadded: 3.1
+
+    Precomputed data of a species tree used by
+    :func:`get_reconciled_tree_lca`: a constant time lowest common
+    ancestor index, the depth of every node and the mapping from
+    species names (species tree leaf names) to nodes. Building it once
+    and reusing it is recommended when reconciling many gene trees
+    against the same species tree.
+
+    :argument sptree: species tree (PhyloTree instance).
+    """
+    def __init__(self, sptree):
+        self.lca = _LCAIndex(sptree)
+        self.nodes = self.lca.nodes
+        node2id = self.lca.node2id
+        self.parent = [None] * len(self.nodes)
+        self.children = []
+        self.sp2id = {}
+        for i, node in enumerate(self.nodes):
+            self.children.append([node2id[ch] for ch in node.children])
+            for ch in node.children:
+                self.parent[node2id[ch]] = i
+            if not node.children:
+                self.sp2id.setdefault(node.name, i)
+
+    def get_common_ancestor(self, id1, id2):
+        """ Returns the id of the common ancestor of two nodes. """
+        return self.lca._lca_id(id1, id2)
+
+def get_reconciled_tree_lca(gtree, sptree, collapse_losses=False):
+    """
+    .. versionadded: 3.1
+
+    Reconciles a binary gene tree with a species tree by mapping every
+    gene tree node to the lowest common ancestor of the species under
+    it (Zmasek and Eddy's algorithm), and returns the reconciled
+    topology together with the inferred gene losses. Reconciled trees
+    are the same as those returned by :func:`get_reconciled_tree`, but
+    they are obtained in near-linear time, with no copy of the species
+    tree per gene tree node. Gene tree nodes are labeled with
+    evoltype=D|S.
+
+    Christian M. Zmasek, Sean R. Eddy: A simple algorithm
+    to infer gene duplication and speciation events on a
+    gene tree. Bioinformatics 17(9): 821-828 (2001)
+
+    :argument gtree: gene tree (PhyloTree instance)
+
+    :argument sptree: species tree (PhyloTree instance) or a
+       :class:`SpeciesTreeIndex` built from it. Species are matched
+       against species tree leaf names.
+
+    :argument False collapse_losses: If True, every lost species tree
+       lineage is represented by a single leaf named after the lost
+       species tree node, instead of a copy of its whole subtree.
+
+    :returns: a tuple (reconciled_tree, events, losses), where events is
+       the list of evolutionary events (one per internal gene tree node,
+       in postorder) and losses a list of (gene_node, species_node)
+       tuples, indicating the species tree lineages lost in the branch
+       leading to each gene tree node.
+    """
+    if isinstance(sptree, SpeciesTreeIndex):
+        spindex = sptree
+    else:
+        spindex = SpeciesTreeIndex(sptree)
+    sp2id = spindex.sp2id
+    nodecls = gtree.__class__
+
+    # Leaves in preorder, so the sequences of each event are ranges
+    # of a single list
+    leaves, node2range = gtree.get_leaf_ranges()
+
+    missing_sp = set([leaf.species for leaf in leaves]) - set(sp2id)
+    if missing_sp:
+        raise KeyError("* The following species are not contained in the species tree: "+ ','.join(missing_sp))
+
+    events = []
+    losses = []
+    node2sp = {}
+    node2recon = {}
+    for node in gtree.traverse("postorder"):
+        if not node.children:
+            node2sp[node] = sp2id[node.species]
+            node2recon[node] = _copy_gene_node(node, nodecls)
+            continue
+        elif len(node.children) != 2:
+            raise ValueError("Algorithm can only work with binary trees.")
+
+        ch0, ch1 = node.children
+        sp0, sp1 = node2sp[ch0], node2sp[ch1]
+        spnode = spindex.get_common_ancestor(sp0, sp1)
+        node2sp[node] = spnode
+        recon0, recon1 = node2recon.pop(ch0), node2recon.pop(ch1)
+
+        e = EvolEvent()
+        e.node = node
+        e.in_seqs = LeafNameSet(leaves, [node2range[ch0]])
+        e.out_seqs = LeafNameSet(leaves, [node2range[ch1]])
+        e.inparalogs = LeafNameSet(leaves, [node2range[ch0]])
+        if spnode == sp0 or spnode == sp1:
+            # Each child is placed on its own copy of the expected
+            # species topology
+            e.etype = "D"
+            e.outparalogs = LeafNameSet(leaves, [node2range[ch1]])
+            newnode = _copy_gene_node(node, nodecls)
+            for ch, sp, recon in [(ch0, sp0, recon0), (ch1, sp1, recon1)]:
+                if sp == spnode:
+                    newnode.add_child(recon)
+                else:
+                    template = _new_loss_node(spindex.nodes[spnode], nodecls)
+                    _fill_template(spindex, template, spnode, [(sp, recon, ch)],
+                                   node, losses, nodecls, collapse_losses)
+                    newnode.add_child(template)
+        else:
+            # Both children are placed on the same expected topology
+            e.etype = "S"
+            e.orthologs = LeafNameSet(leaves, [node2range[ch1]])
+            newnode = _copy_gene_node(node, nodecls)
+            _fill_template(spindex, newnode, spnode, [(sp0, recon0, ch0), (sp1, recon1, ch1)],
+                           node, losses, nodecls, collapse_losses)
+
+        newnode.add_feature("evoltype", e.etype)
+        node.add_feature("evoltype", e.etype)
+        node2recon[node] = newnode
+        events.append(e)
+
+    return node2recon[gtree], events, losses
+
+def _copy_gene_node(node, nodecls):
+    """ Shallow copy of a gene tree node, with no children. """
+    newnode = nodecls()
+    newnode._speciesFunction = node._speciesFunction
+    for f in node.features:
+        newnode.add_feature(f, getattr(node, f))
+    return newnode
+
+def _new_loss_node(spnode, nodecls):
+    newnode = nodecls(name=spnode.name, dist=1)
+    newnode._speciesFunction = _get_species_on_TOL
+    newnode.add_feature("evoltype", "L")
+    return newnode
+
+def _fill_template(spindex, top_node, top, replacements, gnode, losses, nodecls,
+                   collapse_losses=False):
+    """ Populates top_node with the topology of the species tree under
+    the species node top, in which the species node of each replacement
+    is replaced by its reconciled gene tree. Species lineages not
+    leading to any replacement are reported as losses. Children
+    ordering follows the one obtained by get_reconciled_tree. """
+    # species nodes in the path from the top node to every replacement,
+    # and the gene tree branch in which their lost lineages are placed
+    if len(replacements) == 1:
+        path2gene = {top: replacements[0][2]}
+    else:
+        path2gene = {top: gnode}
+    targets = {}
+    for sp, recon, ch in replacements:
+        targets[sp] = recon
+        parent = spindex.parent[sp]
+        while parent != top and parent not in path2gene:
+            path2gene[parent] = ch
+            parent = spindex.parent[parent]
+
+    to_visit = [(top_node, top)]
+    while to_visit:
+        newnode, sp = to_visit.pop()
+        for ch in spindex.children[sp]:
+            if ch in targets:
+                continue
+            lossnode = _new_loss_node(spindex.nodes[ch], nodecls)
+            newnode.add_child(lossnode)
+            if ch in path2gene:
+                to_visit.append((lossnode, ch))
+            else:
+                losses.append((path2gene[sp], spindex.nodes[ch]))
+                if collapse_losses:
+                    continue
+                for spdesc in spindex.nodes[ch].get_children():
+                    _copy_loss_clade(spdesc, lossnode, nodecls)
+        # replaced nodes are placed at the end, in replacement order
+        for sp2, recon, ch in replacements:
+            if spindex.parent[sp2] == sp:
+                newnode.add_child(recon)
+
+def _copy_loss_clade(spnode, parent, nodecls):
+    to_visit = [(spnode, parent)]
+    while to_visit:
+        spnode, parent = to_visit.pop()
+        lossnode = _new_loss_node(spnode, nodecls)
+        parent.add_child(lossnode)
+        for ch in reversed(spnode.children):
+            to_visit.append((ch, lossnode))
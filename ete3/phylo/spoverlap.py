@@ -38,10 +38,29 @@ from __future__ import absolute_import
 #
 # #END_LICENSE#############################################################
 
-from .evolevents import EvolEvent
+from collections import deque
+
+from .evolevents import EvolEvent, LeafNameSet
 
 __all__ = ["get_evol_events_from_leaf", "get_evol_events_from_root"]
 
+def _get_smaller_outgroup(root, leaves, node2range):
+    # Checks that is actually rooted
+    outgroups = root.get_children()
+    if len(outgroups) != 2:
+        raise TypeError("Tree is not rooted")
+
+    # Cautch the smaller outgroup (will be stored as the tree
+    # outgroup)
+    sizes = []
+    for outg in outgroups:
+        start, end = node2range[outg]
+        sizes.append(len(set([leaves[i].name for i in range(start, end)])))
+    if sizes[1] < sizes[0]:
+        return outgroups[1]
+    else:
+        return outgroups[0]
+
 def get_evol_events_from_leaf(node, sos_thr=0.0):
     """ Returns a list of duplication and speciation events in
     which the current node has been involved. Scanned nodes are
@@ -58,52 +77,35 @@ def get_evol_events_from_leaf(node, sos_thr=0.0):
     """
     # Get the tree's root
     root = node.get_tree_root()
+    leaves, node2range = root.get_leaf_ranges()
+    smaller_outg = _get_smaller_outgroup(root, leaves, node2range)
 
-    # Checks that is actually rooted
-    outgroups = root.get_children()
-    if len(outgroups) != 2:
-        raise TypeError("Tree is not rooted")
-
-    # Cautch the smaller outgroup (will be stored as the tree
-    # outgroup)
-    o1 = set([n.name for n in outgroups[0].get_leaves()])
-    o2 = set([n.name for n in outgroups[1].get_leaves()])
-
-    if len(o2)<len(o1):
-        smaller_outg = outgroups[1]
-    else:
-        smaller_outg = outgroups[0]
-
-
-    # Prepare to browse tree from leaf to root
+    # Prepare to browse tree from leaf to root. Leaves browsed at each
+    # step are those under the current node, and sister leaves are
+    # those under its parent but not under the current node.
     all_events = []
     current  = node
     ref_spcs = node.species
-    sister_leaves  = set([])
     browsed_spcs   = set([current.species])
-    browsed_leaves = set([current])
     # get family Size
-    fSize =  len([n for n in root.get_leaves() if n.species == ref_spcs])
+    leaf_species = [n.species for n in leaves]
+    fSize = leaf_species.count(ref_spcs)
 
     # Clean previous analysis
-    for n in root.get_descendants()+[root]:
+    for n in node2range:
         n.del_feature("evoltype")
 
     while current.up:
-        # distances control (0.0 distance check)
-        d = 0
-        for s in current.get_sisters():
-            for leaf in s.get_leaves():
-                d += current.get_distance(leaf)
-                sister_leaves.add(leaf)
+        start, end = node2range[current]
+        up_start, up_end = node2range[current.up]
         # Process sister node only if there is any new sequence.
-        # (previene dupliaciones por nombres repetidos)
-        sister_leaves = sister_leaves.difference(browsed_leaves)
-        if len(sister_leaves)==0:
+        if up_end - up_start == end - start:
             current = current.up
             continue
+        sister_ranges = [(up_start, start), (end, up_end)]
         # Gets species at both sides of event
-        sister_spcs     = set([n.species for n in sister_leaves])
+        sister_spcs = set(leaf_species[up_start:start])
+        sister_spcs.update(leaf_species[end:up_end])
         overlaped_spces = browsed_spcs & sister_spcs
         all_spcs        = browsed_spcs | sister_spcs
         score = float(len(overlaped_spces))/len(all_spcs)
@@ -111,19 +113,17 @@ def get_evol_events_from_leaf(node, sos_thr=0.0):
         event = EvolEvent()
         event.fam_size   = fSize
         event.seed      = node.name
-        # event.e_newick  = current.up.get_newick()  # high mem usage!!
         event.sos = score
         event.outgroup  = smaller_outg.name
-        # event.allseqs   = set(current.up.get_leaf_names())
-        event.in_seqs = set([n.name for n in browsed_leaves])
-        event.out_seqs = set([n.name for n in sister_leaves])
-        event.inparalogs  = set([n.name for n in browsed_leaves if n.species == ref_spcs])
+        event.in_seqs = LeafNameSet(leaves, [(start, end)])
+        event.out_seqs = LeafNameSet(leaves, sister_ranges)
+        event.inparalogs  = LeafNameSet(leaves, [(start, end)], ref_spcs)
 
         # If species overlap: duplication
         if score > sos_thr:# and d > 0.0: Removed branch control.
             event.node = current.up
             event.etype = "D"
-            event.outparalogs = set([n.name for n in sister_leaves  if n.species == ref_spcs])
+            event.outparalogs = LeafNameSet(leaves, sister_ranges, ref_spcs)
             event.orthologs   = set([])
             current.up.add_feature("evoltype","D")
             all_events.append(event)
@@ -132,15 +132,13 @@ def get_evol_events_from_leaf(node, sos_thr=0.0):
         elif score <= sos_thr:
             event.node = current.up
             event.etype = "S"
-            event.orthologs = set([n.name for n in sister_leaves if n.species != ref_spcs])
+            event.orthologs = LeafNameSet(leaves, sister_ranges, ref_spcs, same_species=False)
             event.outparalogs = set([])
             current.up.add_feature("evoltype","S")
             all_events.append(event)
 
         # Updates browsed species
-        browsed_spcs   |= sister_spcs
-        browsed_leaves |= sister_leaves
-        sister_leaves  = set([])
+        browsed_spcs |= sister_spcs
         # And keep ascending
         current = current.up
     return all_events
@@ -157,82 +155,77 @@ def get_evol_events_from_root(node, sos_thr):
 
     # Get the tree's root
     root = node.get_tree_root()
-
-    # Checks that is actually rooted
-    outgroups = root.get_children()
-    if len(outgroups) != 2:
-        raise TypeError("Tree is not rooted")
-
-    # Cautch the smaller outgroup (will be stored as the tree outgroup)
-    o1 = set([n.name for n in outgroups[0].get_leaves()])
-    o2 = set([n.name for n in outgroups[1].get_leaves()])
-
-
-    if len(o2)<len(o1):
-        smaller_outg = outgroups[1]
-    else:
-        smaller_outg = outgroups[0]
+    leaves, node2range = root.get_leaf_ranges()
+    smaller_outg = _get_smaller_outgroup(root, leaves, node2range)
 
     # Get family size
-    fSize = len( [n for n in root.get_leaves()] )
-
-    # Clean data from previous analyses
-    for n in root.get_descendants()+[root]:
+    fSize = len(leaves)
+
+    # Species under each node are encoded as bitsets, computed in
+    # postorder from the species of each leaf
+    sp2bit = {}
+    node2spcs = {}
+    for postorder, n in root.iter_prepostorder():
+        # Clean data from previous analyses
         n.del_feature("evoltype")
+        if postorder:
+            bits = 0
+            for ch in n.children:
+                bits |= node2spcs[ch]
+            node2spcs[n] = bits
+        elif not n.children:
+            bit = sp2bit.setdefault(n.species, 1 << len(sp2bit))
+            node2spcs[n] = bit
+    smaller_start, smaller_end = node2range[smaller_outg]
+    outgroup_spcs = set([leaves[i].species for i in range(smaller_start, smaller_end)])
 
     # Gets Prepared to browse the tree from root to leaves
-    to_visit = []
-    current = root
+    to_visit = deque([root])
     all_events = []
-    while current:
+    while to_visit:
+        current = to_visit.popleft()
         # Gets childs and appends them to the To_visit list
-        childs = current.get_children()
-        to_visit += childs
+        childs = current.children
+        to_visit.extend(childs)
         if len(childs)>2:
             raise TypeError("nodes are expected to have two childs.")
         elif len(childs)==0:
             pass # leaf
         else:
-            # Get leaves and species at both sides of event
-            sideA_leaves= set([n for n in childs[0].get_leaves()])
-            sideB_leaves= set([n for n in childs[1].get_leaves()])
-            sideA_spcs  = set([n.species for n in childs[0].get_leaves()])
-            sideB_spcs  = set([n.species for n in childs[1].get_leaves()])
             # Calculates species overlap
-            overlaped_spcs = sideA_spcs & sideB_spcs
-            all_spcs       = sideA_spcs | sideB_spcs
-            score = float(len(overlaped_spcs))/len(all_spcs)
+            sideA_spcs, sideB_spcs = node2spcs[childs[0]], node2spcs[childs[1]]
+            noverlaped_spcs = _count_bits(sideA_spcs & sideB_spcs)
+            nall_spcs = _count_bits(sideA_spcs | sideB_spcs)
+            score = float(noverlaped_spcs)/nall_spcs
+            sideA_range = [node2range[childs[0]]]
+            sideB_range = [node2range[childs[1]]]
 
             # Creates a new evolEvent
             event = EvolEvent()
             event.fam_size   = fSize
             event.branch_supports = [current.support, current.children[0].support, current.children[1].support]
-            # event.seed      = leafName
-            # event.e_newick  = current.up.get_newick()  # high mem usage!!
             event.sos = score
-            event.outgroup_spcs  = smaller_outg.get_species()
-            event.in_seqs = set([n.name for n in sideA_leaves])
-            event.out_seqs = set([n.name for n in sideB_leaves])
-            event.inparalogs  = set([n.name for n in sideA_leaves])
+            event.outgroup_spcs  = set(outgroup_spcs)
+            event.in_seqs = LeafNameSet(leaves, sideA_range)
+            event.out_seqs = LeafNameSet(leaves, sideB_range)
+            event.inparalogs  = LeafNameSet(leaves, sideA_range)
             # If species overlap: duplication
             if score >sos_thr:
                 event.node = current
                 event.etype = "D"
-                event.outparalogs = set([n.name for n in sideB_leaves])
+                event.outparalogs = LeafNameSet(leaves, sideB_range)
                 event.orthologs   = set([])
                 current.add_feature("evoltype","D")
             # If NO species overlap: speciation
             else:
                 event.node = current
                 event.etype = "S"
-                event.orthologs = set([n.name for n in sideB_leaves])
+                event.orthologs = LeafNameSet(leaves, sideB_range)
                 event.outparalogs = set([])
                 current.add_feature("evoltype","S")
 
             all_events.append(event)
-        # Keep visiting nodes
-        try:
-            current = to_visit.pop(0)
-        except IndexError:
-            current = None
     return all_events
+
+def _count_bits(value):
+    return bin(value).count("1")
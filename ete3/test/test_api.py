@@ -3,6 +3,7 @@ from __future__ import absolute_import
 import unittest
 from .datasets import *
 from .test_tree import *
+from .test_frozentree import *
 from .test_interop import *
 from .test_seqgroup import *
 from .test_phylotree import *
@@ -10,6 +11,9 @@ from .test_ncbiquery import *
 
 from .test_arraytable import *
 from .test_clustertree import *
+from .test_svg_render import *
+from .test_webplugin import *
+from .test_lod import *
 
 from .test_evol import *
 #from .test_xml_parsers import *
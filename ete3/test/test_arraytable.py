@@ -1,7 +1,7 @@
 from __future__ import absolute_import
 import unittest
 
-from .. import ClusterTree, ArrayTable
+from .. import ClusterTree, ArrayTable, numpy
 from .datasets import *
 
 class Test_Coretype_ArrayTable(unittest.TestCase):
@@ -45,3 +45,41 @@ class Test_Coretype_ArrayTable(unittest.TestCase):
 
         # Continue this......
 
+    def test_arraytable_types(self):
+        """ Tests reading tables with missing values and custom types"""
+        text = "#NAMES\tc1\tc2\tc3\nA\t1.5\t\t2\nB\t \tnan\t-inf\nA\t0\t1\t2\n"
+        A = ArrayTable(text, mtype="float32")
+        self.assertEqual(A.matrix.dtype, numpy.float32)
+        self.assertEqual(A.rowNames, ["A", "B", "A_2"])
+        self.assertEqual(A.get_row_vector("A")[0], 1.5)
+        self.assertTrue(numpy.isnan(A.get_row_vector("A")[1]))
+        self.assertTrue(numpy.isnan(A.get_row_vector("B")[:2]).all())
+        self.assertEqual(A.get_row_vector("B")[2], -numpy.inf)
+        self.assertEqual(A.get_column_vector("c3").tolist(), [2, -numpy.inf, 2])
+
+        self.assertRaises(ValueError, ArrayTable, "#NAMES\tc1\nA\tNA\n")
+        self.assertRaises(ValueError, ArrayTable, "#NAMES\tc1\nA\t1\t2\n")
+
+    def test_arraytable_npy(self):
+        """ Tests saving and memory mapping binary tables"""
+        A = ArrayTable(expression)
+        A.write_npy("/tmp/ete_test_arraytable.npy")
+        B = ArrayTable("/tmp/ete_test_arraytable.npy")
+        self.assertTrue(isinstance(B.matrix, numpy.memmap))
+        self.assertEqual(A.rowNames, B.rowNames)
+        self.assertEqual(A.colNames, B.colNames)
+        self.assertEqual(A.matrix.tolist(), B.matrix.tolist())
+        self.assertEqual(B.get_row_vector("C").tolist(), A.get_row_vector("C").tolist())
+
+        B = ArrayTable("/tmp/ete_test_arraytable.npy", mmap_mode=None)
+        self.assertFalse(isinstance(B.matrix, numpy.memmap))
+
+        t = ClusterTree("(((A,B),(C,(D,E))),(F,(G,H)));",
+                        text_array="/tmp/ete_test_arraytable.npy")
+        self.assertEqual((t&"A").profile.tolist(),
+                         [-1.23, -0.81, 1.79, 0.78,-0.42,-0.69, 0.58])
+        self.assertEqual(t.arraytable._matrix_max, 1.79)
+        self.assertEqual(t.arraytable._matrix_min, -2.19)
+
+if __name__ == '__main__':
+    unittest.main()
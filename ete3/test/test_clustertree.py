@@ -2,7 +2,7 @@ from __future__ import absolute_import
 from __future__ import print_function
 import unittest
 
-from .. import ClusterTree
+from .. import ClusterTree, numpy
 from .datasets import *
 
 class Test_ClusterTree(unittest.TestCase):
@@ -27,3 +27,44 @@ class Test_ClusterTree(unittest.TestCase):
         c3 = t.get_common_ancestor("F", "G", "H")
         print(t.get_dunn([c1, c2, c3]))
 
+
+    def test_batch_validation(self):
+        """ Tests batch calculation of profiles and validation values """
+        from ..clustering import clustvalidation
+        nw = "(((A,B),(C,(D,E))),(F,(G,H)));"
+        for fdist in [clustvalidation.euclidean_dist,
+                      clustvalidation.pearson_dist,
+                      clustvalidation.spearman_dist]:
+            t1 = ClusterTree(nw, text_array=expression, fdist=fdist)
+            t2 = ClusterTree(nw, text_array=expression, fdist=fdist)
+            dunn = t2.update_validation()
+            for n1, n2 in zip(t1.traverse(), t2.traverse()):
+                leaf_profiles = [l.profile for l in n1.iter_leaves()]
+                self.assertTrue(numpy.allclose(n2._profile, numpy.mean(leaf_profiles, axis=0)))
+                self.assertTrue(numpy.allclose(n2._std_profile, numpy.std(leaf_profiles, axis=0)))
+                values1 = [n1.silhouette, n1.intracluster_dist, n1.intercluster_dist]
+                values2 = [n2._silhouette, n2._intracluster_dist, n2._intercluster_dist]
+                self.assertTrue(numpy.allclose(values1, values2, equal_nan=True))
+                if not n1.is_leaf():
+                    self.assertAlmostEqual(dunn[n2], t1.get_dunn(n1.children, fdist=fdist))
+
+            # leaves with the same rank order as their sister get
+            # distances of exactly 0, as with the pairwise functions
+            ranked = "#Names\tc1\tc2\tc3\tc4\nA\t0.1\t0.5\t0.3\t0.9\nB\t1.2\t2.0\t1.6\t2.8\nC\t0.4\t0.1\t0.8\t0.2\n"
+            t1 = ClusterTree("((A,B),C);", text_array=ranked, fdist=fdist)
+            vdist = clustvalidation.get_vectorized_dist(fdist)
+            for name in "AB":
+                leaf = t1&name
+                sister = leaf.get_sisters()[0]
+                if fdist(leaf.profile, sister.profile) == 0.0:
+                    rows = numpy.array([leaf.profile])
+                    self.assertEqual(vdist(rows, sister.profile)[0], 0.0)
+                    self.assertEqual(leaf.silhouette, 0.0)
+                    self.assertEqual(leaf.intercluster_dist, 0.0)
+
+            # matrix distances match pairwise ones, even with missing values
+            matrix = numpy.array([l.profile for l in t1.iter_leaves()])
+            matrix[0][2] = numpy.nan
+            vector = (t1&"C").profile
+            expected = [fdist(row, vector) for row in matrix]
+            self.assertTrue(numpy.allclose(vdist(matrix, vector), expected, equal_nan=True))
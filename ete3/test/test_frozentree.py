@@ -0,0 +1,104 @@
+from __future__ import absolute_import
+import unittest
+import random
+import pickle
+
+from .. import Tree, FrozenTree
+from ..coretype.tree import TreeError
+from ..parser.newick import NewickError
+from .datasets import *
+
+class Test_Coretype_FrozenTree(unittest.TestCase):
+    """ Tests array based trees """
+    def setUp(self):
+        t = Tree()
+        t.populate(100, random_branches=True)
+        for n in t.traverse():
+            if random.random() < 0.3:
+                n.add_feature("mood", random.choice(["happy", "sad"]))
+        self.nw = t.write(format=1, features=["mood"], format_root_node=True)
+        self.tree = Tree(self.nw, format=1)
+
+    def test_read_and_write(self):
+        for ft in [FrozenTree(self.nw, format=1), FrozenTree.from_tree(self.tree)]:
+            for f in [0, 1, 5, 9, 100]:
+                self.assertEqual(ft.write(format=f, features=[]),
+                                 self.tree.write(format=f, features=[]))
+            self.assertEqual(ft.write(format=1, features=["mood"], format_root_node=True),
+                             self.nw)
+            self.assertEqual(ft.to_tree().write(format=1, features=["mood"], format_root_node=True),
+                             self.nw)
+
+        for nw in [nw_full, nw2_full, nw_simple5, nw_simple6]:
+            self.assertEqual(FrozenTree(nw).write(features=[]), Tree(nw).write(features=[]))
+        self.assertEqual(FrozenTree("hola;").write(format=9), "hola;")
+
+        # NHX dist and support values are converted into numbers
+        t = Tree("((A:1,B:2)90:1,C:3);")
+        ft = FrozenTree(t.write(features=[]))
+        self.assertEqual(ft.write(features=[]), t.write(features=[]))
+        self.assertEqual([n.dist for n in ft.traverse()], [n.dist for n in t.traverse()])
+        self.assertEqual([n.support for n in ft.traverse()], [n.support for n in t.traverse()])
+        self.assertRaises(NewickError, FrozenTree, "(A[&&NHX:dist=x],B);")
+
+    def test_traverse(self):
+        ft = FrozenTree(self.nw, format=1)
+        is_leaf_fn = lambda n: n.dist > 0.5
+        for strategy in ["preorder", "postorder", "levelorder"]:
+            self.assertEqual([n.name for n in ft.traverse(strategy)],
+                             [n.name for n in self.tree.traverse(strategy)])
+            self.assertEqual([n.name for n in ft.traverse(strategy, is_leaf_fn=is_leaf_fn)],
+                             [n.name for n in self.tree.traverse(strategy, is_leaf_fn=is_leaf_fn)])
+        self.assertEqual(ft.write(is_leaf_fn=is_leaf_fn), self.tree.write(is_leaf_fn=is_leaf_fn))
+        self.assertEqual(ft.get_leaf_names(), self.tree.get_leaf_names())
+        self.assertEqual([n.name for n in ft.get_leaves()], self.tree.get_leaf_names())
+        self.assertEqual(len(ft), len(self.tree))
+        self.assertEqual(len(ft.get_descendants()), len(self.tree.get_descendants()))
+
+    def test_node_views(self):
+        ft = FrozenTree(self.nw, format=1)
+        for view, n in zip(ft.traverse("preorder"), self.tree.traverse("preorder")):
+            self.assertEqual(view.name, n.name)
+            self.assertEqual(view.dist, n.dist)
+            self.assertEqual(view.support, n.support)
+            self.assertEqual(view.features, n.features)
+            self.assertEqual(view.is_leaf(), n.is_leaf())
+            self.assertEqual([ch.name for ch in view.children], [ch.name for ch in n.children])
+            self.assertEqual([a.name for a in view.get_ancestors()], [a.name for a in n.get_ancestors()])
+            if hasattr(n, "mood"):
+                self.assertEqual(view.mood, n.mood)
+        self.assertEqual(ft & self.tree.children[0].get_leaf_names()[0],
+                         ft & self.tree.children[0].get_leaf_names()[0])
+        self.assertTrue(ft.up is None)
+        self.assertEqual(len(set(ft.traverse())), len(list(self.tree.traverse())))
+        self.assertRaises(TreeError, ft.__and__, "unknown")
+
+        leaf = ft.get_leaves()[0]
+        leaf.dist = 5
+        leaf.name = "renamed"
+        leaf.add_feature("color", "red")
+        self.assertEqual(ft.get_leaves()[0].dist, 5.0)
+        self.assertEqual(ft.get_leaf_names()[0], "renamed")
+        self.assertEqual(ft.get_leaves()[0].color, "red")
+        self.assertRaises(TreeError, setattr, leaf, "dist", "1a")
+
+        ft2 = pickle.loads(pickle.dumps(ft))
+        self.assertEqual(ft2.write(features=[]), ft.write(features=[]))
+
+    def test_common_ancestors_and_distances(self):
+        ft = FrozenTree(self.nw, format=1)
+        names = self.tree.get_leaf_names()
+        for i in range(100):
+            a, b, c = random.sample(names, 3)
+            self.assertEqual(ft.get_common_ancestor(a, b, c).name,
+                             self.tree.get_common_ancestor(a, b, c).name)
+            self.assertEqual(ft.get_common_ancestor([ft&a, ft&b]).name,
+                             self.tree.get_common_ancestor([a, b]).name)
+            self.assertAlmostEqual(ft.get_distance(a, b), self.tree.get_distance(a, b))
+            self.assertEqual(ft.get_distance(a, b, topology_only=True),
+                             self.tree.get_distance(a, b, topology_only=True))
+            self.assertAlmostEqual((ft&a).get_distance(c), (self.tree&a).get_distance(c))
+        self.assertRaises(TreeError, ft.get_common_ancestor, names[0], FrozenTree(self.nw, format=1))
+
+if __name__ == '__main__':
+    unittest.main()
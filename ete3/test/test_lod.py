@@ -0,0 +1,156 @@
+# #START_LICENSE###########################################################
+#
+#
+# This file is part of the Environment for Tree Exploration program
+# (ETE).  http://etetoolkit.org
+#
+# ETE is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ETE is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public
+# License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ETE.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#                     ABOUT THE ETE PACKAGE
+#                     =====================
+#
+# ETE is distributed under the GPL copyleft license (2008-2015).
+#
+# If you make use of ETE in published work, please cite:
+#
+# Jaime Huerta-Cepas, Joaquin Dopazo and Toni Gabaldon.
+# ETE: a python Environment for Tree Exploration. Jaime BMC
+# Bioinformatics 2010,:24doi:10.1186/1471-2105-11-24
+#
+# Note that extra references to the specific methods implemented in
+# the toolkit may be available in the documentation.
+#
+# More info at http://etetoolkit.org. Contact: huerta@embl.de
+#
+#
+# #END_LICENSE#############################################################
+from __future__ import absolute_import
+import unittest
+
+from .. import Tree
+from ..treeview.lod import LevelOfDetail
+
+def _is_leaf(node):
+    return node.is_leaf() or getattr(node, "collapsed", False)
+
+def _get_spans(lod, nodes, leaf_height=1.0):
+    """ Returns the (top, bottom) span of the given nodes, as if they
+    were drawn with leaves of leaf_height units."""
+    node2span = {}
+    start = 0.0
+    is_terminal = lambda n: _is_leaf(n) or n in lod.frontier
+    for node in lod.tree.traverse("preorder", is_leaf_fn=is_terminal):
+        if is_terminal(node):
+            height = lod.size[node] * leaf_height
+            for n in [node] + node.get_ancestors():
+                y0, y1 = node2span.get(n, (start, start))
+                node2span[n] = (min(y0, start), max(y1, start + height))
+            start += height
+    return dict([(n, span) for n, span in node2span.items() if n in nodes])
+
+class Test_LevelOfDetail(unittest.TestCase):
+    """ Tests the level of detail frontier used by the GUI """
+    def setUp(self):
+        self.t = Tree()
+        self.t.populate(1000)
+
+    def test_sizes(self):
+        """ Tests clade sizes and depths """
+        t = Tree("((A:1,B:2)C:1,(D:1,E:1)F:3);", format=1)
+        lod = LevelOfDetail(t, _is_leaf)
+        self.assertEqual(len(lod), 4)
+        self.assertEqual(lod.size[t&"C"], 2)
+        self.assertEqual(lod.depth[t&"C"], 2.0)
+        self.assertEqual(lod.depth[t], 4.0)
+
+        lod = LevelOfDetail(t, _is_leaf, force_topology=True)
+        self.assertEqual(lod.depth[t], 2.0)
+
+        # nodes collapsed by the user count as a single leaf
+        (t&"C").collapsed = True
+        lod = LevelOfDetail(t, _is_leaf)
+        self.assertEqual(len(lod), 3)
+        self.assertTrue((t&"A") not in lod.size)
+
+    def test_init_frontier(self):
+        """ Tests the initial frontier """
+        lod = LevelOfDetail(self.t, _is_leaf)
+        lod.init_frontier(max_clades=50)
+        self.assertTrue(0 < len(lod.frontier) <= 50)
+        self.assertTrue(all([not n.is_leaf() for n in lod.frontier]))
+
+        # frontier clades do not overlap and, together with the leaves
+        # above the frontier, cover the whole tree
+        covered = 0
+        for node in self.t.traverse(is_leaf_fn=lambda n: n in lod.frontier):
+            if node in lod.frontier:
+                self.assertTrue(all([anc not in lod.frontier
+                                     for anc in node.get_ancestors()]))
+                covered += lod.size[node]
+            elif node.is_leaf():
+                covered += 1
+        self.assertEqual(covered, len(self.t))
+
+        # small trees are fully expanded
+        t = Tree("((A,B),(C,D));")
+        lod = LevelOfDetail(t, _is_leaf)
+        lod.init_frontier()
+        self.assertEqual(lod.frontier, set())
+
+    def test_update(self):
+        """ Tests frontier refinement when zooming and scrolling """
+        lod = LevelOfDetail(self.t, _is_leaf)
+        lod.init_frontier(max_clades=20)
+        visible = set([n for n in self.t.traverse(is_leaf_fn=lambda n: n in lod.frontier)])
+        node2span = _get_spans(lod, visible)
+        height = node2span[self.t][1]
+
+        # the whole tree is visible at a large zoom, so every clade is
+        # expanded
+        changed = lod.update(node2span, 100.0, 0, height, 10)
+        self.assertTrue(changed)
+        self.assertEqual(lod.frontier, set())
+        self.assertFalse(lod.update(node2span, 100.0, 0, height, 10))
+
+        # at a small zoom only large clades are expanded
+        lod.update(node2span, 0.005, 0, height, 10)
+        self.assertEqual(lod.frontier, set([self.t]))
+
+        # clades out of the visible region are collapsed
+        lod.update(node2span, 100.0, 0, height / 10.0, 10)
+        self.assertTrue(lod.frontier)
+        self.assertTrue(self.t not in lod.frontier)
+        for node in lod.frontier:
+            if node in node2span:
+                self.assertTrue(node2span[node][0] > height / 10.0)
+
+    def test_rebuild(self):
+        """ Tests that a new LevelOfDetail picks up topology changes """
+        t = Tree("((A,B)C,(D,E)F);", format=1)
+        (t&"C").collapsed = True
+        lod = LevelOfDetail(t, _is_leaf)
+        self.assertEqual(lod.size[t&"C"], 1)
+
+        (t&"C").collapsed = False
+        (t&"A").add_child(name="G")
+        (t&"A").add_child(name="H")
+        lod = LevelOfDetail(t, _is_leaf)
+        self.assertEqual(lod.size[t&"C"], 3)
+        node2span = _get_spans(lod, set(t.traverse()))
+        lod.update(node2span, 1.0, 0, 10, 0.5)
+        self.assertEqual(lod.frontier, set())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,7 @@ import unittest
 
 from .. import PhyloTree, NCBITaxa
 from ..ncbi_taxonomy import ncbiquery
+from ..utils import LRUCache
 
 DATABASE_PATH = "test_tmp/testdb.sqlite"
 
@@ -103,6 +104,133 @@ class Test_ncbiquery(unittest.TestCase):
     t2 = ncbi.get_lineage("245018")
     self.assertEqual(t2, [1, 131567, 2, 1783272, 1239, 186801, 186802, 186803, 207244, 649756])
 
+  def test_update_db_from_taxdump(self):
+    import io
+    import tarfile
+    dmp_files = {
+      "nodes.dmp": ["1\t|\t1\t|\tno rank\t|",
+                    "2\t|\t1\t|\tsuperkingdom\t|",
+                    "10\t|\t2\t|\tgenus\t|",
+                    "11\t|\t10\t|\tspecies\t|",
+                    "12\t|\t10\t|\tspecies\t|",
+                    "3\t|\t1\t|\tsuperkingdom\t|"],
+      "names.dmp": ["1\t|\troot\t|\t\t|\tscientific name\t|",
+                    "2\t|\tBacteria\t|\t\t|\tscientific name\t|",
+                    "3\t|\tArchaea\t|\t\t|\tscientific name\t|",
+                    "10\t|\tGenus\t|\t\t|\tscientific name\t|",
+                    "11\t|\tGenus one\t|\t\t|\tscientific name\t|",
+                    "11\t|\tfirst one\t|\t\t|\tgenbank common name\t|",
+                    "11\t|\tGenus uno\t|\t\t|\tsynonym\t|",
+                    "11\t|\tgenus UNO\t|\t\t|\tsynonym\t|",
+                    "12\t|\t\"Genus two\"\t|\t\t|\tscientific name\t|"],
+      "merged.dmp": ["99\t|\t12\t|"]}
+    targz = "/tmp/etetemp_taxdump.tar.gz"
+    dbfile = "/tmp/etetemp_taxa/taxa.sqlite"
+    with tarfile.open(targz, "w:gz") as tar:
+      for fname, lines in dmp_files.items():
+        data = ("\n".join(lines) + "\n").encode()
+        info = tarfile.TarInfo(fname)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+    ncbiquery.update_db(dbfile, targz)
+
+    ncbi = NCBITaxa(dbfile=dbfile)
+    self.assertEqual(ncbi.get_lineage(11), [1, 2, 10, 11])
+    self.assertEqual(ncbi.get_lineage(99), [1, 2, 10, 12])
+    self.assertEqual(ncbi.get_taxid_translator([11, 12]), {11: "Genus one", 12: "Genus two"})
+    self.assertEqual(ncbi.get_common_names([11, 12]), {11: "first one"})
+    self.assertEqual(ncbi.get_rank([10, 3]), {10: "genus", 3: "superkingdom"})
+    self.assertEqual(ncbi.get_name_translator(["Genus uno"]), {"Genus uno": [11]})
+    self.assertEqual(set(ncbi.get_descendant_taxa(2)), set([11, 12]))
+    self.assertEqual(ncbi.get_topology([11, 12, 3]).write(format=9), "(3,(11,12));")
+    t = ncbi.get_topology([11, 3], annotate=False)
+    self.assertEqual(t.write(format=9, features=["rank"]), "(3[&&NHX:rank=superkingdom],11[&&NHX:rank=species]);")
+    self.assertEqual(ncbi.get_topology([11, 3], intermediate_nodes=True).write(format=8), "(((11)10)2,3);")
+    # single-child nodes are moved to the end of their new parent
+    self.assertEqual(ncbi.get_topology([11, 12, 3], rank_limit="genus").write(format=9), "(3,10);")
+    self.assertEqual(ncbi.get_descendant_taxa(1, intermediate_nodes=True), [2, 10, 11, 12, 3])
+    self.assertEqual(ncbi.get_descendant_taxa(11), [11])
+    self.assertEqual(ncbi.get_topology([2], intermediate_nodes=True).write(format=8, format_root_node=True), "(11,12)10;")
+    self.assertRaises(ValueError, ncbi.get_descendant_taxa, 50)
+
+    # failed updates leave the previous database untouched
+    broken = "/tmp/etetemp_taxdump_broken.tar.gz"
+    with tarfile.open(broken, "w:gz") as tar:
+      for fname in ["nodes.dmp", "names.dmp"]:
+        data = ("\n".join(dmp_files[fname]) + "\n").encode()
+        info = tarfile.TarInfo(fname)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+    self.assertRaises(KeyError, ncbiquery.update_db, dbfile, broken)
+    self.assertFalse(os.path.exists(dbfile + ".tmp"))
+    self.assertEqual(NCBITaxa(dbfile=dbfile).get_lineage(99), [1, 2, 10, 12])
+
+    # databases created by older versions only contain traverse.pkl files
+    import pickle
+    os.remove(dbfile + ncbiquery.TRAVERSE_INDEX_SUFFIX)
+    with open(dbfile + ".traverse.pkl", "wb") as OUT:
+      pickle.dump([1, 2, 10, 11, 12, 10, 2, 3, 1], OUT, 2)
+    ncbi = NCBITaxa(dbfile=dbfile)
+    self.assertEqual(ncbi.get_descendant_taxa(1, intermediate_nodes=True), [2, 10, 11, 12, 3])
+    self.assertEqual(ncbi.get_descendant_taxa(2), [11, 12])
+    self.assertTrue(os.path.exists(dbfile + ncbiquery.TRAVERSE_INDEX_SUFFIX))
+
+    # indexes mapped by live instances are replaced, not overwritten
+    ncbiquery.update_db(dbfile, targz)
+    self.assertEqual(ncbi.get_descendant_taxa(2), [11, 12])
+    self.assertFalse(os.path.exists(dbfile + ncbiquery.TRAVERSE_INDEX_SUFFIX + ".tmp"))
+
+    # legacy indexes are kept in memory if they cannot be converted
+    os.remove(dbfile + ncbiquery.TRAVERSE_INDEX_SUFFIX)
+    def read_only(*args):
+      raise IOError("Read-only file system")
+    write_traverse_index = ncbiquery.write_traverse_index
+    ncbiquery.write_traverse_index = read_only
+    try:
+      ncbi = NCBITaxa(dbfile=dbfile)
+      self.assertEqual(ncbi.get_descendant_taxa(2), [11, 12])
+    finally:
+      ncbiquery.write_traverse_index = write_traverse_index
+    self.assertFalse(os.path.exists(dbfile + ncbiquery.TRAVERSE_INDEX_SUFFIX))
+
+  def test_lru_cache(self):
+    cache = LRUCache(2)
+    cache.set(1, "a")
+    cache.set(2, "b")
+    self.assertEqual(cache.get(1), "a")
+    cache.set(3, "c")
+    # 2 was the least recently used item
+    self.assertEqual(cache.get(2), None)
+    self.assertEqual(cache.get(3), "c")
+    self.assertEqual(len(cache), 2)
+    self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    cache = LRUCache(0)
+    cache.set(1, "a")
+    self.assertEqual(len(cache), 0)
+
+  def test_cache(self):
+    ncbi = NCBITaxa(dbfile=DATABASE_PATH, cache_size=100)
+    lineage = ncbi.get_lineage(9606)
+    info = ncbi.cache_info()
+    self.assertEqual((info["hits"], info["misses"]), (0, 1))
+
+    self.assertEqual(ncbi.get_lineage(9606), lineage)
+    self.assertEqual(ncbi.get_rank([9606]), {9606: 'species'})
+    self.assertEqual(ncbi.get_taxid_translator([9606]), {9606: 'Homo sapiens'})
+    info = ncbi.cache_info()
+    self.assertEqual((info["hits"], info["misses"]), (3, 1))
+
+    ncbi.clear_cache()
+    ncbi.prefetch([9606, 9598], lineages=True)
+    info = ncbi.cache_info()
+    self.assertEqual(info["size"], len(set(lineage + ncbi.get_lineage(9598))))
+    self.assertEqual(ncbi.get_lineage_translator([9606])[9606], lineage)
+    self.assertEqual(ncbi.cache_info()["misses"], info["misses"])
+
+    ncbi.prefetch(range(1, 1000))
+    self.assertEqual(ncbi.cache_info()["size"], 100)
+
 if __name__ == '__main__':
   unittest.main()
 
@@ -294,6 +294,147 @@ class Test_phylo_module(unittest.TestCase):
         self.assertEqual(t.get_common_ancestor(seed, 'SP3_a').evoltype, 'S')
         self.assertEqual(t.get_common_ancestor(seed, 'SP1_c').evoltype, 'S')
 
+    def test_evol_event_seqs(self):
+        """ Tests the sequence sets stored in evolutionary events"""
+        t = PhyloTree('(((SP1_a, SP2_a), (SP3_a, SP1_b)), (SP1_c, SP2_c));')
+        events = t.get_descendant_evol_events()
+        root_event = [e for e in events if e.node is t][0]
+        self.assertEqual(root_event.in_seqs, set(["SP1_a", "SP2_a", "SP3_a", "SP1_b"]))
+        self.assertEqual(root_event.out_seqs, set(["SP1_c", "SP2_c"]))
+        self.assertEqual(root_event.outparalogs, set(["SP1_c", "SP2_c"]))
+        self.assertEqual(root_event.orthologs, set())
+        self.assertEqual(root_event.outgroup_spcs, set(["SP1", "SP2"]))
+
+        seed = t & 'SP1_a'
+        events = seed.get_my_evol_events()
+        self.assertEqual([e.etype for e in events], ["S", "D", "D"])
+        self.assertEqual(events[0].orthologs, set(["SP2_a"]))
+        self.assertEqual(events[1].inparalogs, set(["SP1_a"]))
+        self.assertEqual(events[1].outparalogs, set(["SP1_b"]))
+        self.assertEqual(events[2].in_seqs, set(["SP1_a", "SP2_a", "SP3_a", "SP1_b"]))
+        self.assertEqual(events[2].outparalogs, set(["SP1_c"]))
+
+        import pickle
+        event = pickle.loads(pickle.dumps(events[2]))
+        self.assertEqual(event.out_seqs, set(["SP1_c", "SP2_c"]))
+        self.assertEqual(event.orthologs, set())
+
+    def test_orthology_records(self):
+        """ Tests batch extraction of ortholog and paralog pairs"""
+        from .. import iter_orthology_records, write_orthology_records, iter_orthology_arrays
+        nw1 = '(((SP1_a, SP2_a), (SP3_a, SP1_b)), (SP1_c, SP2_c));'
+        nw2 = '((SP1_d, SP2_d), SP3_d);'
+        expected = [
+            ('fam1', 'D', 0, 'SP1_a', 'SP1_c'), ('fam1', 'D', 0, 'SP1_a', 'SP2_c'),
+            ('fam1', 'D', 0, 'SP1_b', 'SP1_c'), ('fam1', 'D', 0, 'SP1_b', 'SP2_c'),
+            ('fam1', 'D', 0, 'SP2_a', 'SP1_c'), ('fam1', 'D', 0, 'SP2_a', 'SP2_c'),
+            ('fam1', 'D', 0, 'SP3_a', 'SP1_c'), ('fam1', 'D', 0, 'SP3_a', 'SP2_c'),
+            ('fam1', 'D', 1, 'SP1_a', 'SP1_b'), ('fam1', 'D', 1, 'SP1_a', 'SP3_a'),
+            ('fam1', 'D', 1, 'SP2_a', 'SP1_b'), ('fam1', 'D', 1, 'SP2_a', 'SP3_a'),
+            ('fam1', 'S', 2, 'SP1_c', 'SP2_c'),
+            ('fam1', 'S', 3, 'SP1_a', 'SP2_a'),
+            ('fam1', 'S', 4, 'SP3_a', 'SP1_b'),
+            ('1', 'S', 0, 'SP1_d', 'SP3_d'), ('1', 'S', 0, 'SP2_d', 'SP3_d'),
+            ('1', 'S', 1, 'SP1_d', 'SP2_d'),
+        ]
+        get_sp = lambda name: name.split("_")[0]
+        trees = [("fam1", nw1), nw2]
+        records = list(iter_orthology_records(trees, sp_naming_function=get_sp))
+        self.assertEqual(records, expected)
+
+        orthologs = list(iter_orthology_records(trees, sp_naming_function=get_sp, paralogs=False))
+        self.assertEqual(orthologs, [r for r in expected if r[1] == "S"])
+
+        # Species are taken from the default naming function in
+        # parallel mode
+        trees = [(str(i), nw1) for i in range(20)] + [("last", nw2)]
+        serial = list(iter_orthology_records(trees))
+        self.assertEqual(list(iter_orthology_records(iter(trees), cpus=2, chunksize=3)), serial)
+
+        fname = "/tmp/etetemp_orthology.tsv"
+        self.assertEqual(write_orthology_records(trees, fname), len(serial))
+        lines = open(fname).readlines()
+        self.assertEqual(lines[0], "#family\tetype\tevent\tseq1\tseq2\n")
+        self.assertEqual(lines[-1], "last\tS\t1\tSP1_d\tSP2_d\n")
+        self.assertEqual(len(lines), len(serial) + 1)
+
+        arrays = list(iter_orthology_arrays(trees))
+        self.assertEqual([fam for fam, arr in arrays], [fam for fam, nw in trees])
+        fam, arr = arrays[-1]
+        self.assertEqual(list(arr.seq2), ["SP3_d", "SP3_d", "SP2_d"])
+        self.assertEqual([tuple(r) for r in arr], [r for r in serial if r[0] == "last"])
+
+    def test_species_cache(self):
+        """ Tests species caching and bulk species resolution"""
+        calls = []
+        def get_sp(name):
+            calls.append(name)
+            return name.split("_")[0]
+        t = PhyloTree('((Hsa_1,Ptr_1),(Hsa_2,(Mmu_1,Ptr_2)));', sp_naming_function=get_sp)
+        leaf = t & "Hsa_1"
+        self.assertEqual(leaf.species, "Hsa")
+        self.assertEqual(leaf.species, "Hsa")
+        self.assertEqual(calls, ["Hsa_1"])
+
+        # cache is invalidated when the name or the naming function change
+        leaf.name = "Mmu_3"
+        self.assertEqual(leaf.species, "Mmu")
+        t.set_species_naming_function(lambda name: name.split("_")[1])
+        self.assertEqual(leaf.species, "3")
+        t.set_species_naming_function(get_sp)
+
+        del calls[:]
+        species, leaf2code = t.resolve_species()
+        self.assertEqual(species, ["Mmu", "Ptr", "Hsa"])
+        self.assertEqual(len(calls), 5)
+        self.assertEqual(sorted(leaf2code.values()), [0, 0, 1, 1, 2])
+        for l in t:
+            self.assertEqual(species[leaf2code[l]], l.species)
+        self.assertEqual(len(calls), 5)
+
+        # naming functions receiving nodes are still supported
+        t.set_species_naming_function(lambda node: node.sp)
+        for l in t:
+            l.add_feature("sp", l.name[:1])
+        self.assertEqual((t & "Ptr_2").species, "P")
+        (t & "Ptr_2").sp = "X"
+        self.assertEqual((t & "Ptr_2").species, "X")
+
+    def test_speciation_trees(self):
+        """ Tests TreeKO species trees in all output modes"""
+        t = PhyloTree('(((Hsa_1,Ptr_1),(Hsa_2,Ptr_2)),((Mmu_1,Rno_1),(Mmu_2,Rno_2)));')
+        ntrees, ndups, sptrees = t.get_speciation_trees()
+        self.assertEqual((ntrees, ndups), (4, 2))
+        sptrees = list(sptrees)
+        expected = set(['((Hsa_1,Ptr_1),(Mmu_1,Rno_1));', '((Hsa_1,Ptr_1),(Mmu_2,Rno_2));',
+                        '((Hsa_2,Ptr_2),(Mmu_1,Rno_1));', '((Hsa_2,Ptr_2),(Mmu_2,Rno_2));'])
+        self.assertEqual(set([sp.write(format=9) for sp in sptrees]), expected)
+        self.assertEqual(sptrees[0].get_species(), set(["Hsa", "Ptr", "Mmu", "Rno"]))
+
+        newicks = list(t.get_speciation_trees(newick_only=True, autodetect_duplications=False)[2])
+        self.assertEqual(newicks, list(t.get_speciation_trees(output="newick")[2]))
+        self.assertEqual(set([PhyloTree(nw).write(format=9) for nw in newicks]), expected)
+
+        leaves = list(t.get_speciation_trees(output="leaves")[2])
+        self.assertEqual([[l.name for l in lvs] for lvs in leaves],
+                         [sp.get_leaf_names() for sp in sptrees])
+        self.assertTrue(all([l.get_tree_root() is t for lvs in leaves for l in lvs]))
+
+        bitsets = list(t.get_speciation_trees(output="bitset")[2])
+        all_leaves = t.get_leaves()
+        self.assertEqual(bitsets, [sum([1 << all_leaves.index(l) for l in lvs]) for lvs in leaves])
+
+        # callbacks can count and filter species trees before building them
+        seen = []
+        def keep_mmu1(sp_leaves):
+            seen.append(len(sp_leaves))
+            return "Mmu_1" in [l.name for l in sp_leaves]
+        filtered = list(t.get_speciation_trees(callback=keep_mmu1)[2])
+        self.assertEqual(seen, [4, 4, 4, 4])
+        self.assertEqual(set([sp.write(format=9) for sp in filtered]),
+                         set(['((Hsa_1,Ptr_1),(Mmu_1,Rno_1));', '((Hsa_2,Ptr_2),(Mmu_1,Rno_1));']))
+        self.assertRaises(ValueError, lambda: list(t.get_speciation_trees(output="xml")[2]))
+
     def test_reconciliation(self):
         """ Tests ortholgy prediction based on the species reconciliation method"""
         gene_tree_nw = '((Dme_001,Dme_002),(((Cfa_001,Mms_001),((Hsa_001,Ptr_001),Mmu_001)),(Ptr_002,(Hsa_002,Mmu_002))));'
@@ -310,6 +451,28 @@ class Test_phylo_module(unittest.TestCase):
 
         self.assertEqual(recon_tree.write(["evoltype"], format=9), PhyloTree(expected_recon).write(features=["evoltype"],format=9))
 
+        # LCA based reconciliation reusing a species tree index
+        from ..phylo.reconciliation import get_reconciled_tree, get_reconciled_tree_lca, SpeciesTreeIndex
+        spindex = SpeciesTreeIndex(sptree)
+        for nw in [gene_tree_nw, '((Hsa_1,Mms_1),(Ptr_1,Dme_1));', 'Hsa_1;']:
+            genetree = PhyloTree(nw)
+            old_recon, old_events = get_reconciled_tree(genetree, sptree, [])
+            recon_tree, events, losses = get_reconciled_tree_lca(genetree, spindex)
+            self.assertEqual(recon_tree.write(["evoltype"], format=9), old_recon.write(["evoltype"], format=9))
+            self.assertEqual([e.etype for e in events], [e.etype for e in old_events])
+            self.assertEqual([e.in_seqs for e in events], [set(e.in_seqs) for e in old_events])
+
+        genetree = PhyloTree(gene_tree_nw)
+        recon_tree, events, losses = get_reconciled_tree_lca(genetree, spindex, collapse_losses=True)
+        self.assertEqual([(gnode.get_leaf_names(), spnode.get_leaf_names()) for gnode, spnode in losses],
+                         [(['Hsa_002'], ['Ptr']), (['Ptr_002'], ['Mmu']), (['Ptr_002'], ['Hsa']),
+                          (['Ptr_002', 'Hsa_002', 'Mmu_002'], ['Mms', 'Cfa'])])
+        self.assertEqual(len([n for n in recon_tree.iter_leaves() if getattr(n, "evoltype", None) == "L"]), 4)
+        self.assertEqual(sorted([n.evoltype for n in genetree.traverse() if n.children]),
+                         ['D', 'D', 'D', 'S', 'S', 'S', 'S', 'S', 'S'])
+        self.assertRaises(KeyError, get_reconciled_tree_lca, PhyloTree('(Hsa_1,Xxx_1);'), spindex)
+        self.assertRaises(ValueError, get_reconciled_tree_lca, PhyloTree('(Hsa_1,Ptr_1,Mmu_1);'), spindex)
+
     def test_miscelaneus(self):
         """ Test several things """
         # Creates a gene phylogeny with several duplication events at
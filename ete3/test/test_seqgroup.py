@@ -73,6 +73,150 @@ class Test_Coretype_SeqGroup(unittest.TestCase):
         #SEQS.write(outfile="/tmp/iphylip_write_test.phy", format="iphylip")
         #SEQS.write(outfile="/tmp/iphylip_write_test.phy", format="phylip")
 
+    def test_buffer_storage(self):
+        """ Tests sequences stored in a contiguous buffer """
+        from ..coretype.seqgroup import SeqBuffer
+        SEQS = SeqGroup(fasta_example)
+        for buffer_file in [None, "/tmp/ete_test_seqbuffer.bin"]:
+            BSEQS = SeqGroup(fasta_example, storage="buffer", buffer_file=buffer_file)
+            self.assertTrue(isinstance(BSEQS.id2seq, SeqBuffer))
+            self.assertEqual(BSEQS.write(), SEQS.write())
+            self.assertEqual(BSEQS.get_seq("Ago0000003"), Ago0000003)
+            self.assertEqual(BSEQS.get_entries(), SEQS.get_entries())
+
+            # sequences can still be updated and added
+            BSEQS.set_seq("Ago0000003", "AC-GT")
+            BSEQS.set_seq("new_seq", "TTTT")
+            self.assertEqual(BSEQS.get_seq("Ago0000003"), "AC-GT")
+            self.assertEqual(BSEQS.get_seq("new_seq"), "TTTT")
+            self.assertEqual(len(BSEQS), len(SEQS) + 1)
+            BSEQS.close()
+            self.assertEqual(BSEQS.get_seq("new_seq"), "TTTT")
+
+        start, end = BSEQS.id2seq.get_offsets(BSEQS.name2id["new_seq"])
+        self.assertEqual(open("/tmp/ete_test_seqbuffer.bin", "rb").read()[start:end], b"TTTT")
+
+        # file handles are closed when leaving a with block
+        with SeqBuffer("/tmp/ete_test_seqbuffer.bin") as buf:
+            buf["seq"] = "ACGT"
+            self.assertEqual(buf["seq"], "ACGT")
+            handle = buf._handle
+        self.assertTrue(handle.closed)
+
+        # other formats are also supported
+        BSEQS = SeqGroup(phylip_interlived, format="iphylip", storage="buffer")
+        self.assertEqual(BSEQS.write(format="iphylip"), phylip_interlived)
+        self.assertRaises(ValueError, SeqGroup, fasta_example, storage="xxx")
+
+    def test_fasta_duplicates(self):
+        """ Tests long and duplicated entries in fasta files """
+        seq = "ACGT" * 5000
+        wrapped = "\n".join([seq[i:i+60] for i in range(0, len(seq), 60)])
+        fasta = ">A\n%s\n>B\n%s\n>A\tcomment\n%s\n>A\nAC\n" %(wrapped, wrapped, wrapped)
+        SEQS = SeqGroup(fasta)
+        self.assertEqual([name for name, s, c in SEQS], ["A", "B", "1_A", "2_A"])
+        self.assertEqual(SEQS.get_seq("1_A"), seq)
+        self.assertEqual(SEQS.get_seq("2_A"), "AC")
+        self.assertRaises(Exception, SeqGroup, ">A\n>B\nAC\n")
+
+    def test_indexed_fasta(self):
+        """ Tests lazy access to indexed fasta files """
+        import os, zlib, struct
+        fasta = ">seq1\tcomment\nACGT\nAC\n>seq2\nAAAAA\nCCCCC\nG\n>seq1\nTT\n"
+        fname = "/tmp/ete_test_indexed.fa"
+        open(fname, "w").write(fasta)
+        # bgzip compressed copy, in blocks of 10 bytes
+        data = fasta.encode()
+        with open(fname + ".gz", "wb") as out:
+            for block in [data[i:i+10] for i in range(0, len(data), 10)] + [b""]:
+                compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+                cdata = compressor.compress(block) + compressor.flush()
+                out.write(b"\x1f\x8b\x08\x04\0\0\0\0\0\xff" + struct.pack("<H", 6) + b"BC" +
+                          struct.pack("<HH", 2, len(cdata) + 25) + cdata +
+                          struct.pack("<II", zlib.crc32(block) & 0xffffffff, len(block)))
+
+        for path in [fname, fname + ".gz"]:
+            for index in [path + ".fai", path + ".gzi"]:
+                if os.path.exists(index):
+                    os.remove(index)
+
+            for reuse in [False, True]:
+                SEQS = SeqGroup(path, storage="index")
+                self.assertEqual(open(path + ".fai").read(),
+                                 "seq1\t6\t14\t4\t5\nseq2\t11\t28\t5\t6\nseq1\t2\t48\t2\t3\n")
+                self.assertEqual(SEQS.get_seq("seq2"), "AAAAACCCCCG")
+                self.assertEqual(SEQS.get_seq("1_seq1"), "TT")
+                self.assertEqual([(name, seq) for name, seq, comments in SEQS],
+                                 [("seq1", "ACGTAC"), ("seq2", "AAAAACCCCCG"), ("1_seq1", "TT")])
+                SEQS.set_seq("seq2", "A-A")
+                self.assertEqual(SEQS.get_seq("seq2"), "A-A")
+                SEQS.close()
+        self.assertTrue(os.path.exists(fname + ".gz.gzi"))
+
+        # comment lines are skipped as in read_fasta
+        fname = "/tmp/ete_test_indexed_comments.fa"
+        open(fname, "w").write("#comment\n>seq1\n#comment\nACGT\nAC\n#comment\n>seq2\nAA\n")
+        if os.path.exists(fname + ".fai"):
+            os.remove(fname + ".fai")
+        with SeqGroup(fname, storage="index") as SEQS:
+            self.assertEqual([(name, seq) for name, seq, comments in SEQS],
+                             [("seq1", "ACGTAC"), ("seq2", "AA")])
+        self.assertTrue(SEQS.id2seq.index._fh is None)
+
+        # files are also closed when indexes are garbage collected
+        import gc, warnings
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            SEQS = SeqGroup(fname, storage="index")
+            del SEQS
+            gc.collect()
+        self.assertEqual([w for w in caught if w.category.__name__ == "ResourceWarning"], [])
+        open(fname, "w").write(">seq1\nACGT\n#comment\nAC\n")
+        self.assertRaises(ValueError, SeqGroup, fname, storage="index")
+
+        open("/tmp/ete_test_indexed_bad.fa", "w").write(">seq1\nACG\nACGT\n")
+        self.assertRaises(ValueError, SeqGroup, "/tmp/ete_test_indexed_bad.fa", storage="index")
+        self.assertRaises(ValueError, SeqGroup, fasta, storage="index")
+
+    def test_alignment_array(self):
+        alg = SeqGroup(phylip_sequencial, format="phylip")
+        names = [name for name, seq, comments in alg.iter_entries()]
+        matrix = alg.to_array()
+        self.assertEqual(matrix.shape, (len(alg), len(alg.get_seq(names[0]))))
+        self.assertEqual(matrix.dtype.name, "uint8")
+        for row, name in enumerate(names):
+            self.assertEqual(matrix[row].tobytes().decode(), alg.get_seq(name))
+
+        # round trip keeps names, order and sequences
+        alg2 = SeqGroup.from_array(matrix, names)
+        self.assertEqual(alg2.write(format="fasta"), alg.write(format="fasta"))
+        self.assertEqual(alg2.write(format="phylip"), alg.write(format="phylip"))
+        alg3 = SeqGroup.from_array(matrix, names, storage="buffer")
+        self.assertEqual(alg3.write(format="fasta"), alg.write(format="fasta"))
+
+        # column profiles
+        gaps = alg.get_gap_profile()
+        identity = alg.get_identity_profile()
+        for col in [0, 10, 57, matrix.shape[1] - 1]:
+            column = [alg.get_seq(name)[col] for name in names]
+            self.assertAlmostEqual(gaps[col], column.count("-") / float(len(column)))
+            counts = [column.count(c) for c in set(column) if c != "-"]
+            self.assertAlmostEqual(identity[col], max(counts or [0]) / float(len(column)))
+
+        # column and row subsets
+        trimmed = alg.select_columns(gaps < 0.5)
+        for name in names:
+            expected = "".join(c for c, g in zip(alg.get_seq(name), gaps) if g < 0.5)
+            self.assertEqual(trimmed.get_seq(name), expected)
+        subset = alg.select_rows(names[:2])
+        self.assertEqual(len(subset), 2)
+        self.assertEqual(subset.get_seq(names[1]), alg.get_seq(names[1]))
+        self.assertEqual(alg.select_columns([0, 1]).get_seq(names[0]),
+                         alg.get_seq(names[0])[:2])
+        self.assertEqual(alg.select_columns([]).get_seq(names[0]), "")
+
+        self.assertRaises(ValueError, SeqGroup(fasta_example).to_array)
+
     def test_alg_from_scratch(self):
 
         alg = SeqGroup(phylip_sequencial, format="phylip")
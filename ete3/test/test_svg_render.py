@@ -0,0 +1,169 @@
+# #START_LICENSE###########################################################
+#
+#
+# This file is part of the Environment for Tree Exploration program
+# (ETE).  http://etetoolkit.org
+#
+# ETE is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ETE is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public
+# License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ETE.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#                     ABOUT THE ETE PACKAGE
+#                     =====================
+#
+# ETE is distributed under the GPL copyleft license (2008-2015).
+#
+# If you make use of ETE in published work, please cite:
+#
+# Jaime Huerta-Cepas, Joaquin Dopazo and Toni Gabaldon.
+# ETE: a python Environment for Tree Exploration. Jaime BMC
+# Bioinformatics 2010,:24doi:10.1186/1471-2105-11-24
+#
+# Note that extra references to the specific methods implemented in
+# the toolkit may be available in the documentation.
+#
+# More info at http://etetoolkit.org. Contact: huerta@embl.de
+#
+#
+# #END_LICENSE#############################################################
+from __future__ import absolute_import
+import unittest
+from xml.etree import ElementTree
+
+from .. import Tree, TreeStyle, faces
+from ..treeview import svg_render, render_many, face_cache
+
+class Test_SVG_Render(unittest.TestCase):
+    """ Tests the Qt free SVG render backend """
+    def setUp(self):
+        self.t = Tree()
+        self.t.populate(20, random_branches=True)
+
+    def test_render_file(self):
+        """ Tests writing SVG files for rectangular and circular trees """
+        for mode in ["r", "c"]:
+            ts = TreeStyle()
+            ts.mode = mode
+            ts.show_branch_length = True
+            ts.title.add_face(faces.TextFace("Title"), column=0)
+            img_map = self.t.render("/tmp/ete_test_%s.svg" %mode, tree_style=ts,
+                                    w=400, backend="svg")
+            svg = ElementTree.parse("/tmp/ete_test_%s.svg" %mode).getroot()
+            self.assertEqual(svg.get("width"), "400")
+            texts = set(e.text for e in svg.iter("{http://www.w3.org/2000/svg}text"))
+            self.assertTrue("Title" in texts)
+            for leaf in self.t:
+                self.assertTrue(leaf.name in texts)
+
+            # one node ball per node and one name face per leaf
+            self.assertEqual(len(img_map["nodes"]), len(list(self.t.traverse())))
+            self.assertEqual(set(f[5] for f in img_map["faces"] if f[5] is not None),
+                             set(self.t.get_leaf_names()) |
+                             set("%0.3g" %n.dist for n in self.t.traverse()))
+            for x1, y1, x2, y2, nid, label in img_map["faces"]:
+                self.assertTrue(0 <= x1 <= x2 <= 400.5)
+                self.assertTrue(0 <= y1 <= y2)
+
+    def test_get_img(self):
+        """ Tests returning the image data """
+        ts = TreeStyle()
+        ts.rotation = 90
+        ts.legend.add_face(faces.CircleFace(5, "red"), column=0)
+        ts.legend.add_face(faces.RectFace(10, 5, "black", "green"), column=1)
+        svg, img_map = svg_render.get_img(self.t, tree_style=ts)
+        self.assertEqual(img_map, {})
+        ElementTree.fromstring(svg.encode("utf-8"))
+
+    def test_unsupported(self):
+        """ Tests errors for features the SVG backend does not support"""
+        ts = TreeStyle()
+        ts.title.add_face(faces.StaticItemFace(None), column=0)
+        self.assertRaises(ValueError, self.t.render, "/tmp/ete_test.svg",
+                          tree_style=ts, backend="svg")
+        self.assertRaises(ValueError, self.t.render, "/tmp/ete_test.jpg",
+                          backend="svg")
+        self.assertRaises(ValueError, self.t.render, "/tmp/ete_test.svg",
+                          backend="foo")
+
+    def test_render_many(self):
+        """ Tests rendering several trees at once """
+        t2 = Tree()
+        t2.populate(10, random_branches=True)
+        for n in t2.traverse():
+            n.dist *= 10
+        ts = TreeStyle()
+        ts.title.add_face(faces.TextFace("Title"), column=0)
+        self.t.render("/tmp/ete_test_single.svg", tree_style=ts, backend="svg")
+
+        for workers in [1, 2]:
+            trees = [("a", t2), ("b", self.t), ("c", t2)]
+            results = list(render_many(trees, "/tmp/ete_test_many_%s.svg", ts,
+                                       workers=workers, backend="svg"))
+            self.assertEqual(sorted(r[:2] for r in results),
+                             [(0, "/tmp/ete_test_many_a.svg"),
+                              (1, "/tmp/ete_test_many_b.svg"),
+                              (2, "/tmp/ete_test_many_c.svg")])
+            for index, fname, secs in results:
+                self.assertTrue(secs >= 0)
+            # the scale of the previous tree is not reused
+            self.assertEqual(open("/tmp/ete_test_many_b.svg").read(),
+                             open("/tmp/ete_test_single.svg").read())
+
+        results = list(render_many([t2, self.t], "/tmp/ete_test_many_%d.svg",
+                                   backend="svg"))
+        self.assertEqual([r[1] for r in results], ["/tmp/ete_test_many_0.svg",
+                                                   "/tmp/ete_test_many_1.svg"])
+
+class Test_Face_Cache(unittest.TestCase):
+    """ Tests the font and text metrics caches """
+    def test_lru_cache(self):
+        """ Tests LRU eviction and counters """
+        cache = face_cache.LRUCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertTrue("a" in cache)
+        self.assertTrue("b" not in cache)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.stats(), {"size": 2, "maxsize": 2, "hits": 1,
+                                         "misses": 1, "evictions": 1})
+        cache.maxsize = 1
+        self.assertEqual(list(cache._data.keys()), ["c"])
+        cache.clear()
+        self.assertEqual(cache.stats(), {"size": 0, "maxsize": 1, "hits": 0,
+                                         "misses": 0, "evictions": 0})
+
+    def test_text_metrics(self):
+        """ Tests that identical labels are measured only once """
+        face_cache.clear_caches()
+        t = Tree("((A:1,B:1):1,(C:1,D:1):1);")
+        ts = TreeStyle()
+        ts.show_branch_length = True
+        t.render("/tmp/ete_test.svg", tree_style=ts, backend="svg")
+        stats = face_cache.cache_stats()["text_metrics"]
+        # four leaf names, "1" and "0" branch lengths and the scale label
+        self.assertEqual(stats["size"], 7)
+        self.assertTrue(stats["hits"] > 0)
+
+        maxsize = face_cache.TEXT_METRICS.maxsize
+        try:
+            face_cache.set_cache_size(3)
+            self.assertEqual(face_cache.cache_stats()["text_metrics"]["size"], 3)
+            self.assertEqual(svg_render.get_text_size("A", "Arial", 10),
+                             svg_render._measure_text("A", "arial", 10, False))
+        finally:
+            face_cache.set_cache_size(maxsize)
+
+if __name__ == '__main__':
+    unittest.main()
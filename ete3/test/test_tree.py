@@ -253,6 +253,95 @@ class Test_Coretype_Tree(unittest.TestCase):
             self.assertEqual(nw, nw_back)
             self.assertEqual(nw, nw_back2)
 
+    def test_fast_newick_engine(self):
+        """ tests that the fast parser engine is equivalent to the regex one """
+        from ..parser.newick import NW_FORMAT, read_newick
+
+        t = Tree()
+        t.populate(50, random_branches=True)
+        for n in t.traverse():
+            n.add_features(mood=random.choice(["happy", "sad"]))
+        for f in NW_FORMAT:
+            nw = t.write(format=f, features=["mood"], format_root_node=True)
+            t1 = Tree(nw, format=f)
+            t2 = Tree(nw, format=f, newick_engine="fast")
+            self.assertEqual(t1.write(format=f, features=[]),
+                             t2.write(format=f, features=[]))
+            self.assertEqual(t1.dist, t2.dist)
+
+        for nw in [nw_full, nw2_full, nw_simple5, nw_simple6, "hola;", "(hola);",
+                   "( A , B:0.5 )C;", "(A,\n(B,\tC));"]:
+            self.assertEqual(Tree(nw, format=1).write(format=1, features=[]),
+                             Tree(nw, format=1, newick_engine="fast").write(format=1, features=[]))
+
+        # NHX blocks may contain newick reserved chars
+        t = read_newick("(A[&&NHX:note=x,y(z)],B);", engine="fast")
+        self.assertEqual((t&"A").note, "x,y(z)")
+
+        # quoted names
+        complex_name = "((A:0.0001[&&NHX:hello=true],B:0.011)90:0.01[&&NHX:hello=true],(C:0.01, D:0.001)hello:0.01);"
+        nw = '''(("A:\\"0.1\\"":1,"%s":2)"C:'0.00'":3,"D'sd''\'":4);''' %complex_name
+        t = Tree(newick=nw, format=1, quoted_node_names=True, newick_engine="fast")
+        self.assertEqual(nw, t.write(quoted_node_names=True, format=1))
+        self.assertRaises(NewickError, Tree, newick=nw, quoted_node_names=True, format=0, newick_engine="fast")
+
+        # errors
+        for nw in ["((A,B),C;", "((A,B),C));", "(A,,B);", "(A,B)", "(A,(B)C D);",
+                   "(A:0.1:0.2,B);", "(A:x,B);", "(((A, B), C)[&&NHX:nameI]);",
+                   "(A,B);(C,D);"]:
+            self.assertRaises(NewickError, Tree, nw, newick_engine="fast")
+        self.assertRaises(NewickError, Tree, "(A,B)C;", format=0, newick_engine="fast")
+        self.assertRaises(NewickError, Tree, "(A,B);", format=2, newick_engine="fast")
+        self.assertRaises(ValueError, Tree, "(A,B);", newick_engine="unknown")
+
+    def test_iter_newick(self):
+        """ tests reading multi-newick streams """
+        import gzip
+        from io import StringIO
+        from ..parser import newick
+        from ..parser.newick import iter_newick
+
+        trees = []
+        for i in range(20):
+            t = Tree()
+            t.populate(10, random_branches=True)
+            trees.append(t.write())
+
+        with gzip.open("/tmp/etetempmulti.nw.gz", "wt") as OUT:
+            OUT.write("\n".join(trees) + "\n")
+        with open("/tmp/etetempmulti.nw", "w") as OUT:
+            OUT.write("\n".join(trees))
+
+        # force trees to be split across several chunks
+        chunk_size = newick.STREAM_CHUNK_SIZE
+        newick.STREAM_CHUNK_SIZE = 7
+        try:
+            for fname in ["/tmp/etetempmulti.nw.gz", "/tmp/etetempmulti.nw"]:
+                self.assertEqual([t.write() for t in iter_newick(fname)], trees)
+                self.assertEqual([t.write() for t in iter_newick(fname, skip=5, every=3)],
+                                 trees[5::3])
+                self.assertEqual([t.write() for t in iter_newick(fname, engine="regex", skip=18)],
+                                 trees[18:])
+        finally:
+            newick.STREAM_CHUNK_SIZE = chunk_size
+
+        # semicolons within NHX blocks and quoted names
+        stream = StringIO("(A[&&NHX:x=;],'B;C')D;\n(E,F);")
+        names = [t.get_leaf_names() for t in iter_newick(stream, format=1, quoted_names=True)]
+        self.assertEqual(names, [["A", "B;C"], ["E", "F"]])
+
+        t = next(iter_newick(StringIO("((a,b),c);"), tree_class=PhyloTree))
+        self.assertTrue(isinstance(t, PhyloTree))
+        # classes that do not accept all parser options
+        from .. import ClusterTree
+        t = next(iter_newick(StringIO("((a,b),c);"), tree_class=ClusterTree))
+        self.assertEqual(t.get_leaf_names(), ["a", "b", "c"])
+        self.assertRaises(ValueError, list, iter_newick(StringIO("((a,b),c);"), format=1,
+                                                        tree_class=ClusterTree))
+
+        self.assertRaises(NewickError, list, iter_newick(StringIO("(A,B);(C,D)")))
+        self.assertRaises(ValueError, list, iter_newick(StringIO("(A,B);"), every=0))
+
     def test_custom_formatting_formats(self):
         """ test to change dist, name and support formatters """
         t = Tree('((A:1.111111, B:2.222222)C:3.33333, D:4.44444);', format=1)
@@ -698,6 +787,14 @@ class Test_Coretype_Tree(unittest.TestCase):
         self.assertEqual(ancestors, ["H", "I", "root"])
         self.assertEqual(t.get_ancestors(), [])
 
+        # leaves of every clade as ranges of the preorder leaf list
+        leaves, node2range = t.get_leaf_ranges()
+        self.assertEqual([n.name for n in leaves], ['A', 'B', 'C', 'D', 'F'])
+        self.assertEqual(node2range[t], (0, 5))
+        self.assertEqual(node2range[t&"I"], (0, 3))
+        self.assertEqual(node2range[t&"J"], (3, 5))
+        self.assertEqual(node2range[t&"C"], (2, 3))
+
         # add something of is_leaf_fn etc...
         custom_test = lambda x: x.name in set("JCH")
         custom_leaves = t.get_leaves(is_leaf_fn=custom_test)
@@ -948,6 +1045,51 @@ class Test_Coretype_Tree(unittest.TestCase):
                          (1.0, 8, 8, 0.0, 0.0, 6, 1, "NA"))
 
 
+    def test_robinson_foulds_matrix(self):
+        from .. import robinson_foulds_matrix
+        names = ["L%d" % i for i in range(15)]
+        random.seed(2)
+        trees1, trees2 = [], []
+        for trees, size in [(trees1, 5), (trees2, 4)]:
+            for i in range(size):
+                t = Tree()
+                t.populate(12, names_library=random.sample(names, 12), random_branches=True)
+                t.resolve_polytomy(recursive=False)
+                for n in t.traverse():
+                    n.support = random.random()
+                for n in t.get_descendants():
+                    if not n.is_leaf() and n.up is not t and random.random() < 0.2:
+                        n.delete()
+                trees.append(t)
+
+        for unrooted in [False, True]:
+            for min_support in [0.0, 0.5]:
+                kargs = dict(unrooted_trees=unrooted, min_support_t1=min_support,
+                             min_support_t2=min_support)
+                rf = robinson_foulds_matrix(trees1, trees2, **kargs)
+                nrf = robinson_foulds_matrix(trees1, trees2, normalized=True, **kargs)
+                self.assertEqual(rf.shape, (5, 4))
+                for i, t1 in enumerate(trees1):
+                    for j, t2 in enumerate(trees2):
+                        expected, max_rf = t1.robinson_foulds(t2, **kargs)[:2]
+                        self.assertEqual(rf[i, j], expected)
+                        if max_rf > 0:
+                            self.assertAlmostEqual(nrf[i, j], expected / float(max_rf))
+
+                allvsall = robinson_foulds_matrix(trees1, **kargs)
+                for i, t1 in enumerate(trees1):
+                    for j, t2 in enumerate(trees1):
+                        self.assertEqual(allvsall[i, j], t1.robinson_foulds(t2, **kargs)[0])
+
+        parallel = robinson_foulds_matrix(trees1, trees2, cpus=2)
+        self.assertTrue((parallel == robinson_foulds_matrix(trees1, trees2)).all())
+
+        t = Tree("(A,B,C);")
+        self.assertRaises(TreeError, robinson_foulds_matrix, [t], [t])
+        self.assertEqual(robinson_foulds_matrix([t], [t], unrooted_trees=True)[0, 0], 0)
+        self.assertRaises(TreeError, robinson_foulds_matrix,
+                          [Tree("((A,A),B);")], [Tree("((A,B),C);")])
+
     def test_tree_diff(self):
         # this is the result of 100 Ktreedist runs on random trees, using rooted
         # and unrooted topologies. ETE should provide the same RF result
@@ -1299,6 +1441,63 @@ class Test_Coretype_Tree(unittest.TestCase):
         self.assertEqual(set(mono_nodes), green_yellow_nodes)
 
 
+    def test_lca_index(self):
+        t = Tree()
+        t.populate(200, random_branches=True)
+        ref = t.copy()
+        nodes = list(t.traverse())
+        random.seed(1)
+        queries = [random.sample(nodes, 3) for _ in range(200)]
+        expected_lca = [t.get_common_ancestor(*q) for q in queries]
+        expected_dist = [a.get_distance(b) for a, b, c in queries]
+        expected_topo = [a.get_distance(b, topology_only=True) for a, b, c in queries]
+
+        t.build_lca_index()
+        for n in t.traverse():
+            self.assertTrue(n._get_lca_index() is not None)
+        self.assertEqual([t.get_common_ancestor(*q) for q in queries], expected_lca)
+        self.assertEqual([t.get_common_ancestor(*q, get_path=True)[0] for q in queries],
+                         expected_lca)
+        for (a, b, c), d1, d2 in zip(queries, expected_dist, expected_topo):
+            self.assertAlmostEqual(a.get_distance(b), d1, places=6)
+            self.assertEqual(a.get_distance(b, topology_only=True), d2)
+            if a.is_leaf():
+                self.assertAlmostEqual(t.get_distance(a.name, b), d1, places=6)
+
+        names = t.get_leaf_names()
+        for i in range(50):
+            values = random.sample(names, random.randint(1, 10))
+            is_mono, clade_type, foreign = t.check_monophyly(values, "name")
+            ref_mono, ref_type, ref_foreign = ref.check_monophyly(values, "name")
+            self.assertEqual((is_mono, clade_type), (ref_mono, ref_type))
+            self.assertEqual(sorted(n.name for n in foreign),
+                             sorted(n.name for n in ref_foreign))
+
+        # copies are not indexed, and the original keeps its index
+        t2 = t.copy()
+        self.assertTrue(t2._get_lca_index() is None)
+        self.assertTrue(t._get_lca_index() is not None)
+
+        # any topology change invalidates the index
+        t.children[0].add_child(name="new")
+        self.assertTrue(t._get_lca_index() is None)
+        self.assertTrue(nodes[-1]._get_lca_index() is None)
+        t.build_lca_index()
+        leaf = t.search_nodes(name="new")[0]
+        self.assertEqual(t.get_common_ancestor(leaf, t.children[0]), t.children[0])
+        leaf.detach()
+        self.assertTrue(t._get_lca_index() is None)
+        t.build_lca_index()
+        t.set_outgroup(t.get_leaves()[0])
+        self.assertTrue(t._get_lca_index() is None)
+
+        # so does any branch length change
+        t = Tree('((A:1,B:1):1,C:1);')
+        t.build_lca_index()
+        (t&'A').dist = 10
+        self.assertTrue(t._get_lca_index() is None)
+        self.assertEqual(t.get_distance('A', 'C'), 12.0)
+
     def test_copy(self):
         t = Tree("((A, B)Internal_1:0.7, (C, D)Internal_2:0.5)root:1.3;", format=1)
         # we add a custom annotation to the node named A
@@ -1395,6 +1594,37 @@ class Test_Coretype_Tree(unittest.TestCase):
                 self.assertAlmostEqual(actualdists[i][j], dists[i][j], places=4)
         self.assertEqual(actualleaves, leaves)
 
+        # nested lists are keyed by leaf name, so duplicated names are
+        # reported once
+        t2 = Tree("((A:1,B:2):1,(A:3,C:1):2);")
+        dists2, leaves2 = t2.cophenetic_matrix()
+        self.assertEqual(leaves2, ["A", "B", "C"])
+        self.assertEqual(len(dists2), 3)
+        self.assertEqual(dists2[0][0], 0)
+        self.assertTrue(isinstance(dists2[0][0], int))
+        dists2, leaves2 = t2.cophenetic_matrix(as_array=True)
+        self.assertEqual(leaves2, ["A", "B", "A", "C"])
+        self.assertEqual(dists2.shape, (4, 4))
+
+        # NumPy arrays follow the leaf order of the tree
+        order = [actualleaves.index(name) for name in t.get_leaf_names()]
+        dists, leaves = t.cophenetic_matrix(as_array=True)
+        self.assertEqual(leaves, t.get_leaf_names())
+        for i, ri in enumerate(order):
+            for j, rj in enumerate(order):
+                self.assertAlmostEqual(actualdists[ri][rj], dists[i, j], places=4)
+
+        dists32, leaves = t.cophenetic_matrix(as_array=True, dtype="float32")
+        self.assertEqual(str(dists32.dtype), "float32")
+        self.assertTrue(abs(dists32 - dists).max() < 1e-5)
+
+        import os
+        fname = "/tmp/etetempcophenetic.mmap"
+        mdists, leaves = t.cophenetic_matrix(memmap=fname, dtype="float32")
+        self.assertEqual(mdists.shape, (len(leaves), len(leaves)))
+        self.assertEqual(os.path.getsize(fname), len(leaves) ** 2 * 4)
+        self.assertTrue(abs(mdists - dists32).max() < 1e-6)
+
 
     # def test_traversing_speed(self):
     #     return
@@ -0,0 +1,169 @@
+# #START_LICENSE###########################################################
+#
+#
+# This file is part of the Environment for Tree Exploration program
+# (ETE).  http://etetoolkit.org
+#
+# ETE is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ETE is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public
+# License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ETE.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#                     ABOUT THE ETE PACKAGE
+#                     =====================
+#
+# ETE is distributed under the GPL copyleft license (2008-2015).
+#
+# If you make use of ETE in published work, please cite:
+#
+# Jaime Huerta-Cepas, Joaquin Dopazo and Toni Gabaldon.
+# ETE: a python Environment for Tree Exploration. Jaime BMC
+# Bioinformatics 2010,:24doi:10.1186/1471-2105-11-24
+#
+# Note that extra references to the specific methods implemented in
+# the toolkit may be available in the documentation.
+#
+# More info at http://etetoolkit.org. Contact: huerta@embl.de
+#
+#
+# #END_LICENSE#############################################################
+from __future__ import absolute_import
+import io
+import os
+import unittest
+from xml.etree import ElementTree
+
+from six.moves.urllib.parse import urlencode
+
+from .. import Tree, TreeStyle, WebTreeApplication
+from ..webplugin.tiles import TreeTiler, _GridIndex
+
+class Test_Webplugin_Tiles(unittest.TestCase):
+    """ Tests the tiled tree viewer """
+    def setUp(self):
+        self.t = Tree()
+        self.t.populate(200, random_branches=True)
+
+    def test_grid_index(self):
+        """ Tests region queries in the grid index """
+        index = _GridIndex(cell_size=10)
+        index.add((0, 0, 5, 5))
+        index.add((100, 100, 400, 120))
+        index.add(None)
+        index.add((50, 0, 51, 1))
+        self.assertEqual(index.query((0, 0, 10, 10)), [0, 2])
+        self.assertEqual(index.query((0, 0, 1000, 1000)), [0, 1, 2, 3])
+        self.assertEqual(index.query((0, 0, 1000, 1000), min_size=3), [0, 1, 2])
+        self.assertEqual(index.query((390, 110, 500, 500)), [1, 2])
+
+    def test_tiles(self):
+        """ Tests tile images, tile maps and the tile cache """
+        ts = TreeStyle()
+        ts.show_branch_length = True
+        tiler = TreeTiler(self.t, tree_style=ts, tile_size=128, backend="svg",
+                          cache_dir="/tmp/ete_test_tiles")
+        tiler.clear_cache()
+        info = tiler.get_info()
+        self.assertEqual(info["format"], "svg")
+        self.assertEqual(tiler.get_tile_grid(0), (1, 1))
+        cols, rows = tiler.get_tile_grid(tiler.max_zoom)
+        self.assertEqual(rows, int((info["height"] - 1) // 128) + 1)
+        self.assertTrue(tiler.get_scale(tiler.max_zoom) == 1.0)
+
+        # every leaf name is drawn in the tiles at max zoom
+        names = set()
+        for x in range(cols):
+            for y in range(rows):
+                svg = ElementTree.fromstring(tiler.get_tile(tiler.max_zoom, x, y))
+                self.assertEqual(svg.get("width"), "128")
+                names.update([e.text for e in svg.iter("{http://www.w3.org/2000/svg}text")])
+        self.assertTrue(set(self.t.get_leaf_names()) <= names)
+
+        # tile maps use coordinates relative to each tile
+        labels = set()
+        for x in range(cols):
+            for y in range(rows):
+                tile_map = tiler.get_tile_map(tiler.max_zoom, x, y)
+                for x1, y1, x2, y2, nid, label in tile_map["faces"] + tile_map["nodes"]:
+                    self.assertTrue(x2 >= 0 and y2 >= 0 and x1 <= 128 and y1 <= 128)
+                    self.assertTrue(nid in tile_map["node_areas"])
+                    labels.add(label)
+        self.assertTrue(set(self.t.get_leaf_names()) <= labels)
+        # small areas are not returned when zoomed out
+        self.assertEqual(tiler.get_tile_map(0, 0, 0)["nodes"], [])
+
+        # tiles are cached in memory and on disk
+        data = tiler.get_tile(0, 0, 0)
+        self.assertTrue(tiler.get_tile(0, 0, 0) is data)
+        self.assertTrue(os.path.exists("/tmp/ete_test_tiles/0/0_0.svg"))
+        # tiles are moved into place, with no temporary files left behind,
+        # and writing into an existing zoom directory works
+        self.assertEqual(os.listdir("/tmp/ete_test_tiles/0"), ["0_0.svg"])
+        tiler._tiles.clear()
+        os.remove("/tmp/ete_test_tiles/0/0_0.svg")
+        self.assertEqual(tiler.get_tile(0, 0, 0), data)
+        self.assertEqual(os.listdir("/tmp/ete_test_tiles/0"), ["0_0.svg"])
+        tiler._tiles.clear()
+        self.assertEqual(tiler.get_tile(0, 0, 0), data)
+        tiler.clear_cache()
+        self.assertFalse(os.path.exists("/tmp/ete_test_tiles/0"))
+
+        self.assertRaises(ValueError, tiler.get_tile, 0, 1, 0)
+        self.assertRaises(ValueError, tiler.get_tile, tiler.max_zoom + 1, 0, 0)
+
+    def test_tile_mode(self):
+        """ Tests serving tiles from the web application """
+        if not os.path.exists("/tmp/ete_test_web"):
+            os.mkdir("/tmp/ete_test_web")
+        app = WebTreeApplication()
+        app.CONFIG["temp_dir"] = "/tmp/ete_test_web"
+        app.set_tree_loader(Tree)
+        app.set_tile_mode(tile_size=128, backend="svg")
+
+        def request(method, **queries):
+            status = []
+            environ = {"PATH_INFO": "/"+method, "REQUEST_METHOD": "GET",
+                       "QUERY_STRING": urlencode(queries),
+                       "wsgi.input": io.BytesIO()}
+            response = app(environ, lambda code, headers: status.append((code, headers)))
+            return status[0], response
+
+        status, html = request("draw", treeid="test", tree=self.t.write())
+        self.assertTrue('ete_tile_viewer("test"' in html)
+
+        status, response = request("tile", treeid="test", z=0, x=0, y=0)
+        self.assertEqual(status, ("200 OK", [("content-type", "image/svg+xml")]))
+        ElementTree.fromstring(response[0])
+
+        status, response = request("tile", treeid="test", z=0, x=0, y=0,
+                                   map=1, mapid="tile_map")
+        self.assertEqual(status[0], "200 OK")
+        self.assertTrue(response[0].startswith(b'<MAP NAME="tile_map"'))
+
+        status, response = request("tile", treeid="test", z=0, x=1, y=0)
+        self.assertEqual(status[0], "404 Not Found")
+
+        # a new process loads the tree dumped by the previous one
+        app = WebTreeApplication()
+        app.CONFIG["temp_dir"] = "/tmp/ete_test_web"
+        app.set_tree_loader(Tree)
+        app.set_tile_mode(tile_size=128, backend="svg")
+        status, response = request("tile", treeid="test", z=0, x=0, y=0)
+        self.assertEqual(status, ("200 OK", [("content-type", "image/svg+xml")]))
+        ElementTree.fromstring(response[0])
+        self.assertEqual(sorted(app._treeid2tree["test"].get_leaf_names()),
+                         sorted(self.t.get_leaf_names()))
+
+        self.assertRaises(ValueError, TreeTiler, self.t, backend="png")
+
+if __name__ == '__main__':
+    unittest.main()
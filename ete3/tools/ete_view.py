@@ -39,6 +39,7 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
+import sys
 import random
 import re
 import colorsys
@@ -47,6 +48,7 @@ from collections import defaultdict
 from .common import log, POSNAMES, node_matcher, src_tree_iterator
 from .. import (Tree, PhyloTree, TextFace, RectFace, faces, TreeStyle, CircleFace, AttrFace,
                 add_face_to_node, random_color)
+from ..treeview import render_many
 from six.moves import map
 
 DESC = ""
@@ -77,6 +79,10 @@ COLOR_RANKS = { "superclass": "#a6cee3", "class": "#a6cee3", "subclass": "#a6cee
 
 
 
+def no_layout(node):
+    # module level function, so the tree style can be sent to render workers
+    pass
+
 def populate_args(view_args_p):
     view_args_p.add_argument("--face", action="append",
                              help="adds a face to the selected nodes. In example --face 'value:@dist, pos:b-top, color:red, size:10, if:@dist>0.9' ")
@@ -154,6 +160,18 @@ def populate_args(view_args_p):
                         help=("Adjust tree scale so the distance from root to the"
                               " farthest leaf uses a fixed width in pixels."))
 
+    img_gr.add_argument("--lod", dest="level_of_detail",
+                        type=int, default=10000,
+                        help=("Trees with more leaves than this value are shown"
+                              " in level of detail mode: small or hidden clades"
+                              " are collapsed until zooming or scrolling to them."
+                              " Use 0 to disable it."))
+
+    img_gr.add_argument("--workers", dest="workers",
+                        type=int, default=1,
+                        help=("Number of processes used to render the images"
+                              " when several trees are provided."))
+
 
     edit_gr = view_args_p.add_argument_group("TREE EDIT OPTIONS")
 
@@ -227,6 +245,7 @@ def run(args):
     ts.mode = args.mode
     ts.show_leaf_name = True
     ts.tree_width = args.tree_width
+    ts.level_of_detail = args.level_of_detail or None
 
 
     for f in FACES:
@@ -267,239 +286,248 @@ def run(args):
         ts.show_branch_length = True
     if args.force_topology:
         ts.force_topology = True
-    ts.layout_fn = lambda x: None
+    ts.layout_fn = no_layout
+
+    # scale the tree
+    if not args.height:
+        args.height = None
+    if not args.width:
+        args.width = None
+
+    if args.image:
+        def iter_targets():
+            for tindex, t in enumerate(iter_trees(args)):
+                if tindex > 0:
+                    yield "t%d.%s" %(tindex, args.image), t
+                else:
+                    yield args.image, t
 
-    for tindex, tfile in enumerate(src_tree_iterator(args)):
-        #print tfile
+        for tindex, fname, secs in render_many(iter_targets(), "%s", tree_style=ts,
+                                               workers=args.workers, w=args.width,
+                                               h=args.height, units=args.size_units):
+            print("%s rendered in %0.2f secs" %(fname, secs), file=sys.stderr)
+    else:
+        for t in iter_trees(args):
+            t.show(None, tree_style=ts)
+
+
+def iter_trees(args):
+    for tfile in src_tree_iterator(args):
         if args.raxml:
             nw = re.sub(":(\d+\.\d+)\[(\d+)\]", ":\\1[&&NHX:support=\\2]", open(tfile).read())
             t = PhyloTree(nw, format=args.src_newick_format)
         else:
             t = PhyloTree(tfile, format=args.src_newick_format)
+        annotate_tree(t, args)
+        yield t
 
+def annotate_tree(t, args):
+    if args.alg:
+        t.link_to_alignment(args.alg, alg_format=args.alg_format)
 
-        if args.alg:
-            t.link_to_alignment(args.alg, alg_format=args.alg_format)
-
-        if args.heatmap:
-            DEFAULT_COLOR_SATURATION = 0.3
-            BASE_LIGHTNESS = 0.7
-            def gradient_color(value, max_value, saturation=0.5, hue=0.1):
-                def rgb2hex(rgb):
-                    return '#%02x%02x%02x' % rgb
-                def hls2hex(h, l, s):
-                    return rgb2hex( tuple([int(x*255) for x in colorsys.hls_to_rgb(h, l, s)]))
-
-                lightness = 1 - (value * BASE_LIGHTNESS) / max_value
-                return hls2hex(hue, lightness, DEFAULT_COLOR_SATURATION)
-
-
-            heatmap_data = {}
-            max_value, min_value = None, None
-            for line in open(args.heatmap):
-                if line.startswith('#COLNAMES'):
-                    pass
-                elif line.startswith('#') or not line.strip():
-                    pass
-                else:
-                    fields = line.split('\t')
-                    name = fields[0].strip()
-
-                    values = [float(x) if x else None for x in fields[1:]]
-
-                    maxv = max(values)
-                    minv = min(values)
-                    if max_value is None or maxv > max_value:
-                        max_value = maxv
-                    if min_value is None or minv < min_value:
-                        min_value = minv
-                    heatmap_data[name] = values
-
-            heatmap_center_value = 0
-            heatmap_color_center = "white"
-            heatmap_color_up = 0.3
-            heatmap_color_down = 0.7
-            heatmap_color_missing = "black"
-
-            heatmap_max_value = abs(heatmap_center_value - max_value)
-            heatmap_min_value = abs(heatmap_center_value - min_value)
-
-            if heatmap_center_value <= min_value:
-                heatmap_max_value = heatmap_min_value + heatmap_max_value
+    if args.heatmap:
+        DEFAULT_COLOR_SATURATION = 0.3
+        BASE_LIGHTNESS = 0.7
+        def gradient_color(value, max_value, saturation=0.5, hue=0.1):
+            def rgb2hex(rgb):
+                return '#%02x%02x%02x' % rgb
+            def hls2hex(h, l, s):
+                return rgb2hex( tuple([int(x*255) for x in colorsys.hls_to_rgb(h, l, s)]))
+
+            lightness = 1 - (value * BASE_LIGHTNESS) / max_value
+            return hls2hex(hue, lightness, DEFAULT_COLOR_SATURATION)
+
+
+        heatmap_data = {}
+        max_value, min_value = None, None
+        for line in open(args.heatmap):
+            if line.startswith('#COLNAMES'):
+                pass
+            elif line.startswith('#') or not line.strip():
+                pass
             else:
-                heatmap_max_value = max(heatmap_min_value, heatmap_max_value)
-
-
-
-        # scale the tree
-        if not args.height:
-            args.height = None
-        if not args.width:
-            args.width = None
-
-        f2color = {}
-        f2last_seed = {}
-        for node in t.traverse():
-            node.img_style['size'] = 0
-            if len(node.children) == 1:
-                node.img_style['size'] = 2
-                node.img_style['shape'] = "square"
-                node.img_style['fgcolor'] = "steelblue"
-
-            ftype_pos = defaultdict(int)
-
-            for findex, f in enumerate(FACES):
-                if (f['nodetype'] == 'any' or
-                    (f['nodetype'] == 'leaf' and node.is_leaf()) or
-                    (f['nodetype'] == 'internal' and not node.is_leaf())):
-
-
-                    # if node passes face filters
-                    if node_matcher(node, f["filters"]):
-                        if f["value"].startswith("@"):
-                            fvalue = getattr(node, f["value"][1:], None)
-                        else:
-                            fvalue = f["value"]
-
-                        # if node's attribute has content, generate face
-                        if fvalue is not None:
-                            fsize = f["size"]
-                            fbgcolor = f["bgcolor"]
-                            fcolor = f['color']
-
-                            if fcolor:
-                                # Parse color options
-                                auto_m = re.search("auto\(([^)]*)\)", fcolor)
-                                if auto_m:
-                                    target_attr = auto_m.groups()[0].strip()
-                                    if not target_attr :
-                                        color_keyattr = f["value"]
-                                    else:
-                                        color_keyattr = target_attr
-
-                                    color_keyattr = color_keyattr.lstrip('@')
-                                    color_bin = getattr(node, color_keyattr, None)
+                fields = line.split('\t')
+                name = fields[0].strip()
+
+                values = [float(x) if x else None for x in fields[1:]]
+
+                maxv = max(values)
+                minv = min(values)
+                if max_value is None or maxv > max_value:
+                    max_value = maxv
+                if min_value is None or minv < min_value:
+                    min_value = minv
+                heatmap_data[name] = values
+
+        heatmap_center_value = 0
+        heatmap_color_center = "white"
+        heatmap_color_up = 0.3
+        heatmap_color_down = 0.7
+        heatmap_color_missing = "black"
+
+        heatmap_max_value = abs(heatmap_center_value - max_value)
+        heatmap_min_value = abs(heatmap_center_value - min_value)
+
+        if heatmap_center_value <= min_value:
+            heatmap_max_value = heatmap_min_value + heatmap_max_value
+        else:
+            heatmap_max_value = max(heatmap_min_value, heatmap_max_value)
+
+
+
+    f2color = {}
+    f2last_seed = {}
+    for node in t.traverse():
+        node.img_style['size'] = 0
+        if len(node.children) == 1:
+            node.img_style['size'] = 2
+            node.img_style['shape'] = "square"
+            node.img_style['fgcolor'] = "steelblue"
+
+        ftype_pos = defaultdict(int)
+
+        for findex, f in enumerate(FACES):
+            if (f['nodetype'] == 'any' or
+                (f['nodetype'] == 'leaf' and node.is_leaf()) or
+                (f['nodetype'] == 'internal' and not node.is_leaf())):
+
+
+                # if node passes face filters
+                if node_matcher(node, f["filters"]):
+                    if f["value"].startswith("@"):
+                        fvalue = getattr(node, f["value"][1:], None)
+                    else:
+                        fvalue = f["value"]
+
+                    # if node's attribute has content, generate face
+                    if fvalue is not None:
+                        fsize = f["size"]
+                        fbgcolor = f["bgcolor"]
+                        fcolor = f['color']
+
+                        if fcolor:
+                            # Parse color options
+                            auto_m = re.search("auto\(([^)]*)\)", fcolor)
+                            if auto_m:
+                                target_attr = auto_m.groups()[0].strip()
+                                if not target_attr :
+                                    color_keyattr = f["value"]
+                                else:
+                                    color_keyattr = target_attr
 
-                                    last_seed = f2last_seed.setdefault(color_keyattr, random.random())
+                                color_keyattr = color_keyattr.lstrip('@')
+                                color_bin = getattr(node, color_keyattr, None)
 
-                                    seed = last_seed + 0.10 + random.uniform(0.1, 0.2)
-                                    f2last_seed[color_keyattr] = seed
+                                last_seed = f2last_seed.setdefault(color_keyattr, random.random())
 
-                                    fcolor = f2color.setdefault(color_bin, random_color(h=seed))
+                                seed = last_seed + 0.10 + random.uniform(0.1, 0.2)
+                                f2last_seed[color_keyattr] = seed
 
-                            if fbgcolor:
-                                # Parse color options
-                                auto_m = re.search("auto\(([^)]*)\)", fbgcolor)
-                                if auto_m:
-                                    target_attr = auto_m.groups()[0].strip()
-                                    if not target_attr :
-                                        color_keyattr = f["value"]
-                                    else:
-                                        color_keyattr = target_attr
-
-                                    color_keyattr = color_keyattr.lstrip('@')
-                                    color_bin = getattr(node, color_keyattr, None)
-
-                                    last_seed = f2last_seed.setdefault(color_keyattr, random.random())
-
-                                    seed = last_seed + 0.10 + random.uniform(0.1, 0.2)
-                                    f2last_seed[color_keyattr] = seed
-
-                                    fbgcolor = f2color.setdefault(color_bin, random_color(h=seed))
-
-                            if f["ftype"] == "text":
-                                if f.get("format", None):
-                                    fvalue = f["format"] % fvalue
-
-                                F = TextFace(fvalue,
-                                             fsize = fsize,
-                                             fgcolor = fcolor or "black",
-                                             fstyle = f.get('fstyle', None))
-
-                            elif f["ftype"] == "fullseq":
-                                F = faces.SeqMotifFace(seq=fvalue, seq_format="seq",
-                                                       gap_format="line",
-                                                       height=fsize)
-                            elif f["ftype"] == "compactseq":
-                                F = faces.SeqMotifFace(seq=fvalue, seq_format="compactseq",
-                                                       gap_format="compactseq",
-                                                       height=fsize)
-                            elif f["ftype"] == "blockseq":
-                                F = faces.SeqMotifFace(seq=fvalue, 
-                                                       height=fsize,
-                                                       fgcolor=fcolor or "slategrey",
-                                                       bgcolor=fbgcolor or "slategrey",
-                                                       scale_factor = 1.0)
-                                fbgcolor = None
-                            elif f["ftype"] == "bubble":
-                                try:
-                                    v = float(fvalue)
-                                except ValueError:
-                                    rad = fsize
-                                else:
-                                    rad = fsize * v
-                                F = faces.CircleFace(radius=rad, style="sphere",
-                                                     color=fcolor or "steelblue")
+                                fcolor = f2color.setdefault(color_bin, random_color(h=seed))
 
-                            elif f["ftype"] == "heatmap":
-                                if not f['column']:
-                                    col = ftype_pos[f["pos"]]
+                        if fbgcolor:
+                            # Parse color options
+                            auto_m = re.search("auto\(([^)]*)\)", fbgcolor)
+                            if auto_m:
+                                target_attr = auto_m.groups()[0].strip()
+                                if not target_attr :
+                                    color_keyattr = f["value"]
                                 else:
-                                    col = f["column"]
-
-                                for i, value in enumerate(heatmap_data.get(node.name, [])):
-                                    ftype_pos[f["pos"]] += 1
-
-                                    if value is None:
-                                        color = heatmap_color_missing
-                                    elif value > heatmap_center_value:
-                                        color = gradient_color(abs(heatmap_center_value - value), heatmap_max_value, hue=heatmap_color_up)
-                                    elif value < heatmap_center_value:
-                                        color = gradient_color(abs(heatmap_center_value - value), heatmap_max_value, hue=heatmap_color_down)
-                                    else:
-                                        color = heatmap_color_center
-                                    node.add_face(RectFace(20, 20, color, color), position="aligned", column=col + i)
-                                    # Add header
-                                    # for i, name in enumerate(header):
-                                    #    nameF = TextFace(name, fsize=7)
-                                    #    nameF.rotation = -90
-                                    #    tree_style.aligned_header.add_face(nameF, column=i)
-                                F = None
-
-                            elif f["ftype"] == "profile":
-                                # internal profiles?
-                                F = None
-                            elif f["ftype"] == "barchart":
-                                F = None
-                            elif f["ftype"] == "piechart":
-                                F = None
-
-
-
-                            # Add the Face
-                            if F:
-                                F.opacity = f['opacity'] or 1.0
-
-                                # Set face general attributes
-                                if fbgcolor:
-                                    F.background.color = fbgcolor
-
-                                if not f['column']:
-                                    col = ftype_pos[f["pos"]]
-                                    ftype_pos[f["pos"]] += 1
+                                    color_keyattr = target_attr
+
+                                color_keyattr = color_keyattr.lstrip('@')
+                                color_bin = getattr(node, color_keyattr, None)
+
+                                last_seed = f2last_seed.setdefault(color_keyattr, random.random())
+
+                                seed = last_seed + 0.10 + random.uniform(0.1, 0.2)
+                                f2last_seed[color_keyattr] = seed
+
+                                fbgcolor = f2color.setdefault(color_bin, random_color(h=seed))
+
+                        if f["ftype"] == "text":
+                            if f.get("format", None):
+                                fvalue = f["format"] % fvalue
+
+                            F = TextFace(fvalue,
+                                         fsize = fsize,
+                                         fgcolor = fcolor or "black",
+                                         fstyle = f.get('fstyle', None))
+
+                        elif f["ftype"] == "fullseq":
+                            F = faces.SeqMotifFace(seq=fvalue, seq_format="seq",
+                                                   gap_format="line",
+                                                   height=fsize)
+                        elif f["ftype"] == "compactseq":
+                            F = faces.SeqMotifFace(seq=fvalue, seq_format="compactseq",
+                                                   gap_format="compactseq",
+                                                   height=fsize)
+                        elif f["ftype"] == "blockseq":
+                            F = faces.SeqMotifFace(seq=fvalue, 
+                                                   height=fsize,
+                                                   fgcolor=fcolor or "slategrey",
+                                                   bgcolor=fbgcolor or "slategrey",
+                                                   scale_factor = 1.0)
+                            fbgcolor = None
+                        elif f["ftype"] == "bubble":
+                            try:
+                                v = float(fvalue)
+                            except ValueError:
+                                rad = fsize
+                            else:
+                                rad = fsize * v
+                            F = faces.CircleFace(radius=rad, style="sphere",
+                                                 color=fcolor or "steelblue")
+
+                        elif f["ftype"] == "heatmap":
+                            if not f['column']:
+                                col = ftype_pos[f["pos"]]
+                            else:
+                                col = f["column"]
+
+                            for i, value in enumerate(heatmap_data.get(node.name, [])):
+                                ftype_pos[f["pos"]] += 1
+
+                                if value is None:
+                                    color = heatmap_color_missing
+                                elif value > heatmap_center_value:
+                                    color = gradient_color(abs(heatmap_center_value - value), heatmap_max_value, hue=heatmap_color_up)
+                                elif value < heatmap_center_value:
+                                    color = gradient_color(abs(heatmap_center_value - value), heatmap_max_value, hue=heatmap_color_down)
                                 else:
-                                    col = f["column"]
-                                node.add_face(F, column=col, position=f["pos"])
-
-        if args.image:
-            if tindex > 0: 
-                t.render("t%d.%s" %(tindex, args.image),
-                         tree_style=ts, w=args.width, h=args.height, units=args.size_units)
-            else:
-                t.render("%s" %(args.image),
-                         tree_style=ts, w=args.width, h=args.height, units=args.size_units)                
-        else:
-            t.show(None, tree_style=ts)
+                                    color = heatmap_color_center
+                                node.add_face(RectFace(20, 20, color, color), position="aligned", column=col + i)
+                                # Add header
+                                # for i, name in enumerate(header):
+                                #    nameF = TextFace(name, fsize=7)
+                                #    nameF.rotation = -90
+                                #    tree_style.aligned_header.add_face(nameF, column=i)
+                            F = None
+
+                        elif f["ftype"] == "profile":
+                            # internal profiles?
+                            F = None
+                        elif f["ftype"] == "barchart":
+                            F = None
+                        elif f["ftype"] == "piechart":
+                            F = None
+
+
+
+                        # Add the Face
+                        if F:
+                            F.opacity = f['opacity'] or 1.0
+
+                            # Set face general attributes
+                            if fbgcolor:
+                                F.background.color = fbgcolor
+
+                            if not f['column']:
+                                col = ftype_pos[f["pos"]]
+                                ftype_pos[f["pos"]] += 1
+                            else:
+                                col = f["column"]
+                            node.add_face(F, column=col, position=f["pos"])
 
 
 def parse_faces(face_args):
@@ -42,3 +42,4 @@ from __future__ import absolute_import
 from .main import *
 from .faces import *
 from .svg_colors import *
+from .batch import *
@@ -0,0 +1,128 @@
+# #START_LICENSE###########################################################
+#
+#
+# This file is part of the Environment for Tree Exploration program
+# (ETE).  http://etetoolkit.org
+#
+# ETE is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ETE is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public
+# License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ETE.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#                     ABOUT THE ETE PACKAGE
+#                     =====================
+#
+# ETE is distributed under the GPL copyleft license (2008-2015).
+#
+# If you make use of ETE in published work, please cite:
+#
+# Jaime Huerta-Cepas, Joaquin Dopazo and Toni Gabaldon.
+# ETE: a python Environment for Tree Exploration. Jaime BMC
+# Bioinformatics 2010,:24doi:10.1186/1471-2105-11-24
+#
+# Note that extra references to the specific methods implemented in
+# the toolkit may be available in the documentation.
+#
+# More info at http://etetoolkit.org. Contact: huerta@embl.de
+#
+#
+# #END_LICENSE#############################################################
+from __future__ import absolute_import
+import time
+
+__all__ = ["render_many"]
+
+# Style and layout shared by all the trees rendered by a worker process. They
+# are sent once when the worker starts instead of once per tree.
+_WORKER_ARGS = None
+
+def _init_worker(tree_style, layout, render_args):
+    global _WORKER_ARGS
+    _WORKER_ARGS = (tree_style, layout, render_args)
+
+def _render_job(job):
+    return _render_one(job, *_WORKER_ARGS)
+
+def _render_one(job, tree_style, layout, render_args):
+    index, t, file_name = job
+    if tree_style is not None:
+        # The scale computed for the previous tree must not be reused
+        tree_style._scale = None
+    t0 = time.time()
+    t.render(file_name, layout=layout, tree_style=tree_style, **render_args)
+    return index, file_name, time.time() - t0
+
+def _iter_jobs(trees, out_pattern):
+    for index, item in enumerate(trees):
+        if isinstance(item, tuple):
+            key, t = item
+        else:
+            key, t = index, item
+        yield index, t, out_pattern % key
+
+def render_many(trees, out_pattern, tree_style=None, layout=None, workers=1,
+                w=None, h=None, units="px", dpi=90, backend=None):
+    """Renders a collection of trees into image files, using several
+    processes if requested. Results are yielded as soon as each image is
+    written, so this function should be consumed as an iterator:
+
+    ::
+
+       for index, fname, secs in render_many(trees, "family_%d.png", ts, workers=4):
+           print(fname, secs)
+
+    .. versionadded: 3.1
+
+    :argument trees: an iterable of tree instances, or of (key, tree)
+       tuples.
+
+    :argument out_pattern: output file name pattern. It is formatted with
+       the position of each tree (i.e. "tree_%05d.png") or with its key
+       when (key, tree) tuples are given (i.e. "%s.svg").
+
+    :var None tree_style: a TreeStyle instance shared by all the trees.
+       It is built only once per worker.
+
+    :var None layout: a layout function shared by all the trees. As with
+       the tree_style, it must be picklable (a module level function)
+       when workers > 1.
+
+    :var 1 workers: number of processes used to render the images. Each
+       worker reuses the same GUI application for all its trees.
+
+    :var None w, h, units, dpi, backend: image options, as in
+       :func:`TreeNode.render`.
+
+    :returns: (index, file_name, seconds) tuples in order of completion,
+       where seconds is the time spent rendering each tree.
+
+    """
+    render_args = {"w": w, "h": h, "units": units, "dpi": dpi,
+                   "backend": backend}
+    jobs = _iter_jobs(trees, out_pattern)
+    if workers is None or workers <= 1:
+        for job in jobs:
+            yield _render_one(job, tree_style, layout, render_args)
+        return
+
+    import multiprocessing
+    pool = multiprocessing.Pool(workers, _init_worker,
+                                (tree_style, layout, render_args))
+    try:
+        for result in pool.imap_unordered(_render_job, jobs):
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
@@ -73,7 +73,9 @@ def init_scene(t, layout, ts):
 def show_tree(t, layout=None, tree_style=None, win_name=None):
     """ Interactively shows a tree."""
     scene, img = init_scene(t, layout, tree_style)
-    tree_item, n2i, n2f = render(t, img)
+    # large trees are drawn in level of detail mode
+    lod = scene.init_lod(t, img)
+    tree_item, n2i, n2f = render(t, img, lod=lod)
     scene.init_values(t, img, n2i, n2f)
 
     tree_item.setParentItem(scene.master_item)
@@ -85,6 +87,7 @@ def show_tree(t, layout=None, tree_style=None, win_name=None):
 
     mainapp.show()
     mainapp.on_actionFit2tree_triggered()
+    mainapp.view.schedule_lod_update()
     # Restore Ctrl-C behavior
     signal.signal(signal.SIGINT, signal.SIG_DFL)
     if GUI_TIMEOUT is not None:
@@ -0,0 +1,64 @@
+# #START_LICENSE###########################################################
+#
+#
+# This file is part of the Environment for Tree Exploration program
+# (ETE).  http://etetoolkit.org
+#
+# ETE is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ETE is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public
+# License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ETE.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#                     ABOUT THE ETE PACKAGE
+#                     =====================
+#
+# ETE is distributed under the GPL copyleft license (2008-2015).
+#
+# If you make use of ETE in published work, please cite:
+#
+# Jaime Huerta-Cepas, Joaquin Dopazo and Toni Gabaldon.
+# ETE: a python Environment for Tree Exploration. Jaime BMC
+# Bioinformatics 2010,:24doi:10.1186/1471-2105-11-24
+#
+# Note that extra references to the specific methods implemented in
+# the toolkit may be available in the documentation.
+#
+# More info at http://etetoolkit.org. Contact: huerta@embl.de
+#
+#
+# #END_LICENSE#############################################################
+from __future__ import absolute_import
+
+from ..utils import LRUCache
+
+__all__ = ["LRUCache", "FONTS", "TEXT_METRICS", "cache_stats", "clear_caches",
+           "set_cache_size"]
+
+# Caches shared by all renders in the current process, so the same labels
+# are not measured again for every node or every time the GUI redraws a
+# tree. Font objects are keyed by (ftype, fsize, bold, fstyle). Text sizes
+# are keyed by the backend name, the font options and the text.
+FONTS = LRUCache(256)
+TEXT_METRICS = LRUCache(100000)
+
+def cache_stats():
+    """Returns the stats of the font and text metrics caches."""
+    return {"fonts": FONTS.stats(), "text_metrics": TEXT_METRICS.stats()}
+
+def clear_caches():
+    """Empties the font and text metrics caches."""
+    FONTS.clear()
+    TEXT_METRICS.clear()
+
+def set_cache_size(maxsize):
+    """Sets the max number of text sizes kept in cache."""
+    TEXT_METRICS.maxsize = maxsize
@@ -60,14 +60,22 @@ from six.moves import map
 from six.moves import range
 from six.moves import zip
 
-from .qt import (QGraphicsRectItem, QGraphicsLineItem,
-                 QGraphicsPolygonItem, QGraphicsEllipseItem,
-                 QPen, QColor, QBrush, QPolygonF, QFont,
-                 QPixmap, QFontMetrics, QPainter,
-                 QRadialGradient, QGraphicsSimpleTextItem, QGraphicsTextItem,
-                 QGraphicsItem, Qt,  QPointF, QRect, QRectF, QGraphicsSvgItem)
+try:
+    from .qt import (QGraphicsRectItem, QGraphicsLineItem,
+                     QGraphicsPolygonItem, QGraphicsEllipseItem,
+                     QPen, QColor, QBrush, QPolygonF, QFont,
+                     QPixmap, QFontMetrics, QPainter,
+                     QRadialGradient, QGraphicsSimpleTextItem, QGraphicsTextItem,
+                     QGraphicsItem, Qt,  QPointF, QRect, QRectF, QGraphicsSvgItem)
+except ImportError:
+    # Without Qt, faces can still be created and drawn by the SVG backend
+    # (svg_render.py). Qt based items are only built when rendering with Qt.
+    QGraphicsRectItem = QGraphicsLineItem = QGraphicsPolygonItem = \
+        QGraphicsEllipseItem = QGraphicsSimpleTextItem = QGraphicsTextItem = \
+        QGraphicsItem = QGraphicsSvgItem = object
 
 from .main import add_face_to_node, _Background, _Border, COLOR_SCHEMES
+from .face_cache import FONTS, TEXT_METRICS
 
 _aafgcolors = {
     'A':"#000000" ,
@@ -281,22 +289,30 @@ class TextFace(Face):
     def _load_bounding_rect(self, txt=None):
         if txt is None:
             txt= self.get_text()
-        fm = QFontMetrics(self._get_font())
+        # Labels sharing font and text are measured only once (see face_cache)
+        key = ("qt", self.ftype, self.fsize, self.bold, self.fstyle,
+               self.tight_text, txt)
+        rects = TEXT_METRICS.get(key)
+        if rects is None:
+            rects = self._measure_text(txt)
+            TEXT_METRICS.set(key, rects)
+        self._bounding_rect = QRectF(*rects[0])
+        self._real_rect = QRectF(*rects[1])
+
+    def _measure_text(self, txt):
+        fm = self._get_font_and_metrics()[1]
         tx_w = fm.width(txt)
         if self.tight_text:
-            textr = fm.tightBoundingRect(self.get_text())
+            textr = fm.tightBoundingRect(txt)
             down = textr.height() + textr.y()
             up = textr.height() - down
             asc = fm.ascent()
-            des = fm.descent()
-            center = (asc + des) / 2.0
-            xcenter = ((up+down)/2.0) + asc - up
-            self._bounding_rect = QRectF(0, asc - up, tx_w, textr.height())
-            self._real_rect = QRectF(0, 0, tx_w, textr.height())
+            return ((0, asc - up, tx_w, textr.height()),
+                    (0, 0, tx_w, textr.height()))
         else:
             textr = fm.boundingRect(QRect(0, 0, 0, 0), 0, txt) # see issue 241
-            self._bounding_rect = QRectF(0, 0, textr.width(), textr.height())
-            self._real_rect = QRectF(0, 0, textr.width(), textr.height())
+            return ((0, 0, textr.width(), textr.height()),
+                    (0, 0, textr.width(), textr.height()))
 
     def _get_text(self):
         return self._text
@@ -317,13 +333,21 @@ class TextFace(Face):
     text = property(_get_text, _set_text)
 
     def _get_font(self):
-        font = QFont(self.ftype, self.fsize)
-        font.setBold(self.bold)
-        if self.fstyle == "italic":
-            font.setStyle(QFont.StyleItalic)
-        elif self.fstyle == "oblique":
-            font.setStyle(QFont.StyleOblique)
-        return font
+        return self._get_font_and_metrics()[0]
+
+    def _get_font_and_metrics(self):
+        key = (self.ftype, self.fsize, self.bold, self.fstyle)
+        cached = FONTS.get(key)
+        if cached is None:
+            font = QFont(self.ftype, self.fsize)
+            font.setBold(self.bold)
+            if self.fstyle == "italic":
+                font.setStyle(QFont.StyleItalic)
+            elif self.fstyle == "oblique":
+                font.setStyle(QFont.StyleOblique)
+            cached = (font, QFontMetrics(font))
+            FONTS.set(key, cached)
+        return cached
 
     def _height(self):
         return self.get_bounding_rect().height()
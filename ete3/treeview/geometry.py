@@ -0,0 +1,406 @@
+# #START_LICENSE###########################################################
+#
+#
+# This file is part of the Environment for Tree Exploration program
+# (ETE).  http://etetoolkit.org
+#
+# ETE is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ETE is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public
+# License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ETE.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#                     ABOUT THE ETE PACKAGE
+#                     =====================
+#
+# ETE is distributed under the GPL copyleft license (2008-2015).
+#
+# If you make use of ETE in published work, please cite:
+#
+# Jaime Huerta-Cepas, Joaquin Dopazo and Toni Gabaldon.
+# ETE: a python Environment for Tree Exploration. Jaime BMC
+# Bioinformatics 2010,:24doi:10.1186/1471-2105-11-24
+#
+# Note that extra references to the specific methods implemented in
+# the toolkit may be available in the documentation.
+#
+# More info at http://etetoolkit.org. Contact: huerta@embl.de
+#
+#
+# #END_LICENSE#############################################################
+from __future__ import absolute_import
+import math
+
+from .main import _leaf
+
+# Qt independent functions calculating the size and position of node
+# partitions. They are shared by the Qt (qt4_render) and the SVG
+# (svg_render) renderers, so node items only need to provide the regions
+# and methods used here (nodeRegion, facesRegion, fullRegion, setPos,
+# moveBy, setParentItem).
+
+
+def init_node_dimensions(node, item, faceblock, img):
+    """Calculates width and height of all different subparts and faces
+    of a given node. Branch lengths are not taken into account, so some
+    dimensions must be adjusted after setting a valid scale.
+    """
+
+    min_separation = img.min_leaf_separation
+
+    if _leaf(node):
+        aligned_height = faceblock["aligned"].h
+        aligned_width = faceblock["aligned"].w
+    else:
+        aligned_height = 0
+        aligned_width = 0
+
+    ndist =  1.0 if img.force_topology else node.dist
+    item.branch_length = (ndist * img._scale) if img._scale else 0
+    ## Calculate dimensions of the different node regions
+    ##
+    ##
+    ##                                |
+    ##                                |        ------
+    ##          b-top       --------- |        |    |
+    ## xoff-------------- O |b-right| |        |alg |
+    ##          b-bottom    --------- |        |    |
+    ##                                |        ------
+    ##                                |
+    ##
+    ##      0     1       2     3     4           5
+    ##
+
+    item.xoff = 0.0
+    # widths
+    w1 = max(faceblock["branch-bottom"].w, faceblock["branch-top"].w)
+    w0 = item.branch_length - w1 if item.branch_length > w1 else 0
+    w2 = node.img_style["size"]
+    w3 = faceblock["branch-right"].w
+    w4 = node.img_style["vt_line_width"] if not _leaf(node) and len(node.children) > 1 else 0.0
+    w5 = 0
+    # heights
+    h0 = node.img_style["hz_line_width"]
+    h1 = node.img_style["hz_line_width"] + faceblock["branch-top"].h + faceblock["branch-bottom"].h
+    h2 = node.img_style["size"]
+    h3 = faceblock["branch-right"].h
+    h4 = 0
+    h5 = aligned_height
+
+    # This fixes the problem of miss-aligned branches in ultrametric trees. If
+    # there is nothing between the hz line and the vt line, then I prevent
+    # vt_line_width to add extra width to the node, so node distances are
+    # preserved in the img.
+    if w2 == 0 and w3 == 0:
+        w4 = 0
+
+    # ignore face heights if requested
+    if img.mode == "c" and img.allow_face_overlap:
+        h1, h3, h5 = 0, 0, 0
+
+    item.heights = [h0, h1, h2, h3, h4, h5]
+    item.widths = [w0, w1, w2, w3, w4, w5]
+
+    # Calculate total node size
+    total_w = sum([w0, w1, w2, w3, w4, item.xoff]) # do not count aligned faces
+	
+    if img.mode == "c":
+        max_h = max(item.heights[:4] + [min_separation])
+    elif img.mode == "r":
+        max_h = max(item.heights + [min_separation])
+
+    max_h += img.branch_vertical_margin
+
+    # correct possible unbalanced block in branch faces
+    h_imbalance = abs(faceblock["branch-top"].h - faceblock["branch-bottom"].h)
+    if h_imbalance + h1 > max_h:
+        max_h += h_imbalance
+
+    # clades collapsed in level of detail mode keep the height of their
+    # leaves
+    lod_clade = getattr(node, "_lod_collapsed", None)
+    if lod_clade:
+        max_h = max(max_h, lod_clade[1])
+
+    item.facesRegion.setRect(0, 0, w3, max_h)
+    item.nodeRegion.setRect(0, 0, total_w, max_h)
+    item.fullRegion.setRect(0, 0, total_w + get_clade_width(node, img), max_h)
+
+
+def get_clade_width(node, img):
+    """ Returns the width of a clade collapsed in level of detail mode
+    (0 for any other node)"""
+    lod_clade = getattr(node, "_lod_collapsed", None)
+    if lod_clade and img._scale:
+        return lod_clade[2] * img._scale
+    return 0
+
+
+def update_branch_lengths(tree, n2i, n2f, img):
+    for node in tree.traverse("postorder", is_leaf_fn=_leaf):
+        item = n2i[node]
+        ndist = 1.0 if img.force_topology else node.dist
+        item.branch_length = ndist * img._scale
+        w0 = 0
+
+        if item.branch_length > item.widths[1]:
+            w0 = item.widths[0] = item.branch_length - item.widths[1]
+            item.nodeRegion.adjust(0, 0, w0, 0)
+
+        child_width = 0
+        if not _leaf(node):
+            for ch in node.children:
+                child_width = max(child_width, n2i[ch].fullRegion.width())
+                if w0 and img.mode == "r":
+                    #n2i[ch].translate(w0, 0) # deprecated in qt4.8
+                    n2i[ch].moveBy(w0, 0)
+        else:
+            child_width = get_clade_width(node, img)
+        item.fullRegion.setWidth(item.nodeRegion.width() + child_width)
+
+
+def get_partition_center(n, n2i, n2f):
+        down_h = n2f[n]["branch-bottom"].h
+        up_h = n2f[n]["branch-top"].h
+
+        #right_h = max(n2f[n]["branch-right"].h, n.img_style["size"]) /2
+        right_h = n2i[n].nodeRegion.height()/2
+
+        up_h = max(right_h, up_h)
+        down_h = max(right_h, down_h)
+
+        fullR = n2i[n].fullRegion
+
+        if _leaf(n):
+            center = fullR.height()/2
+        else:
+            first_child_part = n2i[n.children[0]]
+            last_child_part = n2i[n.children[-1]]
+            c1 = first_child_part.start_y + first_child_part.center
+            c2 = last_child_part.start_y + last_child_part.center
+            center = c1 + ((c2-c1)/2)
+
+        if up_h > center:
+            center = up_h
+        elif down_h > fullR.height() - center:
+            center = fullR.height() - down_h
+
+        return center
+
+
+def init_rect_leaf_item(node, n2i, n2f):
+    item = n2i[node]
+    item.center = get_partition_center(node, n2i, n2f)
+
+
+def init_rect_node_item(node, n2i, n2f):
+    item = n2i[node]
+    all_childs_height = sum([n2i[c].fullRegion.height() for c in node.children])
+    all_childs_width = max([n2i[c].fullRegion.width() for c in node.children])
+    if all_childs_height > item.fullRegion.height():
+        item.fullRegion.setHeight(all_childs_height)
+
+    item.fullRegion.setWidth(all_childs_width + item.nodeRegion.width())
+
+    suby = 0
+    subx = item.nodeRegion.width()
+    if item.nodeRegion.height() > all_childs_height:
+        suby += ((item.fullRegion.height() - all_childs_height))/2
+
+    for c in node.children:
+        cpart = n2i[c]
+        # Sets x and y position of child within parent
+        # partition (relative positions)
+        cpart.setParentItem(item)
+        cpart.setPos(subx, suby)
+        cpart.start_y = suby
+        suby += cpart.fullRegion.height()
+    item.center = get_partition_center(node, n2i, n2f)
+
+
+def get_min_radius(w, h, angle, xoffset):
+    """ returns the radius and X-displacement required to render a
+    rectangle (w,h) within and given angle (a)."""
+
+    # converts to radians
+    angle = (angle * math.pi) / 180
+    b = xoffset + w
+    a = h / 2
+    off = 0
+    if xoffset:
+        effective_angle = math.atan(a / xoffset)
+        if effective_angle > angle / 2 and angle / 2 < math.pi:
+            off = a / math.tan(angle / 2)
+            bb = off + w
+            #r = math.sqrt(a**2 + bb**2)
+            r = math.hypot(a, bb)
+            off = max (off, xoffset) - xoffset
+        else:
+            #r = math.sqrt(a**2 + b**2)
+            r = math.hypot(a, b)
+    else:
+        # It happens on root nodes
+        #r1 = math.sqrt(a**2 + b**2)
+        r1 = math.hypot(a, b)
+        #effective_angle = math.asin(a/r1)
+        #r2 = w / math.cos(effective_angle)
+        #print r1, r2
+        r = r1#+r2
+
+    return r, off
+
+
+def init_circular_leaf_item(node, n2i, n2f, last_rotation, rot_step):
+    item = n2i[node]
+    item.rotation = last_rotation
+    item.full_start = last_rotation - (rot_step / 2)
+    item.full_end = last_rotation + (rot_step / 2)
+    item.angle_span = rot_step
+    #item.center = item.nodeRegion.height() / 2
+    item.effective_height = get_effective_height(node, n2i, n2f)
+    item.center = item.effective_height/2
+    #item.setParentItem(n2i[node.up])
+
+
+def init_circular_node_item(node, n2i, n2f):
+    item = n2i[node]
+    if len(node.children) > 1:
+        first_c = n2i[node.children[0]]
+        last_c = n2i[node.children[-1]]
+        rot_start = first_c.rotation
+        rot_end = last_c.rotation
+        item.rotation = rot_start + ((rot_end - rot_start) / 2)
+        item.full_start = first_c.full_start
+        item.full_end = last_c.full_end
+        item.angle_span = item.full_end - item.full_start
+    else:
+        child = n2i[node.children[0]]
+        rot_start = child.full_start
+        rot_end = child.full_end
+        item.angle_span = child.angle_span
+        item.rotation = child.rotation
+        #item.rotation = rot_start + ((rot_end - rot_start) / 2)
+        item.full_start = child.full_start
+        item.full_end = child.full_end
+
+    item.effective_height = get_effective_height(node, n2i, n2f)
+    item.center = item.effective_height/2
+
+
+def get_effective_height(n, n2i, n2f):
+    """Returns the height needed to calculated the adjustment
+    of node to its available angle.
+    """
+    down_h = n2f[n]["branch-bottom"].h
+    up_h = n2f[n]["branch-top"].h
+
+    right_h = n2i[n].nodeRegion.height()/2
+    up_h = max(right_h, up_h)
+    down_h = max(right_h, down_h)
+
+    fullR = n2i[n].fullRegion
+    center = fullR.height()/2
+    return max(up_h, down_h)*2
+
+
+#@tracktime
+def calculate_optimal_scale(root_node, n2i, rot_step, img):
+    """ Note: Seems to be fast. 0.5s from a tree of 10.000 leaves"""
+
+    n2minradius = {}
+    n2sumdist = {}
+    n2sumwidth = {}
+    visited_nodes = []
+    # Calcula la posicion minima de los elementos (con scale=0, es
+    # decir, sin tener en cuenta branch lengths.
+    for node in root_node.traverse('preorder', is_leaf_fn=_leaf):
+        visited_nodes.append(node)
+        ndist = node.dist if not img.force_topology else 1.0
+        item = n2i[node]
+        # Uses size of all node parts, except branch length
+        w = sum(item.widths[1:5])
+        h = item.effective_height
+        parent_radius = n2minradius.get(node.up, 0)
+        angle = rot_step if _leaf(node) else item.angle_span
+
+        r, xoffset = get_min_radius(w, h, angle, parent_radius)
+        n2minradius[node] = r
+        n2sumdist[node] = n2sumdist.get(node.up, 0) + ndist
+        # versed sine: the little extra line needed to complete the
+        # radius.
+        #vs = r - (parent_radius + xoffset + w)
+        n2sumwidth[node] = n2sumwidth.get(node.up, 0) + sum(item.widths[2:5]) #+ vs
+
+    root_opening = 0.0
+    most_distant = max(n2sumdist.values())
+    if most_distant == 0: return 0.0
+
+    best_scale = None
+    for node in visited_nodes:
+        item = n2i[node]
+        ndist = node.dist if not img.force_topology else 1.0
+        if best_scale is None:
+            best_scale = (n2minradius[node] - n2sumwidth[node]) / ndist if ndist else 0.0
+        else:
+            #Whats the expected radius of this node?
+            current_rad = n2sumdist[node] * best_scale + (n2sumwidth[node] + root_opening)
+
+            # If still too small, it means we need to increase scale.
+            if current_rad < n2minradius[node]:
+                # This is a simplification of the real ecuacion needed
+                # to calculate the best scale. Given that I'm not
+                # taking into account the versed sine of each parent
+                # node, the equation is actually very simple.
+                if img.root_opening_factor:
+                    best_scale = (n2minradius[node] - (n2sumwidth[node])) / (n2sumdist[node] + (most_distant * img.root_opening_factor))
+                    root_opening = most_distant * best_scale * img.root_opening_factor
+                else:
+                    best_scale = (n2minradius[node] - (n2sumwidth[node]) + root_opening) / n2sumdist[node]
+                #print "OOps adjusting scale", ndist, best_scale, n2minradius[node], current_rad, item.heights[5], node.name
+
+            # If the width of branch top/bottom faces is not covered,
+            # we can also increase the scale to adjust it. This may
+            # produce huge scales, so let's keep it optional
+            if img.optimal_scale_level == "full" and \
+               item.widths[1] > ndist * best_scale:
+                best_scale = item.widths[1] / ndist
+                #print "OOps adjusting scale because  branch-faces", ndist, best_scale, item.widths[1]
+
+    # Adjust scale for aligned faces
+    if not img.allow_face_overlap:
+        aligned_h = [(n2i[node].heights[5], node) for node in visited_nodes]
+        aligned_h.sort(reverse=True, key=lambda x: x[0])
+        maxh, maxh_node = aligned_h[0]
+        angle = n2i[maxh_node].angle_span
+        rad, off = get_min_radius(1, maxh, angle, 0.0001)
+        min_alg_scale = None
+        for node in visited_nodes:
+            if n2i[node].heights[5]:
+                new_scale = (rad - (n2sumwidth[node] + root_opening)) / n2sumdist[node]
+                min_alg_scale = min(new_scale, min_alg_scale) if min_alg_scale is not None else new_scale
+        if min_alg_scale is not None and min_alg_scale > best_scale:
+            best_scale = min_alg_scale
+
+    if root_opening:
+        n2i[root_node].nodeRegion.adjust(root_opening, 0, root_opening, 0)
+        n2i[root_node].fullRegion.adjust(root_opening, 0, root_opening, 0)
+        n2i[root_node].xoff = root_opening
+        #n2i[root_node].widths[0] += root_opening
+
+    #for node in visited_nodes:
+    #    item = n2i[node]
+    #    h = item.effective_height
+    #    a = n2sumdist[node] * best_scale + n2sumwidth.get(node)
+    #    b = h/2
+    #    item.radius = math.sqrt(a**2 + b**2)
+    #print "root opening", root_opening
+    #best_scale = max(best_scale, min_scale)
+    return best_scale
@@ -0,0 +1,167 @@
+# #START_LICENSE###########################################################
+#
+#
+# This file is part of the Environment for Tree Exploration program
+# (ETE).  http://etetoolkit.org
+#
+# ETE is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ETE is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public
+# License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ETE.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#                     ABOUT THE ETE PACKAGE
+#                     =====================
+#
+# ETE is distributed under the GPL copyleft license (2008-2015).
+#
+# If you make use of ETE in published work, please cite:
+#
+# Jaime Huerta-Cepas, Joaquin Dopazo and Toni Gabaldon.
+# ETE: a python Environment for Tree Exploration. Jaime BMC
+# Bioinformatics 2010,:24doi:10.1186/1471-2105-11-24
+#
+# Note that extra references to the specific methods implemented in
+# the toolkit may be available in the documentation.
+#
+# More info at http://etetoolkit.org. Contact: huerta@embl.de
+#
+#
+# #END_LICENSE#############################################################
+from __future__ import absolute_import
+
+import heapq
+import itertools
+
+# Number of clades drawn when a tree is first shown in level of detail
+# mode
+LOD_INITIAL_CLADES = 500
+
+class LevelOfDetail(object):
+    """
+    .. versionadded: 3.1
+
+    Keeps track of the clades of a large tree that are drawn as
+    collapsed shapes in the GUI (the level of detail frontier). Only
+    the nodes above the frontier get items and faces, and the frontier
+    is refined as the user zooms or scrolls, so clades smaller than
+    :attr:`TreeStyle.lod_min_height` pixels or out of the visible region
+    are never fully rendered.
+
+    :argument tree: root node of the tree being drawn.
+
+    :argument is_leaf_fn: function used to detect terminal nodes
+      (i.e. nodes collapsed by the user).
+
+    :argument False force_topology: if True, clade depths are measured
+      in number of branches instead of branch lengths.
+    """
+    def __init__(self, tree, is_leaf_fn, force_topology=False):
+        self.tree = tree
+        self.is_leaf_fn = is_leaf_fn
+        # Number of leaves and distance to the farthest leaf of every
+        # node
+        self.size = {}
+        self.depth = {}
+        for node in tree.traverse("postorder", is_leaf_fn=is_leaf_fn):
+            if is_leaf_fn(node):
+                self.size[node] = 1
+                self.depth[node] = 0.0
+            else:
+                self.size[node] = sum([self.size[ch] for ch in node.children])
+                self.depth[node] = max([self.depth[ch] + (1.0 if force_topology else ch.dist)
+                                        for ch in node.children])
+        self.frontier = set()
+        # Estimated height of a leaf row, used as height unit for
+        # collapsed clades
+        self.leaf_height = 1.0
+        self._rendered_leaf_height = None
+
+    def __len__(self):
+        return self.size[self.tree]
+
+    def init_frontier(self, max_clades=LOD_INITIAL_CLADES):
+        """ Sets an initial frontier containing around max_clades
+        clades, by expanding the largest ones first. """
+        counter = itertools.count()
+        heap = [(-self.size[self.tree], next(counter), self.tree)]
+        while len(heap) < max_clades and heap[0][0] < -1:
+            size, _, node = heapq.heappop(heap)
+            for ch in node.children:
+                heapq.heappush(heap, (-self.size[ch], next(counter), ch))
+        self.frontier = set([node for size, _, node in heap if size < -1])
+
+    def update(self, node2span, yscale, top, bottom, min_height):
+        """ Updates the frontier according to the region being
+        displayed. Clades out of the [top, bottom] region, or with an
+        height smaller than min_height pixels, are collapsed.
+
+        :argument node2span: a dictionary with the (top, bottom) scene
+          coordinates of every rendered node.
+
+        :argument yscale: vertical scale of the view (pixels per scene
+          unit).
+
+        Returns True if the tree needs to be drawn again.
+        """
+        frontier = set()
+        y0, y1 = node2span[self.tree]
+        to_visit = [(self.tree, y0, y1)]
+        while to_visit:
+            node, y0, y1 = to_visit.pop()
+            if self.size[node] == 1:
+                continue
+            if y1 < top or y0 > bottom or (y1 - y0) * yscale < min_height:
+                frontier.add(node)
+                continue
+
+            # Children not rendered yet are expected to share the
+            # clade height in proportion to their number of leaves
+            start = y0
+            for ch in node.children:
+                if ch in node2span:
+                    ch_y0, ch_y1 = node2span[ch]
+                else:
+                    ch_y0 = start
+                    ch_y1 = start + (y1 - y0) * self.size[ch] / float(self.size[node])
+                start = ch_y1
+                to_visit.append((ch, ch_y0, ch_y1))
+
+        changed = frontier != self.frontier
+        if self._rendered_leaf_height is not None:
+            # collapsed clades must be resized
+            ratio = self.leaf_height / self._rendered_leaf_height
+            changed = changed or ratio > 1.5 or ratio < 0.66
+        self.frontier = frontier
+        return changed
+
+    def set_leaf_heights(self, heights):
+        """ Updates the estimated leaf height from the heights of
+        rendered leaves """
+        if heights:
+            self.leaf_height = max(1.0, sum(heights) / float(len(heights)))
+
+    def collapse(self):
+        """ Marks the nodes in the frontier so they are drawn as
+        collapsed clades. """
+        for node in self.frontier:
+            node._lod_collapsed = (self.size[node],
+                                   self.size[node] * self.leaf_height,
+                                   self.depth[node])
+        self._rendered_leaf_height = self.leaf_height
+
+    def restore(self):
+        """ Removes the collapsed marks set by :func:`collapse`. """
+        for node in self.frontier:
+            try:
+                del node._lod_collapsed
+            except AttributeError:
+                pass
@@ -45,7 +45,12 @@ import re
 import types
 from sys import stderr
 
-from .qt import *
+try:
+    from .qt import *
+except ImportError:
+    # Qt is only needed by the GUI and the Qt image renderer. Styles and
+    # faces can still be used with the SVG backend (svg_render.py)
+    pass
 
 from .svg_colors import SVG_COLORS, COLOR_SCHEMES
 
@@ -338,6 +343,18 @@ class TreeStyle(object):
 
     :param "gray" guiding_lines_color: RGB code or name in :data:`SVG_COLORS`
 
+    **-- About large trees --**
+
+    :param 10000 level_of_detail: When a tree with more leaves than
+      this value is shown in the GUI (rectangular mode only), clades
+      smaller than :attr:`lod_min_height` pixels or out of the visible
+      region are drawn as collapsed shapes, and their content is drawn
+      as the user zooms or scrolls. Use None to always draw full
+      trees. Images rendered to files are never affected.
+
+    :param 4 lod_min_height: Min height, in pixels, of a clade to be
+      fully drawn in level of detail mode.
+
     **-- About node faces --**
 
     :param False allow_face_overlap: If True, node faces are not taken
@@ -501,6 +518,10 @@ class TreeStyle(object):
         self.guiding_lines_type = 2 # 0 solid, 1 dashed, 2 dotted
         self.guiding_lines_color = "gray"
 
+        # Level of detail mode used by the GUI for large trees
+        self.level_of_detail = 10000
+        self.lod_min_height = 4
+
         # :::::::::::::::::::::::::
         # FACES
         # :::::::::::::::::::::::::
@@ -586,7 +607,9 @@ class FaceContainer(dict):
 
 def _leaf(node):
     collapsed = hasattr(node, "_img_style") and not node.img_style["draw_descendants"]
-    return collapsed or node.is_leaf()
+    # nodes can also be collapsed temporarily by the level of detail
+    # mode of the GUI
+    return collapsed or node.is_leaf() or hasattr(node, "_lod_collapsed")
 
 def add_face_to_node(face, node, column, aligned=False, position="branch-right"):
     """
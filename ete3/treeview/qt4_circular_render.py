@@ -43,6 +43,9 @@ import colorsys
 from .qt import *
 from .main import _leaf, tracktime
 from .node_gui_actions import _NodeActions
+from .geometry import (get_min_radius, init_circular_leaf_item,
+                       init_circular_node_item, get_effective_height,
+                       calculate_optimal_scale)
 
 class _LineItem(QGraphicsLineItem):
     def paint(self, painter, option, widget):
@@ -160,37 +163,6 @@ def rotate_and_displace(item, rotation, height, offset):
     item.setTransform(t)
 
 
-def get_min_radius(w, h, angle, xoffset):
-    """ returns the radius and X-displacement required to render a
-    rectangle (w,h) within and given angle (a)."""
-
-    # converts to radians
-    angle = (angle * math.pi) / 180
-    b = xoffset + w
-    a = h / 2
-    off = 0
-    if xoffset:
-        effective_angle = math.atan(a / xoffset)
-        if effective_angle > angle / 2 and angle / 2 < math.pi:
-            off = a / math.tan(angle / 2)
-            bb = off + w
-            #r = math.sqrt(a**2 + bb**2)
-            r = math.hypot(a, bb)
-            off = max (off, xoffset) - xoffset
-        else:
-            #r = math.sqrt(a**2 + b**2)
-            r = math.hypot(a, b)
-    else:
-        # It happens on root nodes
-        #r1 = math.sqrt(a**2 + b**2)
-        r1 = math.hypot(a, b)
-        #effective_angle = math.asin(a/r1)
-        #r2 = w / math.cos(effective_angle)
-        #print r1, r2
-        r = r1#+r2
-
-    return r, off
-
 def render_circular(root_node, n2i, rot_step):
     max_r = 0.0
     for node in root_node.traverse('preorder', is_leaf_fn=_leaf):
@@ -257,146 +229,3 @@ def render_circular(root_node, n2i, rot_step):
     n2i[root_node].max_r = max_r
     return max_r
 
-def init_circular_leaf_item(node, n2i, n2f, last_rotation, rot_step):
-    item = n2i[node]
-    item.rotation = last_rotation
-    item.full_start = last_rotation - (rot_step / 2)
-    item.full_end = last_rotation + (rot_step / 2)
-    item.angle_span = rot_step
-    #item.center = item.nodeRegion.height() / 2
-    item.effective_height = get_effective_height(node, n2i, n2f)
-    item.center = item.effective_height/2
-    #item.setParentItem(n2i[node.up])
-
-def init_circular_node_item(node, n2i, n2f):
-    item = n2i[node]
-    if len(node.children) > 1:
-        first_c = n2i[node.children[0]]
-        last_c = n2i[node.children[-1]]
-        rot_start = first_c.rotation
-        rot_end = last_c.rotation
-        item.rotation = rot_start + ((rot_end - rot_start) / 2)
-        item.full_start = first_c.full_start
-        item.full_end = last_c.full_end
-        item.angle_span = item.full_end - item.full_start
-    else:
-        child = n2i[node.children[0]]
-        rot_start = child.full_start
-        rot_end = child.full_end
-        item.angle_span = child.angle_span
-        item.rotation = child.rotation
-        #item.rotation = rot_start + ((rot_end - rot_start) / 2)
-        item.full_start = child.full_start
-        item.full_end = child.full_end
-
-    item.effective_height = get_effective_height(node, n2i, n2f)
-    item.center = item.effective_height/2
-
-def get_effective_height(n, n2i, n2f):
-    """Returns the height needed to calculated the adjustment
-    of node to its available angle.
-    """
-    down_h = n2f[n]["branch-bottom"].h
-    up_h = n2f[n]["branch-top"].h
-
-    right_h = n2i[n].nodeRegion.height()/2
-    up_h = max(right_h, up_h)
-    down_h = max(right_h, down_h)
-
-    fullR = n2i[n].fullRegion
-    center = fullR.height()/2
-    return max(up_h, down_h)*2
-
-#@tracktime
-def calculate_optimal_scale(root_node, n2i, rot_step, img):
-    """ Note: Seems to be fast. 0.5s from a tree of 10.000 leaves"""
-
-    n2minradius = {}
-    n2sumdist = {}
-    n2sumwidth = {}
-    visited_nodes = []
-    # Calcula la posicion minima de los elementos (con scale=0, es
-    # decir, sin tener en cuenta branch lengths.
-    for node in root_node.traverse('preorder', is_leaf_fn=_leaf):
-        visited_nodes.append(node)
-        ndist = node.dist if not img.force_topology else 1.0
-        item = n2i[node]
-        # Uses size of all node parts, except branch length
-        w = sum(item.widths[1:5])
-        h = item.effective_height
-        parent_radius = n2minradius.get(node.up, 0)
-        angle = rot_step if _leaf(node) else item.angle_span
-
-        r, xoffset = get_min_radius(w, h, angle, parent_radius)
-        n2minradius[node] = r
-        n2sumdist[node] = n2sumdist.get(node.up, 0) + ndist
-        # versed sine: the little extra line needed to complete the
-        # radius.
-        #vs = r - (parent_radius + xoffset + w)
-        n2sumwidth[node] = n2sumwidth.get(node.up, 0) + sum(item.widths[2:5]) #+ vs
-
-    root_opening = 0.0
-    most_distant = max(n2sumdist.values())
-    if most_distant == 0: return 0.0
-
-    best_scale = None
-    for node in visited_nodes:
-        item = n2i[node]
-        ndist = node.dist if not img.force_topology else 1.0
-        if best_scale is None:
-            best_scale = (n2minradius[node] - n2sumwidth[node]) / ndist if ndist else 0.0
-        else:
-            #Whats the expected radius of this node?
-            current_rad = n2sumdist[node] * best_scale + (n2sumwidth[node] + root_opening)
-
-            # If still too small, it means we need to increase scale.
-            if current_rad < n2minradius[node]:
-                # This is a simplification of the real ecuacion needed
-                # to calculate the best scale. Given that I'm not
-                # taking into account the versed sine of each parent
-                # node, the equation is actually very simple.
-                if img.root_opening_factor:
-                    best_scale = (n2minradius[node] - (n2sumwidth[node])) / (n2sumdist[node] + (most_distant * img.root_opening_factor))
-                    root_opening = most_distant * best_scale * img.root_opening_factor
-                else:
-                    best_scale = (n2minradius[node] - (n2sumwidth[node]) + root_opening) / n2sumdist[node]
-                #print "OOps adjusting scale", ndist, best_scale, n2minradius[node], current_rad, item.heights[5], node.name
-
-            # If the width of branch top/bottom faces is not covered,
-            # we can also increase the scale to adjust it. This may
-            # produce huge scales, so let's keep it optional
-            if img.optimal_scale_level == "full" and \
-               item.widths[1] > ndist * best_scale:
-                best_scale = item.widths[1] / ndist
-                #print "OOps adjusting scale because  branch-faces", ndist, best_scale, item.widths[1]
-
-    # Adjust scale for aligned faces
-    if not img.allow_face_overlap:
-        aligned_h = [(n2i[node].heights[5], node) for node in visited_nodes]
-        aligned_h.sort(reverse=True, key=lambda x: x[0])
-        maxh, maxh_node = aligned_h[0]
-        angle = n2i[maxh_node].angle_span
-        rad, off = get_min_radius(1, maxh, angle, 0.0001)
-        min_alg_scale = None
-        for node in visited_nodes:
-            if n2i[node].heights[5]:
-                new_scale = (rad - (n2sumwidth[node] + root_opening)) / n2sumdist[node]
-                min_alg_scale = min(new_scale, min_alg_scale) if min_alg_scale is not None else new_scale
-        if min_alg_scale is not None and min_alg_scale > best_scale:
-            best_scale = min_alg_scale
-
-    if root_opening:
-        n2i[root_node].nodeRegion.adjust(root_opening, 0, root_opening, 0)
-        n2i[root_node].fullRegion.adjust(root_opening, 0, root_opening, 0)
-        n2i[root_node].xoff = root_opening
-        #n2i[root_node].widths[0] += root_opening
-
-    #for node in visited_nodes:
-    #    item = n2i[node]
-    #    h = item.effective_height
-    #    a = n2sumdist[node] * best_scale + n2sumwidth.get(node)
-    #    b = h/2
-    #    item.radius = math.sqrt(a**2 + b**2)
-    #print "root opening", root_opening
-    #best_scale = max(best_scale, min_scale)
-    return best_scale
@@ -61,6 +61,10 @@ except Exception:
 from .. import Tree, TreeStyle
 import time
 
+# Milliseconds to wait after the last zoom or scroll event before
+# updating the level of detail of large trees
+LOD_UPDATE_DELAY = 150
+
 class _SelectorItem(QGraphicsRectItem):
     def __init__(self, parent=None):
         self.Color = QColor("blue")
@@ -127,8 +131,12 @@ class _GUI(QMainWindow):
         self.main.statusbar.showMessage(msg)
 
     def redraw(self):
+        # The tree, its topology or the tree style may have changed, so
+        # the level of detail clade sizes and depths are rebuilt
+        self.scene.init_lod(self.scene.tree, self.scene.img)
         self.scene.draw()
         self.view.init_values()
+        self.view.schedule_lod_update()
 
     def __init__(self, scene, *args):
         QMainWindow.__init__(self, *args)
@@ -283,6 +291,11 @@ class _GUI(QMainWindow):
                     self.scene.view.highlight_node(n)
                     last_match_node = n
 
+            # matches inside collapsed clades (level of detail mode)
+            # are shown through the clade
+            while last_match_node is not None and last_match_node not in self.scene.n2i:
+                last_match_node = last_match_node.up
+
             if last_match_node:
                 item = self.scene.n2i[last_match_node]
                 R = item.mapToScene(item.fullRegion).boundingRect()
@@ -733,6 +746,13 @@ class _TreeView(QGraphicsView):
         self.buffer_node = None
         self.init_values()
 
+        # Detail of large trees is updated once zooming or scrolling
+        # stops
+        self._lod_updating = False
+        self._lod_timer = QtCore.QTimer(self)
+        self._lod_timer.setSingleShot(True)
+        self._lod_timer.timeout.connect(self.update_lod)
+
         if USE_GL:
             print("USING GL")
             F = QtOpenGL.QGLFormat()
@@ -764,6 +784,49 @@ class _TreeView(QGraphicsView):
 
     def resizeEvent(self, e):
         QGraphicsView.resizeEvent(self, e)
+        self.schedule_lod_update()
+
+    def scrollContentsBy(self, dx, dy):
+        QGraphicsView.scrollContentsBy(self, dx, dy)
+        self.schedule_lod_update()
+
+    def schedule_lod_update(self):
+        if getattr(self.scene(), "lod", None) is not None and not self._lod_updating:
+            self._lod_timer.start(LOD_UPDATE_DELAY)
+
+    def update_lod(self):
+        """ Draws the tree again if the level of detail required by the
+        visible region has changed. The node at the center of the view
+        is kept in place."""
+        scene = self.scene()
+        if scene.lod is None:
+            return
+        viewport = self.mapToScene(self.viewport().rect()).boundingRect()
+        center = viewport.center()
+
+        # node containing the center of the view, used as anchor
+        anchor, anchor_pos = None, 0.5
+        anchor_h = None
+        for node in scene.n2i:
+            y0, y1 = scene.get_node_span(node)
+            if y0 <= center.y() <= y1 and (anchor_h is None or y1 - y0 < anchor_h):
+                anchor, anchor_h = node, y1 - y0
+                anchor_pos = (center.y() - y0) / (y1 - y0) if y1 > y0 else 0.5
+
+        if not scene.update_lod(viewport, self.transform().m22()):
+            return
+
+        self._lod_updating = True
+        try:
+            scene.draw(reset_scale=False)
+            self.init_values()
+            while anchor is not None and anchor not in scene.n2i:
+                anchor = anchor.up
+            if anchor is not None:
+                y0, y1 = scene.get_node_span(anchor)
+                self.centerOn(center.x(), y0 + (y1 - y0) * anchor_pos)
+        finally:
+            self._lod_updating = False
 
     def safe_scale(self, xfactor, yfactor):
         self.setTransformationAnchor(self.AnchorUnderMouse)
@@ -785,8 +848,13 @@ class _TreeView(QGraphicsView):
             pass
         else:
             self.scale(xfactor, yfactor)
+            self.schedule_lod_update()
 
     def highlight_node(self, n, fullRegion=False, fg="red", bg="gray", permanent=False):
+        # nodes inside collapsed clades (level of detail mode) are not
+        # drawn
+        if n not in self.scene().n2i:
+            return
         self.unhighlight_node(n)
         item = self.scene().n2i[n]
         hl = QGraphicsRectItem(item.content)
@@ -853,6 +921,8 @@ class _TreeView(QGraphicsView):
                 self.verticalScrollBar().setValue(self.verticalScrollBar().value()+20 )
 
     def set_focus(self, node):
+        if node not in self.scene().n2i:
+            return
         i = self.scene().n2i[node]
         self.focus_highlight.setPen(QColor("red"))
         self.focus_highlight.setBrush(QColor("SteelBlue"))
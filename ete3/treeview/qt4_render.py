@@ -46,9 +46,16 @@ from . import qt4_rect_render as rrender
 from .main import _leaf, NodeStyle, _FaceAreas, tracktime, TreeStyle
 from .node_gui_actions import _NodeActions as _ActionDelegator
 from .qt4_face_render import update_node_faces, _FaceGroupItem, _TextFaceItem
-from .templates import _DEFAULT_STYLE, apply_template
+from .templates import init_tree_style
+from .geometry import (init_node_dimensions, get_clade_width,
+                       update_branch_lengths)
+from .lod import LevelOfDetail
 from . import faces
 
+# Fraction of the visible region height that is also drawn in detail
+# above and below it in level of detail mode
+LOD_VIEW_MARGIN = 0.5
+
 
 ## | General scheme of node content
 ## |==========================================================================================================================|
@@ -140,6 +147,20 @@ class _NodeItem(_EmptyItem):
         self.fullRegion = QRectF()
         self.highlighted = False
 
+class _CladeItem(QGraphicsPolygonItem, _ActionDelegator):
+    """ Shape representing a clade collapsed in level of detail mode """
+    def __init__(self, node, size, x, y, width, height):
+        self.node = node
+        QGraphicsPolygonItem.__init__(self, QPolygonF([QPointF(x, y + height/2.0),
+                                                       QPointF(x + width, y),
+                                                       QPointF(x + width, y + height)]))
+        _ActionDelegator.__init__(self)
+        color = QColor(node.img_style["hz_line_color"])
+        self.setPen(QPen(color))
+        self.setBrush(QBrush(color))
+        self.setOpacity(0.3)
+        self.setToolTip("%d leaves" %size)
+
 class _NodeLineItem(QGraphicsLineItem, _ActionDelegator):
     def __init__(self, node, *args, **kargs):
         self.node = node
@@ -189,6 +210,7 @@ class _TreeScene(QGraphicsScene):
     def __init__(self):
         QGraphicsScene.__init__(self)
         self.view = None
+        self.lod = None
 
     def init_values(self, tree, img, n2i, n2f):
         self.master_item = _EmptyItem()
@@ -196,24 +218,66 @@ class _TreeScene(QGraphicsScene):
         self.n2i = n2i
         self.n2f = n2f
         self.img = img
-
-    def draw(self):
-        self.img._scale = None
-        tree_item, self.n2i, self.n2f = render(self.tree, self.img)
+        if self.lod is not None:
+            self.lod.set_leaf_heights([item.fullRegion.height() for node, item
+                                       in six.iteritems(n2i) if _leaf(node)])
+
+    def init_lod(self, tree, img):
+        """ Enables the level of detail mode if the tree is large
+        enough. Returns the LevelOfDetail instance, or None."""
+        self.lod = None
+        if img.level_of_detail is None or img.mode != "r" or img.rotation:
+            return None
+        lod = LevelOfDetail(tree, _leaf, img.force_topology)
+        if len(lod) > img.level_of_detail:
+            lod.leaf_height = max(1, img.min_leaf_separation) + img.branch_vertical_margin
+            lod.init_frontier()
+            self.lod = lod
+        return self.lod
+
+    def draw(self, reset_scale=True):
+        if reset_scale:
+            self.img._scale = None
         if self.master_item:
             self.removeItem(self.master_item)
-        tree_item, n2i, n2f = render(self.tree, self.img)
+        tree_item, n2i, n2f = render(self.tree, self.img, lod=self.lod)
         self.init_values(self.tree, self.img, n2i, n2f)
         self.addItem(self.master_item)
         tree_item.setParentItem(self.master_item)
         self.setSceneRect(tree_item.rect())
 
-#@tracktime
-def render(root_node, img, hide_root=False):
+    def get_node_span(self, node):
+        """ Returns the top and bottom scene coordinates of a rendered
+        node """
+        item = self.n2i[node]
+        rect = item.mapToScene(item.fullRegion).boundingRect()
+        return rect.top(), rect.bottom()
+
+    def update_lod(self, viewport, yscale):
+        """ Updates the level of detail frontier for the given visible
+        region and vertical scale. Returns True if the tree needs to be
+        drawn again."""
+        node2span = dict([(node, self.get_node_span(node)) for node in self.n2i])
+        margin = viewport.height() * LOD_VIEW_MARGIN
+        return self.lod.update(node2span, yscale, viewport.top() - margin,
+                               viewport.bottom() + margin, self.img.lod_min_height)
+
+def render(root_node, img, hide_root=False, lod=None):
     '''main render function. hide_root option is used when render
-    trees as Faces
+    trees as Faces. If a LevelOfDetail instance is provided, its
+    frontier clades are drawn collapsed.
 
     '''
+    if lod is None:
+        return _render(root_node, img, hide_root)
+    lod.collapse()
+    try:
+        return _render(root_node, img, hide_root)
+    finally:
+        lod.restore()
+
+#@tracktime
+def _render(root_node, img, hide_root=False):
     mode = img.mode
     orientation = img.orientation
 
@@ -702,6 +766,15 @@ def render_node_content(node, n2i, n2f, img):
     fblock_t.render()
     fblock_t.setPos(item.widths[0], center - fblock_t.h - style["hz_line_width"]/2.0)
 
+    # Collapsed clade shape (level of detail mode)
+    lod_clade = getattr(node, "_lod_collapsed", None)
+    if lod_clade and img.mode == "r":
+        clade_item = _CladeItem(node, lod_clade[0], nodeR.width(), 0,
+                                item.fullRegion.width() - nodeR.width(),
+                                item.fullRegion.height())
+    else:
+        clade_item = None
+
     # Vertical line
     if not _leaf(node):
         if img.mode == "c":
@@ -742,7 +815,7 @@ def render_node_content(node, n2i, n2f, img):
     item.mapped_items = [node_ball, fblock_r, fblock_b, fblock_t]
 
 
-    for i in [vt_line, extra_line, hz_line]:
+    for i in [vt_line, extra_line, hz_line, clade_item]:
         if i:
             #item.static_items.addToGroup(i)
             item.static_items.append(i)
@@ -1026,125 +1099,3 @@ def init_items(root_node, parent, n2i, n2f, img, rot_step, hide_root):
                 rrender.init_rect_leaf_item(node, n2i, n2f)
             else:
                 rrender.init_rect_node_item(node, n2i, n2f)
-
-
-def init_node_dimensions(node, item, faceblock, img):
-    """Calculates width and height of all different subparts and faces
-    of a given node. Branch lengths are not taken into account, so some
-    dimensions must be adjusted after setting a valid scale.
-    """
-
-    min_separation = img.min_leaf_separation
-
-    if _leaf(node):
-        aligned_height = faceblock["aligned"].h
-        aligned_width = faceblock["aligned"].w
-    else:
-        aligned_height = 0
-        aligned_width = 0
-
-    ndist =  1.0 if img.force_topology else node.dist
-    item.branch_length = (ndist * img._scale) if img._scale else 0
-    ## Calculate dimensions of the different node regions
-    ##
-    ##
-    ##                                |
-    ##                                |        ------
-    ##          b-top       --------- |        |    |
-    ## xoff-------------- O |b-right| |        |alg |
-    ##          b-bottom    --------- |        |    |
-    ##                                |        ------
-    ##                                |
-    ##
-    ##      0     1       2     3     4           5
-    ##
-
-    item.xoff = 0.0
-    # widths
-    w1 = max(faceblock["branch-bottom"].w, faceblock["branch-top"].w)
-    w0 = item.branch_length - w1 if item.branch_length > w1 else 0
-    w2 = node.img_style["size"]
-    w3 = faceblock["branch-right"].w
-    w4 = node.img_style["vt_line_width"] if not _leaf(node) and len(node.children) > 1 else 0.0
-    w5 = 0
-    # heights
-    h0 = node.img_style["hz_line_width"]
-    h1 = node.img_style["hz_line_width"] + faceblock["branch-top"].h + faceblock["branch-bottom"].h
-    h2 = node.img_style["size"]
-    h3 = faceblock["branch-right"].h
-    h4 = 0
-    h5 = aligned_height
-
-    # This fixes the problem of miss-aligned branches in ultrametric trees. If
-    # there is nothing between the hz line and the vt line, then I prevent
-    # vt_line_width to add extra width to the node, so node distances are
-    # preserved in the img.
-    if w2 == 0 and w3 == 0:
-        w4 = 0
-
-    # ignore face heights if requested
-    if img.mode == "c" and img.allow_face_overlap:
-        h1, h3, h5 = 0, 0, 0
-
-    item.heights = [h0, h1, h2, h3, h4, h5]
-    item.widths = [w0, w1, w2, w3, w4, w5]
-
-    # Calculate total node size
-    total_w = sum([w0, w1, w2, w3, w4, item.xoff]) # do not count aligned faces
-	
-    if img.mode == "c":
-        max_h = max(item.heights[:4] + [min_separation])
-    elif img.mode == "r":
-        max_h = max(item.heights + [min_separation])
-
-    max_h += img.branch_vertical_margin
-
-    # correct possible unbalanced block in branch faces
-    h_imbalance = abs(faceblock["branch-top"].h - faceblock["branch-bottom"].h)
-    if h_imbalance + h1 > max_h:
-        max_h += h_imbalance
-
-    item.facesRegion.setRect(0, 0, w3, max_h)
-    item.nodeRegion.setRect(0, 0, total_w, max_h)
-    item.fullRegion.setRect(0, 0, total_w, max_h)
-
-def update_branch_lengths(tree, n2i, n2f, img):
-    for node in tree.traverse("postorder", is_leaf_fn=_leaf):
-        item = n2i[node]
-        ndist = 1.0 if img.force_topology else node.dist
-        item.branch_length = ndist * img._scale
-        w0 = 0
-
-        if item.branch_length > item.widths[1]:
-            w0 = item.widths[0] = item.branch_length - item.widths[1]
-            item.nodeRegion.adjust(0, 0, w0, 0)
-
-        child_width = 0
-        if not _leaf(node):
-            for ch in node.children:
-                child_width = max(child_width, n2i[ch].fullRegion.width())
-                if w0 and img.mode == "r":
-                    #n2i[ch].translate(w0, 0) # deprecated in qt4.8
-                    n2i[ch].moveBy(w0, 0)
-        item.fullRegion.setWidth(item.nodeRegion.width() + child_width)
-
-def init_tree_style(t, ts):
-    custom_ts = True
-    if not ts:
-        custom_ts = False
-        ts = TreeStyle()
-
-    if not ts.layout_fn:
-        cl = t.__class__
-        try:
-            ts_template = _DEFAULT_STYLE[cl]
-        except KeyError as e:
-            pass
-        else:
-            if not custom_ts:
-                apply_template(ts, ts_template)
-            else:
-                ts.layout_fn = ts_template.get("layout_fn", None)
-
-    return ts
-
@@ -0,0 +1,1288 @@
+# #START_LICENSE###########################################################
+#
+#
+# This file is part of the Environment for Tree Exploration program
+# (ETE).  http://etetoolkit.org
+#
+# ETE is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ETE is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public
+# License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ETE.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#                     ABOUT THE ETE PACKAGE
+#                     =====================
+#
+# ETE is distributed under the GPL copyleft license (2008-2015).
+#
+# If you make use of ETE in published work, please cite:
+#
+# Jaime Huerta-Cepas, Joaquin Dopazo and Toni Gabaldon.
+# ETE: a python Environment for Tree Exploration. Jaime BMC
+# Bioinformatics 2010,:24doi:10.1186/1471-2105-11-24
+#
+# Note that extra references to the specific methods implemented in
+# the toolkit may be available in the documentation.
+#
+# More info at http://etetoolkit.org. Contact: huerta@embl.de
+#
+#
+# #END_LICENSE#############################################################
+from __future__ import absolute_import
+import base64
+import io
+import math
+from xml.sax.saxutils import escape, quoteattr
+
+import six
+
+from .main import _leaf, _FaceAreas, FACE_POSITIONS
+from .templates import init_tree_style
+from .geometry import (init_node_dimensions, update_branch_lengths,
+                       init_rect_leaf_item, init_rect_node_item,
+                       init_circular_leaf_item, init_circular_node_item,
+                       calculate_optimal_scale, get_min_radius)
+from .face_cache import TEXT_METRICS
+from . import faces
+
+__all__ = ["render_tree", "get_img", "get_render_backend"]
+
+# Qt independent renderer. Node and face dimensions are calculated as in
+# qt4_render (both share the geometry module), but the image is written
+# directly as SVG, so no Qt application or X server is needed. Only
+# TextFace, AttrFace, RectFace and CircleFace are supported.
+
+# Font sizes are given in points. As in Qt on 96 dpi screens, they are
+# converted into pixels using this factor.
+PX_PER_PT = 96 / 72.0
+
+# Vertical font metrics (Helvetica/Arial), relative to the font size
+FONT_ASCENT = 0.905
+FONT_DESCENT = 0.212
+
+# Character widths of Helvetica (ASCII 32-126), in 1/1000 of the font
+# size. Used to approximate text widths without a font engine.
+_CHAR_WIDTHS = dict(zip(
+    [chr(i) for i in range(32, 127)],
+    [278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333,
+     278, 278, 556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278,
+     584, 584, 584, 556, 1015, 667, 667, 722, 722, 667, 611, 778, 722, 278,
+     500, 667, 556, 833, 722, 778, 667, 778, 722, 667, 611, 722, 667, 944,
+     667, 667, 611, 278, 278, 278, 469, 556, 333, 556, 556, 500, 556, 556,
+     278, 556, 556, 222, 222, 500, 222, 833, 556, 556, 556, 556, 333, 500,
+     278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584]))
+_DEFAULT_CHAR_WIDTH = 556
+_MONOSPACE_CHAR_WIDTH = 600
+_MONOSPACE_FONTS = set(["courier", "courier new", "monospace", "mono",
+                        "consolas", "menlo"])
+# Fonts noticeably wider than Helvetica
+_FONT_WIDTH_FACTORS = {"verdana": 1.12, "tahoma": 1.02}
+_BOLD_WIDTH_FACTOR = 1.05
+
+# SVG dash patterns for line types (0 solid, 1 dashed, 2 dotted),
+# relative to the line width, as used by Qt pens
+_DASH_PATTERNS = {1: (4, 2), 2: (1, 2)}
+
+_IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+def get_text_size(text, ftype="Verdana", fsize=10, bold=False):
+    """Returns the approximate width and height, in pixels, of a line
+    of text. Widths are estimated from Helvetica metrics."""
+    key = ("svg", ftype, fsize, bold, text)
+    size = TEXT_METRICS.get(key)
+    if size is None:
+        size = _measure_text(text, ftype.lower(), fsize, bold)
+        TEXT_METRICS.set(key, size)
+    return size
+
+def _measure_text(text, ftype, fsize, bold):
+    px = fsize * PX_PER_PT
+    if ftype in _MONOSPACE_FONTS:
+        width = len(text) * _MONOSPACE_CHAR_WIDTH
+    else:
+        width = sum([_CHAR_WIDTHS.get(ch, _DEFAULT_CHAR_WIDTH) for ch in text])
+        width *= _FONT_WIDTH_FACTORS.get(ftype, 1.0)
+    if bold:
+        width *= _BOLD_WIDTH_FACTOR
+    return width * px / 1000.0, (FONT_ASCENT + FONT_DESCENT) * px
+
+def get_face_size(face):
+    """Returns the width and height of a face (margins excluded)"""
+    if isinstance(face, faces.TextFace):
+        return get_text_size(face.get_text(), face.ftype, face.fsize, face.bold)
+    elif isinstance(face, faces.RectFace):
+        return face.width, face.height
+    elif isinstance(face, faces.CircleFace):
+        return face.radius * 2, face.radius * 2
+    else:
+        raise ValueError("%s faces are not supported by the SVG backend"
+                         % face.__class__.__name__)
+
+
+# Affine transformations are stored as SVG matrices (a, b, c, d, e, f)
+
+def _mult(m, n):
+    """ Returns the matrix applying n and then m """
+    a, b, c, d, e, f = m
+    A, B, C, D, E, F = n
+    return (a*A + c*B, b*A + d*B, a*C + c*D, b*C + d*D,
+            a*E + c*F + e, b*E + d*F + f)
+
+def _translate(dx, dy):
+    return (1.0, 0.0, 0.0, 1.0, dx, dy)
+
+def _rotate(angle):
+    rad = math.radians(angle)
+    cos, sin = math.cos(rad), math.sin(rad)
+    return (cos, sin, -sin, cos, 0.0, 0.0)
+
+def _scale(sx, sy):
+    return (sx, 0.0, 0.0, sy, 0.0, 0.0)
+
+def _around(m, x, y):
+    """ Applies transformation m around point x,y """
+    return _mult(_translate(x, y), _mult(m, _translate(-x, -y)))
+
+def _map_point(m, x, y):
+    a, b, c, d, e, f = m
+    return a*x + c*y + e, b*x + d*y + f
+
+def _map_rect(m, x, y, w, h):
+    """ Returns the bounding rect (x1, y1, x2, y2) of a transformed rect """
+    points = [_map_point(m, px, py) for px, py in
+              ((x, y), (x + w, y), (x, y + h), (x + w, y + h))]
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+class _Rect(object):
+    """ Minimal replacement of QRectF used to store node regions """
+    def __init__(self, x=0, y=0, w=0, h=0):
+        self.setRect(x, y, w, h)
+
+    def setRect(self, x, y, w, h):
+        self.x1, self.y1 = x, y
+        self.x2, self.y2 = x + w, y + h
+
+    def adjust(self, dx1, dy1, dx2, dy2):
+        self.x1 += dx1
+        self.y1 += dy1
+        self.x2 += dx2
+        self.y2 += dy2
+
+    def x(self):
+        return self.x1
+
+    def y(self):
+        return self.y1
+
+    def width(self):
+        return self.x2 - self.x1
+
+    def height(self):
+        return self.y2 - self.y1
+
+    def setWidth(self, w):
+        self.x2 = self.x1 + w
+
+    def setHeight(self, h):
+        self.y2 = self.y1 + h
+
+class _NodeBox(object):
+    """ Qt free equivalent of the _NodeItem partitions used by
+    qt4_render. Positions are relative to the parent partition. """
+    def __init__(self, node):
+        self.node = node
+        self.nodeRegion = _Rect()
+        self.facesRegion = _Rect()
+        self.fullRegion = _Rect()
+        self.parent = None
+        self.x = 0
+        self.y = 0
+        self.ball = None
+        self.hz_line = None
+        self.extra_line = None
+        self.vt_line = None
+        self.vt_arc = None
+        self.fb_pos = {}
+        self.matrix = _IDENTITY
+        self.content_matrix = _IDENTITY
+
+    def setParentItem(self, parent):
+        self.parent = parent
+
+    def setPos(self, x, y):
+        self.x, self.y = x, y
+
+    def moveBy(self, dx, dy):
+        self.x += dx
+        self.y += dy
+
+class _FaceBlock(object):
+    """ Qt free equivalent of qt4_face_render._FaceGroupItem. Calculates
+    the grid of faces of a given node position."""
+    def __init__(self, faces, node, as_grid=False):
+        self.as_grid = as_grid
+        self.c2max_w = {}
+        self.r2max_h = {}
+        self.node = node
+        self.column2faces = faces
+        self.columns = sorted(set(self.column2faces.keys()))
+        # faces are flipped in mirrored trees and inverted when upside
+        # down in circular trees
+        self.flipped = False
+        self.inverted = False
+        # transformation from block to image coordinates (set when drawn)
+        self.matrix = None
+        self.w = 0
+        self.h = 0
+        self.update_columns_size()
+
+    def update_columns_size(self):
+        self.sizes = {}
+        self.c2height = {}
+
+        for c in self.columns:
+            faces = self.column2faces.get(c, [])
+            self.sizes[c] = {}
+            total_height = 0
+            for r, f in enumerate(faces):
+                f.node = self.node
+                fw, fh = get_face_size(f)
+                width = fw + f.margin_right + f.margin_left
+                height = fh + f.margin_top + f.margin_bottom
+
+                if f.rotation:
+                    if f.rotation == 90 or f.rotation == 270:
+                        width, height = height, width
+                    elif f.rotation == 180:
+                        pass
+                    else:
+                        x0 = width / 2.0
+                        y0 = height / 2.0
+                        theta = (f.rotation * math.pi) / 180
+                        trans = lambda x, y: (x0 + (x-x0) * math.cos(theta) + (y-y0) * math.sin(theta),
+                                              y0 - (x-x0) * math.sin(theta) + (y-y0) * math.cos(theta))
+                        coords = (trans(0, 0), trans(0, height), trans(width, 0), trans(width, height))
+                        width = max([e[0] for e in coords]) - min([e[0] for e in coords])
+                        height = max([e[1] for e in coords]) - min([e[1] for e in coords])
+
+                self.sizes[c][r] = [width, height, fw, fh]
+                self.c2max_w[c] = max(self.c2max_w.get(c, 0), width)
+                self.r2max_h[r] = max(self.r2max_h.get(r, 0), height)
+                total_height += height
+            self.c2height[c] = total_height
+
+        if not self.sizes:
+            return
+
+        if self.as_grid:
+            self.h = max([sum([self.r2max_h[r] for r in rows])
+                          for rows in six.itervalues(self.sizes)])
+        else:
+            self.h = max(six.itervalues(self.c2height))
+        self.w = sum(self.c2max_w.values())
+
+    def setup_grid(self, c2max_w=None, r2max_h=None, as_grid=True):
+        if c2max_w:
+            self.c2max_w = c2max_w
+        if r2max_h:
+            self.r2max_h = r2max_h
+        # complete missing face columns
+        if self.columns:
+            self.columns = list(range(min(self.c2max_w), max(self.c2max_w)+1))
+        self.as_grid = as_grid
+        self.update_columns_size()
+        return self.c2max_w, self.r2max_h
+
+    def iter_faces(self):
+        """ Yields each face together with its cell rect (x, y, w, h) and
+        the rect of the face content, relative to the block."""
+        x = 0
+        for c in self.columns:
+            max_w = self.c2max_w[c]
+            if self.as_grid:
+                y = 0
+            else:
+                y = (self.h - self.c2height.get(c, 0)) / 2.0
+
+            for r, f in enumerate(self.column2faces.get(c, [])):
+                w, h, fw, fh = self.sizes[c][r]
+                max_h = self.r2max_h[r] if self.as_grid else h
+
+                x_offset, y_offset = 0, 0
+                if max_w > w:
+                    if f.hz_align == 1:
+                        x_offset = (max_w - w) / 2.0
+                    elif f.hz_align == 2:
+                        x_offset = max_w - w
+                if max_h > h:
+                    if f.vt_align == 1:
+                        y_offset = (max_h - h) / 2.0
+                    elif f.vt_align == 2:
+                        y_offset = max_h - h
+
+                fx = x + f.margin_left + x_offset
+                fy = y + f.margin_top + y_offset
+                if f.rotation and f.rotation != 180:
+                    # rotated faces are centered in their cell
+                    fx += (w - fw) / 2.0
+                    fy += (h - fh) / 2.0
+
+                yield f, (x, y, max_w, max_h), (fx, fy, fw, fh)
+                y += max_h
+            x += max_w
+
+    def get_face_matrix(self, face, content):
+        """ Returns the transformation from face to image coordinates """
+        fx, fy, fw, fh = content
+        m = _mult(self.matrix, _translate(fx, fy))
+        if face.rotation and face.rotation != 180:
+            m = _mult(m, _around(_rotate(face.rotation), fw / 2.0, fh / 2.0))
+        if self.inverted and face.rotable:
+            m = _mult(m, _around(_rotate(181), fw / 2.0, fh / 2.0))
+        if self.flipped:
+            m = _mult(m, _around(_scale(-1, 1), fw / 2.0, fh / 2.0))
+        return m
+
+
+class _SVGCanvas(object):
+    """ Collects the SVG elements of an image, and the bounding rect of
+    each one, so image regions can be exported without the elements that
+    fall outside them."""
+    def __init__(self):
+        self.elements = []
+        self.bboxes = []
+        self.gradients = {}
+
+    def _add(self, tag, attrs, m=None, content=None, bbox=None):
+        # (matrix, local rect) pairs, mapped only when needed
+        self.bboxes.append((m, bbox))
+        attrs = [(k, v) for k, v in attrs if v is not None]
+        if m is not None and m != _IDENTITY:
+            attrs.append(("transform", "matrix(%s)" % " ".join(["%.6g" % v for v in m])))
+        # only text values need to be escaped
+        txt_attrs = " ".join(["%s=%s" % (k, quoteattr(v) if isinstance(v, six.string_types)
+                                         else '"%s"' % _fmt(v)) for k, v in attrs])
+        if content is None:
+            self.elements.append("<%s %s/>" % (tag, txt_attrs))
+        else:
+            self.elements.append("<%s %s>%s</%s>" % (tag, txt_attrs, escape(content), tag))
+
+    def _stroke(self, color, width, line_type):
+        # Qt draws 0 width (cosmetic) pens as 1 pixel lines, whatever the
+        # image scale
+        attrs = [("stroke", color), ("stroke-width", width or 1)]
+        if not width:
+            attrs.append(("vector-effect", "non-scaling-stroke"))
+        width = width or 1
+        if line_type in _DASH_PATTERNS:
+            attrs.append(("stroke-dasharray",
+                          ",".join([_fmt(v * width) for v in _DASH_PATTERNS[line_type]])))
+        return attrs
+
+    def line(self, x1, y1, x2, y2, color, width=0, line_type=0, m=None):
+        self._add("line", [("x1", x1), ("y1", y1), ("x2", x2), ("y2", y2)] +
+                  self._stroke(color, width, line_type), m,
+                  bbox=(min(x1, x2), min(y1, y2), abs(x2 - x1), abs(y2 - y1)))
+
+    def rect(self, x, y, w, h, fill=None, stroke=None, width=0, line_type=0,
+             m=None, opacity=None):
+        attrs = [("x", x), ("y", y), ("width", w), ("height", h),
+                 ("fill", fill or "none"), ("opacity", opacity)]
+        if stroke:
+            attrs += self._stroke(stroke, width, line_type)
+        self._add("rect", attrs, m, bbox=(x, y, w, h))
+
+    def ellipse(self, cx, cy, rx, ry, fill=None, stroke=None, sphere=False,
+                m=None, opacity=None):
+        if sphere:
+            fill = "url(#%s)" % self.get_sphere_gradient(fill)
+        attrs = [("cx", cx), ("cy", cy), ("rx", rx), ("ry", ry),
+                 ("fill", fill or "none"), ("opacity", opacity)]
+        if stroke:
+            attrs += self._stroke(stroke, 0, 0)
+        self._add("ellipse", attrs, m, bbox=(cx - rx, cy - ry, 2 * rx, 2 * ry))
+
+    def path(self, d, fill=None, stroke=None, width=0, line_type=0, m=None,
+             bbox=None):
+        attrs = [("d", d), ("fill", fill or "none")]
+        if stroke:
+            attrs += self._stroke(stroke, width, line_type)
+        self._add("path", attrs, m, bbox=bbox)
+
+    def text(self, x, y, text, ftype="Verdana", fsize=10, color="black",
+             bold=False, fstyle="normal", anchor=None, m=None, opacity=None):
+        """ Draws text with its top left corner at x, y (or its center when
+        anchor is "middle") """
+        px = fsize * PX_PER_PT
+        # generic family used by viewers without the requested font
+        generic = "monospace" if ftype.lower() in _MONOSPACE_FONTS else "sans-serif"
+        w, h = get_text_size(text, ftype, fsize, bold)
+        if anchor == "middle":
+            y -= (FONT_ASCENT + FONT_DESCENT) * px / 2.0
+            bbox = (x - w / 2.0, y, w, h)
+        else:
+            bbox = (x, y, w, h)
+        attrs = [("x", x), ("y", y + FONT_ASCENT * px),
+                 ("font-family", "%s,%s" % (ftype, generic)),
+                 ("font-size", "%spx" % _fmt(px)),
+                 ("fill", color), ("text-anchor", anchor),
+                 ("font-weight", "bold" if bold else None),
+                 ("font-style", fstyle if fstyle in ("italic", "oblique") else None),
+                 ("opacity", opacity)]
+        self._add("text", attrs, m, content=text, bbox=bbox)
+
+    def get_bboxes(self):
+        """ Returns the bounding rect (x1, y1, x2, y2) of each element, or
+        None when unknown"""
+        return [_map_rect(m or _IDENTITY, *bbox) if bbox is not None else None
+                for m, bbox in self.bboxes]
+
+    def get_sphere_gradient(self, color):
+        if color not in self.gradients:
+            self.gradients[color] = "sphere%d" % len(self.gradients)
+        return self.gradients[color]
+
+    def to_svg(self, width, height, viewbox, keep_ratio=True, elements=None):
+        """ Returns the SVG code of the image. If elements (a sorted list
+        of element positions) is given, only those elements are included."""
+        defs = []
+        for color, gid in sorted(six.iteritems(self.gradients), key=lambda x: x[1]):
+            defs.append('<radialGradient id="%s" cx="0.5" cy="0.5" r="0.5" '
+                        'fx="0.33" fy="0.33"><stop offset="0.05" stop-color="white"/>'
+                        '<stop offset="1" stop-color=%s/></radialGradient>'
+                        % (gid, quoteattr(color)))
+        header = ('<svg xmlns="http://www.w3.org/2000/svg" version="1.1" '
+                  'width="%s" height="%s" viewBox="%s" preserveAspectRatio="%s">'
+                  % (_fmt(width), _fmt(height), " ".join(map(_fmt, viewbox)),
+                     "xMidYMid meet" if keep_ratio else "none"))
+        lines = ['<?xml version="1.0" encoding="UTF-8" standalone="no"?>',
+                 header,
+                 "<title>Generated with ETE http://etetoolkit.org</title>"]
+        if defs:
+            lines.append("<defs>%s</defs>" % "".join(defs))
+        if elements is None:
+            lines.extend(self.elements)
+        else:
+            lines.extend([self.elements[i] for i in elements])
+        lines.append("</svg>")
+        return "\n".join(lines) + "\n"
+
+def _fmt(value):
+    if isinstance(value, float):
+        return "%.6g" % value
+    return str(value)
+
+def _arc_path(r, angle_start, angle_end):
+    """ Returns the SVG path of a circular arc centered at 0,0 (clock-wise
+    angles in degrees)"""
+    x1, y1 = _map_point(_rotate(angle_start), r, 0)
+    x2, y2 = _map_point(_rotate(angle_end), r, 0)
+    large = 1 if abs(angle_end - angle_start) > 180 else 0
+    return "M %s %s A %s %s 0 %d 1 %s %s" % tuple(
+        list(map(_fmt, [x1, y1, r, r])) + [large] + list(map(_fmt, [x2, y2])))
+
+def _sector_path(r1, r2, angle_start, angle_end):
+    """ Returns the SVG path of a ring sector centered at 0,0 """
+    x1, y1 = _map_point(_rotate(angle_start), r2, 0)
+    x2, y2 = _map_point(_rotate(angle_end), r2, 0)
+    x3, y3 = _map_point(_rotate(angle_end), r1, 0)
+    x4, y4 = _map_point(_rotate(angle_start), r1, 0)
+    large = 1 if abs(angle_end - angle_start) > 180 else 0
+    return ("M %s %s A %s %s 0 %d 1 %s %s L %s %s A %s %s 0 %d 0 %s %s Z" %
+            tuple(list(map(_fmt, [x1, y1, r2, r2])) + [large] +
+                  list(map(_fmt, [x2, y2, x3, y3, r1, r1])) + [large] +
+                  list(map(_fmt, [x4, y4]))))
+
+def _sector_bbox(r1, r2, angle_start, angle_end):
+    """ Returns the bounding rect (x, y, w, h) of a ring sector centered
+    at 0,0, as drawn by _arc_path (r1 = r2) or _sector_path"""
+    angles = [angle_start, angle_end]
+    # the sector reaches its max extent at the axes it crosses
+    axis = math.ceil(angle_start / 90.0) * 90
+    while axis < angle_end:
+        angles.append(axis)
+        axis += 90
+    points = [_map_point(_rotate(a), r, 0) for a in angles for r in (r1, r2)]
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys)
+
+
+def render_tree(t, imgName, w=None, h=None, layout=None,
+                tree_style=None, header=None, units="px",
+                dpi=90):
+    """ Render tree image into a file without Qt."""
+    for nid, n in enumerate(t.traverse("preorder")):
+        n.add_feature("_nid", nid)
+    img = init_tree_style(t, tree_style)
+    if layout:
+        img.layout_fn = layout
+
+    canvas, main_rect, n2b, n2f = render(t, img)
+    if imgName.startswith("%%inline"):
+        return save(canvas, main_rect, imgName, w=w, h=h, units=units, dpi=dpi)
+    x_scale, y_scale = save(canvas, main_rect, imgName, w=w, h=h,
+                            units=units, dpi=dpi)
+    return get_tree_img_map(n2b, n2f, main_rect, x_scale, y_scale)
+
+def get_img(t, w=None, h=None, layout=None, tree_style=None,
+            header=None, units="px", dpi=90, return_format="%%return"):
+    """ Returns the image data and the image map of a tree without Qt."""
+    for nid, n in enumerate(t.traverse("preorder")):
+        n.add_feature("_nid", nid)
+    img = init_tree_style(t, tree_style)
+    if layout:
+        img.layout_fn = layout
+
+    canvas, main_rect, n2b, n2f = render(t, img)
+    x_scale, y_scale, imgdata = save(canvas, main_rect, return_format, w=w,
+                                     h=h, units=units, dpi=dpi)
+    if 'PNG' in return_format.upper():
+        img_map = get_tree_img_map(n2b, n2f, main_rect, x_scale, y_scale)
+    else:
+        img_map = {}
+    return [imgdata, img_map]
+
+def get_render_backend(backend=None):
+    """ Returns the name of the backend ("qt" or "svg") used to render
+    images. If backend is None, Qt is used when available and this
+    module otherwise."""
+    if backend is None or backend == "qt":
+        try:
+            from . import drawer
+        except ImportError:
+            if backend == "qt":
+                raise
+            return "svg"
+        return "qt"
+    elif backend == "svg":
+        return "svg"
+    else:
+        raise ValueError("Unknown render backend [%s]" %backend)
+
+def render(root_node, img):
+    """Draws a tree in a _SVGCanvas. Returns the canvas, the image rect
+    (x1, y1, x2, y2) and the node boxes and face blocks used."""
+    mode = img.mode
+    arc_span = img.arc_span
+    layout_fn = img._layout_handler
+
+    n2b = {} # node to boxes
+    n2f = {} # node to face blocks
+
+    virtual_leaves = 0
+
+    if img.show_branch_length:
+        bl_face = faces.AttrFace("dist", fsize=8, ftype="Arial", fgcolor="black", formatter = "%0.3g")
+    if img.show_branch_support:
+        su_face = faces.AttrFace("support", fsize=8, ftype="Arial", fgcolor="darkred", formatter = "%0.3g")
+    if img.show_leaf_name:
+        na_face = faces.AttrFace("name", fsize=10, ftype="Arial", fgcolor="black")
+
+    for n in root_node.traverse(is_leaf_fn=_leaf):
+        set_style(n, layout_fn)
+
+        if img.show_branch_length:
+            faces.add_face_to_node(bl_face, n, 0, position="branch-top")
+
+        if not _leaf(n) and img.show_branch_support:
+            faces.add_face_to_node(su_face, n, 0, position="branch-bottom")
+
+        if _leaf(n) and n.name and img.show_leaf_name:
+            faces.add_face_to_node(na_face, n, 0, position="branch-right")
+
+        if _leaf(n):
+            virtual_leaves += 1
+
+        update_node_faces(n, n2f, img)
+
+    rot_step = float(arc_span) / virtual_leaves
+
+    # Calculate optimal branch length
+    if img._scale is not None:
+        init_items(root_node, n2b, n2f, img, rot_step)
+    elif img.scale is None:
+        # create items and calculate node dimensions skipping branch lengths
+        init_items(root_node, n2b, n2f, img, rot_step)
+        if mode == 'r':
+            if img.optimal_scale_level == "full":
+                scales = [(b.widths[1]/n.dist) for n, b in six.iteritems(n2b) if n.dist]
+                img._scale = max(scales) if scales else 0.0
+            else:
+                farthest, dist = root_node.get_farthest_leaf(topology_only=img.force_topology)
+                img._scale = img.tree_width / dist if dist else 0.0
+            update_branch_lengths(root_node, n2b, n2f, img)
+        else:
+            img._scale = calculate_optimal_scale(root_node, n2b, rot_step, img)
+            update_branch_lengths(root_node, n2b, n2f, img)
+            init_items(root_node, n2b, n2f, img, rot_step)
+    else:
+        # create items and calculate node dimensions CONSIDERING branch lengths
+        img._scale = img.scale
+        init_items(root_node, n2b, n2f, img, rot_step)
+
+    for node in root_node.traverse(is_leaf_fn=_leaf):
+        init_node_content(node, n2b, n2f, img)
+
+    # Adjust content to rect or circular layout
+    if mode == "c":
+        tree_radius = init_circular_positions(root_node, n2b, rot_step)
+        main_rect = [-tree_radius, -tree_radius, tree_radius, tree_radius]
+    else:
+        init_rect_positions(root_node, n2b)
+        main_rect = [0, 0, n2b[root_node].fullRegion.width(),
+                     n2b[root_node].fullRegion.height()]
+
+    # Extra layers: aligned faces, floating faces, node backgrounds. As
+    # in qt4_render, the order of the following calls IS IMPORTANT
+    floatings = init_floatings(n2b, n2f, img)
+    aligned_faces, surroundings = init_aligned_faces(img, main_rect, n2b, n2f)
+    backgrounds = init_backgrounds(img, main_rect, root_node, n2b)
+
+    # rotate if necessary in circular images. flip and adjust if mirror
+    # orientation.
+    tree_matrix = _IDENTITY
+    if mode == "c":
+        for node, faceblock in six.iteritems(n2f):
+            rotation = n2b[node].rotation
+            if rotation > 90 and rotation < 270:
+                for fb in six.itervalues(faceblock):
+                    fb.inverted = True
+    elif mode == "r" and img.orientation == 1:
+        tree_matrix = _mult(_translate(main_rect[2] - main_rect[0], 0),
+                            _scale(-1, 1))
+        for faceblock in six.itervalues(n2f):
+            for fb in six.itervalues(faceblock):
+                fb.flipped = True
+        for pos, fb in surroundings:
+            fb.flipped = True
+
+    # Rotate main image if necessary
+    if img.rotation:
+        rotation = _around(_rotate(img.rotation),
+                           (main_rect[0] + main_rect[2]) / 2.0,
+                           (main_rect[1] + main_rect[3]) / 2.0)
+        tree_matrix = _mult(rotation, tree_matrix)
+        main_rect = list(_map_rect(rotation, main_rect[0], main_rect[1],
+                                   main_rect[2] - main_rect[0],
+                                   main_rect[3] - main_rect[1]))
+
+    main_rect[0] -= img.margin_left
+    main_rect[1] -= img.margin_top
+    main_rect[2] += img.margin_right
+    main_rect[3] += img.margin_bottom
+
+    # Fix negative coordinates, so main item always starts at 0,0
+    _x = abs(main_rect[0]) if main_rect[0] < 0 else 0
+    _y = abs(main_rect[1]) if main_rect[1] < 0 else 0
+    if _x or _y:
+        tree_matrix = _mult(_translate(_x, _y), tree_matrix)
+        main_rect = [main_rect[0] + _x, main_rect[1] + _y,
+                     main_rect[2] + _x, main_rect[3] + _y]
+
+    for box in six.itervalues(n2b):
+        box.matrix = _mult(tree_matrix, box.matrix)
+        box.content_matrix = _mult(tree_matrix, box.content_matrix)
+
+    # Draw layers from bottom to top
+    canvas = _SVGCanvas()
+    for path, rect, color in backgrounds:
+        if path:
+            canvas.path(path, fill=color, stroke=color, m=tree_matrix, bbox=rect)
+        else:
+            canvas.rect(*rect, fill=color, stroke=color, m=tree_matrix)
+
+    draw_floatings(canvas, floatings, tree_matrix, behind=True)
+    for node in root_node.traverse(is_leaf_fn=_leaf):
+        draw_node_content(canvas, node, n2b, n2f, img)
+        if node in aligned_faces:
+            draw_aligned_faces(canvas, node, n2b[node], aligned_faces[node], img)
+    for pos, fb in surroundings:
+        draw_faceblock(canvas, fb, _mult(tree_matrix, _translate(*pos)))
+    draw_floatings(canvas, floatings, tree_matrix, behind=False)
+
+    # Add extra components and adjust main_rect to them
+    add_legend(canvas, img, main_rect)
+    add_title(canvas, img, main_rect)
+    add_scale(canvas, img, main_rect)
+
+    # Draws a border around the tree
+    if img.show_border:
+        canvas.rect(main_rect[0], main_rect[1], main_rect[2] - main_rect[0],
+                    main_rect[3] - main_rect[1], stroke="black")
+
+    return canvas, main_rect, n2b, n2f
+
+def set_style(n, layout_func):
+    n._temp_faces = _FaceAreas()
+    for func in layout_func:
+        func(n)
+
+def update_node_faces(node, n2f, img):
+    # Organize all faces of this node in face blocks
+    faceblock = {}
+    n2f[node] = faceblock
+    for position in FACE_POSITIONS:
+        fixed_faces = getattr(getattr(node, "faces", None), position, {})
+        all_faces = getattr(node._temp_faces, position)
+        for column, values in six.iteritems(fixed_faces):
+            all_faces.setdefault(column, []).extend(values)
+        faceblock[position] = _FaceBlock(all_faces, node)
+
+    node._temp_faces = None
+    return faceblock
+
+def init_items(root_node, n2b, n2f, img, rot_step):
+    for node in root_node.traverse("preorder", is_leaf_fn=_leaf):
+        if node not in n2b:
+            box = n2b[node] = _NodeBox(node)
+            init_node_dimensions(node, box, n2f[node], img)
+
+    last_rotation = img.arc_start
+    for node in root_node.traverse("postorder", is_leaf_fn=_leaf):
+        if img.mode == "c":
+            if _leaf(node):
+                init_circular_leaf_item(node, n2b, n2f, last_rotation, rot_step)
+                last_rotation += rot_step
+            else:
+                init_circular_node_item(node, n2b, n2f)
+        elif img.mode == "r":
+            if _leaf(node):
+                init_rect_leaf_item(node, n2b, n2f)
+            else:
+                init_rect_node_item(node, n2b, n2f)
+
+def init_node_content(node, n2b, n2f, img):
+    """Calculates the position of node elements, relative to the node
+    content, as in qt4_render.render_node_content."""
+    style = node.img_style
+    box = n2b[node]
+    nodeR = box.nodeRegion
+    center = box.center
+    branch_length = box.branch_length
+    ball_size = style["size"]
+
+    vlw = style["vt_line_width"] if not _leaf(node) and len(node.children) > 1 else 0.0
+    face_start_x = max(0, nodeR.width() - box.facesRegion.width() - vlw)
+    ball_start_x = face_start_x - ball_size
+
+    if ball_size:
+        box.ball = [ball_start_x, center - (ball_size / 2.0)]
+
+    join_fix = 0
+    if img.mode == "c" and node.up and node.up.img_style["vt_line_width"]:
+        join_fix = node.up.img_style["vt_line_width"]
+    box.hz_line = [-join_fix, center, branch_length, center]
+
+    if img.complete_branch_lines_when_necessary:
+        box.extra_line = [branch_length, center, ball_start_x, center]
+
+    fblock_r = n2f[node]["branch-right"]
+    fblock_t = n2f[node]["branch-top"]
+    box.fb_pos = {
+        "branch-right": [face_start_x, center - fblock_r.h / 2.0],
+        "branch-bottom": [box.widths[0], center + style["hz_line_width"] / 2.0],
+        "branch-top": [box.widths[0], center - fblock_t.h - style["hz_line_width"] / 2.0],
+        }
+
+    if not _leaf(node) and img.mode == "r":
+        first_child = node.children[0]
+        last_child = node.children[-1]
+        first_child_part = n2b[first_child]
+        last_child_part = n2b[last_child]
+        c1 = first_child_part.start_y + first_child_part.center
+        c2 = last_child_part.start_y + last_child_part.center
+        fx = nodeR.width() - (vlw / 2.0)
+        if first_child.img_style["hz_line_width"] > 0:
+            c1 -= (first_child.img_style["hz_line_width"] / 2.0)
+        if last_child.img_style["hz_line_width"] > 0:
+            c2 += (last_child.img_style["hz_line_width"] / 2.0)
+        box.vt_line = [fx, c1, fx, c2]
+
+def init_rect_positions(root_node, n2b):
+    for node in root_node.traverse("preorder", is_leaf_fn=_leaf):
+        box = n2b[node]
+        if box.parent is not None:
+            x, y = _map_point(box.parent.matrix, box.x, box.y)
+        else:
+            x, y = box.x, box.y
+        box.matrix = box.content_matrix = _translate(x, y)
+
+def init_circular_positions(root_node, n2b, rot_step):
+    """Qt free version of qt4_circular_render.render_circular"""
+    max_r = 0.0
+    for node in root_node.traverse('preorder', is_leaf_fn=_leaf):
+        box = n2b[node]
+        w = sum(box.widths[1:5])
+        h = box.effective_height
+
+        parent_radius = n2b[node.up].radius if node.up and node.up in n2b else box.xoff
+        angle = rot_step if _leaf(node) else box.angle_span
+
+        r, xoffset = get_min_radius(w, h, angle, parent_radius + box.widths[0])
+        box.radius = r
+        box.content_matrix = _mult(_rotate(box.rotation),
+                                   _translate(parent_radius, -h / 2.0))
+        max_r = max(max_r, r)
+
+        if not _leaf(node) and len(node.children) > 1:
+            # Vertical arc line
+            box.vt_arc = [r - node.img_style["vt_line_width"] / 2.0,
+                          n2b[node.children[0]].rotation,
+                          n2b[node.children[-1]].rotation]
+
+        # If applies, it sets the length of the extra branch length
+        if box.extra_line:
+            xtra = box.extra_line[2] - box.extra_line[0]
+            if xtra > 0:
+                xtra = xoffset + xtra
+            else:
+                xtra = xoffset
+            box.extra_line = [box.branch_length, box.center,
+                              box.branch_length + xtra, box.center]
+            box.nodeRegion.setWidth(box.nodeRegion.width() + xtra)
+
+        # And moves elements
+        if xoffset:
+            for pos in [box.ball] + list(box.fb_pos.values()):
+                if pos:
+                    pos[0] += xoffset
+
+    n2b[root_node].max_r = max_r
+    return max_r
+
+def init_floatings(n2b, n2f, img):
+    """Returns the floating face blocks and their transformations,
+    sorted by stacking order."""
+    floatings = []
+    for node, faceblock in six.iteritems(n2f):
+        box = n2b[node]
+        xtra = box.extra_line[2] - box.extra_line[0] if box.extra_line else 0
+        for behind, position in [(False, "float"), (True, "float-behind")]:
+            fb = faceblock[position]
+            if not fb.column2faces:
+                continue
+            if img.mode == "c":
+                # Floatings are positioned over branches
+                m = _mult(_rotate(box.rotation),
+                          _translate(box.radius - box.nodeRegion.width() + xtra,
+                                     -fb.h / 2.0))
+            else:
+                start = box.branch_length + xtra - fb.w
+                m = _mult(box.content_matrix,
+                          _translate(start, box.center - (fb.h / 2.0)))
+            z = node._nid if img.children_faces_on_top else -node._nid
+            floatings.append([behind, z, m, fb])
+    floatings.sort(key=lambda x: x[1])
+    return floatings
+
+def init_aligned_faces(img, main_rect, n2b, n2f):
+    """Calculates the position of aligned faces and of their header and
+    footer, enlarging main_rect accordingly."""
+    aligned_faces = dict([[node, fb["aligned"]] for node, fb in six.iteritems(n2f)
+                          if fb["aligned"].column2faces and _leaf(node)])
+
+    # If no aligned faces, nothing to do
+    if not aligned_faces:
+        return {}, []
+
+    if img.mode == "r":
+        tree_end_x = main_rect[2] - main_rect[0]
+        fb_head = _FaceBlock(img.aligned_header, None)
+        fb_foot = _FaceBlock(img.aligned_foot, None)
+        surroundings = [[None, fb_foot], [None, fb_head]]
+        main_rect[1] -= fb_head.h
+        main_rect[3] += fb_foot.h
+    else:
+        tree_end_x = (main_rect[2] - main_rect[0]) / 2.0
+        surroundings = []
+
+    # Calculates the max size of each column
+    c2max_w = {}
+    maxh = 0
+    maxh_node = None
+    for node, fb in list(aligned_faces.items()) + surroundings:
+        if fb.h > maxh:
+            maxh = fb.h
+            maxh_node = node
+        for c, w in six.iteritems(fb.c2max_w):
+            c2max_w[c] = max(w, c2max_w.get(c, 0))
+    extra_width = sum(c2max_w.values())
+
+    if img.mode == "r":
+        if img.draw_aligned_faces_as_table:
+            fb_head.setup_grid(c2max_w)
+            fb_foot.setup_grid(c2max_w)
+        surroundings = [[(tree_end_x, main_rect[1]), fb_head],
+                        [(tree_end_x, main_rect[3] - fb_foot.h), fb_foot]]
+
+    # if no scale provided in circular mode, optimal scale is expected
+    # to provide the correct ending point to start drawing aligned
+    # faces.
+    elif img.mode == "c" and (img.scale or img._scale == 0) and not img.allow_face_overlap:
+        angle = n2b[maxh_node].angle_span
+        rad, off = get_min_radius(1, maxh, angle, tree_end_x)
+        extra_width += rad - tree_end_x
+        tree_end_x = rad
+
+    for node, fb in six.iteritems(aligned_faces):
+        box = n2b[node]
+        if img.draw_aligned_faces_as_table:
+            if img.aligned_table_style == 0:
+                fb.setup_grid(c2max_w, as_grid=True)
+            elif img.aligned_table_style == 1:
+                fb.setup_grid(c2max_w, as_grid=False)
+
+        if img.mode == "c":
+            if node.up in n2b:
+                x = tree_end_x - n2b[node.up].radius
+            else:
+                x = tree_end_x
+        else:
+            x = tree_end_x - _map_point(box.matrix, 0, 0)[0]
+        fb.pos = [x, box.center - (fb.h / 2.0)]
+
+    if img.mode == "c":
+        main_rect[0] -= extra_width
+        main_rect[1] -= extra_width
+        main_rect[2] += extra_width
+        main_rect[3] += extra_width
+    else:
+        main_rect[2] += extra_width
+    return aligned_faces, surroundings
+
+def init_backgrounds(img, main_rect, root_node, n2b):
+    """Returns the background areas of nodes as [path, rect, color]
+    lists, in stacking order"""
+    if img.mode == "c":
+        max_r = (main_rect[2] - main_rect[0]) / 2.0
+    else:
+        max_r = main_rect[2] - main_rect[0]
+
+    backgrounds = []
+    for node in root_node.traverse(is_leaf_fn=_leaf):
+        color = node.img_style["bgcolor"]
+        if color.upper() == "#FFFFFF":
+            continue
+        box = n2b[node]
+        if img.mode == "c":
+            if _leaf(node):
+                first_c = last_c = box
+            else:
+                first_c = n2b[node.children[0]]
+                last_c = n2b[node.children[-1]]
+            parent_radius = getattr(n2b.get(node.up, None), "radius", 0)
+            backgrounds.append([_sector_path(parent_radius, max_r,
+                                             first_c.full_start, last_c.full_end),
+                                _sector_bbox(parent_radius, max_r,
+                                             first_c.full_start, last_c.full_end),
+                                color])
+        else:
+            x, y = _map_point(box.content_matrix, 0, 0)
+            backgrounds.append([None, (x, y, max_r - x, box.fullRegion.height()),
+                                color])
+    return backgrounds
+
+def draw_node_content(canvas, node, n2b, n2f, img):
+    style = node.img_style
+    box = n2b[node]
+    m = box.content_matrix
+
+    if box.vt_line:
+        canvas.line(*box.vt_line, color=style["vt_line_color"],
+                    width=style["vt_line_width"],
+                    line_type=style["vt_line_type"], m=m)
+
+    if box.extra_line and box.extra_line[2] > box.extra_line[0]:
+        canvas.line(*box.extra_line, color=img.extra_branch_line_color,
+                    width=style["hz_line_width"],
+                    line_type=img.extra_branch_line_type, m=m)
+
+    canvas.line(*box.hz_line, color=style["hz_line_color"],
+                width=style["hz_line_width"], line_type=style["hz_line_type"],
+                m=m)
+
+    if box.ball:
+        x, y = box.ball
+        d = style["size"]
+        color = style["fgcolor"]
+        if style["shape"] == "square":
+            canvas.rect(x, y, d, d, fill=color, stroke=color, m=m)
+        else:
+            canvas.ellipse(x + d / 2.0, y + d / 2.0, d / 2.0, d / 2.0,
+                           fill=color, stroke=color,
+                           sphere=style["shape"] == "sphere", m=m)
+
+    for position in ["branch-right", "branch-bottom", "branch-top"]:
+        fb = n2f[node][position]
+        if fb.column2faces:
+            draw_faceblock(canvas, fb, _mult(m, _translate(*box.fb_pos[position])))
+
+    if box.vt_arc:
+        r, rot_start, rot_end = box.vt_arc
+        canvas.path(_arc_path(r, rot_start, rot_end),
+                    stroke=style["vt_line_color"], width=style["vt_line_width"],
+                    line_type=style["vt_line_type"], m=box.matrix,
+                    bbox=_sector_bbox(r, r, rot_start, rot_end))
+
+def draw_aligned_faces(canvas, node, box, fb, img):
+    x, y = fb.pos
+    draw_faceblock(canvas, fb, _mult(box.content_matrix, _translate(x, y)))
+    if img.draw_guiding_lines:
+        # -1 is to connect the two lines, otherwise there is a pixel in between
+        canvas.line(box.nodeRegion.width() - 1, box.center, x, box.center,
+                    color=img.guiding_lines_color,
+                    width=node.img_style["hz_line_width"],
+                    line_type=img.guiding_lines_type, m=box.content_matrix)
+
+def draw_floatings(canvas, floatings, tree_matrix, behind):
+    for is_behind, z, m, fb in floatings:
+        if is_behind == behind:
+            draw_faceblock(canvas, fb, _mult(tree_matrix, m))
+
+def draw_faceblock(canvas, fb, m):
+    """Draws all faces in a face block. m maps block coordinates into the
+    image."""
+    fb.matrix = m
+    for f, cell, content in fb.iter_faces():
+        f.node = fb.node
+        x, y, w, h = cell
+        if f.background.color:
+            canvas.rect(x, y, w, h, fill=f.background.color,
+                        stroke=f.background.color, m=m)
+        if f.border.width is not None and f.border.color:
+            canvas.rect(x, y, w, h, stroke=f.border.color, width=f.border.width,
+                        line_type=f.border.type, m=m)
+
+        fw, fh = content[2:]
+        fm = fb.get_face_matrix(f, content)
+        if f.inner_background.color:
+            canvas.rect(0, 0, fw, fh, fill=f.inner_background.color,
+                        stroke=f.inner_background.color, m=fm)
+        if f.inner_border.width is not None and f.inner_border.color:
+            canvas.rect(0, 0, fw, fh, stroke=f.inner_border.color,
+                        width=f.inner_border.width,
+                        line_type=f.inner_border.type, m=fm)
+        draw_face(canvas, f, fw, fh, fm)
+
+def draw_face(canvas, f, w, h, m):
+    opacity = f.opacity if f.opacity < 1 else None
+    if isinstance(f, faces.TextFace):
+        canvas.text(0, 0, f.get_text(), f.ftype, f.fsize, f.fgcolor, f.bold,
+                    f.fstyle, m=m, opacity=opacity)
+    elif isinstance(f, faces.RectFace):
+        canvas.rect(0, 0, w, h, fill=f.bgcolor, stroke=f.fgcolor, m=m,
+                    opacity=opacity)
+        draw_face_label(canvas, f.label, w, h, m)
+    elif isinstance(f, faces.CircleFace):
+        canvas.ellipse(w / 2.0, h / 2.0, w / 2.0, h / 2.0, fill=f.color,
+                       stroke=f.color, sphere=f.style == "sphere", m=m,
+                       opacity=opacity)
+        draw_face_label(canvas, f.label, w, h, m)
+
+def draw_face_label(canvas, label, w, h, m):
+    """ Draws the centered label of RectFace and CircleFace objects """
+    if not label:
+        return
+    canvas.text(w / 2.0, h / 2.0, label.get("text", "No label text!"),
+                label.get("font", "Verdana"), int(label.get("fontsize", 12)),
+                label["color"], anchor="middle", m=m)
+
+def add_legend(canvas, img, main_rect):
+    if img.legend:
+        legend = _FaceBlock(img.legend, None)
+        legend.setup_grid()
+        lg_w, lg_h = legend.w, legend.h
+        dw = max(0, lg_w - (main_rect[2] - main_rect[0]))
+        if img.legend_position == 1:
+            main_rect[1] -= lg_h
+            main_rect[2] += dw
+            pos = main_rect[0], main_rect[1]
+        elif img.legend_position == 2:
+            main_rect[1] -= lg_h
+            main_rect[2] += dw
+            pos = main_rect[2] - lg_w, main_rect[1]
+        elif img.legend_position == 3:
+            pos = main_rect[0], main_rect[3]
+            main_rect[2] += dw
+            main_rect[3] += lg_h
+        elif img.legend_position == 4:
+            pos = main_rect[2] - lg_w, main_rect[3]
+            main_rect[2] += dw
+            main_rect[3] += lg_h
+        else:
+            return
+        draw_faceblock(canvas, legend, _translate(*pos))
+
+def add_title(canvas, img, main_rect):
+    if img.title:
+        title = _FaceBlock(img.title, None)
+        title.setup_grid()
+        dw = max(0, title.w - (main_rect[2] - main_rect[0]))
+        main_rect[1] -= title.h
+        main_rect[2] += dw
+        draw_faceblock(canvas, title, _translate(main_rect[0], main_rect[1]))
+
+def add_scale(canvas, img, main_rect):
+    if img.show_scale:
+        width = main_rect[2] - main_rect[0]
+        if img.scale_length is None:
+            length = 50.0
+        else:
+            length = img.scale_length * img._scale
+            if length > width:
+                max_value = width / img._scale
+                raise ValueError('Custom scale bar length (TreeStyle.scale_length) is larger than the tree image'
+                                 'Use values between 0 and %g' %max_value)
+
+        m = _translate(main_rect[0] + img.margin_left, main_rect[3])
+        if img.force_topology:
+            wtext = ["Force topology is enabled!",
+                     "Branch lengths do not represent real values."]
+            line_h = get_text_size(wtext[0], "Arial", 8)[1]
+            for i, txt in enumerate(wtext):
+                canvas.text(0, 32 + i * line_h, txt, "Arial", 8, "darkred", m=m)
+        else:
+            canvas.line(0, 5, length, 5, "black", 1, m=m)
+            canvas.line(0, 0, 0, 10, "black", 1, m=m)
+            canvas.line(length, 0, length, 10, "black", 1, m=m)
+            length_text = float(length) / img._scale if img._scale else 0.0
+            canvas.text(0, 10, "%g" % length_text, "Arial", 8, "black", m=m)
+        main_rect[3] += length
+
+def save(canvas, main_rect, imgName, w=None, h=None, dpi=90, units="px"):
+    """Writes the SVG image of a canvas (or converts it into PDF or PNG
+    when cairosvg is available)."""
+    ipython_inline = False
+    if imgName == "%%inline":
+        ipython_inline = True
+        ext = "PNG"
+    elif imgName == "%%inlineSVG":
+        ipython_inline = True
+        ext = "SVG"
+    elif imgName.startswith("%%return"):
+        try:
+            ext = imgName.split(".")[1].upper()
+        except IndexError:
+            ext = 'SVG'
+        imgName = '%%return'
+    else:
+        ext = imgName.split(".")[-1].upper()
+
+    if ext not in ("SVG", "PDF", "PNG"):
+        raise ValueError("Image format [%s] is not supported by the SVG backend" % ext)
+
+    main_w = main_rect[2] - main_rect[0]
+    main_h = main_rect[3] - main_rect[1]
+    aspect_ratio = main_h / main_w
+
+    # auto adjust size
+    keep_ratio = True
+    if not w and not h:
+        units = "px"
+        w = main_w
+        h = main_h
+    elif w and h:
+        keep_ratio = False
+    elif h is None:
+        h = w * aspect_ratio
+    elif w is None:
+        w = h / aspect_ratio
+
+    # Adjust to resolution
+    if units == "mm":
+        w = w * 0.0393700787 * dpi
+        h = h * 0.0393700787 * dpi
+    elif units == "in":
+        w = w * dpi
+        h = h * dpi
+    elif units != "px":
+        raise Exception("wrong unit format")
+
+    x_scale, y_scale = w / main_w, h / main_h
+    svg = canvas.to_svg(w, h, [main_rect[0], main_rect[1], main_w, main_h],
+                        keep_ratio)
+
+    if ext == "SVG":
+        if ipython_inline:
+            from IPython.core.display import SVG
+            return SVG(svg)
+        elif imgName == '%%return':
+            return x_scale, y_scale, svg
+        with io.open(imgName, "w", encoding="utf-8") as OUT:
+            OUT.write(six.text_type(svg))
+    else:
+        data = convert_svg(svg, ext)
+        if ipython_inline:
+            from IPython.core.display import Image
+            return Image(data)
+        elif imgName == '%%return':
+            if ext == "PNG":
+                data = base64.b64encode(data)
+            return x_scale, y_scale, data
+        with open(imgName, "wb") as OUT:
+            OUT.write(data)
+
+    return x_scale, y_scale
+
+def convert_svg(svg, ext):
+    """Converts SVG code into PDF or PNG data using cairosvg"""
+    try:
+        import cairosvg
+    except ImportError:
+        raise ValueError("cairosvg is required to create %s images with the "
+                         "SVG backend. Use SVG images or install cairosvg." % ext)
+    if ext == "PDF":
+        return cairosvg.svg2pdf(bytestring=svg.encode("utf-8"))
+    else:
+        return cairosvg.svg2png(bytestring=svg.encode("utf-8"),
+                                background_color="white")
+
+def get_tree_img_map(n2b, n2f, main_rect, x_scale=1, y_scale=1):
+    """Returns the image map of node and face areas, as
+    qt4_render.get_tree_img_map does"""
+    def _scaled(rect):
+        x1, y1, x2, y2 = rect
+        return [x_scale * (x1 - main_rect[0]), y_scale * (y1 - main_rect[1]),
+                x_scale * (x2 - main_rect[0]), y_scale * (y2 - main_rect[1])]
+
+    node_list = []
+    face_list = []
+    node_areas = {}
+    for n, box in six.iteritems(n2b):
+        nid = n._nid
+        full = box.fullRegion
+        node_areas[nid] = _scaled(_map_rect(box.matrix, full.x(), full.y(),
+                                            full.width(), full.height()))
+        if box.ball:
+            d = n.img_style["size"]
+            node_list.append(_scaled(_map_rect(box.content_matrix, box.ball[0],
+                                               box.ball[1], d, d)) + [nid, None])
+
+        for position in ["branch-right", "branch-bottom", "branch-top", "aligned"]:
+            fb = n2f[n][position]
+            if not fb.column2faces or fb.matrix is None:
+                continue
+            for f, cell, content in fb.iter_faces():
+                f.node = n
+                if isinstance(f, faces.TextFace):
+                    label = f.get_text()
+                else:
+                    label = getattr(f, "label", None)
+                face_list.append(_scaled(_map_rect(fb.get_face_matrix(f, content),
+                                                   0, 0, content[2], content[3]))
+                                 + [nid, label])
+
+    return {"nodes": node_list, "faces": face_list, "node_areas": node_areas}
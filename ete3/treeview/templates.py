@@ -40,6 +40,7 @@ from __future__ import absolute_import
 from .. import (PhyloTree, PhyloNode,
                   ClusterTree, ClusterNode, EvolTree, EvolNode)
 from . import layouts
+from .main import TreeStyle
 import six
 
 def apply_template(tree_style, template):
@@ -71,3 +72,24 @@ _DEFAULT_STYLE={
     ClusterTree: clustering,
     ClusterNode: clustering,
     }
+
+def init_tree_style(t, ts):
+    custom_ts = True
+    if not ts:
+        custom_ts = False
+        ts = TreeStyle()
+
+    if not ts.layout_fn:
+        cl = t.__class__
+        try:
+            ts_template = _DEFAULT_STYLE[cl]
+        except KeyError as e:
+            pass
+        else:
+            if not custom_ts:
+                apply_template(ts, ts_template)
+            else:
+                ts.layout_fn = ts_template.get("layout_fn", None)
+
+    return ts
+
@@ -39,7 +39,9 @@
 from __future__ import absolute_import
 from __future__ import print_function
 import re
+import threading
 import time
+from collections import OrderedDict
 
 import os
 import six
@@ -224,3 +226,75 @@ def timeit(f):
         return r
     return a_wrapper_accepting_arguments
 
+
+class LRUCache(object):
+    """Size limited cache. When full, the least recently used entries are
+    discarded. Hits, misses and evictions are counted, so cache efficiency
+    can be checked with :func:`stats`.
+
+    .. versionadded: 3.1
+
+    :var 10000 maxsize: max number of cached entries. If None, the
+      cache has no size limit; if 0 or lower, nothing is cached.
+    """
+    def __init__(self, maxsize=10000):
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            # moves the entry to the most recently used end
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            self._evict()
+
+    def _evict(self):
+        if self._maxsize is None:
+            return
+        while len(self._data) > max(0, self._maxsize):
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def _get_maxsize(self):
+        return self._maxsize
+
+    def _set_maxsize(self, maxsize):
+        with self._lock:
+            self._maxsize = maxsize
+            self._evict()
+
+    maxsize = property(_get_maxsize, _set_maxsize)
+
+    def clear(self):
+        """Removes all entries and resets counters"""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Returns a dictionary with the current number of entries, max
+        size, hits, misses and evictions of the cache."""
+        return {"size": len(self._data), "maxsize": self._maxsize,
+                "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions}
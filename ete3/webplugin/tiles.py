@@ -0,0 +1,349 @@
+# #START_LICENSE###########################################################
+#
+#
+# This file is part of the Environment for Tree Exploration program
+# (ETE).  http://etetoolkit.org
+#
+# ETE is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ETE is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public
+# License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ETE.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#                     ABOUT THE ETE PACKAGE
+#                     =====================
+#
+# ETE is distributed under the GPL copyleft license (2008-2015).
+#
+# If you make use of ETE in published work, please cite:
+#
+# Jaime Huerta-Cepas, Joaquin Dopazo and Toni Gabaldon.
+# ETE: a python Environment for Tree Exploration. Jaime BMC
+# Bioinformatics 2010,:24doi:10.1186/1471-2105-11-24
+#
+# Note that extra references to the specific methods implemented in
+# the toolkit may be available in the documentation.
+#
+# More info at http://etetoolkit.org. Contact: huerta@embl.de
+#
+#
+# #END_LICENSE#############################################################
+from __future__ import absolute_import
+import errno
+import math
+import os
+import tempfile
+
+import six
+from six.moves import range
+
+from ..utils import LRUCache
+
+__all__ = ["TreeTiler"]
+
+class _GridIndex(object):
+    """ Spatial index of rectangles (x1, y1, x2, y2). Each rectangle is
+    stored in a grid whose cells are about its own size (a loose
+    quadtree), so regions can be queried without scanning all the
+    rectangles, and small rectangles can be skipped when a region is seen
+    from far away. Rectangles given as None are always returned."""
+    def __init__(self, cell_size=16):
+        self.cell_size = cell_size
+        self.boxes = []
+        self.unbounded = []
+        self.levels = {}
+
+    def add(self, bbox):
+        i = len(self.boxes)
+        self.boxes.append(bbox)
+        if bbox is None:
+            self.unbounded.append(i)
+            return i
+        x1, y1, x2, y2 = bbox
+        size = max(x2 - x1, y2 - y1)
+        level = 0
+        while self.cell_size * 2 ** level < size:
+            level += 1
+        cs = self.cell_size * 2 ** level
+        cells = self.levels.setdefault(level, {})
+        for col in range(int(x1 // cs), int(x2 // cs) + 1):
+            for row in range(int(y1 // cs), int(y2 // cs) + 1):
+                cells.setdefault((col, row), []).append(i)
+        return i
+
+    def query(self, region, min_size=0):
+        """ Returns the sorted positions of the rectangles overlapping
+        region, ignoring those whose width and height are smaller than
+        min_size."""
+        x1, y1, x2, y2 = region
+        found = set(self.unbounded)
+        for level, cells in six.iteritems(self.levels):
+            cs = self.cell_size * 2 ** level
+            # all rectangles in this level are smaller than its cells
+            if cs < min_size:
+                continue
+            c1, c2 = int(x1 // cs), int(x2 // cs)
+            r1, r2 = int(y1 // cs), int(y2 // cs)
+            if (c2 - c1 + 1) * (r2 - r1 + 1) > len(cells):
+                buckets = [items for (col, row), items in six.iteritems(cells)
+                           if c1 <= col <= c2 and r1 <= row <= r2]
+            else:
+                buckets = [cells[(col, row)] for col in range(c1, c2 + 1)
+                           for row in range(r1, r2 + 1) if (col, row) in cells]
+            for items in buckets:
+                for i in items:
+                    if i in found:
+                        continue
+                    bx1, by1, bx2, by2 = self.boxes[i]
+                    if (bx1 <= x2 and bx2 >= x1 and by1 <= y2 and by2 >= y1 and
+                        max(bx2 - bx1, by2 - by1) >= min_size):
+                        found.add(i)
+        return sorted(found)
+
+
+class TreeTiler(object):
+    """Lays out a tree image once and serves it as fixed size square
+    tiles at several zoom levels, as map viewers do. Zoom level 0 shows
+    the whole tree in a single tile, and each level doubles the image
+    size until max_zoom, which shows the tree at its natural size.
+
+    Tiles are PNG images when rendered with Qt, or SVG images with the SVG
+    backend. The latter skips elements smaller than min_pixels at the
+    current zoom, so zoomed out tiles of large trees stay small.
+
+    .. versionadded: 3.1
+
+    :argument t: the tree to draw.
+    :var None layout: layout function used to render the tree.
+    :var None tree_style: a TreeStyle instance used to render the tree.
+    :var 256 tile_size: width and height of tiles, in pixels.
+    :var None backend: "qt", "svg" or None (Qt if available, SVG
+       otherwise), as in :func:`TreeNode.render`.
+    :var None cache_dir: if given, tiles are also cached in this
+       directory, so they survive across processes.
+    :var 1024 cache_size: max number of tiles kept in memory.
+    :var 1 min_pixels: smallest elements drawn in SVG tiles.
+    :var 2 min_area_pixels: smallest node and face areas returned by
+       :func:`get_tile_map`.
+    """
+    def __init__(self, t, layout=None, tree_style=None, tile_size=256,
+                 backend=None, cache_dir=None, cache_size=1024,
+                 min_pixels=1, min_area_pixels=2):
+        self.tile_size = tile_size
+        self.cache_dir = cache_dir
+        self.min_pixels = min_pixels
+        self.min_area_pixels = min_area_pixels
+        self._tiles = LRUCache(cache_size)
+
+        for nid, n in enumerate(t.traverse("preorder")):
+            n.add_feature("_nid", nid)
+        if tree_style is not None:
+            # The scale computed for a previous tree must not be reused
+            tree_style._scale = None
+
+        from ..treeview.svg_render import get_render_backend
+        if get_render_backend(backend) == "qt":
+            img_map = self._init_qt(t, layout, tree_style)
+        else:
+            img_map = self._init_svg(t, layout, tree_style)
+
+        x1, y1, x2, y2 = self._rect
+        self.width = x2 - x1
+        self.height = y2 - y1
+        self.max_zoom = max(0, int(math.ceil(math.log(
+            max(self.width, self.height, 1) / float(tile_size), 2))))
+
+        # image map areas at max zoom (scale 1)
+        self._areas = []
+        self._area_index = _GridIndex()
+        for kind in ["nodes", "faces"]:
+            for area in img_map[kind]:
+                self._areas.append((kind, area))
+                self._area_index.add(area[:4])
+        self._node_areas = img_map["node_areas"]
+
+    def _init_qt(self, t, layout, tree_style):
+        from ..treeview import drawer
+        from ..treeview.qt4_render import render, get_tree_img_map
+        scene, img = drawer.init_scene(t, layout, tree_style)
+        tree_item, n2i, n2f = render(t, img)
+        scene.init_values(t, img, n2i, n2f)
+        tree_item.setParentItem(scene.master_item)
+        scene.master_item.setPos(0, 0)
+        scene.addItem(scene.master_item)
+        rect = scene.sceneRect()
+        self._scene = scene
+        self._rect = (rect.x(), rect.y(), rect.x() + rect.width(),
+                      rect.y() + rect.height())
+        self.tile_format = "png"
+
+        # Qt image maps use scene coordinates. Make them relative to the
+        # image origin, as in SVG image maps.
+        img_map = get_tree_img_map(n2i)
+        dx, dy = rect.x(), rect.y()
+        def _shift(area):
+            return [area[0] - dx, area[1] - dy, area[2] - dx, area[3] - dy] + area[4:]
+        img_map["nodes"] = list(map(_shift, img_map["nodes"]))
+        img_map["faces"] = list(map(_shift, img_map["faces"]))
+        img_map["node_areas"] = dict([(nid, _shift(area)) for nid, area in
+                                      six.iteritems(img_map["node_areas"])])
+        return img_map
+
+    def _init_svg(self, t, layout, tree_style):
+        from ..treeview import svg_render
+        from ..treeview.templates import init_tree_style
+        img = init_tree_style(t, tree_style)
+        if layout:
+            img.layout_fn = layout
+        canvas, main_rect, n2b, n2f = svg_render.render(t, img)
+        self._canvas = canvas
+        self._elements = _GridIndex()
+        for bbox in canvas.get_bboxes():
+            self._elements.add(bbox)
+        self._rect = tuple(main_rect)
+        self.tile_format = "svg"
+        return svg_render.get_tree_img_map(n2b, n2f, main_rect)
+
+    def get_scale(self, zoom):
+        """ Returns the image scale at a zoom level """
+        return 2.0 ** (zoom - self.max_zoom)
+
+    def get_tile_grid(self, zoom):
+        """ Returns the number of tile columns and rows at a zoom level """
+        scale = self.get_scale(zoom)
+        return (max(1, int(math.ceil(self.width * scale / self.tile_size))),
+                max(1, int(math.ceil(self.height * scale / self.tile_size))))
+
+    def get_info(self):
+        """ Returns the image size, tile size, max zoom and tile format """
+        return {"width": self.width, "height": self.height,
+                "tile_size": self.tile_size, "max_zoom": self.max_zoom,
+                "format": self.tile_format}
+
+    def _get_tile_region(self, zoom, x, y):
+        if not 0 <= zoom <= self.max_zoom:
+            raise ValueError("Zoom level out of range: %s" %zoom)
+        cols, rows = self.get_tile_grid(zoom)
+        if not (0 <= x < cols and 0 <= y < rows):
+            raise ValueError("Tile out of range: %s,%s" %(x, y))
+        span = self.tile_size / self.get_scale(zoom)
+        return x * span, y * span, span
+
+    def _get_tile_path(self, zoom, x, y):
+        return os.path.join(self.cache_dir, str(zoom),
+                            "%d_%d.%s" %(x, y, self.tile_format))
+
+    def get_tile(self, zoom, x, y):
+        """ Returns the image data of a tile """
+        x1, y1, span = self._get_tile_region(zoom, x, y)
+        data = self._tiles.get((zoom, x, y))
+        if data is not None:
+            return data
+
+        path = self._get_tile_path(zoom, x, y) if self.cache_dir else None
+        if path and os.path.exists(path):
+            with open(path, "rb") as IN:
+                data = IN.read()
+        else:
+            data = self._render_tile(zoom, self._rect[0] + x1,
+                                     self._rect[1] + y1, span)
+            if path:
+                self._write_tile(path, data)
+        self._tiles.set((zoom, x, y), data)
+        return data
+
+    def _write_tile(self, path, data):
+        # tiles are written to a temporary file and moved into place, so
+        # concurrent requests never read partially written tiles
+        tile_dir = os.path.dirname(path)
+        try:
+            os.makedirs(tile_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        fd, tmp_path = tempfile.mkstemp(dir=tile_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as OUT:
+                OUT.write(data)
+            if hasattr(os, "replace"):
+                os.replace(tmp_path, path)
+            else:
+                os.rename(tmp_path, path)
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _render_tile(self, zoom, x1, y1, span):
+        size = self.tile_size
+        if self.tile_format == "svg":
+            scale = self.get_scale(zoom)
+            # include elements whose strokes may reach the tile
+            pad = 2 / scale
+            elements = self._elements.query((x1 - pad, y1 - pad, x1 + span + pad,
+                                             y1 + span + pad),
+                                            min_size=self.min_pixels / scale)
+            svg = self._canvas.to_svg(size, size, [x1, y1, span, span],
+                                      elements=elements)
+            return svg.encode("utf-8")
+
+        from ..treeview.qt import (QImage, QPainter, QColor, QRectF, QByteArray,
+                                   QBuffer, QIODevice, Qt)
+        ii = QImage(size, size, QImage.Format_ARGB32)
+        ii.fill(QColor(Qt.white).rgb())
+        pp = QPainter(ii)
+        pp.setRenderHint(QPainter.Antialiasing)
+        pp.setRenderHint(QPainter.TextAntialiasing)
+        pp.setRenderHint(QPainter.SmoothPixmapTransform)
+        self._scene.render(pp, QRectF(0, 0, size, size),
+                           QRectF(x1, y1, span, span), Qt.IgnoreAspectRatio)
+        pp.end()
+        ba = QByteArray()
+        buf = QBuffer(ba)
+        buf.open(QIODevice.WriteOnly)
+        ii.save(buf, "PNG")
+        return bytes(ba.data())
+
+    def get_tile_map(self, zoom, x, y):
+        """ Returns the image map of a tile, in the same format as
+        get_tree_img_map: node and face areas overlapping the tile, and
+        the full areas of their nodes. Coordinates are relative to the
+        tile."""
+        x1, y1, span = self._get_tile_region(zoom, x, y)
+        scale = self.get_scale(zoom)
+        def _to_tile(area):
+            return [(area[0] - x1) * scale, (area[1] - y1) * scale,
+                    (area[2] - x1) * scale, (area[3] - y1) * scale]
+
+        tile_map = {"nodes": [], "faces": [], "node_areas": {}}
+        for i in self._area_index.query((x1, y1, x1 + span, y1 + span),
+                                        min_size=self.min_area_pixels / scale):
+            kind, area = self._areas[i]
+            nid = area[4]
+            tile_map[kind].append(_to_tile(area) + area[4:])
+            if nid in self._node_areas:
+                tile_map["node_areas"][nid] = _to_tile(self._node_areas[nid])
+        return tile_map
+
+    def clear_cache(self):
+        """ Removes all cached tiles, in memory and on disk """
+        self._tiles.clear()
+        if not self.cache_dir:
+            return
+        for zoom in range(self.max_zoom + 1):
+            zoom_dir = os.path.join(self.cache_dir, str(zoom))
+            if not os.path.isdir(zoom_dir):
+                continue
+            for fname in os.listdir(zoom_dir):
+                if fname.endswith("." + self.tile_format):
+                    os.remove(os.path.join(zoom_dir, fname))
+            if not os.listdir(zoom_dir):
+                os.rmdir(zoom_dir)
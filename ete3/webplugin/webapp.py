@@ -41,10 +41,12 @@ from __future__ import print_function
 import sys
 import os
 import time
-import cgi
 from hashlib import md5
 import six.moves.cPickle
 from six.moves import map
+from six.moves.urllib.parse import parse_qs
+
+from .tiles import TreeTiler
 
 ALL = ["WebTreeApplication"]
 
@@ -74,6 +76,11 @@ class WebTreeApplication(object):
         self._treeid2tree = {}
         self._treeid2cache = {}
         self._treeid2index = {}
+        self._treeid2tiler = {}
+        self._treeid2node_actions = {}
+        self._tile_size = None
+        self._tile_cache_size = None
+        self._tile_backend = None
         self.queries = {}
         self.CONFIG = {
             "temp_dir":"/var/www/webplugin/",
@@ -87,6 +94,22 @@ class WebTreeApplication(object):
         self._height = h
         self._size_units = units
 
+    def set_tile_mode(self, tile_size=256, cache_size=1024, backend=None):
+        """ Shows trees in a zoomable viewer made of image tiles, instead of
+        a single image. Trees are drawn only once, and tiles are served
+        (and cached in memory and in CONFIG["temp_dir"]) as they are
+        browsed. Use tile_size=None to disable it.
+
+        .. versionadded: 3.1
+
+        :var 256 tile_size: width and height of tiles, in pixels.
+        :var 1024 cache_size: max number of tiles kept in memory per tree.
+        :var None backend: render backend, as in :func:`TreeNode.render`.
+        """
+        self._tile_size = tile_size
+        self._tile_cache_size = cache_size
+        self._tile_backend = backend
+
     def set_external_app_handler(self, handler):
         """ Sets a custom function that will extend current WSGI
         application."""
@@ -115,7 +138,7 @@ class WebTreeApplication(object):
         """ Fix a :class:`TreeStyle` instance to render tree images. """
         self._tree_style = handler
 
-    def _get_html_map(self, img_map, treeid, mapid, tree):
+    def _get_node_actions(self, tree):
         # Scans for node-enabled actions.
         nid2actions = {}
         nid2face_actions = {}
@@ -125,6 +148,12 @@ class WebTreeApplication(object):
                     nid2actions.setdefault(int(n._nid), []).append(aindex)
                 elif target == "face" and (not checker or checker(n)):
                     nid2face_actions.setdefault(int(n._nid), []).append(aindex)
+        return nid2actions, nid2face_actions
+
+    def _get_html_map(self, img_map, treeid, mapid, tree, node_actions=None):
+        if node_actions is None:
+            node_actions = self._get_node_actions(tree)
+        nid2actions, nid2face_actions = node_actions
 
         html_map = '<MAP NAME="%s"  class="ete_tree_img">' %(mapid)
         if img_map["nodes"]:
@@ -166,16 +195,16 @@ class WebTreeApplication(object):
         # if no tree is given, and not in memmory, it tries to loaded
         # from previous sessions
         if treeid not in self._treeid2tree:
-            self._load_tree_from_path(self._treeid2cache[treeid])
+            self._load_tree_from_path(treeid, self._treeid2cache[treeid])
 
         # Returns True if tree and indexes are loaded
         return (treeid in self._treeid2tree) and (treeid in self._treeid2index)
 
-    def _load_tree_from_path(self, pkl_path):
+    def _load_tree_from_path(self, treeid, pkl_path):
         tree_path = os.path.join(self.CONFIG["temp_dir"], pkl_path)
         if os.path.exists(tree_path):
-            print(six.moves.cPickle.load(open(tree_path)))
-            t = self._treeid2tree[treeid] = six.moves.cPickle.load(open(tree_path))
+            with open(tree_path, "rb") as handle:
+                self._treeid2tree[treeid] = six.moves.cPickle.load(handle)
             self._load_tree_index(treeid)
             return True
         else:
@@ -219,12 +248,17 @@ class WebTreeApplication(object):
 
         layout_fn = self._treeid2layout.get(treeid, self._layout)
         mapid = "img_map_"+str(time.time())
-        img_map = _render_tree(t, img_path, self.CONFIG["DISPLAY"], layout = layout_fn,
-                               tree_style = self._tree_style,
-                               w=self._width,
-                               h=self._height,
-                               units=self._size_units)
-        html_map = self._get_html_map(img_map, treeid, mapid, t)
+        if self._tile_size:
+            # The tree has probably changed, so previous tiles are discarded
+            self._load_tiler(treeid, reset=True)
+            html_map = ""
+        else:
+            img_map = _render_tree(t, img_path, self.CONFIG["DISPLAY"], layout = layout_fn,
+                                   tree_style = self._tree_style,
+                                   w=self._width,
+                                   h=self._height,
+                                   units=self._size_units)
+            html_map = self._get_html_map(img_map, treeid, mapid, t)
         for n in t.traverse():
             self._treeid2index[treeid][str(n._nid)]=n
             if hasattr(n, "_QtItem_"):
@@ -245,28 +279,84 @@ class WebTreeApplication(object):
 
         ete_publi = '<div style="margin:0px;padding:0px;text-align:left;"><a href="http://etetoolkit.org" style="font-size:7pt;" target="_blank" >%s</a></div>' %\
             (version_tag)
-        img_html = """<img id="%s" class="ete_tree_img" src="%s" USEMAP="#%s" onLoad='javascript:bind_popup();' onclick='javascript:show_context_menu("%s", "", "%s");' >""" %\
-            (treeid, img_url, mapid, treeid, ','.join(map(str, tree_actions)))
+        if self._tile_size:
+            tiler = self._treeid2tiler[treeid]
+            img_html = """<div id="ETE_tiles_%s" class="ete_tile_viewer"></div><script>ete_tile_viewer("%s", %d, %d, %d, %d, "%s");</script>""" %\
+                (treeid, treeid, tiler.width, tiler.height, tiler.tile_size,
+                 tiler.max_zoom, ','.join(map(str, tree_actions)))
+        else:
+            img_html = """<img id="%s" class="ete_tree_img" src="%s" USEMAP="#%s" onLoad='javascript:bind_popup();' onclick='javascript:show_context_menu("%s", "", "%s");' >""" %\
+                (treeid, img_url, mapid, treeid, ','.join(map(str, tree_actions)))
 
         tree_div_id = "ETE_tree_"+str(treeid)
         return html_map+ '<div id="%s" >'%tree_div_id + img_html + ete_publi + "</div>"
 
+    def _load_tiler(self, treeid, reset=False):
+        # Tiles are drawn from a single layout of the tree, which is
+        # rebuilt only when the tree changes or is loaded by a new process.
+        tiler = self._treeid2tiler.get(treeid)
+        if tiler and not reset:
+            return tiler
+        cache_dir = os.path.join(self.CONFIG["temp_dir"], "tiles", treeid)
+        if tiler:
+            tiler.clear_cache()
+        t = self._treeid2tree[treeid]
+        os.environ["DISPLAY"] = self.CONFIG["DISPLAY"]
+        tiler = TreeTiler(t, layout=self._treeid2layout.get(treeid, self._layout),
+                          tree_style=self._tree_style, tile_size=self._tile_size,
+                          backend=self._tile_backend, cache_dir=cache_dir,
+                          cache_size=self._tile_cache_size)
+        if reset:
+            tiler.clear_cache()
+        self._treeid2tiler[treeid] = tiler
+        self._treeid2node_actions[treeid] = self._get_node_actions(t)
+        for n in t.traverse():
+            self._treeid2index[treeid][str(n._nid)] = n
+        return tiler
+
+    def _get_tile(self, treeid, start_response):
+        t = self._treeid2tree[treeid]
+        tiler = self._load_tiler(treeid)
+        try:
+            zoom, x, y = [int(self.queries.get(k, [0])[0]) for k in ["z", "x", "y"]]
+            if self.queries.get("map", [None])[0]:
+                mapid = self.queries.get("mapid", ["tile_map"])[0]
+                html = self._get_html_map(tiler.get_tile_map(zoom, x, y), treeid,
+                                          mapid, t, self._treeid2node_actions[treeid])
+                start_response('200 OK', [('content-type', 'text/html')])
+                return [html.encode("utf-8")]
+            data = tiler.get_tile(zoom, x, y)
+        except ValueError as e:
+            start_response('404 Not Found', [('content-type', 'text/plain')])
+            return [str(e).encode("utf-8")]
+        ctype = "image/png" if tiler.tile_format == "png" else "image/svg+xml"
+        start_response('200 OK', [('content-type', ctype)])
+        return [data]
+
     # WSGI web application
     def __call__(self, environ, start_response):
         """ This function is executed when the application is called
         by the WSGI apache module. It is, therefore, in charge of
         answering web requests."""
         path = environ['PATH_INFO'].split("/")
-        start_response('202 OK', [('content-type', 'text/plain')])
         if environ['REQUEST_METHOD'].upper() == 'GET' and  environ['QUERY_STRING']:
-            self.queries = cgi.parse_qs(environ['QUERY_STRING'])
+            self.queries = parse_qs(environ['QUERY_STRING'])
         elif environ['REQUEST_METHOD'].upper() == 'POST' and environ['wsgi.input']:
-            self.queries = cgi.parse_qs(environ['wsgi.input'].read())
+            self.queries = parse_qs(environ['wsgi.input'].read())
         else:
             self.queries = {}
 
         method = path[1]
         treeid = self.queries.get("treeid", [None])[0]
+        if method == "tile":
+            # tiles and their image maps are requested by the tile viewer
+            # (see ete_tile_viewer in ete.js)
+            if not self._load_tree(treeid):
+                start_response('404 Not Found', [('content-type', 'text/plain')])
+                return [("tile: Cannot load the tree: %s" %treeid).encode("utf-8")]
+            return self._get_tile(treeid, start_response)
+
+        start_response('202 OK', [('content-type', 'text/plain')])
         nodeid = self.queries.get("nid", [None])[0]
         textface = self.queries.get("textface", [None])[0]
         actions = self.queries.get("show_actions", [None])[0]
@@ -282,8 +372,8 @@ class WebTreeApplication(object):
             if not self._load_tree(treeid, tree):
                 return "draw: Cannot load the tree: %s" %treeid
 
+            t = self._treeid2tree[treeid]
             if self._custom_tree_renderer:
-                t = self._treeid2tree[treeid]
                 return self._custom_tree_renderer(t, treeid, self)
             elif t and treeid:
                 return self._get_tree_img(treeid=treeid)
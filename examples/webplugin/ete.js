@@ -66,6 +66,73 @@ function show_box(e, box) {
   box.show();
 }
 
+/* Tiled tree viewer, used when the application runs in tile mode
+   (WebTreeApplication.set_tile_mode). Only the tiles in sight are
+   requested, together with their image maps. */
+function ete_tile_viewer(treeid, width, height, tile_size, max_zoom, actions){
+  var viewer = $("#ETE_tiles_"+treeid);
+  var plane = $('<div class="ete_tile_plane"></div>');
+  var controls = $('<div class="ete_tile_controls"><input type="button" value="+"> <input type="button" value="-"></div>');
+  viewer.before(controls);
+  viewer.append(plane);
+
+  // start with the largest zoom showing the whole tree width
+  var zoom = max_zoom;
+  while (zoom > 0 && width * Math.pow(2, zoom - max_zoom) > viewer.width()){
+    zoom -= 1;
+  }
+
+  function load_tiles(){
+    var scale = Math.pow(2, zoom - max_zoom);
+    var cols = Math.ceil(width * scale / tile_size);
+    var rows = Math.ceil(height * scale / tile_size);
+    var x1 = Math.floor(viewer.scrollLeft() / tile_size);
+    var y1 = Math.floor(viewer.scrollTop() / tile_size);
+    var x2 = Math.min(cols - 1, Math.floor((viewer.scrollLeft() + viewer.width()) / tile_size));
+    var y2 = Math.min(rows - 1, Math.floor((viewer.scrollTop() + viewer.height()) / tile_size));
+    for (var x = x1; x <= x2; x++){
+      for (var y = y1; y <= y2; y++){
+        var tid = "ETE_tile_"+treeid+"_"+zoom+"_"+x+"_"+y;
+        if (document.getElementById(tid)){
+          continue;
+        }
+        var params = "treeid="+treeid+"&z="+zoom+"&x="+x+"&y="+y;
+        var img = $('<img class="ete_tree_img" border=0>');
+        img.attr({"id": tid, "src": ete_webplugin_URL+"/tile?"+params, "usemap": "#"+tid+"_map"});
+        img.css({"position": "absolute", "left": x * tile_size, "top": y * tile_size});
+        img.click(function(){ show_context_menu(treeid, "", actions); });
+        plane.append(img);
+        $.get(ete_webplugin_URL+"/tile?"+params+"&map=1&mapid="+tid+"_map", function(html){
+          plane.append(html);
+          bind_popup();
+        });
+      }
+    }
+  }
+
+  function set_zoom(new_zoom){
+    if (new_zoom < 0 || new_zoom > max_zoom){
+      return;
+    }
+    // keep the center of the view
+    var factor = Math.pow(2, new_zoom - zoom);
+    var cx = (viewer.scrollLeft() + viewer.width() / 2) * factor;
+    var cy = (viewer.scrollTop() + viewer.height() / 2) * factor;
+    zoom = new_zoom;
+    var scale = Math.pow(2, zoom - max_zoom);
+    plane.html("");
+    plane.css({"width": Math.ceil(width * scale), "height": Math.ceil(height * scale)});
+    viewer.scrollLeft(cx - viewer.width() / 2);
+    viewer.scrollTop(cy - viewer.height() / 2);
+    load_tiles();
+  }
+
+  controls.find("input:first").click(function(){ set_zoom(zoom + 1); });
+  controls.find("input:last").click(function(){ set_zoom(zoom - 1); });
+  viewer.scroll(load_tiles);
+  set_zoom(zoom);
+}
+
 $(document).ready(function(){
   hide_popup();
 });
@@ -490,6 +490,9 @@ ts.branch_vertical_margin = 5
 application.set_tree_style(ts)
 #application.set_default_layout_fn(main_layout)
 application.set_tree_size(None, None)
+# Large trees can be browsed as a zoomable map of image tiles, which
+# are drawn as they are needed instead of as a single huge image
+#application.set_tile_mode(tile_size=256)
 # I want to make up how tree image in shown using a custrom tree
 # renderer that adds much more HTML code
 application.set_external_tree_renderer(tree_renderer)